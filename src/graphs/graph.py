@@ -34,7 +34,10 @@ from graphs.nodes.material_generate_nodes import (
     commercial_web_search_node,
     technical_web_search_node,
     commercial_material_generate_node,
-    technical_material_generate_node
+    technical_material_generate_node,
+    route_by_material_type,
+    COMMERCIAL_RETRIEVAL_NODES,
+    TECHNICAL_RETRIEVAL_NODES
 )
 
 # 工作流类型选择函数
@@ -117,18 +120,20 @@ builder.add_edge(["invalid_items_check", "commercial_score_check", "technical_pl
                 "indicator_response_check", "technical_score_check", "bid_structure_check"],
                 "modification_summary")
 
-# 材料生成流程的边
-builder.add_edge("tender_requirements_parse", "commercial_kb_search")
-builder.add_edge("tender_requirements_parse", "technical_kb_search")
-
-builder.add_edge("commercial_kb_search", "commercial_web_search")
-builder.add_edge("technical_kb_search", "technical_web_search")
+# 材料生成流程的边：按材料类型选择分支，分支内知识库检索与互联网搜索并行执行
+builder.add_conditional_edges(
+    source="tender_requirements_parse",
+    path=route_by_material_type,
+    path_map=COMMERCIAL_RETRIEVAL_NODES + TECHNICAL_RETRIEVAL_NODES
+)
 
-builder.add_edge("commercial_web_search", "commercial_material_generate")
-builder.add_edge("technical_web_search", "technical_material_generate")
+# 两路检索都完成后再生成材料
+builder.add_edge(COMMERCIAL_RETRIEVAL_NODES, "commercial_material_generate")
+builder.add_edge(TECHNICAL_RETRIEVAL_NODES, "technical_material_generate")
 
-# 商务和技术材料都生成完成后结束
-builder.add_edge(["commercial_material_generate", "technical_material_generate"], END)
+# 各分支生成完成后各自结束（未选中的分支不会执行）
+builder.add_edge("commercial_material_generate", END)
+builder.add_edge("technical_material_generate", END)
 
 # 检查流程结束
 builder.add_edge("modification_summary", END)
@@ -33,7 +33,10 @@ from graphs.nodes.material_generate_nodes import (
     commercial_web_search_node,
     technical_web_search_node,
     commercial_material_generate_node,
-    technical_material_generate_node
+    technical_material_generate_node,
+    route_by_material_type,
+    COMMERCIAL_RETRIEVAL_NODES,
+    TECHNICAL_RETRIEVAL_NODES
 )
 
 
@@ -43,10 +46,9 @@ def create_material_generate_graph() -> StateGraph:
 
     工作流：
     1. 解析招标文件，提取商务和技术要求
-    2. 并行生成商务材料和技术材料
-       - 知识库检索
-       - 互联网搜索（可选）
-       - 材料生成
+    2. 按材料类型（material_type）并行生成商务材料和/或技术材料
+       - 知识库检索与互联网搜索并行执行
+       - 两路检索完成后生成材料
     """
     # 创建状态图，使用子图专用的 GlobalState
     builder = StateGraph(MaterialGenerateState)
@@ -95,18 +97,20 @@ def create_material_generate_graph() -> StateGraph:
     # 设置入口
     builder.set_entry_point("tender_requirements_parse")
 
-    # 添加边
-    builder.add_edge("tender_requirements_parse", "commercial_kb_search")
-    builder.add_edge("tender_requirements_parse", "technical_kb_search")
-
-    builder.add_edge("commercial_kb_search", "commercial_web_search")
-    builder.add_edge("technical_kb_search", "technical_web_search")
+    # 添加边：按材料类型选择分支，分支内知识库检索与互联网搜索并行执行
+    builder.add_conditional_edges(
+        source="tender_requirements_parse",
+        path=route_by_material_type,
+        path_map=COMMERCIAL_RETRIEVAL_NODES + TECHNICAL_RETRIEVAL_NODES
+    )
 
-    builder.add_edge("commercial_web_search", "commercial_material_generate")
-    builder.add_edge("technical_web_search", "technical_material_generate")
+    # 两路检索都完成后再生成材料
+    builder.add_edge(COMMERCIAL_RETRIEVAL_NODES, "commercial_material_generate")
+    builder.add_edge(TECHNICAL_RETRIEVAL_NODES, "technical_material_generate")
 
-    # 商务和技术材料都生成完成后结束
-    builder.add_edge(["commercial_material_generate", "technical_material_generate"], END)
+    # 各分支生成完成后各自结束（未选中的分支不会执行）
+    builder.add_edge("commercial_material_generate", END)
+    builder.add_edge("technical_material_generate", END)
 
     # 编译图
     return builder.compile()
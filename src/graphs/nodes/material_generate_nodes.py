@@ -5,10 +5,10 @@
 import os
 import json
 import re
+from typing import List
 from jinja2 import Template
 from langchain_core.runnables import RunnableConfig
 from langgraph.runtime import Runtime
-from coze_coding_dev_sdk import SearchClient
 
 try:
     from coze_coding_utils.runtime_ctx.context import Context
@@ -35,7 +35,8 @@ from graphs.state_materials import (
     TechnicalMaterialGenerateInput,
     TechnicalMaterialGenerateOutput
 )
-from tools.knowledge_base_tool import KnowledgeBaseTool
+from tools.knowledge_base_tool import get_shared_knowledge_base
+from tools.web_search_tool import WebSearchTool
 from graphs.node import call_llm
 
 
@@ -103,11 +104,9 @@ def knowledge_base_search_node(
     """
     ctx = runtime.context
 
-    # 初始化知识库工具
-    kb_tool = KnowledgeBaseTool(state.knowledge_base_path)
-
-    # 扫描知识库目录
-    kb_tool.scan_directory()
+    # 获取进程内共享的知识库实例，并同步其他进程的索引更新（目录扫描在后台线程中进行）
+    kb_tool = get_shared_knowledge_base(state.knowledge_base_path)
+    kb_tool.ensure_fresh()
 
     # 执行搜索
     search_results = kb_tool.search(state.query, top_k=5)
@@ -140,6 +139,24 @@ def knowledge_base_search_node(
     )
 
 
+# 检索阶段各分支的节点：知识库检索与互联网搜索互不依赖，并行执行
+COMMERCIAL_RETRIEVAL_NODES = ["commercial_kb_search", "commercial_web_search"]
+TECHNICAL_RETRIEVAL_NODES = ["technical_kb_search", "technical_web_search"]
+
+
+def route_by_material_type(state: GlobalState) -> List[str]:
+    """
+    根据材料生成类型选择要执行的检索分支，未选中的分支（含其生成节点）不会执行
+
+    material_type 为 None（输入中显式传 null）时与 both 相同，两个分支都执行。
+    """
+    if state.material_type == "commercial":
+        return COMMERCIAL_RETRIEVAL_NODES
+    if state.material_type == "technical":
+        return TECHNICAL_RETRIEVAL_NODES
+    return COMMERCIAL_RETRIEVAL_NODES + TECHNICAL_RETRIEVAL_NODES
+
+
 def commercial_kb_search_node(
     state: CommercialKBSearchInput,
     config: RunnableConfig,
@@ -152,14 +169,12 @@ def commercial_kb_search_node(
     """
     ctx = runtime.context
 
-    # 初始化知识库工具
-    kb_tool = KnowledgeBaseTool(state.knowledge_base_path)
+    # 获取进程内共享的知识库实例，并同步其他进程的索引更新（目录扫描在后台线程中进行）
+    kb_tool = get_shared_knowledge_base(state.knowledge_base_path)
+    kb_tool.ensure_fresh()
 
-    # 扫描知识库目录
-    kb_tool.scan_directory()
-
-    # 执行搜索
-    search_results = kb_tool.search(state.commercial_requirements, top_k=5)
+    # 按需求条目拆分为子查询后批量检索
+    search_results = kb_tool.search_many([state.commercial_requirements], top_k=5)[0]
 
     # 标注素材出处
     for result in search_results:
@@ -197,14 +212,12 @@ def technical_kb_search_node(
     """
     ctx = runtime.context
 
-    # 初始化知识库工具
-    kb_tool = KnowledgeBaseTool(state.knowledge_base_path)
+    # 获取进程内共享的知识库实例，并同步其他进程的索引更新（目录扫描在后台线程中进行）
+    kb_tool = get_shared_knowledge_base(state.knowledge_base_path)
+    kb_tool.ensure_fresh()
 
-    # 扫描知识库目录
-    kb_tool.scan_directory()
-
-    # 执行搜索
-    search_results = kb_tool.search(state.technical_requirements, top_k=5)
+    # 按需求条目拆分为子查询后批量检索
+    search_results = kb_tool.search_many([state.technical_requirements], top_k=5)[0]
 
     # 标注素材出处
     for result in search_results:
@@ -242,32 +255,10 @@ def commercial_web_search_node(
     """
     ctx = runtime.context
 
-    # 获取查询词
-    query = state.commercial_requirements if state.commercial_requirements else "商务资质、项目经验、服务承诺"
-
-    # 调用联网搜索
-    try:
-        client = SearchClient(ctx=ctx)
-        response = client.web_search(
-            query=query,
-            count=5,
-            need_summary=True
-        )
-
-        # 提取搜索结果
-        search_results = []
-        if response.web_items:
-            for item in response.web_items:
-                search_results.append({
-                    'content': item.summary or item.snippet,
-                    'url': item.url,
-                    'title': item.title,
-                    'site_name': item.site_name,
-                    'source_type': 'web_search'
-                })
-    except Exception as e:
-        # 如果搜索失败，返回空结果
-        search_results = []
+    # 按需求条目拆分为多条查询并发搜索（带缓存），合并后按 URL 去重；搜索失败时返回空结果
+    search_results = WebSearchTool(ctx=ctx).search_requirements(
+        state.commercial_requirements, "商务资质、项目经验、服务承诺", count=5
+    )
 
     # 只返回商务搜索结果
     return CommercialWebSearchOutput(commercial_web_results=search_results)
@@ -285,32 +276,10 @@ def technical_web_search_node(
     """
     ctx = runtime.context
 
-    # 获取查询词
-    query = state.technical_requirements if state.technical_requirements else "技术方案、系统架构、实施方案"
-
-    # 调用联网搜索
-    try:
-        client = SearchClient(ctx=ctx)
-        response = client.web_search(
-            query=query,
-            count=5,
-            need_summary=True
-        )
-
-        # 提取搜索结果
-        search_results = []
-        if response.web_items:
-            for item in response.web_items:
-                search_results.append({
-                    'content': item.summary or item.snippet,
-                    'url': item.url,
-                    'title': item.title,
-                    'site_name': item.site_name,
-                    'source_type': 'web_search'
-                })
-    except Exception as e:
-        # 如果搜索失败，返回空结果
-        search_results = []
+    # 按需求条目拆分为多条查询并发搜索（带缓存），合并后按 URL 去重；搜索失败时返回空结果
+    search_results = WebSearchTool(ctx=ctx).search_requirements(
+        state.technical_requirements, "技术方案、系统架构、实施方案", count=5
+    )
 
     # 只返回技术搜索结果
     return TechnicalWebSearchOutput(technical_web_results=search_results)
@@ -333,33 +302,12 @@ def web_search_node(
     is_commercial = bool(state.commercial_kb_results or (state.commercial_requirements and not state.technical_requirements))
 
     if is_commercial:
-        query = state.commercial_requirements if state.commercial_requirements else "商务资质、项目经验、服务承诺"
+        requirements, default_query = state.commercial_requirements, "商务资质、项目经验、服务承诺"
     else:
-        query = state.technical_requirements if state.technical_requirements else "技术方案、系统架构、实施方案"
-
-    # 调用联网搜索
-    try:
-        client = SearchClient(ctx=ctx)
-        response = client.web_search(
-            query=query,
-            count=5,
-            need_summary=True
-        )
-
-        # 提取搜索结果
-        search_results = []
-        if response.web_items:
-            for item in response.web_items:
-                search_results.append({
-                    'content': item.summary or item.snippet,
-                    'url': item.url,
-                    'title': item.title,
-                    'site_name': item.site_name,
-                    'source_type': 'web_search'
-                })
-    except Exception as e:
-        # 如果搜索失败，返回空结果
-        search_results = []
+        requirements, default_query = state.technical_requirements, "技术方案、系统架构、实施方案"
+
+    # 按需求条目拆分为多条查询并发搜索（带缓存），合并后按 URL 去重；搜索失败时返回空结果
+    search_results = WebSearchTool(ctx=ctx).search_requirements(requirements, default_query, count=5)
 
     # 根据类型返回不同的字段
     if is_commercial:
@@ -393,7 +341,7 @@ def commercial_material_generate_node(
     kb_materials = ""
     if state.commercial_kb_results:
         kb_materials = "\n".join([
-            f"[本地知识库 - {r.get('source_doc', '')} - {r.get('source_page', 'N/A')}]: {r.get('content', '')[:800]}"
+            f"[本地知识库 - {r.get('source_doc', '')} - {r.get('source_page', 'N/A')}]: {(r.get('passage') or r.get('content', ''))[:800]}"
             for r in state.commercial_kb_results[:5]
         ])
 
@@ -446,7 +394,7 @@ def technical_material_generate_node(
     kb_materials = ""
     if state.technical_kb_results:
         kb_materials = "\n".join([
-            f"[本地知识库 - {r.get('source_doc', '')} - {r.get('source_page', 'N/A')}]: {r.get('content', '')[:800]}"
+            f"[本地知识库 - {r.get('source_doc', '')} - {r.get('source_page', 'N/A')}]: {(r.get('passage') or r.get('content', ''))[:800]}"
             for r in state.technical_kb_results[:5]
         ])
 
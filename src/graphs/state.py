@@ -24,6 +24,7 @@ class GlobalState(BaseModel):
 
     # 投标材料生成相关状态
     workflow_type: Literal["check", "generate"] = Field(default="check", description="工作流类型：check=检查，generate=生成材料")
+    material_type: Optional[Literal["commercial", "technical", "both"]] = Field(default="both", description="材料生成类型：commercial=商务材料，technical=技术材料，both=两者都生成（为空时同 both）")
     commercial_requirements: str = Field(default="", description="商务要求内容")
     technical_requirements: str = Field(default="", description="技术要求内容")
     commercial_template: str = Field(default="", description="商务材料模板（如果有）")
@@ -1,23 +1,30 @@
 import argparse
 import asyncio
 import json
+import os
+import sys
+import threading
 import traceback
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, Iterable, AsyncIterable, AsyncGenerator, Optional
-import threading
-import contextvars
 import cozeloop
 import uvicorn
 import time
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
 from langgraph.graph.state import CompiledStateGraph
+from langgraph.checkpoint.memory import MemorySaver
 
 from coze_coding_utils.runtime_ctx.context import new_context, Context
 from utils.helper import graph_helper
 from utils.log.node_log import LOG_FILE
+from utils.log.async_writer import get_log_writer, shutdown_log_writers
+from utils.log.payload_policy import format_payload_text
+from utils.log.timeline import RUN_TRACE_HEADER, tracing_requested, start_timeline, get_timeline, finish_timeline
 from utils.log.write_log import setup_logging, request_context
 from utils.log.config import LOG_LEVEL
 from utils.messages.server import (
@@ -26,6 +33,20 @@ from utils.messages.server import (
     MESSAGE_END_CODE_CANCELED,
 )
 from utils.error import ErrorClassifier, classify_error
+from utils.runs import (
+    get_run_registry,
+    current_worker_id,
+    RUN_STATUS_RUNNING,
+    RUN_STATUS_COMPLETED,
+    RUN_STATUS_CANCELLED,
+    RUN_STATUS_FAILED,
+    AdmissionController,
+    AdmissionRejected,
+    parse_priority,
+    PRIORITY_HEADER,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BATCH,
+)
 
 setup_logging(
     log_file=LOG_FILE,
@@ -41,15 +62,49 @@ from utils.helper.agent_helper import (
     to_stream_input,
     to_client_message,
     agent_iter_server_messages,
+    agent_aiter_server_messages,
 )
+from utils.helper.stream_helper import buffered_aiter, graph_max_fanout, install_sync_executor, sync_executor_size
 from utils.openai.handler import OpenAIChatHandler
-from utils.log.parser import LangGraphParser
+from utils.log.parser import get_graph_parser
 from utils.log.err_trace import extract_core_stack
 from utils.log.loop_trace import init_run_config, init_agent_config
+from utils.metrics import (
+    REGISTRY,
+    ADMISSION_QUEUE_WAIT,
+    SharedMetrics,
+    default_shared_dir,
+    METRICS_SHARED_DIR,
+    METRICS_SNAPSHOT_INTERVAL,
+)
+from utils.runs.resume import CheckpointNotFound, fork_for_rerun, load_resumable_state, snapshot_output
+from utils.jobs import (
+    get_job_store,
+    JobWorkerPool,
+    JOB_WORKER_CONCURRENCY,
+    JOB_STATUS_SUCCEEDED,
+    JOB_STATUS_FAILED,
+    JOB_STATUS_CANCELLED,
+)
 
 
 # 超时配置常量
 TIMEOUT_SECONDS = 900  # 15分钟
+# /run 是否默认写 checkpoint（开启后失败或中断的运行可通过 resume_run_id 续跑、单节点重跑）；
+# 关闭时也可按请求以查询参数 checkpoint=1 开启。成功结束的运行会删除其 checkpoint 线程
+RUN_CHECKPOINT_ENABLED = os.getenv("RUN_CHECKPOINT_ENABLED", "false").lower() in ("1", "true", "yes")
+# 启动时预编译全部单节点图（/node_run 首次调用不再有编译开销）
+NODE_GRAPH_WARMUP = os.getenv("NODE_GRAPH_WARMUP", "0") == "1"
+# 启用作业时要求持久化 checkpointer：为 true 时只能退化为 MemorySaver 则拒绝启动，否则只记录错误日志
+JOB_REQUIRE_PERSISTENT_CHECKPOINTER = os.getenv("JOB_REQUIRE_PERSISTENT_CHECKPOINTER", "false").lower() in ("1", "true", "yes")
+# HTTP worker 进程数
+HTTP_WORKERS = int(os.getenv("HTTP_WORKERS", "1"))
+# 轮询共享登记表中取消标志的间隔（秒）
+RUN_CANCEL_POLL_INTERVAL = float(os.getenv("RUN_CANCEL_POLL_INTERVAL", "0.5"))
+# 清理登记表中已结束记录的间隔（秒）
+RUN_REGISTRY_CLEANUP_INTERVAL = float(os.getenv("RUN_REGISTRY_CLEANUP_INTERVAL", "600"))
+# 共享登记表中本 worker 租约的续约间隔（秒），须明显小于 RUN_REGISTRY_LEASE_TTL
+RUN_REGISTRY_HEARTBEAT_INTERVAL = float(os.getenv("RUN_REGISTRY_HEARTBEAT_INTERVAL", "10"))
 
 class GraphService:
     def __init__(self):
@@ -58,6 +113,20 @@ class GraphService:
 
         # 用于跟踪正在运行的任务（使用asyncio.Task）
         self.running_tasks: Dict[str, asyncio.Task] = {}
+        # 运行登记表：多 worker 时跨进程共享 run 的归属与取消标志
+        self.run_registry = get_run_registry()
+        # 登记表写入（SQLite 后端有磁盘 I/O）在单线程中按提交顺序执行：不阻塞事件循环，且 finish 不会先于 register
+        self._registry_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="run-registry")
+        self.worker_id = current_worker_id()
+        # 作业与 /run 使用的带 checkpointer 的图（延迟编译）
+        self._checkpoint_graph: Optional[CompiledStateGraph] = None
+        self._checkpoint_graph_lock = threading.Lock()
+        # 单节点图缓存：node_id -> 编译后的单节点图（节点不存在时为 None）
+        self._node_graphs: Dict[str, Optional[CompiledStateGraph]] = {}
+        self._node_graphs_owner: Optional[CompiledStateGraph] = None
+        self._node_graphs_lock = threading.Lock()
+        # /graph_parameter 出入参 Schema 缓存：(图, schema)
+        self._inout_schema: Optional[tuple] = None
         # 错误分类器
         self.error_classifier = ErrorClassifier()
 
@@ -67,7 +136,116 @@ class GraphService:
             return graph_helper.get_agent_instance("agents.agent", ctx)
         else:
             return self.graph
-    
+
+    async def _registry_call(self, func, *args, **kwargs):
+        """在登记表专用线程中执行 func，返回其结果；失败只记录日志并返回 None"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._registry_executor, lambda: func(*args, **kwargs))
+        except Exception as e:
+            logger.warning(f"Run registry {func.__name__} failed: {e}")
+            return None
+
+    async def track_run(self, run_id: str, task: asyncio.Task, method: str = ""):
+        """登记正在运行的任务：本进程记录 Task，共享登记表记录归属 worker"""
+        self.running_tasks[run_id] = task
+        await self._registry_call(self.run_registry.register, run_id, method=method, worker_id=self.worker_id)
+
+    async def untrack_run(self, run_id: str, status: str = RUN_STATUS_COMPLETED, message: str = ""):
+        """清理任务记录并在登记表中标记结束状态"""
+        # 图未正常走到结束回调（如被取消）时由这里收尾时间线
+        finish_timeline(run_id)
+        if self.running_tasks.pop(run_id, None) is None:
+            return
+        await self._registry_call(self.run_registry.finish, run_id, status=status, message=message)
+
+    async def watch_cancellations(self):
+        """
+        轮询共享登记表，取消其他 worker 转发过来的、属于本进程的 run
+
+        /cancel 请求可能落在任意 worker 上，不持有该 run 的 worker 只设置取消标志，
+        由持有者在这里发现并调用 Task.cancel()。
+        """
+        logger.info(f"Watching run cancellations for worker {self.worker_id}")
+        while True:
+            await asyncio.sleep(RUN_CANCEL_POLL_INTERVAL)
+            try:
+                if not self.running_tasks:
+                    continue
+                run_ids = await asyncio.to_thread(self.run_registry.pending_cancels, self.worker_id)
+                for run_id in run_ids:
+                    task = self.running_tasks.get(run_id)
+                    if task is not None and not task.done():
+                        task.cancel()
+                        logger.info(f"Cancelled run_id {run_id} from shared registry")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to poll run registry: {e}")
+
+    async def prune_run_registry(self):
+        """
+        登记表定时任务（所有后端，内存实现否则会无限增长）：
+
+        - 每 RUN_REGISTRY_HEARTBEAT_INTERVAL 续约本 worker 的租约（在登记表专用线程中执行，不受默认线程池排队影响）
+        - 每 RUN_REGISTRY_CLEANUP_INTERVAL 把租约过期的 worker 遗留的 running 记录标记为 failed，并删除结束超过保留时间的记录
+        """
+        claimed = await self._registry_call(self.run_registry.claim_worker, self.worker_id)
+        if claimed:
+            logger.warning(f"Marked {claimed} runs of a previous process with worker id {self.worker_id} as failed")
+        interval = max(0.1, min(RUN_REGISTRY_HEARTBEAT_INTERVAL, RUN_REGISTRY_CLEANUP_INTERVAL))
+        next_cleanup = time.monotonic() + RUN_REGISTRY_CLEANUP_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            await self._registry_call(self.run_registry.heartbeat, self.worker_id)
+            if time.monotonic() < next_cleanup:
+                continue
+            next_cleanup = time.monotonic() + RUN_REGISTRY_CLEANUP_INTERVAL
+            try:
+                removed = await asyncio.to_thread(self.run_registry.cleanup)
+                if removed:
+                    logger.info(f"Pruned {removed} finished runs from registry")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to prune run registry: {e}")
+
+    async def collect_checkpoint_garbage(self):
+        """
+        定期回收 checkpoint 大字段（BlobDedupSaver）中不再被任何线程引用的内容
+
+        删除线程时只删除引用，内容统一在这里回收；只处理已创建的 checkpointer，不为此连接数据库。
+        """
+        from storage.memory.blob_saver import BlobDedupSaver, CHECKPOINT_BLOB_GC_INTERVAL
+        while True:
+            await asyncio.sleep(CHECKPOINT_BLOB_GC_INTERVAL)
+            graph = self._checkpoint_graph
+            if graph is not None and isinstance(graph.checkpointer, BlobDedupSaver):
+                await graph.checkpointer.acollect_garbage()
+
+    def get_run_status(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """查询 run 的状态（任意 worker 均可查询）"""
+        run = self.run_registry.get(run_id)
+        if run is not None:
+            run["local"] = run_id in self.running_tasks
+        return run
+
+    def resume_conflict(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """
+        续跑前检查原运行是否仍在执行：仍由存活的 worker 执行时返回其登记记录，否则返回 None
+
+        执行者租约过期的记录已由登记表标记为 failed；本进程登记为 running 却已没有对应任务的记录
+        （任务未收尾就丢失）在这里标记为 failed，二者都允许续跑。
+        """
+        run = self.get_run_status(run_id)
+        if run is None or run.get("status") != RUN_STATUS_RUNNING:
+            return None
+        if run.get("worker_id") == self.worker_id and not run.get("local"):
+            self.run_registry.finish(run_id, RUN_STATUS_FAILED, message=f"worker {self.worker_id} lost the task")
+            logger.warning(f"Run {run_id} is registered as running but has no task in this worker, resuming it")
+            return None
+        return run
+
     
     @staticmethod
     def _sse_event(data: Any) -> str:
@@ -122,27 +300,69 @@ class GraphService:
             yield error_msg
 
     # 同步运行：本地/HTTP 通用
-    async def run(self, payload: Dict[str, Any], ctx=None) -> Dict[str, Any]:
+    async def run(
+        self,
+        payload: Dict[str, Any],
+        ctx=None,
+        resume_run_id: Optional[str] = None,
+        rerun_node: Optional[str] = None,
+        checkpoint: bool = RUN_CHECKPOINT_ENABLED,
+    ) -> Dict[str, Any]:
+        """
+        运行图
+
+        Args:
+            resume_run_id: 从该运行最后一个 checkpoint 续跑（只执行失败或未执行的节点），此时忽略 payload
+            rerun_node: 与 resume_run_id 同时给出时，以 payload 为新输入重跑该节点及其下游
+            checkpoint: 是否写 checkpoint（续跑时总是使用）；成功结束后删除该线程，失败或取消的保留以便续跑
+        """
         if ctx is None:
             ctx = new_context("run")
 
         run_id = ctx.run_id
         logger.info(f"Starting run with run_id: {run_id}")
+        status = RUN_STATUS_COMPLETED
 
         try:
             graph = self._get_graph(ctx)
+            graph_input: Optional[Dict[str, Any]] = payload
+            configurable: Dict[str, Any] = {"thread_id": ctx.run_id}
+            checkpointed = not graph_helper.is_agent_proj() and bool(checkpoint or resume_run_id)
+            if checkpointed:
+                graph = await self._get_checkpoint_graph()
+            if resume_run_id and rerun_node:
+                fork = await fork_for_rerun(graph, resume_run_id, rerun_node, payload)
+                configurable = dict(fork["configurable"])
+                graph_input = None
+                logger.info(f"Run {run_id} reruns node '{rerun_node}' of run {resume_run_id}")
+            elif resume_run_id:
+                snapshot = await load_resumable_state(graph, resume_run_id)
+                if not snapshot.next:
+                    logger.info(f"Run {resume_run_id} already completed, returning its checkpointed output")
+                    output = snapshot_output(graph, snapshot)
+                    await self._delete_thread(graph, resume_run_id)
+                    return output
+                configurable = {"thread_id": resume_run_id}
+                graph_input = None
+                logger.info(f"Run {run_id} resumes run {resume_run_id}, next nodes: {list(snapshot.next)}")
             # custom tracer
             run_config = init_run_config(graph, ctx)
-            run_config["configurable"] = {"thread_id": ctx.run_id}
+            run_config["configurable"] = configurable
 
             # 直接调用，LangGraph会在当前任务上下文中执行
             # 如果当前任务被取消，LangGraph的执行也会被取消
-            return await graph.ainvoke(payload, config=run_config, context=ctx)
+            output = await graph.ainvoke(graph_input, config=run_config, context=ctx)
+            if checkpointed:
+                # 成功结束后不再需要续跑，删除 checkpoint（含标书全文的各步状态）
+                await self._delete_thread(graph, configurable["thread_id"])
+            return output
 
         except asyncio.CancelledError:
             logger.info(f"Run {run_id} was cancelled")
+            status = RUN_STATUS_CANCELLED
             return {"status": "cancelled", "run_id": run_id, "message": "Execution was cancelled"}
         except Exception as e:
+            status = RUN_STATUS_FAILED
             # 使用错误分类器分类错误
             err = self.error_classifier.classify(e, {"node_name": "run", "run_id": run_id})
             # 记录详细的错误信息和堆栈跟踪
@@ -155,7 +375,7 @@ class GraphService:
             raise
         finally:
             # 清理任务记录
-            self.running_tasks.pop(run_id, None)
+            await self.untrack_run(run_id, status)
 
     # 流式运行（SSE 格式化）：HTTP 路由使用
     async def stream_sse(self, payload: Dict[str, Any], ctx=None) -> AsyncGenerator[str, None]:
@@ -170,12 +390,19 @@ class GraphService:
         else:
             run_config = init_run_config(graph, ctx)  # vibeflow
 
+        status = RUN_STATUS_COMPLETED
         try:
             async for chunk in self.astream(payload, graph, run_config=run_config, ctx=ctx):
                 yield self._sse_event(chunk)
+        except asyncio.CancelledError:
+            status = RUN_STATUS_CANCELLED
+            raise
+        except Exception:
+            status = RUN_STATUS_FAILED
+            raise
         finally:
             # 清理任务记录
-            self.running_tasks.pop(run_id, None)
+            await self.untrack_run(run_id, status)
             cozeloop.flush()
 
     # 取消执行 - 使用asyncio的标准方式
@@ -208,6 +435,23 @@ class GraphService:
                     "run_id": run_id,
                     "message": "Task has already completed"
                 }
+        # 不在本进程：通过共享登记表设置取消标志，由持有该 run 的 worker 轮询后取消
+        run = self.run_registry.request_cancel(run_id)
+        if run is not None:
+            if run["status"] == RUN_STATUS_RUNNING:
+                logger.info(f"Cancellation forwarded to worker {run['worker_id']} for run_id: {run_id}")
+                return {
+                    "status": "success",
+                    "run_id": run_id,
+                    "message": f"Cancellation signal forwarded to worker {run['worker_id']}"
+                }
+            logger.info(f"Task already {run['status']} for run_id: {run_id}")
+            # 持有者已退出（租约过期）的 run 已被标记为 failed，返回其原因而不是报告取消成功
+            return {
+                "status": "already_completed",
+                "run_id": run_id,
+                "message": run.get("message") or "Task has already completed"
+            }
         else:
             logger.warning(f"No active task found for run_id: {run_id}")
             return {
@@ -216,35 +460,153 @@ class GraphService:
                 "message": "No active task found with this run_id. Task may have already completed or run_id is invalid."
             }
 
+    def _get_node_graph(self, node_id: str) -> Optional[CompiledStateGraph]:
+        """
+        获取单节点图（按 node_id 缓存）
+
+        节点函数与出入参类的提取（可能涉及 inspect.getsource + ast.parse）、节点元数据解析和
+        StateGraph 编译只在首次调用时执行；self.graph 被替换后缓存整体失效。
+        """
+        if self._node_graphs_owner is not self.graph:
+            with self._node_graphs_lock:
+                if self._node_graphs_owner is not self.graph:
+                    self._node_graphs = {}
+                    self._node_graphs_owner = self.graph
+        if node_id in self._node_graphs:
+            return self._node_graphs[node_id]
+
+        with self._node_graphs_lock:
+            if node_id in self._node_graphs:
+                return self._node_graphs[node_id]
+            node_func, input_cls, output_cls = graph_helper.get_graph_node_func_with_inout(
+                self.graph.get_graph(), node_id
+            )
+            _graph = None
+            if node_func is not None and input_cls is not None:
+                metadata = get_graph_parser(self.graph).get_node_metadata(node_id) or {}
+                _g = StateGraph(input_cls, input_schema=input_cls, output_schema=output_cls)
+                _g.add_node("sn", node_func, metadata=metadata)
+                _g.set_entry_point("sn")
+                _g.add_edge("sn", END)
+                _graph = _g.compile()
+            self._node_graphs[node_id] = _graph
+            return _graph
+
+    def warm_node_graphs(self) -> int:
+        """预编译全部节点的单节点图，返回编译成功的数量"""
+        if graph_helper.is_agent_proj():
+            return 0
+        count = 0
+        for node_id, node in self.graph.get_graph().nodes.items():
+            if node.data is None or not hasattr(node.data, "func"):
+                continue
+            try:
+                if self._get_node_graph(node.data.func.__name__) is not None:
+                    count += 1
+            except Exception as e:
+                logger.warning(f"Failed to precompile node graph {node_id}: {e}")
+        return count
+
     # 运行指定节点：本地/HTTP 通用
     async def run_node(self, node_id: str, payload: Dict[str, Any], ctx=None) -> Any:
         if ctx is None or Context.run_id == "":
             ctx = new_context(method="node_run")
 
-        node_func, input_cls, output_cls = graph_helper.get_graph_node_func_with_inout(self.graph.get_graph(), node_id)
-        if node_func is None or input_cls is None:
-            raise KeyError(f"node_id '{node_id}' not found")
         assert self.graph is not None, "Graph is not initialized"
-        parser = LangGraphParser(self.graph)
-        metadata = parser.get_node_metadata(node_id) or {}
-
-        _g = StateGraph(input_cls, input_schema=input_cls, output_schema=output_cls)
-        _g.add_node("sn", node_func, metadata=metadata)
-        _g.set_entry_point("sn")
-        _g.add_edge("sn", END)
-        _graph = _g.compile()
+        _graph = self._get_node_graph(node_id)
+        if _graph is None:
+            raise KeyError(f"node_id '{node_id}' not found")
 
         run_config = init_run_config(_graph, ctx)
         return await _graph.ainvoke(payload, config=run_config)
 
-    # 获取工作流的出入参Schema
+    # 获取工作流的出入参Schema（按图缓存）
     def graph_inout_schema(self) -> Any:
         if graph_helper.is_agent_proj():
             return {"input_schema": {}, "output_schema": {}}
+        cached = self._inout_schema
+        if cached is not None and cached[0] is self.graph:
+            return cached[1]
         _graph_input = self.graph.get_input_schema()
         _graph_output = self.graph.get_output_schema()
 
-        return {"input_schema": _graph_input.model_json_schema(), "output_schema": _graph_output.model_json_schema()}
+        schema = {"input_schema": _graph_input.model_json_schema(), "output_schema": _graph_output.model_json_schema()}
+        self._inout_schema = (self.graph, schema)
+        return schema
+
+    def build_checkpoint_graph(self) -> CompiledStateGraph:
+        """
+        编译带 checkpointer 的图（作业与 /run 使用）：同一个 builder 编译并挂载 checkpointer，每个 superstep 后持久化状态
+
+        首次调用会获取数据库地址、带重试地建表，可能阻塞数十秒，须在线程中调用（见 _get_checkpoint_graph）。
+        """
+        with self._checkpoint_graph_lock:
+            if self._checkpoint_graph is None:
+                from storage.memory.memory_saver import get_memory_saver
+                self._checkpoint_graph = self.graph.builder.compile(checkpointer=get_memory_saver())
+        return self._checkpoint_graph
+
+    async def _get_checkpoint_graph(self) -> CompiledStateGraph:
+        """带 checkpointer 的图；尚未创建时在线程中创建，不阻塞事件循环"""
+        if self._checkpoint_graph is None:
+            return await asyncio.to_thread(self.build_checkpoint_graph)
+        return self._checkpoint_graph
+
+    @staticmethod
+    async def _delete_thread(graph: CompiledStateGraph, thread_id: str):
+        """删除 checkpoint 线程，失败只记录日志"""
+        if graph.checkpointer is None:
+            return
+        try:
+            await graph.checkpointer.adelete_thread(thread_id)
+        except Exception as e:
+            logger.warning(f"Failed to delete checkpoint thread {thread_id}: {e}")
+
+    # 执行作业：thread_id 默认即 job_id，已有未完成的 checkpoint 时从中断处续跑
+    async def run_job(self, job: Dict[str, Any], on_node) -> Dict[str, Any]:
+        job_id = job["job_id"]
+        ctx = new_context(method="job")
+        ctx.run_id = job_id
+        request_context.set(ctx)
+        if tracing_requested(None):
+            start_timeline(job_id)
+
+        graph = await self._get_checkpoint_graph()
+        run_config = init_run_config(graph, ctx)
+        # 以 resume_run_id 提交的作业续跑指定运行的 checkpoint 线程
+        thread_id = job.get("thread_id") or job_id
+        run_config["configurable"] = {"thread_id": thread_id}
+
+        graph_input: Optional[Dict[str, Any]] = job["payload"]
+        snapshot = await graph.aget_state(run_config)
+        if snapshot.next:
+            logger.info(f"Resuming job {job_id} from checkpoint {thread_id}, next nodes: {list(snapshot.next)}")
+            graph_input = None
+        elif snapshot.values:
+            # 上次执行已跑完但结果未写入作业库
+            return snapshot_output(graph, snapshot)
+
+        output: Dict[str, Any] = {}
+        try:
+            async for mode, chunk in graph.astream(
+                graph_input, config=run_config, stream_mode=["updates", "values"], context=ctx
+            ):
+                if mode == "updates":
+                    for node_name in chunk:
+                        if not node_name.startswith("__"):
+                            await on_node(node_name)
+                else:
+                    output = chunk
+        finally:
+            cozeloop.flush()
+        return output
+
+    async def cleanup_job(self, job_id: str, status: str):
+        """作业结束后删除其 checkpoint（失败的作业保留，便于排查）"""
+        if status == JOB_STATUS_FAILED:
+            return
+        job = await asyncio.to_thread(get_job_store().get, job_id)
+        await self._delete_thread(await self._get_checkpoint_graph(), (job or {}).get("thread_id") or job_id)
 
     async def astream(self, payload: Dict[str, Any], graph: CompiledStateGraph, run_config: RunnableConfig, ctx=Context) -> AsyncIterable[Any]:
         client_msg, session_id = to_client_message(payload)
@@ -252,111 +614,286 @@ class GraphService:
         run_config["configurable"] = {"thread_id": session_id}
         stream_input = to_stream_input(client_msg)
 
-        # 使用后台线程拉取同步流，并通过事件循环安全地推送到异步队列
-        loop = asyncio.get_running_loop()
-        q: asyncio.Queue = asyncio.Queue()
-        context = contextvars.copy_context()
         start_time = time.time()
-        # 取消标志，用于通知 producer 线程停止
-        cancelled = threading.Event()
-
-        def producer():
-            last_seq = 0
-            try:
-                # 在开始前检查是否已取消
-                if cancelled.is_set():
-                    logger.info(f"Producer cancelled before start for run_id: {ctx.run_id}")
-                    return
-
-                items = graph.stream(stream_input, stream_mode="messages", config=run_config, context=ctx)
-                server_msgs_iter = agent_iter_server_messages(
-                    items,
-                    session_id=client_msg.session_id,
-                    query_msg_id=client_msg.local_msg_id,
-                    local_msg_id=client_msg.local_msg_id,
-                    run_id=ctx.run_id,
-                    log_id=ctx.logid,
-                )
-                for sm in server_msgs_iter:
-                    # 检查是否已取消
-                    if cancelled.is_set():
-                        logger.info(f"Producer cancelled during iteration for run_id: {ctx.run_id}")
-                        # 发送取消结束消息
-                        cancel_msg = create_message_end_dict(
-                            code=MESSAGE_END_CODE_CANCELED,
-                            message="Stream cancelled by upstream",
-                            session_id=client_msg.session_id,
-                            query_msg_id=client_msg.local_msg_id,
-                            log_id=ctx.logid,
-                            time_cost_ms=int((time.time() - start_time) * 1000),
-                            reply_id=getattr(sm, 'reply_id', ''),
-                            sequence_id=last_seq + 1,
-                        )
-                        loop.call_soon_threadsafe(q.put_nowait, cancel_msg)
-                        return
-
-                    # 主动检查执行时间，及时中断
-                    if time.time() - start_time > TIMEOUT_SECONDS:
-                        logger.error(f"Agent execution timeout after {TIMEOUT_SECONDS}s for run_id: {ctx.run_id}")
-                        timeout_msg = create_message_end_dict(
-                            code="TIMEOUT",
-                            message=f"Execution timeout: exceeded {TIMEOUT_SECONDS} seconds",
-                            session_id=client_msg.session_id,
-                            query_msg_id=client_msg.local_msg_id,
-                            log_id=ctx.logid,
-                            time_cost_ms=int((time.time() - start_time) * 1000),
-                            reply_id=getattr(sm, 'reply_id', ''),
-                            sequence_id=last_seq + 1,
-                        )
-                        loop.call_soon_threadsafe(q.put_nowait, timeout_msg)
-                        return
-                    loop.call_soon_threadsafe(q.put_nowait, sm.dict())
-                    last_seq = sm.sequence_id
-            except Exception as ex:
-                # 如果已取消，不再发送错误消息
-                if cancelled.is_set():
-                    logger.info(f"Producer exception after cancel for run_id: {ctx.run_id}, ignoring: {ex}")
-                    return
-                # 使用错误分类器获取错误码
-                err = classify_error(ex, {"node_name": "astream"})
-                end_msg = create_message_end_dict(
-                    code=str(err.code),
-                    message=err.message,
-                    session_id=client_msg.session_id,
-                    query_msg_id=client_msg.local_msg_id,
-                    log_id=ctx.logid,
-                    time_cost_ms=int((time.time() - start_time) * 1000),
-                    reply_id="",
-                    sequence_id=last_seq + 1,
-                )
-                loop.call_soon_threadsafe(q.put_nowait, end_msg)
-            finally:
-                loop.call_soon_threadsafe(q.put_nowait, None)
-
-        threading.Thread(target=lambda: context.run(producer), daemon=True).start()
+        last_seq = 0
+        reply_id = ""
+
+        # 在事件循环上原生执行 graph.astream，同步节点由 LangGraph 交给固定大小的默认线程池（见 install_sync_executor）
+        items = graph.astream(stream_input, stream_mode="messages", config=run_config, context=ctx)
+        server_msgs_iter = agent_aiter_server_messages(
+            items,
+            session_id=client_msg.session_id,
+            query_msg_id=client_msg.local_msg_id,
+            local_msg_id=client_msg.local_msg_id,
+            run_id=ctx.run_id,
+            log_id=ctx.logid,
+        )
 
         try:
-            while True:
-                item = await q.get()
-                if item is None:
-                    break
-                yield item
+            # 经有界队列转发：客户端读取慢时图的执行暂停，超过 TIMEOUT_SECONDS 时中断
+            async for sm in buffered_aiter(server_msgs_iter, deadline=start_time + TIMEOUT_SECONDS):
+                last_seq = sm.sequence_id
+                reply_id = getattr(sm, 'reply_id', '')
+                yield sm.dict()
+        except asyncio.TimeoutError:
+            logger.error(f"Agent execution timeout after {TIMEOUT_SECONDS}s for run_id: {ctx.run_id}")
+            yield create_message_end_dict(
+                code="TIMEOUT",
+                message=f"Execution timeout: exceeded {TIMEOUT_SECONDS} seconds",
+                session_id=client_msg.session_id,
+                query_msg_id=client_msg.local_msg_id,
+                log_id=ctx.logid,
+                time_cost_ms=int((time.time() - start_time) * 1000),
+                reply_id=reply_id,
+                sequence_id=last_seq + 1,
+            )
         except asyncio.CancelledError:
-            logger.info(f"Stream cancelled for run_id: {ctx.run_id}, signaling producer to stop")
-            # 设置取消标志，通知 producer 线程停止
-            cancelled.set()
+            logger.info(f"Stream cancelled for run_id: {ctx.run_id}")
             raise
+        except Exception as ex:
+            # 使用错误分类器获取错误码
+            err = classify_error(ex, {"node_name": "astream"})
+            yield create_message_end_dict(
+                code=str(err.code),
+                message=err.message,
+                session_id=client_msg.session_id,
+                query_msg_id=client_msg.local_msg_id,
+                log_id=ctx.logid,
+                time_cost_ms=int((time.time() - start_time) * 1000),
+                reply_id="",
+                sequence_id=last_seq + 1,
+            )
 
 
 service = GraphService()
 app = FastAPI()
 
+
+@app.on_event("startup")
+async def install_graph_executor():
+    # 同步节点使用固定大小的线程池，而不是每个流式请求一个线程；
+    # 大小按 同时执行的图运行数（准入并发 + 作业并发）× 图的最大扇出 计算，并行分支不会因线程不足而排队
+    fanout = 1 if graph_helper.is_agent_proj() else graph_max_fanout(service.graph)
+    executor = install_sync_executor(
+        max_workers=sync_executor_size(admission.max_concurrency + max(0, JOB_WORKER_CONCURRENCY), fanout)
+    )
+    REGISTRY.gauge(
+        "graph_executor_tasks",
+        "Tasks in the sync node / to_thread executor by state",
+        lambda: {(state,): executor.stats()[state] for state in ("active", "queued")},
+        ["state"],
+    )
+    REGISTRY.gauge("graph_executor_max_workers", "Sync node / to_thread executor size", lambda: executor.max_workers)
+
+
+@app.on_event("startup")
+async def warm_graph_caches():
+    # 预先计算 /graph_parameter 的 Schema；NODE_GRAPH_WARMUP=1 时同时预编译全部单节点图
+    if graph_helper.is_agent_proj():
+        return
+    service.graph_inout_schema()
+    if NODE_GRAPH_WARMUP:
+        count = await asyncio.to_thread(service.warm_node_graphs)
+        logger.info(f"Precompiled {count} single-node graphs")
+
+
+@app.on_event("startup")
+async def warm_checkpointer():
+    # 默认写 checkpoint 或启用作业时，启动阶段在线程中创建 checkpointer（连接数据库、建表），不在请求路径上首次创建
+    if graph_helper.is_agent_proj() or not (RUN_CHECKPOINT_ENABLED or JOB_WORKER_CONCURRENCY > 0):
+        return
+    await asyncio.to_thread(service.build_checkpoint_graph)
+
+
+@app.on_event("startup")
+async def start_checkpoint_gc():
+    # checkpoint 大字段去重时定期回收无引用的内容（不在每次运行结束时执行）
+    if graph_helper.is_agent_proj():
+        return
+    app.state.checkpoint_gc = asyncio.create_task(service.collect_checkpoint_garbage())
+
+
+@app.on_event("startup")
+async def start_cancel_watcher():
+    # 多 worker 共享登记表时，轮询转发给本进程的取消请求；任何后端都定期续约本 worker 租约并清理已结束的记录
+    if service.run_registry.shared:
+        app.state.cancel_watcher = asyncio.create_task(service.watch_cancellations())
+    app.state.registry_pruner = asyncio.create_task(service.prune_run_registry())
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    # 持久化作业的 worker 池（智能体项目不支持作业模式）
+    if graph_helper.is_agent_proj() or JOB_WORKER_CONCURRENCY <= 0:
+        return
+    # MemorySaver 的 checkpoint 只在本进程内存中：进程退出后被回收的作业只能从头重跑，其他 worker 也无法续跑
+    graph = await service._get_checkpoint_graph()
+    if isinstance(graph.checkpointer, MemorySaver):
+        message = (
+            f"Job workers enabled (JOB_WORKER_CONCURRENCY={JOB_WORKER_CONCURRENCY}) but the checkpointer is an "
+            "in-process MemorySaver: reclaimed jobs restart from scratch. Configure the database or set "
+            "JOB_WORKER_CONCURRENCY=0"
+        )
+        if JOB_REQUIRE_PERSISTENT_CHECKPOINTER:
+            raise RuntimeError(message)
+        logger.error(message)
+    app.state.job_pool = JobWorkerPool(
+        get_job_store(),
+        service.run_job,
+        worker_id=service.worker_id,
+        on_finished=service.cleanup_job,
+    )
+    app.state.job_pool.start()
+    REGISTRY.gauge("job_active", "Jobs executing in this process", lambda: app.state.job_pool.active_jobs)
+
+
+@app.on_event("startup")
+async def start_metrics_snapshots():
+    # 多 worker 部署（或设置了 METRICS_SHARED_DIR）时定期写出本进程的指标快照，/metrics 合并所有 worker 的快照
+    if HTTP_WORKERS <= 1 and not METRICS_SHARED_DIR:
+        return
+    shared = SharedMetrics(REGISTRY, default_shared_dir(), service.worker_id)
+    app.state.shared_metrics = shared
+
+    async def snapshot_loop():
+        while True:
+            try:
+                await asyncio.to_thread(shared.write_snapshot)
+            except Exception as e:
+                logger.warning(f"Failed to write metrics snapshot: {e}")
+            await asyncio.sleep(METRICS_SNAPSHOT_INTERVAL)
+
+    app.state.metrics_snapshots = asyncio.create_task(snapshot_loop())
+
+
+@app.on_event("shutdown")
+async def stop_metrics_snapshots():
+    # 停止写快照并删除本进程的快照，退出的 worker 不再出现在合并结果中
+    task = getattr(app.state, "metrics_snapshots", None)
+    if task is not None:
+        task.cancel()
+        app.state.shared_metrics.remove_snapshot()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    # 运行中的作业放回队列，重启后从 checkpoint 续跑
+    job_pool = getattr(app.state, "job_pool", None)
+    if job_pool is not None:
+        await job_pool.stop()
+
+
+@app.on_event("shutdown")
+async def close_database_pool():
+    # 作业停止后关闭共享的异步连接池（未使用过数据库时不导入）
+    db = sys.modules.get("storage.database.db")
+    if db is not None:
+        await db.close_async_pool()
+
+
+@app.on_event("shutdown")
+async def flush_event_logs():
+    # 写完缓冲区中的事件日志（须在其它关闭钩子之后，以免丢掉它们产生的日志）
+    await asyncio.to_thread(shutdown_log_writers)
+
 # OpenAI 兼容接口处理器
 openai_handler = OpenAIChatHandler(service)
 
+# 准入控制：限制本进程同时执行的图运行数，超出的请求按优先级排队或返回 429
+admission = AdmissionController()
+
+
+# 瞬时值指标：导出时读取
+REGISTRY.gauge("admission_in_flight", "Graph runs currently executing in this process", lambda: admission.in_flight)
+REGISTRY.gauge(
+    "admission_queue_depth",
+    "Requests waiting for an execution slot",
+    lambda: {(k,): v for k, v in admission.stats()["queue_depth_by_priority"].items()},
+    ["priority"],
+)
+REGISTRY.gauge("graph_running_tasks", "Runs registered for cancellation in this process", lambda: len(service.running_tasks))
+REGISTRY.gauge("log_buffer_depth", "Event log entries waiting to be written", lambda: get_log_writer(LOG_FILE).stats()["buffered"])
+
+
+async def _admit(request: Request, default_priority: str, run_id: str) -> float:
+    """
+    为请求获取执行名额
+
+    优先级取自请求头 X-Request-Priority（interactive / batch），未设置时使用接口默认值。
+
+    Returns:
+        获得名额的时间，归还名额时用于统计运行耗时
+    """
+    priority = parse_priority(request.headers.get(PRIORITY_HEADER), default_priority)
+    wait_start = time.time()
+    try:
+        await admission.acquire(priority)
+    except AdmissionRejected as e:
+        ADMISSION_QUEUE_WAIT.observe(time.time() - wait_start, priority=priority, outcome=e.reason)
+        logger.warning(
+            f"Request rejected by admission control: run_id={run_id}, priority={priority}, "
+            f"reason={e.reason}, stats={admission.stats()}"
+        )
+        raise HTTPException(
+            status_code=429,
+            detail={"error_code": "TOO_MANY_REQUESTS", "reason": e.reason, "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    admitted_at = time.time()
+    ADMISSION_QUEUE_WAIT.observe(admitted_at - wait_start, priority=priority, outcome="admitted")
+    return admitted_at
+
+
+def _release_after_stream(response: StreamingResponse, admitted_at: float) -> StreamingResponse:
+    """流式响应结束（或客户端断开）后归还执行名额，保证只归还一次"""
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(time.time() - admitted_at)
+
+    body_iterator = response.body_iterator
+
+    async def guarded():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            release()
+
+    response.body_iterator = guarded()
+    # 生成器未被迭代就断开时，由后台任务兜底
+    background = response.background
+
+    async def release_in_background():
+        release()
+        if background is not None:
+            await background()
+
+    response.background = BackgroundTask(release_in_background)
+    return response
+
+
+def _start_trace(request: Request, run_id: str) -> bool:
+    """按全局开关或 X-Run-Trace 请求头为本次运行开启耗时时间线（GET /runs/{run_id}/trace 导出）"""
+    if not tracing_requested(request.headers.get(RUN_TRACE_HEADER)):
+        return False
+    start_timeline(run_id)
+    return True
+
 
 @app.post("/run")
-async def http_run(request: Request) -> Dict[str, Any]:
+async def http_run(request: Request, response: Response) -> Dict[str, Any]:
+    """
+    同步运行图
+
+    查询参数：
+    - resume_run_id：从该运行最后一个 checkpoint 续跑，已成功的节点不再执行（请求体可为空）
+    - rerun_node：与 resume_run_id 一起使用，以请求体为新输入重跑该节点及其下游
+    - checkpoint：1 / true 时本次运行写 checkpoint（RUN_CHECKPOINT_ENABLED 未开启时按请求开启），失败后可续跑
+    """
     global result
     raw_body = await request.body()
     try:
@@ -369,20 +906,43 @@ async def http_run(request: Request) -> Dict[str, Any]:
     ctx = new_context(method="run", headers=request.headers)
     run_id = ctx.run_id
     request_context.set(ctx)
+    response.headers["X-Run-Id"] = run_id
 
     logger.info(
         f"Received request for /run: "
         f"run_id={run_id}, "
         f"query={dict(request.query_params)}, "
-        f"body={body_text}"
+        f"body={format_payload_text(body_text, run_id)}"
     )
 
+    resume_run_id = request.query_params.get("resume_run_id") or None
+    rerun_node = request.query_params.get("rerun_node") or None
+    checkpoint = RUN_CHECKPOINT_ENABLED or (
+        request.query_params.get("checkpoint", "").lower() in ("1", "true", "yes")
+    )
+    if rerun_node and not resume_run_id:
+        raise HTTPException(status_code=400, detail="rerun_node requires resume_run_id")
+    if resume_run_id:
+        running = await asyncio.to_thread(service.resume_conflict, resume_run_id)
+        if running is not None:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Run is still running on worker {running.get('worker_id')}: {resume_run_id} "
+                       f"(it can be resumed once it ends or the worker's lease expires)",
+            )
+
+    admitted_at = await _admit(request, PRIORITY_BATCH, run_id)
     try:
-        payload = await request.json()
+        # 续跑时请求体可以为空
+        payload = await request.json() if raw_body.strip() or not resume_run_id else {}
+        # 通过准入与请求体校验后才开启时间线，提前返回的请求不会留下进行中的时间线
+        _start_trace(request, run_id)
 
         # 创建任务并记录 - 这是关键，让我们可以通过run_id取消任务
-        task = asyncio.create_task(service.run(payload, ctx))
-        service.running_tasks[run_id] = task
+        task = asyncio.create_task(service.run(
+            payload, ctx, resume_run_id=resume_run_id, rerun_node=rerun_node, checkpoint=checkpoint
+        ))
+        await service.track_run(run_id, task, method="run")
 
         try:
             result = await asyncio.wait_for(task, timeout=float(TIMEOUT_SECONDS))
@@ -402,12 +962,18 @@ async def http_run(request: Request) -> Dict[str, Any]:
             result = {}
         if isinstance(result, dict):
             result["run_id"] = run_id
+            if resume_run_id:
+                # checkpoint 仍记在原运行下，再次续跑 / 重跑时使用原 run_id
+                result["resumed_from"] = resume_run_id
         return result
 
     except json.JSONDecodeError as e:
         logger.error(f"JSON decode error in http_run: {e}, traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=400, detail=f"Invalid JSON format, {extract_core_stack()}")
 
+    except CheckpointNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
     except asyncio.CancelledError:
         logger.info(f"Request cancelled for run_id: {run_id}")
         result = {"status": "cancelled", "run_id": run_id, "message": "Execution was cancelled"}
@@ -420,15 +986,20 @@ async def http_run(request: Request) -> Dict[str, Any]:
             f"Unexpected error in http_run: [{error_response['error_code']}] {error_response['error_message']}, "
             f"traceback: {traceback.format_exc()}", exc_info=True
         )
+        # 返回 run_id，客户端可据此以 resume_run_id 续跑
         raise HTTPException(
             status_code=500,
             detail={
                 "error_code": error_response["error_code"],
                 "error_message": error_response["error_message"],
                 "stack_trace": extract_core_stack(),
-            }
+                "run_id": resume_run_id or run_id,
+            },
+            headers={"X-Run-Id": run_id},
         )
     finally:
+        admission.release(time.time() - admitted_at)
+        finish_timeline(run_id)
         cozeloop.flush()
 
 
@@ -449,7 +1020,7 @@ async def http_stream_run(request: Request):
         f"Received request for /stream_run: "
         f"run_id={run_id}, "
         f"query={dict(request.query_params)}, "
-        f"body={body_text}"
+        f"body={format_payload_text(body_text, run_id)}"
     )
 
     try:
@@ -463,11 +1034,13 @@ async def http_stream_run(request: Request):
         # 将真正的流式任务登记到 running_tasks，确保 /cancel 能定位到它
         task = asyncio.current_task()
         if task:
-            service.running_tasks[run_id] = task
+            await service.track_run(run_id, task, method="stream_run")
             logger.info(f"Registered streaming task for run_id: {run_id}")
 
         client_msg, _ = to_client_message(payload)
         t0 = time.time()
+        # 生成器开始执行时已通过准入；未被迭代就断开的请求不会开启时间线
+        _start_trace(request, run_id)
 
         try:
             async for chunk in service.stream_sse(payload, ctx):
@@ -504,10 +1077,15 @@ async def http_stream_run(request: Request):
                 local_msg_id=client_msg.local_msg_id,
             )
             yield service._sse_event(error_msg)
+        finally:
+            finish_timeline(run_id)
 
+    admitted_at = await _admit(request, PRIORITY_INTERACTIVE, run_id)
     # 注意：StreamingResponse会在后台运行generator
-    response = StreamingResponse(cancellable_stream(), media_type="text/event-stream")
-    return response
+    response = StreamingResponse(
+        cancellable_stream(), media_type="text/event-stream", headers={"X-Run-Id": run_id}
+    )
+    return _release_after_stream(response, admitted_at)
 
 @app.post("/cancel/{run_id}")
 async def http_cancel(run_id: str, request: Request):
@@ -524,6 +1102,115 @@ async def http_cancel(run_id: str, request: Request):
     return result
 
 
+@app.get("/runs/{run_id}")
+async def http_run_status(run_id: str):
+    """查询 run 的归属 worker、状态与取消标志（多 worker 下任意进程均可查询）"""
+    run = await asyncio.to_thread(service.get_run_status, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Run not found: {run_id}")
+    return run
+
+
+@app.get("/runs/{run_id}/trace")
+async def http_run_trace(run_id: str):
+    """
+    导出 run 的耗时时间线（Chrome trace / Perfetto JSON）
+
+    需在运行时开启记录（RUN_TRACE_ENABLED 或请求头 X-Run-Trace: 1），时间线保存在执行该 run 的进程内；
+    请求落在其他 worker 上时返回 409 并指明持有时间线的 worker。
+    """
+    timeline = get_timeline(run_id)
+    if timeline is None:
+        run = await asyncio.to_thread(service.get_run_status, run_id)
+        owner = run.get("worker_id") if run is not None else None
+        if owner and owner != service.worker_id:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Trace for run {run_id} is held in memory by worker {owner}, not {service.worker_id}; "
+                       f"retry until the request reaches that worker",
+            )
+        raise HTTPException(status_code=404, detail=f"Trace not found for run: {run_id}")
+    return JSONResponse(timeline.to_chrome_trace())
+
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """作业状态视图（不含输入与结果）"""
+    return {
+        "job_id": job["job_id"],
+        "tenant": job["tenant"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "cancel_requested": job["cancel_requested"],
+        "progress": job["progress"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "thread_id": job.get("thread_id") or job["job_id"],
+    }
+
+
+def _get_job_or_404(job_id: str) -> Dict[str, Any]:
+    job = get_job_store().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+
+@app.post("/jobs")
+async def http_submit_job(request: Request):
+    """
+    提交异步作业，立即返回 job_id
+
+    租户取自请求头 X-Tenant-Id（或查询参数 tenant），worker 按租户公平领取作业。
+    查询参数 resume_run_id 指定时，作业从该运行（run_id 或 job_id）最后一个 checkpoint 续跑，请求体可为空。
+    """
+    if graph_helper.is_agent_proj():
+        raise HTTPException(status_code=400, detail="Jobs are not supported for agent projects")
+    resume_run_id = request.query_params.get("resume_run_id") or None
+    try:
+        raw_body = await request.body()
+        payload = json.loads(raw_body) if raw_body.strip() or not resume_run_id else {}
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON format:{extract_core_stack()}")
+    if resume_run_id:
+        try:
+            await load_resumable_state(await service._get_checkpoint_graph(), resume_run_id)
+        except CheckpointNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    tenant = request.headers.get("x-tenant-id") or request.query_params.get("tenant") or "default"
+    job = await asyncio.to_thread(get_job_store().submit, payload, tenant, resume_run_id)
+    logger.info(f"Job submitted: job_id={job['job_id']}, tenant={tenant}, resume_run_id={resume_run_id}")
+    return JSONResponse(status_code=202, content=_job_view(job))
+
+
+@app.get("/jobs/{job_id}")
+async def http_get_job(job_id: str):
+    """查询作业状态与逐节点进度"""
+    job = await asyncio.to_thread(_get_job_or_404, job_id)
+    return _job_view(job)
+
+
+@app.get("/jobs/{job_id}/result")
+async def http_get_job_result(job_id: str):
+    """获取作业输出：未完成时返回 202，失败或取消时返回 409"""
+    job = await asyncio.to_thread(_get_job_or_404, job_id)
+    if job["status"] == JOB_STATUS_SUCCEEDED:
+        return {"job_id": job_id, "status": job["status"], "result": job["result"]}
+    if job["status"] in (JOB_STATUS_FAILED, JOB_STATUS_CANCELLED):
+        raise HTTPException(status_code=409, detail={"job_id": job_id, "status": job["status"], "error": job["error"]})
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": job["status"]})
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def http_cancel_job(job_id: str):
+    """取消作业：排队中的立即取消，运行中的由执行者在下一次心跳时取消"""
+    await asyncio.to_thread(_get_job_or_404, job_id)
+    job = await asyncio.to_thread(get_job_store().request_cancel, job_id)
+    return _job_view(job)
+
+
 @app.post(path="/node_run/{node_id}")
 async def http_node_run(node_id: str, request: Request):
     raw_body = await request.body()
@@ -537,7 +1224,7 @@ async def http_node_run(node_id: str, request: Request):
     logger.info(
         f"Received request for /node_run/{node_id}: "
         f"query={dict(request.query_params)}, "
-        f"body={body_text}",
+        f"body={format_payload_text(body_text, ctx.run_id)}",
     )
 
     try:
@@ -545,6 +1232,7 @@ async def http_node_run(node_id: str, request: Request):
     except json.JSONDecodeError as e:
         logger.error(f"JSON decode error in http_node_run: {e}, traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=400, detail=f"Invalid JSON format:{extract_core_stack()}")
+    _start_trace(request, ctx.run_id)
     try:
         return await service.run_node(node_id, payload, ctx)
     except KeyError:
@@ -566,6 +1254,7 @@ async def http_node_run(node_id: str, request: Request):
             }
         )
     finally:
+        finish_timeline(ctx.run_id)
         cozeloop.flush()
 
 
@@ -579,14 +1268,46 @@ async def openai_chat_completions(request: Request):
 
     try:
         payload = await request.json()
-        return await openai_handler.handle(payload, ctx)
     except json.JSONDecodeError as e:
         logger.error(f"JSON decode error in openai_chat_completions: {e}")
         raise HTTPException(status_code=400, detail="Invalid JSON format")
+
+    admitted_at = await _admit(request, PRIORITY_INTERACTIVE, ctx.run_id)
+    streaming = False
+    try:
+        response = await openai_handler.handle(payload, ctx)
+        if isinstance(response, StreamingResponse):
+            streaming = True
+            return _release_after_stream(response, admitted_at)
+        return response
     finally:
+        if not streaming:
+            admission.release(time.time() - admitted_at)
         cozeloop.flush()
 
 
+@app.get("/metrics")
+async def http_metrics(scope: str = ""):
+    """
+    Prometheus 文本格式的指标，每个样本带 worker 标签（主机名:进程号）
+
+    多 worker 部署时默认合并所有存活 worker 的快照（其他 worker 的数据最多滞后 METRICS_SNAPSHOT_INTERVAL 秒），
+    scope=local 只返回处理本请求的 worker 的实时指标；单 worker 时即本进程指标。
+    """
+    shared = getattr(app.state, "shared_metrics", None)
+    if shared is not None and scope != "local":
+        text = await asyncio.to_thread(shared.render)
+    else:
+        text = REGISTRY.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/admission")
+async def http_admission_stats():
+    """准入控制状态：执行中数量、各优先级排队深度与拒绝计数"""
+    return admission.stats()
+
+
 @app.get("/health")
 async def health_check():
     try:
@@ -594,6 +1315,7 @@ async def health_check():
         return {
             "status": "ok",
             "message": "Service is running",
+            "admission": admission.stats(),
         }
     except Exception as e:
         raise HTTPException(status_code=503, detail=str(e))
@@ -609,6 +1331,8 @@ def parse_args():
     parser.add_argument("-n", type=str, default="", help="Node ID for single node run")
     parser.add_argument("-p", type=int, default=5000, help="HTTP server port")
     parser.add_argument("-i", type=str, default="", help="Input JSON string for flow/node mode")
+    parser.add_argument("-w", type=int, default=HTTP_WORKERS, help="HTTP server worker processes")
+    parser.add_argument("-t", "--trace", type=str, default="", help="Write Chrome trace JSON of the run to this path (flow mode)")
     return parser.parse_args()
 
 
@@ -624,23 +1348,36 @@ def parse_input(input_str: str) -> Dict[str, Any]:
         # If not valid JSON, treat as plain text
         return {"text": input_str}
 
-def start_http_server(port):
-    workers = 1
+def start_http_server(port, workers=HTTP_WORKERS):
     reload = False
     if graph_helper.is_dev_env():
         reload = True
+        # reload 模式只支持单进程
+        workers = 1
+    workers = max(1, workers)
 
+    # 子进程重新导入 main 时据此选择共享的运行登记表
+    os.environ["HTTP_WORKERS"] = str(workers)
     logger.info(f"Start HTTP Server, Port: {port}, Workers: {workers}")
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=reload, workers=workers)
 
 if __name__ == "__main__":
     args = parse_args()
     if args.m == "http":
-        start_http_server(args.p)
+        start_http_server(args.p, args.w)
     elif args.m == "flow":
         payload = parse_input(args.i)
-        result = asyncio.run(service.run(payload))
+        ctx = new_context(method="run")
+        request_context.set(ctx)
+        if args.trace:
+            start_timeline(ctx.run_id)
+        result = asyncio.run(service.run(payload, ctx))
         print(json.dumps(result, ensure_ascii=False, indent=2))
+        if args.trace:
+            finish_timeline(ctx.run_id)
+            with open(args.trace, "w", encoding="utf-8") as f:
+                json.dump(get_timeline(ctx.run_id).to_chrome_trace(), f, ensure_ascii=False)
+            print(f"Trace written to {args.trace}")
     elif args.m == "node" and args.n:
         payload = parse_input(args.i)
         result = asyncio.run(service.run_node(args.n, payload))
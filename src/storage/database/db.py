@@ -1,12 +1,55 @@
+"""
+数据库连接层
+
+每个进程只持有两组连接，总数按 DB_MAX_CONNECTIONS（全部 worker 合计）与 worker 数折算：
+- 异步连接池（psycopg AsyncConnectionPool）：checkpointer 与异步代码共用，search_path 为 memory,public；
+  首次使用时才建立连接（懒预热），连接前带抖动重试
+- 同步引擎（SQLAlchemy）：作业库等同步代码使用，只保留少量连接
+连接池状态通过 /metrics 导出（db_pool_connections、db_pool_requests），池耗尽时的排队与超时可以直接观察到。
+"""
+import asyncio
 import os
+import random
 import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple, TypeVar
+from urllib.parse import quote
+
+import psycopg
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import OperationalError
 import logging
+
+from utils.metrics import REGISTRY
+
 logger = logging.getLogger(__name__)
 
 MAX_RETRY_TIME = 20  # 连接最大重试时间（秒）
+# 全部 worker 进程合计的数据库连接上限
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "40"))
+# worker 进程数（与服务的 HTTP_WORKERS 一致）
+DB_WORKERS = max(1, int(os.getenv("HTTP_WORKERS", "1")))
+# 同步引擎的连接数（从每进程预算中划出，其余归异步连接池）
+DB_SYNC_POOL_SIZE = int(os.getenv("DB_SYNC_POOL_SIZE", "2"))
+# 异步连接池常驻的最少连接数（首次使用后在后台补齐）
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+# 从连接池获取连接的等待超时（秒），超时抛出 PoolTimeout
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# 空闲连接回收时间（秒）
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+# 单次建立连接的超时（秒）
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "15"))
+# 异步连接池的 search_path：checkpointer 表在 memory，应用表在 public
+DB_SEARCH_PATH = "memory,public"
+# 重试退避的基础间隔与上限（秒）
+_BACKOFF_BASE = 0.5
+_BACKOFF_MAX = 5.0
+
+T = TypeVar("T")
+
 # Load environment variables from .env if present
 try:
     from dotenv import load_dotenv
@@ -35,6 +78,59 @@ def get_db_url() -> str:
         if url is None or url == "":
             logger.error("PGDATABASE_URL is not set")
     return url
+
+
+def pool_budget() -> Tuple[int, int]:
+    """
+    每进程的连接预算
+
+    Returns:
+        (异步连接池最大连接数, 同步引擎连接数)
+    """
+    per_process = max(2, DB_MAX_CONNECTIONS // DB_WORKERS)
+    sync_size = max(1, min(DB_SYNC_POOL_SIZE, per_process - 1))
+    return per_process - sync_size, sync_size
+
+
+def with_search_path(url: str, search_path: str) -> str:
+    """在连接串上追加 search_path 选项"""
+    option = "options=" + quote(f"-csearch_path={search_path}", safe="")
+    return f"{url}&{option}" if "?" in url else f"{url}?{option}"
+
+
+def _backoff(attempt: int) -> float:
+    """带抖动的指数退避（full jitter），多 worker 同时重启时错开重连"""
+    return random.uniform(0, min(_BACKOFF_MAX, _BACKOFF_BASE * (2 ** attempt)))
+
+
+def retry_with_jitter(func: Callable[[], T], what: str, deadline: float = MAX_RETRY_TIME,
+                      retry_on: Tuple[type, ...] = (OperationalError, psycopg.OperationalError)) -> T:
+    """在 deadline 秒内带抖动重试 func，超时后抛出最后一次的错误"""
+    start_time = time.time()
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except retry_on as e:
+            elapsed = time.time() - start_time
+            if elapsed >= deadline:
+                logger.error(f"{what} failed after {elapsed:.1f}s: {e}")
+                raise
+            delay = min(_backoff(attempt), deadline - elapsed)
+            logger.warning(f"{what} failed, retrying in {delay:.2f}s (attempt {attempt + 1}): {e}")
+            time.sleep(delay)
+            attempt += 1
+
+
+def connect_with_retry(url: str, deadline: float = MAX_RETRY_TIME) -> psycopg.Connection:
+    """建立一条同步 psycopg 连接（autocommit，带抖动重试），用于建表等一次性操作"""
+    return retry_with_jitter(
+        lambda: psycopg.connect(url, autocommit=True, connect_timeout=DB_CONNECT_TIMEOUT),
+        "Database connection",
+        deadline=deadline,
+    )
+
+
 _engine = None
 _SessionLocal = None
 
@@ -43,33 +139,25 @@ def _create_engine_with_retry():
     if url is None or url == "":
         logger.error("PGDATABASE_URL is not set")
         raise ValueError("PGDATABASE_URL is not set")
-    size = 100
-    overflow = 100
+    _, size = pool_budget()
     recycle = 1800
-    timeout = 30
     engine = create_engine(
         url,
         pool_size=size,
-        max_overflow=overflow,
+        max_overflow=0,
         pool_pre_ping=True,
         pool_recycle=recycle,
-        pool_timeout=timeout,
+        pool_timeout=DB_POOL_TIMEOUT,
     )
-    # 验证连接，带重试
-    start_time = time.time()
-    last_error = None
-    while time.time() - start_time < MAX_RETRY_TIME:
-        try:
-            with engine.connect() as conn:
-                conn.execute(text("SELECT 1"))
-            return engine
-        except OperationalError as e:
-            last_error = e
-            elapsed = time.time() - start_time
-            logger.warning(f"Database connection failed, retrying... (elapsed: {elapsed:.1f}s)")
-            time.sleep(min(1, MAX_RETRY_TIME - elapsed))
-    logger.error(f"Database connection failed after {MAX_RETRY_TIME}s: {last_error}")
-    raise last_error  # pyright: ignore [reportGeneralTypeIssues]
+
+    # 验证连接，带抖动重试
+    def _ping():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    retry_with_jitter(_ping, "Database connection")
+    logger.info(f"Database engine created: pool_size={size}, workers={DB_WORKERS}")
+    return engine
 
 def get_engine():
     global _engine
@@ -86,9 +174,158 @@ def get_sessionmaker():
 def get_session():
     return get_sessionmaker()()
 
+
+class LazyAsyncConnectionPool(AsyncConnectionPool):
+    """首次获取连接时才打开的连接池：先带抖动重试探测数据库可达，再打开并在后台补齐 min_size 个连接"""
+
+    _open_lock: Optional[asyncio.Lock] = None
+
+    async def ensure_open(self):
+        if not self.closed:
+            return
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if not self.closed:
+                return
+            await self._probe()
+            await self.open(wait=False)
+            logger.info(f"Database pool opened: min_size={self.min_size}, max_size={self.max_size}")
+
+    async def _probe(self):
+        start_time = time.time()
+        attempt = 0
+        while True:
+            try:
+                conn = await psycopg.AsyncConnection.connect(self.conninfo, connect_timeout=DB_CONNECT_TIMEOUT)
+                await conn.close()
+                return
+            except psycopg.OperationalError as e:
+                elapsed = time.time() - start_time
+                if elapsed >= MAX_RETRY_TIME:
+                    logger.error(f"Database pool connection failed after {elapsed:.1f}s: {e}")
+                    raise
+                delay = min(_backoff(attempt), MAX_RETRY_TIME - elapsed)
+                logger.warning(f"Database pool connection failed, retrying in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    @asynccontextmanager
+    async def connection(self, timeout: Optional[float] = None) -> AsyncIterator[psycopg.AsyncConnection]:
+        await self.ensure_open()
+        async with super().connection(timeout=timeout) as conn:
+            yield conn
+
+    async def getconn(self, timeout: Optional[float] = None) -> psycopg.AsyncConnection:
+        await self.ensure_open()
+        return await super().getconn(timeout=timeout)
+
+
+_async_pool: Optional[LazyAsyncConnectionPool] = None
+
+
+def get_async_pool() -> LazyAsyncConnectionPool:
+    """
+    进程内共享的异步连接池（checkpointer 与异步代码共用）
+
+    创建时不建立连接，首次获取连接时打开。连接参数满足 AsyncPostgresSaver 的要求
+    （autocommit、dict_row、prepare_threshold=0）。
+    """
+    global _async_pool
+    if _async_pool is None:
+        url = get_db_url()
+        if not url:
+            raise ValueError("PGDATABASE_URL is not set")
+        max_size, _ = pool_budget()
+        _async_pool = LazyAsyncConnectionPool(
+            conninfo=with_search_path(url, DB_SEARCH_PATH),
+            kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+            min_size=min(DB_POOL_MIN_SIZE, max_size),
+            max_size=max_size,
+            timeout=DB_POOL_TIMEOUT,
+            max_idle=DB_POOL_MAX_IDLE,
+            check=AsyncConnectionPool.check_connection,
+            name="main",
+            open=False,
+        )
+        logger.info(f"Database pool configured: max_size={max_size}, workers={DB_WORKERS} (opens on first use)")
+    return _async_pool
+
+
+async def close_async_pool():
+    """关闭异步连接池（进程退出时调用）"""
+    global _async_pool
+    pool, _async_pool = _async_pool, None
+    if pool is not None and not pool.closed:
+        await pool.close()
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """连接池状态快照（未创建的池不出现）"""
+    stats: Dict[str, Dict[str, Any]] = {}
+    if _async_pool is not None:
+        s = _async_pool.get_stats()
+        # 未打开（懒预热前）的池没有连接
+        size = 0 if _async_pool.closed else s.get("pool_size", 0)
+        available = 0 if _async_pool.closed else s.get("pool_available", 0)
+        stats["async"] = {
+            "max": _async_pool.max_size,
+            "size": size,
+            "idle": available,
+            "in_use": size - available,
+            "waiting": s.get("requests_waiting", 0),
+            "requests": s.get("requests_num", 0),
+            "queued": s.get("requests_queued", 0),
+            "timeouts": s.get("requests_errors", 0),
+            "connection_errors": s.get("connections_errors", 0),
+        }
+    if _engine is not None:
+        pool = _engine.pool
+        stats["sync"] = {
+            "max": pool.size(),
+            "size": pool.checkedin() + pool.checkedout(),
+            "idle": pool.checkedin(),
+            "in_use": pool.checkedout(),
+        }
+    return stats
+
+
+def _connection_gauge() -> Dict[Tuple[str, str], float]:
+    return {
+        (name, state): s[state]
+        for name, s in pool_stats().items()
+        for state in ("max", "size", "idle", "in_use")
+    }
+
+
+def _request_gauge() -> Dict[Tuple[str, str], float]:
+    return {
+        (name, outcome): s[outcome]
+        for name, s in pool_stats().items()
+        for outcome in ("waiting", "requests", "queued", "timeouts", "connection_errors")
+        if outcome in s
+    }
+
+
+REGISTRY.gauge("db_pool_connections", "Database pool connections by state", _connection_gauge, ["pool", "state"])
+REGISTRY.gauge(
+    "db_pool_requests",
+    "Database pool requests: waiting now, and cumulative total / queued / timed out",
+    _request_gauge,
+    ["pool", "outcome"],
+)
+
 __all__ = [
     "get_db_url",
     "get_engine",
     "get_sessionmaker",
     "get_session",
+    "get_async_pool",
+    "close_async_pool",
+    "connect_with_retry",
+    "retry_with_jitter",
+    "pool_budget",
+    "pool_stats",
+    "with_search_path",
+    "LazyAsyncConnectionPool",
 ]
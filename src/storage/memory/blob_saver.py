@@ -0,0 +1,410 @@
+"""
+checkpoint 大字段去重与压缩
+
+AsyncPostgresSaver 把字符串类型的通道值直接内联进每个 checkpoint 的 JSONB，
+GlobalState 中的 tender_doc_content、bid_doc_content 等整篇文档因此在每个 superstep 都写一遍。
+BlobDedupSaver 包装原 checkpointer：
+- 超过 CHECKPOINT_BLOB_THRESHOLD 字节的字符串通道值（含 pending writes）按 sha256 内容寻址，
+  压缩（zstd，不可用时 zlib）后写入 checkpoint_payloads 表，同一内容只存一份
+- checkpoint 中只保留形如 "cas:sha256:<hex>" 的引用；读取时批量取回并还原
+- checkpoint_payload_refs 记录 (thread_id, hash) 引用关系；删除线程时只删除引用，
+  由定时任务调用 acollect_garbage 清理不再被任何线程引用的内容
+- 进程内缓存已写入的引用与已解压的内容，同一线程后续的 checkpoint 不再传输这些大字段
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import zlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from psycopg.rows import tuple_row
+from psycopg_pool import AsyncConnectionPool
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# 是否启用大字段去重（仅对 Postgres checkpointer 生效）
+CHECKPOINT_BLOB_DEDUP = os.getenv("CHECKPOINT_BLOB_DEDUP", "true").lower() in ("1", "true", "yes")
+# 超过该字节数的字符串通道值转存为内容寻址的 blob
+CHECKPOINT_BLOB_THRESHOLD = int(os.getenv("CHECKPOINT_BLOB_THRESHOLD", "16384"))
+# 压缩算法：zstd / zlib（zstandard 未安装时使用 zlib）
+CHECKPOINT_BLOB_CODEC = os.getenv("CHECKPOINT_BLOB_CODEC", "zstd" if zstandard is not None else "zlib")
+# 进程内已解压内容缓存上限（字节）
+CHECKPOINT_BLOB_CACHE_BYTES = int(os.getenv("CHECKPOINT_BLOB_CACHE_BYTES", str(64 * 1024 * 1024)))
+# 垃圾回收时保留最近多少秒内写入的内容（避免与并发写入竞争）
+CHECKPOINT_BLOB_GC_GRACE_SECONDS = int(os.getenv("CHECKPOINT_BLOB_GC_GRACE_SECONDS", "300"))
+# 垃圾回收间隔（秒），由服务的定时任务调用 acollect_garbage
+CHECKPOINT_BLOB_GC_INTERVAL = float(os.getenv("CHECKPOINT_BLOB_GC_INTERVAL", "600"))
+
+BLOB_REF_PREFIX = "cas:sha256:"
+_REF_LENGTH = len(BLOB_REF_PREFIX) + 64
+# 已知引用 (thread_id, hash) 的缓存条数上限
+_KNOWN_REFS_SIZE = 100000
+# 摘要缓存条数上限（按字符串对象缓存，避免每个 superstep 重新计算整篇文档的 sha256）
+_DIGEST_CACHE_SIZE = 256
+
+SETUP_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS checkpoint_payloads (
+        hash TEXT PRIMARY KEY,
+        codec TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        data BYTEA NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS checkpoint_payload_refs (
+        thread_id TEXT NOT NULL,
+        hash TEXT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (thread_id, hash)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS checkpoint_payload_refs_hash_idx ON checkpoint_payload_refs (hash)",
+]
+
+
+def setup_blob_tables(conn) -> None:
+    """创建 blob 表（同步连接，search_path 需已指向 memory schema）"""
+    with conn.cursor() as cur:
+        for sql in SETUP_SQL:
+            cur.execute(sql)
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, str) and len(value) == _REF_LENGTH and value.startswith(BLOB_REF_PREFIX)
+
+
+def compress(data: bytes, codec: str = CHECKPOINT_BLOB_CODEC) -> Tuple[str, bytes]:
+    """压缩内容，返回 (实际使用的算法, 压缩后数据)"""
+    if codec == "zstd" and zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=3).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("checkpoint blob is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class BlobDedupSaver(BaseCheckpointSaver):
+    """
+    大字段去重的 checkpointer 包装（仅实现异步接口，图以 ainvoke/astream 运行）
+
+    Args:
+        inner: 实际读写 checkpoint 的 AsyncPostgresSaver
+        pool: 与 inner 共用的连接池，用于读写 blob 表
+    """
+
+    def __init__(
+        self,
+        inner: BaseCheckpointSaver,
+        pool: AsyncConnectionPool,
+        threshold: int = CHECKPOINT_BLOB_THRESHOLD,
+        codec: str = CHECKPOINT_BLOB_CODEC,
+    ):
+        super().__init__(serde=inner.serde)
+        self.inner = inner
+        self.pool = pool
+        self.threshold = threshold
+        self.codec = codec
+        self._digests: "OrderedDict[int, Tuple[str, str]]" = OrderedDict()
+        self._known_refs: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+        self._contents: "OrderedDict[str, str]" = OrderedDict()
+        self._contents_bytes = 0
+        # 同一线程的 aput 与 aput_writes 会并发写入同一份内容，新引用的写入串行化
+        self._store_lock = asyncio.Lock()
+        self.stats: Dict[str, int] = {"stored": 0, "stored_bytes": 0, "compressed_bytes": 0, "deduplicated": 0,
+                                      "fetched": 0, "cache_hits": 0, "collected": 0}
+
+    @property
+    def config_specs(self) -> list:
+        return self.inner.config_specs
+
+    def get_next_version(self, current, channel):
+        return self.inner.get_next_version(current, channel)
+
+    # ---------- 内容寻址 ----------
+
+    def _digest(self, value: str) -> str:
+        cached = self._digests.get(id(value))
+        if cached is not None and cached[0] is value:
+            self._digests.move_to_end(id(value))
+            return cached[1]
+        digest = hashlib.sha256(value.encode("utf-8")).hexdigest()
+        # 持有字符串本身，保证 id 在缓存期内不会被复用
+        self._digests[id(value)] = (value, digest)
+        while len(self._digests) > _DIGEST_CACHE_SIZE:
+            self._digests.popitem(last=False)
+        return digest
+
+    def _remember_content(self, digest: str, value: str):
+        if digest in self._contents:
+            self._contents.move_to_end(digest)
+            return
+        self._contents[digest] = value
+        self._contents_bytes += len(value)
+        while self._contents_bytes > CHECKPOINT_BLOB_CACHE_BYTES and self._contents:
+            _, old = self._contents.popitem(last=False)
+            self._contents_bytes -= len(old)
+
+    def _is_large(self, value: Any) -> bool:
+        # len(str) <= 字节数，先按字符数粗筛，避免对小字符串编码
+        return isinstance(value, str) and len(value) * 4 >= self.threshold and \
+            len(value.encode("utf-8")) >= self.threshold and not is_blob_ref(value)
+
+    async def _store(self, thread_id: str, values: Dict[str, str]):
+        """写入新出现的 (thread_id, hash) 引用及其内容；内容已存在时不再传输"""
+        if any((thread_id, d) not in self._known_refs for d in values):
+            async with self._store_lock:
+                await self._store_new(thread_id, values)
+        for d, v in values.items():
+            self._remember_content(d, v)
+
+    async def _store_new(self, thread_id: str, values: Dict[str, str]):
+        new = {d: v for d, v in values.items() if (thread_id, d) not in self._known_refs}
+        if new:
+            async with self.pool.connection() as conn:
+                async with conn.transaction():
+                    async with conn.cursor(row_factory=tuple_row) as cur:
+                        # FOR SHARE：与垃圾回收的删除互斥
+                        await cur.execute(
+                            "SELECT hash FROM checkpoint_payloads WHERE hash = ANY(%s) FOR SHARE", (list(new),)
+                        )
+                        existing = {row[0] for row in await cur.fetchall()}
+                        missing = [(d, new[d]) for d in new if d not in existing]
+                        if missing:
+                            rows = await asyncio.to_thread(self._encode_rows, missing)
+                            await cur.executemany(
+                                "INSERT INTO checkpoint_payloads (hash, codec, size, data) VALUES (%s, %s, %s, %s) "
+                                "ON CONFLICT (hash) DO NOTHING",
+                                rows,
+                            )
+                        await cur.executemany(
+                            "INSERT INTO checkpoint_payload_refs (thread_id, hash) VALUES (%s, %s) "
+                            "ON CONFLICT DO NOTHING",
+                            [(thread_id, d) for d in new],
+                        )
+                self.stats["deduplicated"] += len(existing)
+            for d in new:
+                self._known_refs[(thread_id, d)] = None
+            while len(self._known_refs) > _KNOWN_REFS_SIZE:
+                self._known_refs.popitem(last=False)
+
+    def _encode_rows(self, items: List[Tuple[str, str]]) -> List[Tuple[str, str, int, bytes]]:
+        rows = []
+        for digest, value in items:
+            raw = value.encode("utf-8")
+            codec, data = compress(raw, self.codec)
+            rows.append((digest, codec, len(raw), data))
+            self.stats["stored"] += 1
+            self.stats["stored_bytes"] += len(raw)
+            self.stats["compressed_bytes"] += len(data)
+        return rows
+
+    async def _offload(self, thread_id: str, items: Iterable[Tuple[Any, Any]]) -> Dict[Any, Any]:
+        """把大字符串替换为引用；返回被替换的 {键: 引用}"""
+        refs: Dict[Any, Any] = {}
+        values: Dict[str, str] = {}
+        for k, v in items:
+            if self._is_large(v):
+                digest = self._digest(v)
+                values[digest] = v
+                refs[k] = BLOB_REF_PREFIX + digest
+        if values:
+            await self._store(thread_id, values)
+        return refs
+
+    async def _fetch(self, digests: Set[str]) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        for d in digests:
+            if d in self._contents:
+                found[d] = self._contents[d]
+                self._contents.move_to_end(d)
+        missing = [d for d in digests if d not in found]
+        if missing:
+            async with self.pool.connection() as conn:
+                async with conn.cursor(row_factory=tuple_row) as cur:
+                    await cur.execute(
+                        "SELECT hash, codec, data FROM checkpoint_payloads WHERE hash = ANY(%s)", (missing,)
+                    )
+                    rows = await cur.fetchall()
+
+            def _decode():
+                return {h: decompress(codec, bytes(data)).decode("utf-8") for h, codec, data in rows}
+
+            decoded = await asyncio.to_thread(_decode)
+            for d, v in decoded.items():
+                self._remember_content(d, v)
+            found.update(decoded)
+            self.stats["fetched"] += len(decoded)
+            lost = set(missing) - set(decoded)
+            if lost:
+                raise RuntimeError(f"checkpoint payloads missing: {sorted(lost)}")
+        self.stats["cache_hits"] += len(digests) - len(missing)
+        return found
+
+    async def _restore(self, tuples: List[CheckpointTuple]) -> List[CheckpointTuple]:
+        """批量还原 checkpoint 通道值与 pending writes 中的引用"""
+        digests: Set[str] = set()
+        for t in tuples:
+            digests.update(v[len(BLOB_REF_PREFIX):] for v in t.checkpoint["channel_values"].values() if is_blob_ref(v))
+            digests.update(w[2][len(BLOB_REF_PREFIX):] for w in t.pending_writes or [] if is_blob_ref(w[2]))
+        if not digests:
+            return tuples
+        contents = await self._fetch(digests)
+
+        def _resolve(value: Any) -> Any:
+            return contents[value[len(BLOB_REF_PREFIX):]] if is_blob_ref(value) else value
+
+        restored = []
+        for t in tuples:
+            checkpoint = {**t.checkpoint, "channel_values": {k: _resolve(v) for k, v in t.checkpoint["channel_values"].items()}}
+            pending = [(tid, ch, _resolve(v)) for tid, ch, v in t.pending_writes] if t.pending_writes else t.pending_writes
+            restored.append(t._replace(checkpoint=checkpoint, pending_writes=pending))
+        return restored
+
+    # ---------- checkpointer 接口 ----------
+
+    def _sync_unsupported(self, method: str):
+        raise NotImplementedError(
+            f"BlobDedupSaver.{method} is not supported: the blob store is async-only, "
+            f"run the graph with ainvoke/astream or use the async method a{method}"
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self._sync_unsupported("get_tuple")
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        self._sync_unsupported("list")
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        self._sync_unsupported("put")
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        self._sync_unsupported("put_writes")
+
+    def delete_thread(self, thread_id: str) -> None:
+        self._sync_unsupported("delete_thread")
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        checkpoint_tuple = await self.inner.aget_tuple(config)
+        if checkpoint_tuple is None:
+            return None
+        return (await self._restore([checkpoint_tuple]))[0]
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        async for checkpoint_tuple in self.inner.alist(config, filter=filter, before=before, limit=limit):
+            yield (await self._restore([checkpoint_tuple]))[0]
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        refs = await self._offload(thread_id, checkpoint["channel_values"].items())
+        if refs:
+            checkpoint = {**checkpoint, "channel_values": {**checkpoint["channel_values"], **refs}}
+        return await self.inner.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        refs = await self._offload(thread_id, ((i, value) for i, (_, value) in enumerate(writes)))
+        if refs:
+            writes = [(channel, refs.get(i, value)) for i, (channel, value) in enumerate(writes)]
+        await self.inner.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self.inner.adelete_thread(thread_id)
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("DELETE FROM checkpoint_payload_refs WHERE thread_id = %s", (str(thread_id),))
+        for key in [k for k in self._known_refs if k[0] == str(thread_id)]:
+            self._known_refs.pop(key, None)
+
+    async def acollect_garbage(self) -> int:
+        """
+        删除不再被引用的内容
+
+        先清理超过保留期、所属线程已没有任何 checkpoint 的引用，再删除没有引用且超过保留期的内容。
+
+        Returns:
+            删除的内容条数
+        """
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.transaction():
+                    async with conn.cursor() as cur:
+                        await cur.execute(
+                            "DELETE FROM checkpoint_payload_refs r "
+                            "WHERE r.created_at < now() - make_interval(secs => %s) "
+                            "AND NOT EXISTS (SELECT 1 FROM checkpoints c WHERE c.thread_id = r.thread_id)",
+                            (CHECKPOINT_BLOB_GC_GRACE_SECONDS,),
+                        )
+                        await cur.execute(
+                            "DELETE FROM checkpoint_payloads p "
+                            "WHERE NOT EXISTS (SELECT 1 FROM checkpoint_payload_refs r WHERE r.hash = p.hash) "
+                            "AND p.created_at < now() - make_interval(secs => %s)",
+                            (CHECKPOINT_BLOB_GC_GRACE_SECONDS,),
+                        )
+                        deleted = cur.rowcount
+        except Exception as e:
+            logger.warning(f"Checkpoint payload garbage collection failed: {e}")
+            return 0
+        self.stats["collected"] += max(0, deleted)
+        if deleted:
+            logger.info(f"Collected {deleted} unreferenced checkpoint payloads")
+        return max(0, deleted)
+
+
+__all__ = [
+    "BlobDedupSaver",
+    "setup_blob_tables",
+    "is_blob_ref",
+    "BLOB_REF_PREFIX",
+    "CHECKPOINT_BLOB_DEDUP",
+    "CHECKPOINT_BLOB_GC_INTERVAL",
+]
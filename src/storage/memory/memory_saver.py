@@ -6,20 +6,20 @@ from langgraph.checkpoint.memory import MemorySaver
 from langgraph.checkpoint.base import BaseCheckpointSaver
 from typing import Optional, Union
 import logging
-import time
+
+from storage.memory.blob_saver import BlobDedupSaver, CHECKPOINT_BLOB_DEDUP, setup_blob_tables
 
 logger = logging.getLogger(__name__)
 
-# 数据库连接超时时间（秒），每次尝试 15 秒，共尝试 2 次
-DB_CONNECTION_TIMEOUT = 15
-DB_MAX_RETRIES = 2
+# 建表连接的重试时长（秒），超过后退化为 MemorySaver
+DB_SETUP_RETRY_SECONDS = 30
 
 
 class MemoryManager:
     """Memory Manager 单例类"""
 
     _instance: Optional['MemoryManager'] = None
-    _checkpointer: Optional[Union[AsyncPostgresSaver, MemorySaver]] = None
+    _checkpointer: Optional[Union[AsyncPostgresSaver, BlobDedupSaver, MemorySaver]] = None
     _pool: Optional[AsyncConnectionPool] = None
     _setup_done: bool = False
 
@@ -29,21 +29,13 @@ class MemoryManager:
         return cls._instance
 
     def _connect_with_retry(self, db_url: str) -> Optional[psycopg.Connection]:
-        """带重试的数据库连接，每次 15 秒超时，共尝试 2 次"""
-        last_error = None
-        for attempt in range(1, DB_MAX_RETRIES + 1):
-            try:
-                logger.info(f"Attempting database connection (attempt {attempt}/{DB_MAX_RETRIES})")
-                conn = psycopg.connect(db_url, autocommit=True, connect_timeout=DB_CONNECTION_TIMEOUT)
-                logger.info(f"Database connection established on attempt {attempt}")
-                return conn
-            except Exception as e:
-                last_error = e
-                logger.warning(f"Database connection attempt {attempt} failed: {e}")
-                if attempt < DB_MAX_RETRIES:
-                    time.sleep(1)  # 重试前短暂等待
-        logger.error(f"All {DB_MAX_RETRIES} database connection attempts failed, last error: {last_error}")
-        return None
+        """带抖动重试的数据库连接（仅用于一次性建表），失败返回 None"""
+        from storage.database.db import connect_with_retry
+        try:
+            return connect_with_retry(db_url, deadline=DB_SETUP_RETRY_SECONDS)
+        except Exception as e:
+            logger.error(f"Database connection for checkpointer setup failed: {e}")
+            return None
 
     def _setup_schema_and_tables(self, db_url: str) -> bool:
         """同步创建 schema 和表（只执行一次），返回是否成功"""
@@ -59,6 +51,7 @@ class MemoryManager:
                 cur.execute("CREATE SCHEMA IF NOT EXISTS memory")
             conn.execute("SET search_path TO memory")
             PostgresSaver(conn).setup()
+            setup_blob_tables(conn)
             self._setup_done = True
             logger.info("Memory schema and tables created")
             return True
@@ -101,21 +94,14 @@ class MemoryManager:
         if not self._setup_schema_and_tables(db_url):
             return self._create_fallback_checkpointer()
 
-        # 3. 连接字符串加上 search_path
-        if "?" in db_url:
-            db_url = f"{db_url}&options=-csearch_path%3Dmemory"
-        else:
-            db_url = f"{db_url}?options=-csearch_path%3Dmemory"
-
-        # 4. 尝试创建连接池和 checkpointer
+        # 3. 复用进程内共享的异步连接池（search_path 为 memory,public，首次使用时才建立连接）
         try:
-            self._pool = AsyncConnectionPool(
-                conninfo=db_url,
-                timeout=DB_CONNECTION_TIMEOUT,
-                min_size=1,
-                max_idle=300,
-            )
+            from storage.database.db import get_async_pool
+            self._pool = get_async_pool()
             self._checkpointer = AsyncPostgresSaver(self._pool)
+            if CHECKPOINT_BLOB_DEDUP:
+                # 大字段（整篇文档等）按内容寻址压缩存储，checkpoint 中只保留引用
+                self._checkpointer = BlobDedupSaver(self._checkpointer, self._pool)
             logger.info("AsyncPostgresSaver initialized successfully")
         except Exception as e:
             logger.warning(f"Failed to create AsyncPostgresSaver: {e}, will fallback to MemorySaver")
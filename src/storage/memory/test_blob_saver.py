@@ -0,0 +1,153 @@
+"""
+checkpoint 大字段去重测试：压缩往返、引用替换与还原、删除线程只删引用、同步接口报错
+"""
+import asyncio
+import operator
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Annotated, TypedDict
+
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from storage.memory.blob_saver import BlobDedupSaver, compress, decompress, is_blob_ref
+
+
+class _Cursor:
+    """按语句前缀模拟 blob 表读写的游标"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._rows = []
+        self.rowcount = 0
+
+    async def execute(self, sql, params=()):
+        self.pool.statements.append(sql)
+        if sql.startswith("SELECT hash, codec, data FROM checkpoint_payloads"):
+            self._rows = [(h, *self.pool.payloads[h][:2]) for h in params[0] if h in self.pool.payloads]
+        elif sql.startswith("SELECT hash FROM checkpoint_payloads"):
+            self._rows = [(h,) for h in params[0] if h in self.pool.payloads]
+        elif sql.startswith("DELETE FROM checkpoint_payload_refs WHERE thread_id"):
+            self.pool.refs = {r for r in self.pool.refs if r[0] != params[0]}
+
+    async def executemany(self, sql, rows):
+        self.pool.statements.append(sql)
+        for row in rows:
+            if sql.startswith("INSERT INTO checkpoint_payloads"):
+                digest, codec, _, data = row
+                self.pool.payloads.setdefault(digest, (codec, data))
+            else:
+                self.pool.refs.add(tuple(row))
+
+    async def fetchall(self):
+        return self._rows
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _Connection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self, row_factory=None):
+        return _Cursor(self.pool)
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class _Pool:
+    def __init__(self):
+        self.payloads = {}
+        self.refs = set()
+        self.statements = []
+
+    @asynccontextmanager
+    async def connection(self):
+        yield _Connection(self)
+
+
+class _State(TypedDict):
+    doc: str
+    steps: Annotated[list, operator.add]
+
+
+def _graph(saver):
+    builder = StateGraph(_State)
+    builder.add_node("a", lambda s: {"steps": ["a"]})
+    builder.add_node("b", lambda s: {"steps": ["b"]})
+    builder.add_edge(START, "a")
+    builder.add_edge("a", "b")
+    builder.add_edge("b", END)
+    return builder.compile(checkpointer=saver)
+
+
+def test_compress_round_trip():
+    data = "标书正文".encode("utf-8") * 1000
+    for codec in ("zstd", "zlib"):
+        used, packed = compress(data, codec)
+        assert len(packed) < len(data)
+        assert decompress(used, packed) == data
+
+
+def test_large_values_stored_once_and_restored():
+    """大字段在 checkpoint 中只保留引用，同一内容只写一份，读取时还原"""
+    async def scenario():
+        pool = _Pool()
+        inner = MemorySaver()
+        saver = BlobDedupSaver(inner, pool, threshold=100)
+        graph = _graph(saver)
+        config = {"configurable": {"thread_id": "t1"}}
+        doc = "招标文件正文。" * 200
+        await graph.ainvoke({"doc": doc, "steps": []}, config)
+
+        assert len(pool.payloads) == 1
+        assert pool.refs == {("t1", next(iter(pool.payloads)))}
+        raw = await inner.aget_tuple(config)
+        assert is_blob_ref(raw.checkpoint["channel_values"]["doc"])
+
+        state = await graph.aget_state(config)
+        assert state.values["doc"] == doc and state.values["steps"] == ["a", "b"]
+
+        # 清空进程内缓存后从 blob 表取回
+        saver._contents.clear()
+        restored = await saver.aget_tuple(config)
+        assert restored.checkpoint["channel_values"]["doc"] == doc
+        assert saver.stats["fetched"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_delete_thread_only_drops_refs():
+    """删除线程只删除引用，内容由定时垃圾回收清理"""
+    async def scenario():
+        pool = _Pool()
+        saver = BlobDedupSaver(MemorySaver(), pool, threshold=100)
+        config = {"configurable": {"thread_id": "t1"}}
+        await _graph(saver).ainvoke({"doc": "x" * 500, "steps": []}, config)
+
+        pool.statements.clear()
+        await saver.adelete_thread("t1")
+        assert pool.refs == set() and len(pool.payloads) == 1
+        assert not any("checkpoint_payloads p" in sql for sql in pool.statements)
+        assert await saver.aget_tuple(config) is None
+
+    asyncio.run(scenario())
+
+
+def test_sync_methods_raise():
+    saver = BlobDedupSaver(MemorySaver(), _Pool())
+    with pytest.raises(NotImplementedError, match="aget_tuple"):
+        saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    with pytest.raises(NotImplementedError, match="async-only"):
+        saver.delete_thread("t1")
@@ -0,0 +1,277 @@
+"""
+S3 读穿透本地磁盘缓存与签名 URL 缓存
+
+- 对象按 bucket/key/ETag 缓存在本地磁盘；S3_CACHE_REVALIDATE_SECONDS 内直接命中，
+  超过后用 If-None-Match 条件 GET 校验（未变更时服务端返回 304，不重新传输内容）
+- 按字节数做 LRU 淘汰，总大小不超过 S3_CACHE_MAX_BYTES；进程重启后从缓存目录恢复索引
+- 签名 URL 按 (bucket, key, expire_time) 缓存，剩余有效期低于刷新余量前重复使用，减少 /sign-url 代理调用
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from storage.s3.s3_storage import S3SyncStorage
+
+logger = logging.getLogger(__name__)
+
+# 缓存目录
+S3_CACHE_DIR = os.getenv("S3_CACHE_DIR", os.path.join(tempfile.gettempdir(), "s3_cache"))
+# 缓存总大小上限（字节）
+S3_CACHE_MAX_BYTES = int(os.getenv("S3_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# 距上次校验多少秒内直接命中，不再访问 S3（0 表示每次都做条件校验）
+S3_CACHE_REVALIDATE_SECONDS = float(os.getenv("S3_CACHE_REVALIDATE_SECONDS", "30"))
+# 签名 URL 剩余有效期低于该值（秒，最多取有效期的一半）时重新签名
+S3_PRESIGN_REFRESH_MARGIN = float(os.getenv("S3_PRESIGN_REFRESH_MARGIN", "300"))
+# 签名 URL 缓存条数上限
+S3_PRESIGN_CACHE_SIZE = int(os.getenv("S3_PRESIGN_CACHE_SIZE", "10000"))
+
+_NOT_MODIFIED_CODES = {"304", "NotModified"}
+
+
+def _entry_name(bucket: str, key: str, etag: str) -> str:
+    return hashlib.sha1(f"{bucket}\0{key}\0{etag}".encode("utf-8")).hexdigest()
+
+
+class _CacheEntry:
+    __slots__ = ("bucket", "key", "etag", "size", "path", "validated_at")
+
+    def __init__(self, bucket: str, key: str, etag: str, size: int, path: str, validated_at: float = 0.0):
+        self.bucket = bucket
+        self.key = key
+        self.etag = etag
+        self.size = size
+        self.path = path
+        self.validated_at = validated_at
+
+
+class CachedS3Storage:
+    """
+    S3SyncStorage 的读穿透缓存包装
+
+    read_file / get_local_path / generate_presigned_url 走缓存，其余方法原样转发给底层存储。
+    """
+
+    def __init__(
+        self,
+        storage: S3SyncStorage,
+        cache_dir: str = S3_CACHE_DIR,
+        max_bytes: int = S3_CACHE_MAX_BYTES,
+        revalidate_seconds: float = S3_CACHE_REVALIDATE_SECONDS,
+    ):
+        self.storage = storage
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self._entries: "OrderedDict[Tuple[str, str], _CacheEntry]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._presigned: "OrderedDict[Tuple[str, str, int], Tuple[str, float]]" = OrderedDict()
+        self.stats: Dict[str, int] = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0, "presign_hits": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.storage, name)
+
+    # ---------- 索引 ----------
+
+    def _load_index(self):
+        """从缓存目录的元数据文件恢复索引（按修改时间排序作为 LRU 顺序）"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.cache_dir, name)
+            data_path = meta_path[:-5] + ".bin"
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                stat = os.stat(data_path)
+                entries.append((stat.st_mtime, _CacheEntry(meta["bucket"], meta["key"], meta["etag"], stat.st_size, data_path)))
+            except Exception:
+                self._remove_files(data_path)
+        for _, entry in sorted(entries, key=lambda item: item[0]):
+            self._entries[(entry.bucket, entry.key)] = entry
+            self._total_bytes += entry.size
+        self._evict()
+
+    @staticmethod
+    def _remove_files(data_path: str):
+        for path in (data_path, data_path[:-4] + ".json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        """按 LRU 淘汰直到总大小不超过上限（需持有 self._lock 或在初始化中调用）"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.size
+            self._remove_files(entry.path)
+            self.stats["evictions"] += 1
+
+    def _key_lock(self, cache_key: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(cache_key)
+            if lock is None:
+                lock = self._key_locks[cache_key] = threading.Lock()
+            return lock
+
+    def _store(self, bucket: str, key: str, etag: str, content: bytes) -> _CacheEntry:
+        """原子写入缓存文件并登记索引"""
+        base = os.path.join(self.cache_dir, _entry_name(bucket, key, etag))
+        data_path = base + ".bin"
+        tmp_path = f"{data_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, data_path)
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump({"bucket": bucket, "key": key, "etag": etag}, f, ensure_ascii=False)
+        entry = _CacheEntry(bucket, key, etag, len(content), data_path, time.time())
+        with self._lock:
+            old = self._entries.pop((bucket, key), None)
+            if old is not None:
+                self._total_bytes -= old.size
+                if old.path != data_path:
+                    self._remove_files(old.path)
+            self._entries[(bucket, key)] = entry
+            self._total_bytes += entry.size
+            self._evict()
+        return entry
+
+    def _touch(self, cache_key: Tuple[str, str], entry: _CacheEntry):
+        with self._lock:
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+        try:
+            os.utime(entry.path)
+        except OSError:
+            pass
+
+    # ---------- 对象 ----------
+
+    def _ensure_cached(self, file_key: str, bucket: Optional[str]) -> _CacheEntry:
+        """确保对象在本地缓存且为最新版本，返回缓存条目"""
+        target_bucket = self.storage._resolve_bucket(bucket)
+        cache_key = (target_bucket, file_key)
+        with self._key_lock(cache_key):
+            entry = self._entries.get(cache_key)
+            if entry is not None and not os.path.exists(entry.path):
+                entry = None
+            if entry is not None and time.time() - entry.validated_at < self.revalidate_seconds:
+                self.stats["hits"] += 1
+                self._touch(cache_key, entry)
+                return entry
+
+            client = self.storage._get_client()
+            params: Dict[str, Any] = {"Bucket": target_bucket, "Key": file_key}
+            if entry is not None:
+                params["IfNoneMatch"] = entry.etag
+            try:
+                resp = client.get_object(**params)
+            except ClientError as e:
+                code = str((e.response or {}).get("Error", {}).get("Code", ""))
+                status = (e.response or {}).get("ResponseMetadata", {}).get("HTTPStatusCode")
+                if entry is not None and (code in _NOT_MODIFIED_CODES or status == 304):
+                    entry.validated_at = time.time()
+                    self.stats["revalidated"] += 1
+                    self._touch(cache_key, entry)
+                    return entry
+                raise
+
+            body = resp.get("Body")
+            if body is None:
+                raise RuntimeError("S3 get_object returned no Body")
+            try:
+                content = body.read()
+            finally:
+                try:
+                    body.close()
+                except Exception as ce:
+                    logger.debug("Failed to close S3 response body: %s", ce)
+            self.stats["misses"] += 1
+            return self._store(target_bucket, file_key, resp.get("ETag") or "", content)
+
+    def read_file(self, *, file_key: str, bucket: Optional[str] = None) -> bytes:
+        """读取对象（优先本地缓存）"""
+        try:
+            for attempt in range(2):
+                entry = self._ensure_cached(file_key, bucket)
+                try:
+                    with open(entry.path, "rb") as f:
+                        return f.read()
+                except FileNotFoundError:
+                    # 读取前恰好被其它线程淘汰：重新拉取一次
+                    if attempt:
+                        raise
+        except Exception as e:
+            logger.error(self.storage._error_msg("Error reading file from S3 cache", e))
+            raise e
+
+    def get_local_path(self, *, file_key: str, bucket: Optional[str] = None) -> str:
+        """
+        返回对象在本地缓存中的路径（供只需要文件路径的解析器使用）
+
+        注意：返回的文件在缓存淘汰时会被删除，调用方应及时读取，不要长期持有
+        """
+        return self._ensure_cached(file_key, bucket).path
+
+    def invalidate(self, *, file_key: str, bucket: Optional[str] = None):
+        """丢弃对象的本地缓存与签名 URL 缓存"""
+        target_bucket = self.storage._resolve_bucket(bucket)
+        with self._lock:
+            entry = self._entries.pop((target_bucket, file_key), None)
+            if entry is not None:
+                self._total_bytes -= entry.size
+                self._remove_files(entry.path)
+            for cache_key in [k for k in self._presigned if k[0] == target_bucket and k[1] == file_key]:
+                self._presigned.pop(cache_key, None)
+
+    def delete_file(self, *, file_key: str, bucket: Optional[str] = None) -> bool:
+        self.invalidate(file_key=file_key, bucket=bucket)
+        return self.storage.delete_file(file_key=file_key, bucket=bucket)
+
+    # ---------- 签名 URL ----------
+
+    def generate_presigned_url(self, *, key: str, bucket: Optional[str] = None, expire_time: int = 1800) -> str:
+        """生成签名 URL；同一对象、同一有效期的 URL 在剩余有效期充足时直接复用"""
+        target_bucket = self.storage._resolve_bucket(bucket)
+        cache_key = (target_bucket, key, int(expire_time))
+        margin = min(S3_PRESIGN_REFRESH_MARGIN, expire_time / 2)
+        now = time.time()
+        with self._lock:
+            cached = self._presigned.get(cache_key)
+            if cached is not None and cached[1] - now > margin:
+                self._presigned.move_to_end(cache_key)
+                self.stats["presign_hits"] += 1
+                return cached[0]
+
+        url = self.storage.generate_presigned_url(key=key, bucket=bucket, expire_time=expire_time)
+        with self._lock:
+            self._presigned[cache_key] = (url, now + expire_time)
+            while len(self._presigned) > S3_PRESIGN_CACHE_SIZE:
+                self._presigned.popitem(last=False)
+        return url
+
+    def cache_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "presigned_urls": len(self._presigned),
+            }
+
+
+__all__ = ["CachedS3Storage"]
@@ -0,0 +1,412 @@
+"""
+S3 兼容存储的异步实现
+
+接口与 S3SyncStorage 一致（上传、读取、列举、删除、分片上传、签名 URL），另提供异步生成器：
+- iter_list_files：自动翻页逐个产出对象 key
+- iter_file：按块流式读取对象内容
+实现：
+- 安装了 aiobotocore 时使用其异步客户端（aiohttp 连接池，进程内共享，池大小 S3_ASYNC_MAX_POOL）；
+  未安装时回退为在线程池中调用 S3SyncStorage，事件循环同样不会被阻塞
+- 所有请求经 asyncio.Semaphore 限制并发（S3_ASYNC_MAX_CONCURRENCY）
+- 签名 URL 通过共享的 httpx.AsyncClient 调用 /sign-url 代理
+- 令牌与端点复用 token_provider 中的进程级缓存；令牌临近过期时在线程中刷新，
+  请求钩子只读取缓存，事件循环上不做令牌网络请求，也不等待令牌锁
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional
+
+import httpx
+from botocore.exceptions import ClientError
+
+from storage.s3.s3_storage import S3SyncStorage, ListFilesResult, parse_sign_response, S3_MAX_ATTEMPTS, S3_RETRY_MODE
+from storage.s3.token_provider import get_token_provider, discover_endpoint_url
+
+try:
+    from aiobotocore.session import get_session as get_aio_session
+    from aiobotocore.config import AioConfig
+except ImportError:
+    get_aio_session = None
+    AioConfig = None
+
+logger = logging.getLogger(__name__)
+
+# 单个存储实例同时进行的请求数上限
+S3_ASYNC_MAX_CONCURRENCY = int(os.getenv("S3_ASYNC_MAX_CONCURRENCY", "16"))
+# 连接池大小
+S3_ASYNC_MAX_POOL = int(os.getenv("S3_ASYNC_MAX_POOL", "32"))
+# 流式读取的块大小（字节）
+S3_ASYNC_READ_CHUNK = int(os.getenv("S3_ASYNC_READ_CHUNK", str(1024 * 1024)))
+# 签名请求超时（秒）
+S3_SIGN_TIMEOUT = float(os.getenv("S3_SIGN_TIMEOUT", "30"))
+
+
+class S3AsyncStorage:
+    """S3兼容存储的异步实现"""
+
+    def __init__(
+        self,
+        *,
+        endpoint_url: Optional[str] = None,
+        access_key: str,
+        secret_key: str,
+        bucket_name: str,
+        region: str = "cn-beijing",
+        max_concurrency: int = S3_ASYNC_MAX_CONCURRENCY,
+    ):
+        # 命名校验、key 生成、桶解析与错误信息沿用同步实现；未安装 aiobotocore 时也作为回退执行者
+        self._sync = S3SyncStorage(
+            endpoint_url=endpoint_url,
+            access_key=access_key,
+            secret_key=secret_key,
+            bucket_name=bucket_name,
+            region=region,
+        )
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._client = None
+        self._client_lock = asyncio.Lock()
+        self._exit_stack = contextlib.AsyncExitStack()
+        self._http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def native(self) -> bool:
+        """是否使用 aiobotocore 原生异步客户端"""
+        return get_aio_session is not None
+
+    # ---------- 客户端 ----------
+
+    async def _endpoint(self) -> str:
+        endpoint = self._sync.endpoint_url
+        if not endpoint:
+            endpoint = await asyncio.to_thread(discover_endpoint_url) or ""
+            if endpoint:
+                self._sync.endpoint_url = endpoint
+        if not endpoint:
+            logger.error("未配置存储端点：请设置endpoint_url")
+            raise ValueError("未配置存储端点：请设置endpoint_url")
+        return endpoint
+
+    async def _get_client(self):
+        if self._client is not None:
+            return self._client
+        async with self._client_lock:
+            if self._client is not None:
+                return self._client
+            endpoint = await self._endpoint()
+            token_provider = get_token_provider()
+
+            client = await self._exit_stack.enter_async_context(
+                get_aio_session().create_client(
+                    "s3",
+                    endpoint_url=endpoint,
+                    aws_access_key_id=self._sync.access_key,
+                    aws_secret_access_key=self._sync.secret_key,
+                    region_name=self._sync.region,
+                    config=AioConfig(
+                        retries={"mode": S3_RETRY_MODE, "max_attempts": S3_MAX_ATTEMPTS},
+                        max_pool_connections=S3_ASYNC_MAX_POOL,
+                    ),
+                )
+            )
+
+            def _inject_header(**kwargs):
+                # 运行在事件循环上：只读缓存（由 _ensure_token 在请求前刷新）
+                token = token_provider.peek()
+                if token is None:
+                    logger.error("Error loading COZE_WORKLOAD_IDENTITY_TOKEN: no valid cached token")
+                    return
+                params = kwargs.get("params", {})
+                headers = params.setdefault("headers", {})
+                headers["x-storage-token"] = token
+
+            def _drop_rejected_token(http_response=None, **kwargs):
+                if http_response is not None and getattr(http_response, "status_code", None) in (401, 403):
+                    token_provider.invalidate()
+
+            client.meta.events.register("before-call.s3", _inject_header)
+            client.meta.events.register("after-call.s3", _drop_rejected_token)
+            self._client = client
+            return client
+
+    @staticmethod
+    async def _ensure_token():
+        """令牌临近过期时在线程中刷新（刷新请求与令牌锁都不占用事件循环）"""
+        token_provider = get_token_provider()
+        if token_provider.is_fresh():
+            return
+        try:
+            await asyncio.to_thread(token_provider.get_token)
+        except Exception as e:
+            logger.error("Error loading COZE_WORKLOAD_IDENTITY_TOKEN: %s", e)
+
+    async def _call(self, method: str, **params) -> Dict[str, Any]:
+        """在并发限制下调用一次 S3 API"""
+        async with self._semaphore:
+            client = await self._get_client()
+            await self._ensure_token()
+            return await getattr(client, method)(**params)
+
+    async def _offload(self, func, *args, **kwargs):
+        """回退模式：在并发限制下把同步调用放到线程池"""
+        async with self._semaphore:
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    def _get_http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=S3_SIGN_TIMEOUT,
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+            )
+        return self._http
+
+    async def close(self):
+        """关闭连接池"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        await self._exit_stack.aclose()
+        self._exit_stack = contextlib.AsyncExitStack()
+        self._client = None
+
+    async def __aenter__(self) -> "S3AsyncStorage":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # ---------- 对象操作 ----------
+
+    async def upload_file(self, *, file_content: bytes, file_name: str,
+                          content_type: str = "application/octet-stream", bucket: Optional[str] = None) -> str:
+        if not self.native:
+            return await self._offload(self._sync.upload_file, file_content=file_content, file_name=file_name,
+                                       content_type=content_type, bucket=bucket)
+        self._sync._validate_file_name(file_name)
+        try:
+            object_key = self._sync._generate_object_key(original_name=file_name)
+            target_bucket = self._sync._resolve_bucket(bucket)
+            await self._call("put_object", Bucket=target_bucket, Key=object_key, Body=file_content,
+                             ContentType=content_type)
+            return object_key
+        except Exception as e:
+            logger.error(self._sync._error_msg("Error uploading file to S3", e))
+            raise e
+
+    async def delete_file(self, *, file_key: str, bucket: Optional[str] = None) -> bool:
+        if not self.native:
+            return await self._offload(self._sync.delete_file, file_key=file_key, bucket=bucket)
+        try:
+            await self._call("delete_object", Bucket=self._sync._resolve_bucket(bucket), Key=file_key)
+            return True
+        except Exception as e:
+            logger.error(self._sync._error_msg("Error deleting file from S3", e))
+            raise e
+
+    async def file_exists(self, *, file_key: str, bucket: Optional[str] = None) -> bool:
+        if not self.native:
+            return await self._offload(self._sync.file_exists, file_key=file_key, bucket=bucket)
+        try:
+            await self._call("head_object", Bucket=self._sync._resolve_bucket(bucket), Key=file_key)
+            return True
+        except ClientError as e:
+            code = (e.response or {}).get("Error", {}).get("Code", "")
+            if code in {"404", "NoSuchKey", "NotFound"}:
+                return False
+            logger.error(self._sync._error_msg("Error checking file existence in S3", e))
+            return False
+        except Exception as e:
+            logger.error(self._sync._error_msg("Error checking file existence in S3", e))
+            return False
+
+    async def read_file(self, *, file_key: str, bucket: Optional[str] = None) -> bytes:
+        if not self.native:
+            return await self._offload(self._sync.read_file, file_key=file_key, bucket=bucket)
+        chunks = [chunk async for chunk in self.iter_file(file_key=file_key, bucket=bucket)]
+        return b"".join(chunks)
+
+    async def iter_file(self, *, file_key: str, bucket: Optional[str] = None,
+                        chunk_size: int = S3_ASYNC_READ_CHUNK) -> AsyncIterator[bytes]:
+        """按块流式读取对象内容（读取期间占用一个并发名额）"""
+        target_bucket = self._sync._resolve_bucket(bucket)
+        try:
+            async with self._semaphore:
+                if self.native:
+                    client = await self._get_client()
+                    await self._ensure_token()
+                    resp = await client.get_object(Bucket=target_bucket, Key=file_key)
+                    body = resp.get("Body")
+                    if body is None:
+                        raise RuntimeError("S3 get_object returned no Body")
+                    async with body as stream:
+                        while True:
+                            chunk = await stream.read(chunk_size)
+                            if not chunk:
+                                break
+                            yield chunk
+                else:
+                    # 首次创建同步客户端可能要发现端点，同样放到线程中
+                    client = await asyncio.to_thread(self._sync._get_client)
+                    resp = await asyncio.to_thread(client.get_object, Bucket=target_bucket, Key=file_key)
+                    body = resp.get("Body")
+                    if body is None:
+                        raise RuntimeError("S3 get_object returned no Body")
+                    try:
+                        while True:
+                            chunk = await asyncio.to_thread(body.read, chunk_size)
+                            if not chunk:
+                                break
+                            yield chunk
+                    finally:
+                        body.close()
+        except Exception as e:
+            logger.error(self._sync._error_msg("Error reading file from S3", e))
+            raise e
+
+    async def list_files(self, *, prefix: Optional[str] = None, bucket: Optional[str] = None, max_keys: int = 1000,
+                         continuation_token: Optional[str] = None) -> ListFilesResult:
+        """列出对象，支持前缀过滤与分页；返回 keys/is_truncated/next_continuation_token。"""
+        if not self.native:
+            return await self._offload(self._sync.list_files, prefix=prefix, bucket=bucket, max_keys=max_keys,
+                                       continuation_token=continuation_token)
+        try:
+            if max_keys <= 0 or max_keys > 1000:
+                raise ValueError("max_keys 必须在 1 到 1000 之间")
+            kwargs: Dict[str, Any] = {
+                "Bucket": self._sync._resolve_bucket(bucket),
+                "MaxKeys": max_keys,
+                "Prefix": prefix,
+                "ContinuationToken": continuation_token,
+            }
+            resp = await self._call("list_objects_v2", **{k: v for k, v in kwargs.items() if v is not None})
+            contents = resp.get("Contents", []) or []
+            return {
+                "keys": [item.get("Key") for item in contents if isinstance(item, dict) and item.get("Key")],
+                "is_truncated": bool(resp.get("IsTruncated")),
+                "next_continuation_token": resp.get("NextContinuationToken"),
+            }
+        except Exception as e:
+            logger.error(self._sync._error_msg("Error listing files in S3", e))
+            raise e
+
+    async def iter_list_files(self, *, prefix: Optional[str] = None, bucket: Optional[str] = None,
+                              page_size: int = 1000) -> AsyncIterator[str]:
+        """自动翻页，逐个产出对象 key"""
+        token: Optional[str] = None
+        while True:
+            page = await self.list_files(prefix=prefix, bucket=bucket, max_keys=page_size, continuation_token=token)
+            for key in page["keys"]:
+                yield key
+            token = page["next_continuation_token"]
+            if not page["is_truncated"] or not token:
+                return
+
+    async def trunk_upload_file(self, *, chunk_iter: AsyncIterable[bytes], file_name: str,
+                                content_type: str = "application/octet-stream", bucket: Optional[str] = None,
+                                part_size: int = 5 * 1024 * 1024) -> str:
+        """流式上传（异步字节迭代器，显式分片 Multipart Upload，分片并发上传）
+        - chunk_iter: 异步可迭代对象，逐块产生 bytes；内部累积到 part_size 再上传，最后一块可小于 5MB
+        - part_size: 每个 part 的最小大小（除最后一个）；默认 5MB
+        同时在途的分片数受 S3_ASYNC_MAX_CONCURRENCY 限制，生产方在名额用尽时等待
+        返回：最终写入的对象 key
+        """
+        target_bucket = self._sync._resolve_bucket(bucket)
+        key = self._sync._generate_object_key(original_name=file_name)
+        if self.native:
+            create = lambda **kw: self._call("create_multipart_upload", **kw)
+            upload_part = lambda **kw: self._call("upload_part", **kw)
+            complete = lambda **kw: self._call("complete_multipart_upload", **kw)
+            abort = lambda **kw: self._call("abort_multipart_upload", **kw)
+        else:
+            client = await asyncio.to_thread(self._sync._get_client)
+            create = lambda **kw: self._offload(client.create_multipart_upload, **kw)
+            upload_part = lambda **kw: self._offload(client.upload_part, **kw)
+            complete = lambda **kw: self._offload(client.complete_multipart_upload, **kw)
+            abort = lambda **kw: self._offload(client.abort_multipart_upload, **kw)
+
+        try:
+            upload_id = (await create(Bucket=target_bucket, Key=key, ContentType=content_type))["UploadId"]
+        except Exception as e:
+            logger.error(self._sync._error_msg("create_multipart_upload failed", e))
+            raise e
+
+        parts: List[Dict[str, Any]] = []
+        in_flight: "set[asyncio.Task]" = set()
+        # 限制在途分片数（与请求并发上限一致），控制内存占用
+        slots = asyncio.Semaphore(self.max_concurrency)
+
+        async def _upload(number: int, data: bytes):
+            try:
+                resp = await upload_part(Bucket=target_bucket, Key=key, UploadId=upload_id, PartNumber=number,
+                                         Body=data)
+                parts.append({"PartNumber": number, "ETag": resp["ETag"]})
+            finally:
+                slots.release()
+
+        async def _submit(number: int, data: bytes):
+            await slots.acquire()
+            # 提前暴露已失败的分片，避免继续消费输入
+            for task in [t for t in in_flight if t.done()]:
+                in_flight.discard(task)
+                task.result()
+            task = asyncio.create_task(_upload(number, data))
+            in_flight.add(task)
+
+        part_number = 1
+        buffer = bytearray()
+        try:
+            async for chunk in chunk_iter:
+                if not chunk:
+                    continue
+                buffer.extend(chunk)
+                while len(buffer) >= part_size:
+                    await _submit(part_number, bytes(memoryview(buffer)[:part_size]))
+                    del buffer[:part_size]
+                    part_number += 1
+            if buffer:
+                await _submit(part_number, bytes(buffer))
+            await asyncio.gather(*in_flight)
+            parts.sort(key=lambda p: p["PartNumber"])
+            await complete(Bucket=target_bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+            return key
+        except BaseException as e:
+            for task in in_flight:
+                task.cancel()
+            logger.error(self._sync._error_msg("multipart upload failed", e) if isinstance(e, Exception) else
+                         "multipart upload cancelled")
+            try:
+                await abort(Bucket=target_bucket, Key=key, UploadId=upload_id)
+            except Exception as ae:
+                logger.error(self._sync._error_msg("abort_multipart_upload failed", ae))
+            raise
+
+    async def generate_presigned_url(self, *, key: str, bucket: Optional[str] = None, expire_time: int = 1800) -> str:
+        """通过 S3 Proxy 生成签名 URL（共享 httpx 连接池）。"""
+        try:
+            token = await asyncio.to_thread(get_token_provider().get_token)
+        except Exception as e:
+            logger.error(f"Error loading x-storage-token: {e}")
+            raise RuntimeError(f"获取 x-storage-token 失败: {e}")
+        sign_base = os.environ.get("COZE_BUCKET_ENDPOINT_URL") or self._sync.endpoint_url
+        if not sign_base:
+            raise RuntimeError("创建 sign-url 请求失败: 未配置签名端点：请设置 COZE_BUCKET_ENDPOINT_URL 或传入 endpoint_url")
+        payload = {"bucket_name": self._sync._resolve_bucket(bucket), "path": key, "expire_time": expire_time}
+        try:
+            async with self._semaphore:
+                resp = await self._get_http().post(
+                    sign_base.rstrip("/") + "/sign-url",
+                    content=json.dumps(payload).encode("utf-8"),
+                    headers={"Content-Type": "application/json", "x-storage-token": token},
+                )
+            if resp.status_code in (401, 403):
+                get_token_provider().invalidate()
+            resp.raise_for_status()
+            return parse_sign_response(resp.headers.get("Content-Type", ""), resp.text)
+        except Exception as e:
+            raise RuntimeError(f"生成签名URL失败: {e}")
+
+
+__all__ = ["S3AsyncStorage"]
@@ -1,18 +1,37 @@
+import json
 import os
+import queue
 import re
+import threading
 from pathlib import Path
 from typing import Optional, Any, Dict, List, TypedDict, Iterable
 from uuid import uuid4
 
 import boto3
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError
 from boto3.s3.transfer import TransferConfig
 import logging
+
+from storage.s3.token_provider import get_token_provider, discover_endpoint_url
+from storage.s3.transfer import (
+    MemoryviewReader,
+    S3_TRANSFER_CONCURRENCY,
+    S3_TRANSFER_PART_SIZE,
+    budgeted_concurrency,
+    ranged_download,
+)
+
 logger = logging.getLogger(__name__)
 
 # 允许的文件名字符集（面向用户输入的约束）
 FILE_NAME_ALLOWED_RE = re.compile(r"^[A-Za-z0-9._\-/]+$")
 
+# botocore 重试模式：adaptive 会在限流（429/503/SlowDown）时在客户端侧自动降速
+S3_RETRY_MODE = os.getenv("S3_RETRY_MODE", "adaptive")
+# 单次调用的最大尝试次数（含首次）
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "5"))
+
 
 class ListFilesResult(TypedDict):
     # list_files 的返回结构类型
@@ -20,6 +39,23 @@ class ListFilesResult(TypedDict):
     is_truncated: bool
     next_continuation_token: Optional[str]
 
+def parse_sign_response(content_type: str, text: str) -> str:
+    """解析 /sign-url 代理的响应，返回签名 URL"""
+    if "application/json" in content_type or text.strip().startswith("{"):
+        try:
+            obj = json.loads(text)
+        except Exception:
+            return text
+        data = obj.get("data")
+        if isinstance(data, dict) and "url" in data:
+            return data["url"]
+        url_value = obj.get("url") or obj.get("signed_url") or obj.get("presigned_url")
+        if url_value:
+            return url_value
+        raise ValueError("签名服务返回缺少 data.url/url 字段")
+    return text
+
+
 class S3SyncStorage:
     """S3兼容存储实现"""
 
@@ -35,19 +71,10 @@ class S3SyncStorage:
         if self._client is None:
             endpoint = self.endpoint_url
             if endpoint is None or endpoint == "":
-                try:
-                    from coze_workload_identity import Client as CozeEnvClient
-                    coze_env_client = CozeEnvClient()
-                    env_vars = coze_env_client.get_project_env_vars()
-                    coze_env_client.close()
-                    for env_var in env_vars:
-                        if env_var.key == "COZE_BUCKET_ENDPOINT_URL":
-                            endpoint = env_var.value.replace("'", "'\\''")
-                            self.endpoint_url = endpoint
-                            break
-                except Exception as e:
-                    logger.error(f"Error loading COZE_BUCKET_ENDPOINT_URL: {e}")
-                    # 保持向下校验逻辑，避免在此处中断
+                # 端点发现结果按进程缓存，失败时保持向下校验逻辑
+                endpoint = discover_endpoint_url()
+                if endpoint:
+                    self.endpoint_url = endpoint
             if endpoint is None or endpoint == "":
                 logger.error("未配置存储端点：请设置endpoint_url")
                 raise ValueError("未配置存储端点：请设置endpoint_url")
@@ -58,28 +85,32 @@ class S3SyncStorage:
                 aws_access_key_id=self.access_key,
                 aws_secret_access_key=self.secret_key,
                 region_name=self.region,
+                # 连接池需容纳并发分片上传 / 分段下载
+                config=BotoConfig(
+                    retries={"mode": S3_RETRY_MODE, "max_attempts": S3_MAX_ATTEMPTS},
+                    max_pool_connections=max(10, S3_TRANSFER_CONCURRENCY * 2),
+                ),
             )
 
-            # 注册 before-call 钩子，发送前注入 x-storage-token 头
+            token_provider = get_token_provider()
+
+            # 注册 before-call 钩子，发送前注入 x-storage-token 头（令牌在进程内缓存至临近过期）
             def _inject_header(**kwargs):
                 try:
-                    from coze_workload_identity import Client as CozeClient
-                    coze_client = CozeClient()
-                    try:
-                        token = coze_client.get_access_token()
-                    except Exception as e:
-                        logger.error("Error loading COZE_WORKLOAD_IDENTITY_TOKEN: %s", e)
-                        token = None
-                        raise e
-                    finally:
-                        coze_client.close()
+                    token = token_provider.get_token()
                     params = kwargs.get("params", {})
                     headers = params.setdefault("headers", {})
                     headers["x-storage-token"] = token
                 except Exception as e:
                     logger.error("Error loading COZE_WORKLOAD_IDENTITY_TOKEN: %s", e)
-                    pass
+
+            # 令牌被服务端拒绝时丢弃缓存，下一次调用重新获取
+            def _drop_rejected_token(http_response=None, **kwargs):
+                if http_response is not None and getattr(http_response, "status_code", None) in (401, 403):
+                    token_provider.invalidate()
+
             client.meta.events.register("before-call.s3", _inject_header)
+            client.meta.events.register("after-call.s3", _drop_rejected_token)
             self._client = client
         return self._client
 
@@ -198,6 +229,90 @@ class S3SyncStorage:
             logger.error(self._error_msg("Error reading file from S3", e))
             raise e
 
+    def _head_for_download(self, client, target_bucket: str, file_key: str) -> tuple[int, Optional[str]]:
+        """查询对象大小与 ETag"""
+        head = client.head_object(Bucket=target_bucket, Key=file_key)
+        return int(head.get("ContentLength") or 0), head.get("ETag")
+
+    def read_file_parallel(self, *, file_key: str, bucket: Optional[str] = None,
+                           part_size: int = S3_TRANSFER_PART_SIZE,
+                           max_concurrency: int = S3_TRANSFER_CONCURRENCY) -> bytearray:
+        """分段并发读取对象到预分配的缓冲区
+        - part_size: 每个 Range GET 的字节数；对象不大于一个分段时退化为 read_file
+        - max_concurrency: 最大并发数；遇到 429/503 等限流时自动减半，成功后逐步恢复
+        返回：对象内容（bytearray，避免拼接后再复制一份）
+        """
+        try:
+            client = self._get_client()
+            target_bucket = self._resolve_bucket(bucket)
+            size, etag = self._head_for_download(client, target_bucket, file_key)
+            if size <= part_size:
+                return bytearray(self.read_file(file_key=file_key, bucket=bucket))
+
+            buffer = bytearray(size)
+            view = memoryview(buffer)
+
+            def _sink(offset: int, data: bytes):
+                view[offset:offset + len(data)] = data
+
+            ranged_download(client, bucket=target_bucket, key=file_key, size=size, sink=_sink, etag=etag,
+                            part_size=part_size, max_concurrency=max_concurrency)
+            return buffer
+        except Exception as e:
+            logger.error(self._error_msg("Error reading file from S3 in parallel", e))
+            raise e
+
+    def download_to_path(self, *, file_key: str, path: str, bucket: Optional[str] = None,
+                         part_size: int = S3_TRANSFER_PART_SIZE,
+                         max_concurrency: int = S3_TRANSFER_CONCURRENCY) -> str:
+        """分段并发下载对象到本地文件
+        - 先写入预分配大小的临时文件（path + ".part"），各分段按偏移直接写入，完成后原子替换为 path
+        - 并发与限流退避同 read_file_parallel
+        返回：本地文件路径
+        """
+        tmp_path = f"{path}.part"
+        try:
+            client = self._get_client()
+            target_bucket = self._resolve_bucket(bucket)
+            size, etag = self._head_for_download(client, target_bucket, file_key)
+            parent = os.path.dirname(path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.truncate(size)
+
+            fd = os.open(tmp_path, os.O_WRONLY)
+            try:
+                if hasattr(os, "pwrite"):
+                    def _sink(offset: int, data: bytes):
+                        view = memoryview(data)
+                        while view:
+                            written = os.pwrite(fd, view, offset)
+                            view = view[written:]
+                            offset += written
+                else:
+                    write_lock = threading.Lock()
+
+                    def _sink(offset: int, data: bytes):
+                        with write_lock:
+                            os.lseek(fd, offset, os.SEEK_SET)
+                            os.write(fd, data)
+
+                if size > 0:
+                    ranged_download(client, bucket=target_bucket, key=file_key, size=size, sink=_sink, etag=etag,
+                                    part_size=part_size, max_concurrency=max_concurrency)
+            finally:
+                os.close(fd)
+            os.replace(tmp_path, path)
+            return path
+        except Exception as e:
+            logger.error(self._error_msg("Error downloading file from S3", e))
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise e
+
     def list_files(self, *, prefix: Optional[str] = None, bucket: Optional[str] = None, max_keys: int = 1000, continuation_token: Optional[str] = None) -> ListFilesResult:
         """列出对象，支持前缀过滤与分页；返回 keys/is_truncated/next_continuation_token。"""
         try:
@@ -232,19 +347,9 @@ class S3SyncStorage:
 
     def generate_presigned_url(self, *, key: str, bucket: Optional[str] = None, expire_time: int = 1800) -> str:
         """通过 S3 Proxy 生成签名 URL。"""
-        import json
         import urllib.request as urllib_request
         try:
-            from coze_workload_identity import Client as CozeClient
-            coze_client = CozeClient()
-            try:
-                token = coze_client.get_access_token()
-            finally:
-                try:
-                    coze_client.close()
-                except Exception:
-                    # 资源释放失败不影响后续流程
-                    pass
+            token = get_token_provider().get_token()
         except Exception as e:
             logger.error(f"Error loading x-storage-token: {e}")
             raise RuntimeError(f"获取 x-storage-token 失败: {e}")
@@ -271,21 +376,10 @@ class S3SyncStorage:
             with urllib_request.urlopen(request) as resp:
                 resp_bytes = resp.read()
                 content_type = resp.headers.get("Content-Type", "")
-                text = resp_bytes.decode("utf-8", errors="replace")
-                if "application/json" in content_type or text.strip().startswith("{"):
-                    try:
-                        obj = json.loads(text)
-                    except Exception:
-                        return text
-                    data = obj.get("data")
-                    if isinstance(data, dict) and "url" in data:
-                        return data["url"]
-                    url_value = obj.get("url") or obj.get("signed_url") or obj.get("presigned_url")
-                    if url_value:
-                        return url_value
-                    raise ValueError("签名服务返回缺少 data.url/url 字段")
-                return text
+                return parse_sign_response(content_type, resp_bytes.decode("utf-8", errors="replace"))
         except Exception as e:
+            if getattr(e, "code", None) in (401, 403):
+                get_token_provider().invalidate()
             raise RuntimeError(f"生成签名URL失败: {e}")
 
     def stream_upload_file(
@@ -297,8 +391,8 @@ class S3SyncStorage:
             bucket: Optional[str] = None,
             multipart_chunksize: int = 5 * 1024 * 1024,
             multipart_threshold: int = 5 * 1024 * 1024,
-            max_concurrency: int = 1,
-            use_threads: bool = False,
+            max_concurrency: Optional[int] = None,
+            use_threads: Optional[bool] = None,
     ) -> str:
         """流式上传（文件对象）
         - fileobj: 任何带有 read() 方法的文件对象（如 open(..., 'rb') 返回的对象、io.BytesIO 等）
@@ -307,8 +401,9 @@ class S3SyncStorage:
         - bucket: 目标桶；为空时取环境变量或实例默认值
         - multipart_chunksize: 分片大小（默认 5MB，以适配代理层限制）
         - multipart_threshold: 触发分片上传的阈值（默认 5MB）
-        - max_concurrency: 并发分片上传的并发数（默认 1，避免代理层节流影响）
-        - use_threads: 是否启用线程并发（默认 False）
+        - max_concurrency: 并发分片上传的并发数（默认 S3_TRANSFER_CONCURRENCY，并受 S3_TRANSFER_MEMORY_BUDGET 约束；
+          代理层限流由客户端的 adaptive 重试模式自动降速）
+        - use_threads: 是否启用线程并发（默认并发数大于 1 时启用）
         返回：最终写入的对象 key
         """
         try:
@@ -319,12 +414,17 @@ class S3SyncStorage:
             extra_args = {"ContentType": content_type} if content_type else {}
             # 使用 boto3 的高阶方法执行多段上传（传入 TransferConfig 控制分片大小）
 
+            concurrency = budgeted_concurrency(multipart_chunksize, max_concurrency or S3_TRANSFER_CONCURRENCY)
+            if use_threads is None:
+                use_threads = concurrency > 1
             config = TransferConfig(
                 multipart_chunksize=multipart_chunksize,
                 multipart_threshold=multipart_threshold,
-                max_concurrency=max_concurrency,
+                max_concurrency=concurrency,
                 use_threads=use_threads,
             )
+            # 非可 seek 的流会把分片读入内存，限制在途分片数以控制内存占用（boto3 的构造参数未暴露此项）
+            config.max_in_memory_upload_chunks = concurrency
             client.upload_fileobj(Fileobj=fileobj, Bucket=target_bucket, Key=key, ExtraArgs=extra_args, Config=config)
             return key
         except Exception as e:
@@ -364,18 +464,23 @@ class S3SyncStorage:
 
     def trunk_upload_file(self, *, chunk_iter: Iterable[bytes], file_name: str,
                            content_type: str = "application/octet-stream", bucket: Optional[str] = None,
-                           part_size: int = 5 * 1024 * 1024) -> str:
+                           part_size: int = 5 * 1024 * 1024, max_concurrency: Optional[int] = None) -> str:
         """流式上传（字节迭代器，显式分片 Multipart Upload）
         - chunk_iter: 可迭代对象，逐块产生 bytes；每块大小可变（内部累积到 part_size 再上传），最后一块可小于 5MB
         - file_name: 原始文件名，用于生成唯一 key
         - content_type: MIME 类型
         - bucket: 目标桶；为空时取环境或实例默认值
         - part_size: 每个 part 的最小大小（除最后一个）；默认 5MB
+        - max_concurrency: 并发上传的分片数（默认 S3_TRANSFER_CONCURRENCY，并受 S3_TRANSFER_MEMORY_BUDGET 约束）
+        实现：预分配 并发数 + 1 个 part_size 的分片缓冲区轮转使用，输入块只复制一次进缓冲区；
+        写满的缓冲区经有界队列交给上传线程，以 memoryview 直接作为 Body，上传完成后归还；
+        全部缓冲区都在上传中时生产方阻塞，内存占用恒定。
         返回：最终写入的对象 key
         """
         client = self._get_client()
         target_bucket = self._resolve_bucket(bucket)
         key = self._generate_object_key(original_name=file_name)
+        concurrency = budgeted_concurrency(part_size, max_concurrency or S3_TRANSFER_CONCURRENCY)
 
         # 初始化分片上传
         try:
@@ -385,28 +490,85 @@ class S3SyncStorage:
             logger.error(self._error_msg("create_multipart_upload failed", e))
             raise e
 
-        parts = []
+        # 空闲缓冲区与待上传分片队列；多一个缓冲区让生产方在所有上传进行中时也能继续填充
+        free_buffers: "queue.Queue[bytearray]" = queue.Queue()
+        for _ in range(concurrency + 1):
+            free_buffers.put(bytearray(part_size))
+        pending_parts: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=concurrency)
+        parts: List[Dict[str, Any]] = []
+        parts_lock = threading.Lock()
+        errors: List[BaseException] = []
+
+        def _uploader():
+            while True:
+                item = pending_parts.get()
+                if item is None:
+                    return
+                number, buf, length = item
+                try:
+                    if not errors:
+                        resp = client.upload_part(Bucket=target_bucket, Key=key, UploadId=upload_id, PartNumber=number,
+                                                  Body=MemoryviewReader(memoryview(buf)[:length]))
+                        with parts_lock:
+                            parts.append({"PartNumber": number, "ETag": resp["ETag"]})
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    free_buffers.put(buf)
+
+        uploaders = [
+            threading.Thread(target=_uploader, name=f"s3-part-upload-{i}", daemon=True)
+            for i in range(concurrency)
+        ]
+        for uploader in uploaders:
+            uploader.start()
+
+        def _take_buffer() -> bytearray:
+            # 等待空闲缓冲区期间上传失败时及早退出
+            while True:
+                if errors:
+                    raise errors[0]
+                try:
+                    return free_buffers.get(timeout=1)
+                except queue.Empty:
+                    continue
+
         part_number = 1
-        buffer = bytearray()
         try:
+            buf = _take_buffer()
+            filled = 0
             for chunk in chunk_iter:
                 if not chunk:
                     continue
-                buffer.extend(chunk)
-                while len(buffer) >= part_size:
-                    data = bytes(buffer[:part_size])
-                    buffer = buffer[part_size:]
-                    resp = client.upload_part(Bucket=target_bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
-                                              Body=data)
-                    parts.append({"PartNumber": part_number, "ETag": resp["ETag"]})
-                    part_number += 1
+                view = memoryview(chunk)
+                while view:
+                    n = min(len(view), part_size - filled)
+                    buf[filled:filled + n] = view[:n]
+                    filled += n
+                    view = view[n:]
+                    if filled == part_size:
+                        pending_parts.put((part_number, buf, filled))
+                        part_number += 1
+                        buf = _take_buffer()
+                        filled = 0
 
             # 上传最后不足 part_size 的余量
-            if len(buffer) > 0:
-                resp = client.upload_part(Bucket=target_bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
-                                          Body=bytes(buffer))
-                parts.append({"PartNumber": part_number, "ETag": resp["ETag"]})
+            if filled > 0:
+                pending_parts.put((part_number, buf, filled))
+            else:
+                free_buffers.put(buf)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            for _ in uploaders:
+                pending_parts.put(None)
+            for uploader in uploaders:
+                uploader.join()
 
+        try:
+            if errors:
+                raise errors[0]
+            parts.sort(key=lambda p: p["PartNumber"])
             # 完成分片
             client.complete_multipart_upload(
                 Bucket=target_bucket,
@@ -0,0 +1,87 @@
+"""
+存储令牌缓存测试：过期时间解析、缓存复用、单飞刷新与刷新失败时沿用旧令牌
+"""
+import base64
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from storage.s3.token_provider import WorkloadTokenProvider, token_expiry
+
+
+def _jwt(exp: float) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+def test_token_expiry_parses_jwt_only():
+    assert token_expiry(_jwt(1700000000)) == 1700000000.0
+    assert token_expiry("opaque-token") is None
+    assert token_expiry("a.not-base64!.c") is None
+
+
+def test_cached_until_refresh_margin():
+    """令牌在过期前 refresh_margin 秒内复用，之后重新获取；无法解析过期时间时按 ttl 缓存"""
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return _jwt(time.time() + 120) if len(calls) == 1 else "opaque"
+
+    provider = WorkloadTokenProvider(fetch=fetch, ttl=300, refresh_margin=60)
+    first = provider.get_token()
+    assert provider.get_token() == first and len(calls) == 1
+
+    provider._expires_at = time.time() + 30
+    assert provider.get_token() == "opaque" and len(calls) == 2
+    assert provider._expires_at == pytest.approx(time.time() + 300, abs=5)
+    provider.invalidate()
+    assert provider.peek() is None
+
+
+def test_concurrent_refresh_is_single_flight():
+    """多个线程同时发现令牌过期时只刷新一次"""
+    calls = []
+    started = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        started.wait(1)
+        return "token"
+
+    provider = WorkloadTokenProvider(fetch=fetch, ttl=300, refresh_margin=0)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(provider.get_token())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    started.set()
+    for t in threads:
+        t.join()
+    assert results == ["token"] * 8
+    assert len(calls) == 1
+
+
+def test_refresh_failure_keeps_unexpired_token():
+    """刷新失败而旧令牌尚未真正过期时继续使用旧令牌，已过期则抛出错误"""
+    tokens = iter(["old"])
+
+    def fetch():
+        try:
+            return next(tokens)
+        except StopIteration:
+            raise ConnectionError("identity service unavailable")
+
+    provider = WorkloadTokenProvider(fetch=fetch, ttl=300, refresh_margin=60)
+    provider.get_token()
+    provider._expires_at = time.time() + 10
+    assert provider.get_token() == "old"
+    provider._expires_at = time.time() - 1
+    with pytest.raises(ConnectionError):
+        provider.get_token()
@@ -0,0 +1,122 @@
+"""
+S3 并发传输辅助测试：内存预算并发、AIMD 限流、分段下载的重试与拼接、memoryview 上传体
+"""
+import io
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+from botocore.exceptions import ClientError
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from storage.s3 import transfer
+from storage.s3.transfer import (
+    AdaptiveConcurrency,
+    MemoryviewReader,
+    budgeted_concurrency,
+    is_throttle_error,
+    ranged_download,
+    split_ranges,
+)
+
+
+def _client_error(code: str, status: int) -> ClientError:
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "GetObject")
+
+
+class _Body:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def iter_chunks(self, size):
+        for i in range(0, len(self._data), size):
+            yield self._data[i:i + size]
+
+    def close(self):
+        pass
+
+
+class _Client:
+    """按 Range 返回数据的假客户端，failures 中的区间首次请求时抛出对应错误"""
+
+    def __init__(self, data: bytes, failures=None):
+        self.data = data
+        self.failures = dict(failures or {})
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def get_object(self, Bucket, Key, Range, IfMatch=None):
+        start, end = (int(x) for x in Range[len("bytes="):].split("-"))
+        with self._lock:
+            self.requests.append((Range, IfMatch))
+            error = self.failures.pop(start, None)
+        if error is not None:
+            raise error
+        return {"Body": _Body(self.data[start:end + 1])}
+
+
+def test_budget_and_ranges():
+    assert budgeted_concurrency(8 << 20, max_concurrency=8, memory_budget=32 << 20) == 4
+    assert budgeted_concurrency(1 << 30, max_concurrency=8, memory_budget=32 << 20) == 1
+    assert split_ranges(10, 4) == [(0, 3), (4, 7), (8, 9)]
+    assert split_ranges(0, 4) == []
+
+
+def test_throttle_detection_and_aimd():
+    """限流错误使并发上限减半，连续成功 limit 次后加一"""
+    assert is_throttle_error(_client_error("SlowDown", 503))
+    assert is_throttle_error(_client_error("Unknown", 429))
+    assert not is_throttle_error(_client_error("NoSuchKey", 404))
+    assert not is_throttle_error(ValueError("x"))
+
+    limiter = AdaptiveConcurrency(8)
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 4 and limiter.throttled == 1
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 5
+
+
+def test_ranged_download_retries_and_assembles(monkeypatch):
+    """分段并发下载：失败与限流的分段重试，结果按偏移拼接完整，每段带 If-Match"""
+    monkeypatch.setattr(transfer, "_backoff", lambda attempt: 0)
+    data = bytes(range(256)) * 40
+    client = _Client(data, failures={0: _client_error("SlowDown", 503), 2048: IOError("reset")})
+    buffer = bytearray(len(data))
+
+    def sink(offset, chunk):
+        buffer[offset:offset + len(chunk)] = chunk
+
+    limiter = ranged_download(
+        client, bucket="b", key="k", size=len(data), sink=sink, etag='"e1"', part_size=1024, max_concurrency=4
+    )
+    assert bytes(buffer) == data
+    assert limiter.throttled == 1
+    assert len(client.requests) == len(split_ranges(len(data), 1024)) + 2
+    assert all(if_match == '"e1"' for _, if_match in client.requests)
+
+
+def test_ranged_download_gives_up_after_retries(monkeypatch):
+    monkeypatch.setattr(transfer, "_backoff", lambda attempt: 0)
+    monkeypatch.setattr(transfer, "S3_TRANSFER_MAX_RETRIES", 1)
+    client = _Client(b"x" * 10, failures={0: _client_error("AccessDenied", 403)})
+    with pytest.raises(ClientError):
+        ranged_download(client, bucket="b", key="k", size=10, sink=lambda o, c: None, part_size=10)
+
+
+def test_memoryview_reader_reads_and_seeks():
+    """上传体按需从缓冲区读取，可 seek 回开头重读（botocore 重试）"""
+    buffer = bytearray(b"0123456789")
+    reader = MemoryviewReader(memoryview(buffer)[2:8])
+    assert len(reader) == 6
+    assert reader.read(3) == b"234"
+    assert reader.tell() == 3
+    assert reader.read() == b"567"
+    reader.seek(0)
+    assert io.BufferedReader(reader).read() == b"234567"
+    assert reader.seek(-2, io.SEEK_END) == 4
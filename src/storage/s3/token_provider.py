@@ -0,0 +1,218 @@
+"""
+工作负载身份令牌（x-storage-token）与存储端点的进程内缓存
+
+原先每次 S3 调用前都会新建 coze_workload_identity.Client 取一次令牌，
+一次 100 个分片的上传就要额外 100+ 次令牌往返。这里把令牌缓存到过期前 S3_TOKEN_REFRESH_MARGIN 秒：
+- 过期时间优先从令牌（JWT 的 exp 字段）解析，解析不到时按 S3_TOKEN_TTL 计算
+- 并发请求同时发现令牌过期时只有一个线程去刷新，其余等待并复用结果（single-flight）
+- 可选后台线程在过期前主动刷新（S3_TOKEN_BACKGROUND_REFRESH），请求路径上不再出现刷新延迟
+- 刷新失败而旧令牌尚未真正过期时继续使用旧令牌
+COZE_BUCKET_ENDPOINT_URL 的发现结果同样按进程缓存。
+"""
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 无法从令牌中解析过期时间时的缓存时长（秒）
+S3_TOKEN_TTL = float(os.getenv("S3_TOKEN_TTL", "300"))
+# 距离过期多少秒时刷新
+S3_TOKEN_REFRESH_MARGIN = float(os.getenv("S3_TOKEN_REFRESH_MARGIN", "60"))
+# 是否启用后台提前刷新
+S3_TOKEN_BACKGROUND_REFRESH = os.getenv("S3_TOKEN_BACKGROUND_REFRESH", "false").lower() in ("1", "true", "yes")
+# 刷新失败后的重试间隔（秒，后台刷新使用）
+_REFRESH_RETRY_INTERVAL = 5.0
+
+
+def fetch_workload_token() -> str:
+    """通过 coze_workload_identity 获取一次访问令牌"""
+    from coze_workload_identity import Client as CozeClient
+    coze_client = CozeClient()
+    try:
+        return coze_client.get_access_token()
+    finally:
+        try:
+            coze_client.close()
+        except Exception:
+            # 资源释放失败不影响后续流程
+            pass
+
+
+def token_expiry(token: str) -> Optional[float]:
+    """解析 JWT 令牌的 exp（秒级时间戳）；不是 JWT 或没有 exp 时返回 None"""
+    try:
+        parts = token.split(".")
+        if len(parts) != 3:
+            return None
+        payload = parts[1] + "=" * (-len(parts[1]) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp else None
+    except Exception:
+        return None
+
+
+class WorkloadTokenProvider:
+    """带过期时间的令牌缓存（线程安全）"""
+
+    def __init__(
+        self,
+        fetch: Callable[[], str] = fetch_workload_token,
+        ttl: float = S3_TOKEN_TTL,
+        refresh_margin: float = S3_TOKEN_REFRESH_MARGIN,
+    ):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _fresh(self, now: float) -> bool:
+        return self._token is not None and now < self._expires_at - self.refresh_margin
+
+    def _refresh_locked(self) -> str:
+        """持有锁时刷新令牌"""
+        try:
+            token = self._fetch()
+        except Exception as e:
+            if self._token is not None and time.time() < self._expires_at:
+                logger.warning(f"Refreshing storage token failed, keep using cached token: {e}")
+                return self._token
+            raise
+        if not token:
+            raise RuntimeError("workload identity returned an empty token")
+        now = time.time()
+        expires_at = token_expiry(token)
+        self._token = token
+        self._expires_at = expires_at if expires_at and expires_at > now else now + self.ttl
+        return token
+
+    def get_token(self) -> str:
+        """
+        获取令牌：缓存未临近过期时直接返回，否则单飞刷新
+
+        Raises:
+            Exception: 令牌获取失败且没有可用的缓存令牌
+        """
+        token = self._token
+        if token is not None and self._fresh(time.time()):
+            return token
+        with self._lock:
+            # 等锁期间可能已被其它线程刷新
+            if self._fresh(time.time()):
+                return self._token  # type: ignore[return-value]
+            return self._refresh_locked()
+
+    def is_fresh(self) -> bool:
+        """缓存令牌是否未临近过期（不加锁）"""
+        return self._fresh(time.time())
+
+    def peek(self) -> Optional[str]:
+        """
+        读取未过期的缓存令牌，不刷新也不加锁（不能阻塞的调用方使用，如事件循环上的请求钩子）
+
+        Returns:
+            缓存令牌；没有或已过期时返回 None
+        """
+        token = self._token
+        if token is not None and time.time() < self._expires_at:
+            return token
+        return None
+
+    def invalidate(self):
+        """丢弃缓存令牌（如服务端返回 401/403）"""
+        with self._lock:
+            self._token = None
+            self._expires_at = 0.0
+
+    def start_background_refresh(self):
+        """启动后台线程，在令牌临近过期前主动刷新"""
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stop.clear()
+            self._refresher = threading.Thread(target=self._refresh_loop, name="s3-token-refresh", daemon=True)
+            self._refresher.start()
+
+    def stop_background_refresh(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            wait = max(0.0, self._expires_at - self.refresh_margin - time.time())
+            if self._stop.wait(wait):
+                return
+            try:
+                with self._lock:
+                    if not self._fresh(time.time()):
+                        self._refresh_locked()
+            except Exception as e:
+                logger.error(f"Background storage token refresh failed: {e}")
+                if self._stop.wait(_REFRESH_RETRY_INTERVAL):
+                    return
+
+
+_provider: Optional[WorkloadTokenProvider] = None
+_provider_lock = threading.Lock()
+
+
+def get_token_provider() -> WorkloadTokenProvider:
+    """进程内共享的令牌提供者"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                provider = WorkloadTokenProvider()
+                if S3_TOKEN_BACKGROUND_REFRESH:
+                    provider.start_background_refresh()
+                _provider = provider
+    return _provider
+
+
+_endpoint_url: Optional[str] = None
+_endpoint_lock = threading.Lock()
+
+
+def discover_endpoint_url() -> Optional[str]:
+    """
+    从项目环境变量中发现 COZE_BUCKET_ENDPOINT_URL（成功结果按进程缓存）
+
+    Returns:
+        端点地址；未找到或查询失败时返回 None（下次调用会重试）
+    """
+    global _endpoint_url
+    if _endpoint_url:
+        return _endpoint_url
+    with _endpoint_lock:
+        if _endpoint_url:
+            return _endpoint_url
+        try:
+            from coze_workload_identity import Client as CozeEnvClient
+            coze_env_client = CozeEnvClient()
+            try:
+                env_vars = coze_env_client.get_project_env_vars()
+            finally:
+                coze_env_client.close()
+            for env_var in env_vars:
+                if env_var.key == "COZE_BUCKET_ENDPOINT_URL":
+                    _endpoint_url = env_var.value.replace("'", "'\\''")
+                    break
+        except Exception as e:
+            logger.error(f"Error loading COZE_BUCKET_ENDPOINT_URL: {e}")
+        return _endpoint_url
+
+
+__all__ = [
+    "WorkloadTokenProvider",
+    "fetch_workload_token",
+    "token_expiry",
+    "get_token_provider",
+    "discover_endpoint_url",
+]
@@ -0,0 +1,247 @@
+"""
+S3 并发传输辅助
+
+- 按内存预算限制分片上传的并发：同时在途的分片数 × 分片大小不超过 S3_TRANSFER_MEMORY_BUDGET
+- 分段并发下载：按字节区间（Range）并发 GET，写入预分配的缓冲区或文件
+- 代理层限流（429/503、SlowDown 等）时按 AIMD 调整并发：被限流减半，连续成功后逐个加回
+- 分片缓冲区以 memoryview 直接作为上传 Body，不再为每个分片复制 bytes
+"""
+import io
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+# 并发传输的最大并发数
+S3_TRANSFER_CONCURRENCY = int(os.getenv("S3_TRANSFER_CONCURRENCY", "8"))
+# 分片 / 分段大小（字节）
+S3_TRANSFER_PART_SIZE = int(os.getenv("S3_TRANSFER_PART_SIZE", str(8 * 1024 * 1024)))
+# 在途分片占用内存上限（字节）
+S3_TRANSFER_MEMORY_BUDGET = int(os.getenv("S3_TRANSFER_MEMORY_BUDGET", str(128 * 1024 * 1024)))
+# 单个分段的最大重试次数
+S3_TRANSFER_MAX_RETRIES = int(os.getenv("S3_TRANSFER_MAX_RETRIES", "5"))
+
+# 视为限流的 HTTP 状态码与错误码
+_THROTTLE_STATUS = {429, 503}
+_THROTTLE_CODES = {"SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded", "TooManyRequests"}
+# 限流退避的基础间隔与上限（秒）
+_BACKOFF_BASE = 0.2
+_BACKOFF_MAX = 10.0
+
+
+def budgeted_concurrency(
+    part_size: int,
+    max_concurrency: int = S3_TRANSFER_CONCURRENCY,
+    memory_budget: int = S3_TRANSFER_MEMORY_BUDGET,
+) -> int:
+    """按内存预算折算的并发数（至少为 1）"""
+    return max(1, min(max_concurrency, memory_budget // max(1, part_size)))
+
+
+def is_throttle_error(e: Exception) -> bool:
+    """是否为存储端 / 代理层的限流错误"""
+    if isinstance(e, ClientError):
+        response = e.response or {}
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        code = response.get("Error", {}).get("Code", "")
+        return status in _THROTTLE_STATUS or code in _THROTTLE_CODES or code in {str(s) for s in _THROTTLE_STATUS}
+    return False
+
+
+def _backoff(attempt: int) -> float:
+    """带抖动的指数退避"""
+    return random.uniform(0, min(_BACKOFF_MAX, _BACKOFF_BASE * (2 ** attempt)))
+
+
+class AdaptiveConcurrency:
+    """AIMD 并发限制：被限流时上限减半，每成功 limit 次上限加一"""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.in_flight = 0
+        self.throttled = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self._successes = 0
+                self.limit = max(1, self.limit // 2)
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self._successes = 0
+                    self.limit += 1
+            self._cond.notify_all()
+
+
+def split_ranges(size: int, part_size: int) -> List[Tuple[int, int]]:
+    """把 [0, size) 切分为 (起始偏移, 结束偏移（含）) 区间"""
+    part_size = max(1, part_size)
+    return [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+
+def ranged_download(
+    client,
+    *,
+    bucket: str,
+    key: str,
+    size: int,
+    sink: Callable[[int, bytes], None],
+    etag: Optional[str] = None,
+    part_size: int = S3_TRANSFER_PART_SIZE,
+    max_concurrency: int = S3_TRANSFER_CONCURRENCY,
+) -> AdaptiveConcurrency:
+    """
+    并发分段下载
+
+    Args:
+        client: boto3 S3 客户端（线程安全）
+        size: 对象大小
+        sink: 写入回调 sink(偏移, 数据)，各分段从不同线程调用，写入区间互不重叠
+        etag: 对象 ETag；传入时每个分段带 If-Match，下载过程中对象被覆盖会失败而不是拼出混合内容
+
+    Returns:
+        并发限制器（含限流次数与最终并发上限，便于记录）
+
+    Raises:
+        Exception: 任一分段重试耗尽后的错误
+    """
+    pending: Deque[Tuple[int, int, int]] = deque((start, end, 0) for start, end in split_ranges(size, part_size))
+    lock = threading.Lock()
+    limiter = AdaptiveConcurrency(min(max_concurrency, len(pending)) or 1)
+    errors: List[BaseException] = []
+
+    def _fetch(start: int, end: int):
+        params = {"Bucket": bucket, "Key": key, "Range": f"bytes={start}-{end}"}
+        if etag:
+            params["IfMatch"] = etag
+        body = client.get_object(**params)["Body"]
+        offset = start
+        try:
+            for chunk in body.iter_chunks(1024 * 1024):
+                sink(offset, chunk)
+                offset += len(chunk)
+        finally:
+            body.close()
+        if offset != end + 1:
+            raise IOError(f"short read for range {start}-{end}: got {offset - start} bytes")
+
+    def _worker():
+        while not errors:
+            limiter.acquire()
+            with lock:
+                item = pending.popleft() if pending else None
+            if item is None:
+                limiter.release()
+                return
+            start, end, attempt = item
+            try:
+                _fetch(start, end)
+            except Exception as e:
+                throttled = is_throttle_error(e)
+                limiter.release(throttled=throttled)
+                if attempt + 1 >= S3_TRANSFER_MAX_RETRIES:
+                    errors.append(e)
+                    return
+                if not throttled:
+                    logger.warning(f"Range {start}-{end} of {key} failed (attempt {attempt + 1}): {e}")
+                time.sleep(_backoff(attempt))
+                with lock:
+                    pending.append((start, end, attempt + 1))
+                continue
+            limiter.release()
+
+    workers = [
+        threading.Thread(target=_worker, name=f"s3-range-{i}", daemon=True)
+        for i in range(limiter.max_concurrency)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if errors:
+        raise errors[0]
+    if limiter.throttled:
+        logger.info(f"Ranged download of {key} throttled {limiter.throttled} times, final concurrency {limiter.limit}")
+    return limiter
+
+
+class MemoryviewReader(io.RawIOBase):
+    """
+    只读、可 seek 的 memoryview 包装，作为 upload_part 的 Body
+
+    botocore 计算校验和与重试时需要 read/seek/tell；直接传 bytes 需要先从分片缓冲区复制一份，
+    这里按需从缓冲区读取，不额外复制整个分片。
+    """
+
+    def __init__(self, view: memoryview):
+        super().__init__()
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), len(self._view) - self._pos)
+        if n <= 0:
+            return 0
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._pos + size)
+        data = self._view[self._pos:end].tobytes()
+        self._pos = end
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = len(self._view) + offset
+        self._pos = max(0, min(self._pos, len(self._view)))
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+
+__all__ = [
+    "MemoryviewReader",
+    "budgeted_concurrency",
+    "is_throttle_error",
+    "AdaptiveConcurrency",
+    "split_ranges",
+    "ranged_download",
+    "S3_TRANSFER_CONCURRENCY",
+    "S3_TRANSFER_PART_SIZE",
+    "S3_TRANSFER_MEMORY_BUDGET",
+]
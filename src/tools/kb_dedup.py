@@ -0,0 +1,171 @@
+"""
+知识库近重复文档检测
+- 签名：对规范化文本的字符 shingle 做单次排列 MinHash（One Permutation Hashing），
+  每个 shingle 只计算一次哈希，再按哈希值分桶取最小值，空桶从右侧相邻桶借值填充
+- 候选：签名按 LSH 分段（band）分桶，同桶文档为候选对
+- 确认：签名估计的 Jaccard 相似度不低于阈值时视为近重复，用并查集聚类
+- 每个簇中内容最长的文档为代表（canonical），其余为变体（variant）；
+  只有代表进入倒排表与向量索引，变体通过 duplicate_of / variants 字段互相关联
+"""
+import os
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+# 是否在索引时去重
+KB_DEDUP_ENABLED = os.getenv("KB_DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# 近重复判定阈值（估计 Jaccard 相似度）
+KB_DEDUP_THRESHOLD = float(os.getenv("KB_DEDUP_THRESHOLD", "0.85"))
+# 检索结果多样化阈值：与已选结果相似度不低于该值的结果被跳过
+KB_DIVERSIFY_THRESHOLD = float(os.getenv("KB_DIVERSIFY_THRESHOLD", "0.6"))
+
+# 签名长度与 LSH 分段数（每段 NUM_HASHES // LSH_BANDS 行，相似度约 0.7 以上的文档对大概率成为候选）
+NUM_HASHES = 128
+LSH_BANDS = 16
+# shingle 长度（字符数）
+SHINGLE_SIZE = 5
+# 参与签名计算的最大字符数，限制超大文档的计算量
+MAX_SIGNATURE_CHARS = 200000
+
+_EMPTY = -1
+_WS_RE = re.compile(r'\s+')
+
+
+def minhash_signature(text: str) -> List[int]:
+    """
+    计算文本的 MinHash 签名
+
+    Args:
+        text: 文档内容
+
+    Returns:
+        长度为 NUM_HASHES 的签名；文本为空时返回空列表
+    """
+    normalized = _WS_RE.sub('', (text or '')[:MAX_SIGNATURE_CHARS].lower())
+    if not normalized:
+        return []
+
+    bins = [_EMPTY] * NUM_HASHES
+    for i in range(max(1, len(normalized) - SHINGLE_SIZE + 1)):
+        h = zlib.crc32(normalized[i:i + SHINGLE_SIZE].encode('utf-8'))
+        b, v = h % NUM_HASHES, h // NUM_HASHES
+        if bins[b] == _EMPTY or v < bins[b]:
+            bins[b] = v
+
+    # 空桶向右借用最近的非空桶，并按距离加偏移，保证不同文档借值一致时才相等
+    signature = list(bins)
+    for b in range(NUM_HASHES):
+        if bins[b] != _EMPTY:
+            continue
+        for distance in range(1, NUM_HASHES):
+            v = bins[(b + distance) % NUM_HASHES]
+            if v != _EMPTY:
+                signature[b] = v + (distance << 26)
+                break
+    return signature
+
+
+def signature_similarity(a: List[int], b: List[int]) -> float:
+    """根据签名估计两个文档的 Jaccard 相似度"""
+    if not a or not b or len(a) != len(b):
+        return 0.0
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+def _ensure_signature(documents: Dict[str, Dict], key: str) -> List[int]:
+    """读取文档签名，缺失时计算并以新条目替换（不修改已发布索引共享的条目）"""
+    doc = documents[key]
+    signature = doc.get('minhash')
+    if signature is None or len(signature) not in (0, NUM_HASHES):
+        signature = minhash_signature(doc.get('content', ''))
+        documents[key] = {**doc, 'minhash': signature}
+    return signature
+
+
+def _set_links(documents: Dict[str, Dict], key: str, duplicate_of: Optional[str], variants: List[str]):
+    """更新文档的代表/变体关联，未变化时不替换条目"""
+    doc = documents[key]
+    if doc.get('duplicate_of') == duplicate_of and doc.get('variants', []) == variants:
+        return
+    entry = {k: v for k, v in doc.items() if k not in ('duplicate_of', 'variants')}
+    if duplicate_of is not None:
+        entry['duplicate_of'] = duplicate_of
+    if variants:
+        entry['variants'] = variants
+    documents[key] = entry
+
+
+def assign_canonicals(
+    documents: Dict[str, Dict],
+    threshold: float = KB_DEDUP_THRESHOLD,
+    enabled: bool = KB_DEDUP_ENABLED
+) -> int:
+    """
+    去重阶段：聚类近重复文档，为每个簇指定代表文档
+
+    直接修改传入的文档字典（写事务中的暂存副本），变化的条目以新字典替换。
+
+    Args:
+        documents: 文档字典（key -> 文档条目）
+        threshold: 近重复判定阈值
+        enabled: 为False时清除已有关联，所有文档都作为代表
+
+    Returns:
+        变体文档数量
+    """
+    keys = sorted(documents.keys())
+    if not enabled:
+        for key in keys:
+            _set_links(documents, key, None, [])
+        return 0
+
+    signatures = {key: _ensure_signature(documents, key) for key in keys}
+
+    parent = {key: key for key in keys}
+
+    def find(key: str) -> str:
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    rows = NUM_HASHES // LSH_BANDS
+    buckets: Dict[tuple, List[str]] = defaultdict(list)
+    for key in keys:
+        signature = signatures[key]
+        if not signature:
+            continue
+        for band in range(LSH_BANDS):
+            buckets[(band, *signature[band * rows:(band + 1) * rows])].append(key)
+
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                root_a, root_b = find(a), find(b)
+                if root_a == root_b:
+                    continue
+                if signature_similarity(signatures[a], signatures[b]) >= threshold:
+                    parent[root_b] = root_a
+
+    clusters: Dict[str, List[str]] = defaultdict(list)
+    for key in keys:
+        clusters[find(key)].append(key)
+
+    variant_count = 0
+    for members in clusters.values():
+        # 内容最长的文档作为代表，长度相同时取路径字典序最小者
+        canonical = min(members, key=lambda k: (-len(documents[k].get('content', '')), k))
+        variants = [k for k in members if k != canonical]
+        _set_links(documents, canonical, None, variants)
+        for key in variants:
+            _set_links(documents, key, canonical, [])
+        variant_count += len(variants)
+    return variant_count
+
+
+def is_canonical(doc: Dict) -> bool:
+    """是否为代表文档（未去重或非变体的文档都视为代表）"""
+    return not doc.get('duplicate_of')
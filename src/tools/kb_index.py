@@ -0,0 +1,361 @@
+"""
+知识库并行索引流水线
+
+流程：
+1. 发现阶段：遍历目录，按文件哈希跳过未修改的文档，生成待提取任务
+2. 提取阶段：进程池并行提取 PDF/DOCX/文本内容，在途任务数有上限，避免结果堆积占满内存
+3. 入库阶段：主进程作为唯一写者更新索引，并定期落盘（检查点）
+
+中断后重新执行时，已落盘的文档会在发现阶段按哈希跳过，从而实现断点续建。
+全量重建（--rebuild）在独立的暂存副本中进行，检查点只写入旁路文件 .kb_index.rebuild.json，
+完成后一次性替换线上索引，重建期间各服务进程继续使用旧索引。
+
+用法（在 src 目录下执行）：
+    python -m tools.kb_index --kb-path ../assets/knowledge_base --workers 32
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, Future, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tools.knowledge_base_tool import (
+    KnowledgeBaseTool,
+    SUPPORTED_EXTENSIONS,
+    extract_document_content,
+)
+
+# 默认每入库多少个文档落盘一次
+DEFAULT_CHECKPOINT_EVERY = 50
+# 默认最长多少秒落盘一次
+DEFAULT_CHECKPOINT_INTERVAL = 30.0
+# 全量重建的检查点文件（位于知识库目录下）
+REBUILD_STATE_FILE = ".kb_index.rebuild.json"
+
+
+@dataclass
+class IndexTask:
+    """待提取的文档"""
+    rel_path: str
+    file_path: str
+    ext: str
+    file_hash: str
+    size: int
+
+
+@dataclass
+class IndexProgress:
+    """索引进度"""
+    total: int = 0
+    skipped: int = 0
+    indexed: int = 0
+    failed: int = 0
+    pruned: int = 0
+    bytes_total: int = 0
+    bytes_done: int = 0
+    started_at: float = field(default_factory=time.time)
+    failed_files: List[str] = field(default_factory=list)
+
+    @property
+    def processed(self) -> int:
+        return self.indexed + self.failed
+
+    def format(self) -> str:
+        """格式化为一行进度信息"""
+        elapsed = max(time.time() - self.started_at, 1e-6)
+        rate = self.bytes_done / elapsed / (1024 * 1024)
+        remaining = self.bytes_total - self.bytes_done
+        eta = remaining / (self.bytes_done / elapsed) if self.bytes_done else 0.0
+        return (
+            f"[kb_index] {self.processed}/{self.total} "
+            f"(新增 {self.indexed}, 失败 {self.failed}, 跳过 {self.skipped}) "
+            f"{rate:.1f} MB/s, 已用 {elapsed:.0f}s, 预计剩余 {eta:.0f}s"
+        )
+
+
+def print_progress(progress: IndexProgress):
+    """默认进度回调：输出到标准错误"""
+    print(progress.format(), file=sys.stderr, flush=True)
+
+
+def discover_documents(
+    kb_tool: KnowledgeBaseTool,
+    documents: Dict[str, Dict],
+    scan_path: str,
+    prune: bool = False
+) -> Tuple[List[IndexTask], IndexProgress]:
+    """
+    发现阶段：找出新增或已修改的文档
+
+    Args:
+        kb_tool: 知识库工具
+        documents: 当前索引（写事务中的暂存副本）
+        scan_path: 要扫描的目录
+        prune: 是否从索引中移除已不存在的文件
+
+    Returns:
+        (待提取任务列表, 初始进度)
+    """
+    progress = IndexProgress()
+    tasks: List[IndexTask] = []
+    seen = set()
+
+    for root, dirs, files in os.walk(scan_path):
+        for file in files:
+            ext = os.path.splitext(file)[1].lower()
+            if ext not in SUPPORTED_EXTENSIONS:
+                continue
+
+            file_path = os.path.join(root, file)
+            rel_path = os.path.relpath(file_path, scan_path)
+            seen.add(rel_path)
+            try:
+                file_hash = kb_tool._get_file_hash(file_path)
+                size = os.path.getsize(file_path)
+            except OSError as e:
+                print(f"读取文件信息失败 {file_path}: {e}")
+                continue
+
+            # 已索引且未修改的文档跳过（也是断点续建的依据）
+            doc = documents.get(rel_path)
+            if doc is not None and doc.get('hash') == file_hash:
+                progress.skipped += 1
+                continue
+
+            tasks.append(IndexTask(rel_path=rel_path, file_path=file_path, ext=ext, file_hash=file_hash, size=size))
+
+    if prune:
+        for rel_path in list(documents.keys()):
+            if rel_path not in seen:
+                del documents[rel_path]
+                progress.pruned += 1
+
+    # 大文件优先提交，避免尾部被单个大 PDF 拖慢
+    tasks.sort(key=lambda t: t.size, reverse=True)
+    progress.total = len(tasks)
+    progress.bytes_total = sum(t.size for t in tasks)
+    return tasks, progress
+
+
+def _rebuild_state_path(kb_tool: KnowledgeBaseTool) -> str:
+    return os.path.join(kb_tool.kb_path, REBUILD_STATE_FILE)
+
+
+def _load_rebuild_state(kb_tool: KnowledgeBaseTool) -> Dict[str, Dict]:
+    """读取上次中断的全量重建进度，没有时返回空索引"""
+    try:
+        with open(_rebuild_state_path(kb_tool), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"读取重建进度失败，从头重建: {e}", file=sys.stderr)
+        return {}
+
+
+def _save_rebuild_state(kb_tool: KnowledgeBaseTool, documents: Dict[str, Dict]):
+    """保存全量重建进度（临时文件 + 原子重命名），不影响线上索引"""
+    path = _rebuild_state_path(kb_tool)
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(documents, f, ensure_ascii=False)
+    os.replace(tmp_file, path)
+
+
+def run_index_pipeline(
+    kb_tool: KnowledgeBaseTool,
+    scan_path: Optional[str] = None,
+    workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    prune: bool = False,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+    checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+    progress_callback: Optional[Callable[[IndexProgress], None]] = None,
+    rebuild: bool = False,
+) -> IndexProgress:
+    """
+    执行并行索引
+
+    Args:
+        kb_tool: 知识库工具（入库阶段的唯一写者，全程持有其写锁）
+        scan_path: 要扫描的目录，为None时使用知识库路径
+        workers: 提取进程数，默认为CPU核数
+        max_in_flight: 在途提取任务上限，默认为进程数的2倍
+        prune: 是否从索引中移除已不存在的文件
+        checkpoint_every: 每入库多少个文档落盘一次
+        checkpoint_interval: 最长多少秒落盘一次
+        progress_callback: 进度回调，在每次落盘及结束时调用
+        rebuild: 忽略已有索引全量重建：检查点写入旁路文件（中断后再次 rebuild 从中继续），完成后一次性发布
+
+    Returns:
+        索引进度统计
+    """
+    scan_path = scan_path or kb_tool.kb_path
+    workers = max(1, workers or os.cpu_count() or 1)
+    max_in_flight = max(workers, max_in_flight or workers * 2)
+
+    with kb_tool.update_index() as staging:
+        if not rebuild:
+            return _run_pipeline(
+                kb_tool, staging, scan_path, workers, max_in_flight, prune,
+                checkpoint_every, checkpoint_interval, progress_callback,
+                lambda: kb_tool.publish(staging),
+            )
+
+        fresh = _load_rebuild_state(kb_tool)
+        progress = _run_pipeline(
+            kb_tool, fresh, scan_path, workers, max_in_flight, True,
+            checkpoint_every, checkpoint_interval, progress_callback,
+            lambda: _save_rebuild_state(kb_tool, fresh),
+        )
+        staging.clear()
+        staging.update(fresh)
+        kb_tool.publish(staging)
+        try:
+            os.remove(_rebuild_state_path(kb_tool))
+        except FileNotFoundError:
+            pass
+        return progress
+
+
+def _run_pipeline(
+    kb_tool: KnowledgeBaseTool,
+    staging: Dict[str, Dict],
+    scan_path: str,
+    workers: int,
+    max_in_flight: int,
+    prune: bool,
+    checkpoint_every: int,
+    checkpoint_interval: float,
+    progress_callback: Optional[Callable[[IndexProgress], None]],
+    publish: Callable[[], None],
+) -> IndexProgress:
+    """在写事务内执行三个阶段，staging 为暂存副本，检查点时调用 publish 落盘"""
+    tasks, progress = discover_documents(kb_tool, staging, scan_path, prune=prune)
+    if not tasks:
+        if progress.pruned:
+            publish()
+        if progress_callback:
+            progress_callback(progress)
+        return progress
+
+    pending: Dict[Future, IndexTask] = {}
+    task_iter = iter(tasks)
+    dirty = progress.pruned
+    last_checkpoint = time.time()
+
+    def checkpoint():
+        nonlocal dirty, last_checkpoint
+        if dirty:
+            publish()
+            dirty = 0
+        last_checkpoint = time.time()
+        if progress_callback:
+            progress_callback(progress)
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        def submit_next() -> bool:
+            task = next(task_iter, None)
+            if task is None:
+                return False
+            pending[pool.submit(extract_document_content, task.file_path, task.ext)] = task
+            return True
+
+        while len(pending) < max_in_flight and submit_next():
+            pass
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                task = pending.pop(fut)
+                try:
+                    content = fut.result()
+                except Exception as e:
+                    print(f"提取文件内容失败 {task.file_path}: {e}")
+                    content = None
+
+                if content:
+                    staging[task.rel_path] = kb_tool.make_document_entry(task.file_path, task.file_hash, content)
+                    progress.indexed += 1
+                    dirty += 1
+                else:
+                    progress.failed += 1
+                    progress.failed_files.append(task.rel_path)
+                progress.bytes_done += task.size
+                submit_next()
+
+            if dirty >= checkpoint_every or time.time() - last_checkpoint >= checkpoint_interval:
+                checkpoint()
+    except BaseException:
+        # 中断时取消未开始的任务，并发布已完成的部分，下次执行从这里继续
+        pool.shutdown(wait=False, cancel_futures=True)
+        if dirty:
+            publish()
+        raise
+    else:
+        pool.shutdown(wait=True)
+
+    checkpoint()
+    return progress
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="并行（重）建本地知识库索引")
+    parser.add_argument("--kb-path", type=str, default=None, help="知识库路径（索引文件所在目录）")
+    parser.add_argument("--dir", type=str, default=None, help="要扫描的目录，默认为知识库路径")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="提取进程数，默认CPU核数")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="在途提取任务上限，默认进程数的2倍")
+    parser.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY, help="每入库多少个文档落盘一次")
+    parser.add_argument("--rebuild", action="store_true", help="忽略已有索引全量重建，完成前线上仍使用旧索引")
+    parser.add_argument("--prune", action="store_true", help="从索引中移除已删除的文件")
+    parser.add_argument("--quiet", action="store_true", help="不输出进度")
+    parser.add_argument("--build-vectors", action="store_true", help="索引完成后预构建向量索引（混合检索用，需要 numpy）")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    kb_tool = KnowledgeBaseTool(args.kb_path)
+    scan_path = os.path.abspath(args.dir) if args.dir else kb_tool.kb_path
+    if not os.path.exists(scan_path):
+        print(f"目录不存在: {scan_path}", file=sys.stderr)
+        return 1
+
+    try:
+        progress = run_index_pipeline(
+            kb_tool,
+            scan_path,
+            workers=args.workers,
+            max_in_flight=args.max_in_flight,
+            prune=args.prune,
+            checkpoint_every=args.checkpoint_every,
+            progress_callback=None if args.quiet else print_progress,
+            rebuild=args.rebuild,
+        )
+    except KeyboardInterrupt:
+        hint = "带 --rebuild 重新执行即可继续重建" if args.rebuild else "重新执行即可继续"
+        print(f"[kb_index] 已中断，已完成部分已保存，{hint}", file=sys.stderr)
+        return 130
+
+    print(
+        f"[kb_index] 完成：新增/更新 {progress.indexed}，失败 {progress.failed}，"
+        f"跳过 {progress.skipped}，移除 {progress.pruned}，文档总数 {kb_tool.get_document_count()}"
+    )
+    for rel_path in progress.failed_files:
+        print(f"[kb_index] 提取失败: {rel_path}", file=sys.stderr)
+
+    if args.build_vectors:
+        dense_index = kb_tool.get_dense_index(wait=True)
+        if dense_index is None:
+            print("[kb_index] 向量索引构建失败或 numpy 不可用", file=sys.stderr)
+            return 1
+        print(f"[kb_index] 向量索引就绪：段落数 {len(dense_index)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+知识库检索基础组件
+- 分词：英文/数字按词切分，中文按字二元组（bigram）切分，不依赖分词库
+- 段落切分：长文档按固定窗口切分为重叠段落，供向量检索使用
+- BM25：基于倒排表（postings）的 BM25 打分
+- 需求拆分：将整段需求文本拆分为逐条需求子查询，供批量检索使用
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+(?:[._\-][a-z0-9]+)*|[\u4e00-\u9fff]+')
+
+# 需求条目分隔：换行、分号，以及 "1." "1、" "(1)" "（一）" "一、" 等编号
+_ITEM_SPLIT_RE = re.compile(r'[\n\r;；]+')
+_ITEM_PREFIX_RE = re.compile(
+    r'^\s*(?:[(（]\s*[0-9一二三四五六七八九十]+\s*[)）]|[0-9]+(?:\.[0-9]+)*(?:[.、)）]|\s)|[一二三四五六七八九十]+[、.]|[-*•●·])\s*'
+)
+
+# 段落窗口大小与重叠（字符数）
+PASSAGE_SIZE = 400
+PASSAGE_OVERLAP = 80
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        词项列表（中文为相邻两字组成的二元组，单字词保留单字）
+    """
+    tokens: List[str] = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        word = match.group()
+        if '\u4e00' <= word[0] <= '\u9fff':
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def split_passages(content: str, size: int = PASSAGE_SIZE, overlap: int = PASSAGE_OVERLAP) -> List[Tuple[int, int]]:
+    """
+    将文档切分为重叠段落
+
+    Args:
+        content: 文档内容
+        size: 段落窗口大小
+        overlap: 相邻段落重叠字符数
+
+    Returns:
+        段落在原文中的 (起始, 结束) 位置列表
+    """
+    if not content:
+        return []
+    step = max(1, size - overlap)
+    spans = []
+    start = 0
+    while start < len(content):
+        end = min(len(content), start + size)
+        spans.append((start, end))
+        if end == len(content):
+            break
+        start += step
+    return spans
+
+
+def split_requirements(text: str, max_items: int = 64, min_len: int = 6) -> List[str]:
+    """
+    将需求文本拆分为逐条需求子查询
+
+    Args:
+        text: 需求文本（可包含多条编号需求）
+        max_items: 子查询数量上限，超出时相邻条目合并
+        min_len: 短于该长度的片段并入上一条（多为标题或编号残留）
+
+    Returns:
+        子查询列表（去重，保持原有顺序）；文本为空时返回空列表
+    """
+    items: List[str] = []
+    for part in _ITEM_SPLIT_RE.split(text or ''):
+        item = _ITEM_PREFIX_RE.sub('', part).strip(' \t:：,，。')
+        if not item:
+            continue
+        if len(item) < min_len and items:
+            items[-1] = f"{items[-1]} {item}"
+        else:
+            items.append(item)
+
+    seen = set()
+    items = [item for item in items if not (item in seen or seen.add(item))]
+    if len(items) > max_items:
+        group = math.ceil(len(items) / max_items)
+        items = [' '.join(items[i:i + group]) for i in range(0, len(items), group)]
+    return items
+
+
+class BM25Index:
+    """
+    BM25 倒排索引
+
+    postings 中直接保存词项在文档中的饱和词频权重 tf*(k1+1)/(tf+k1*norm)，
+    查询时只需乘以 idf 累加，不再重复计算文档长度归一化。
+    """
+
+    def __init__(self, documents: Dict[str, Dict], k1: float = 1.5, b: float = 0.75):
+        """
+        构建索引
+
+        Args:
+            documents: 知识库文档字典（key -> 文档条目）
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+        """
+        self.doc_keys: List[str] = list(documents.keys())
+        self.key_to_idx: Dict[str, int] = {key: idx for idx, key in enumerate(self.doc_keys)}
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        self.idf: Dict[str, float] = {}
+
+        term_counts: List[Counter] = []
+        doc_lens: List[int] = []
+        for key in self.doc_keys:
+            counts = Counter(tokenize(documents[key].get('content', '')))
+            term_counts.append(counts)
+            doc_lens.append(sum(counts.values()))
+
+        n_docs = len(self.doc_keys)
+        avgdl = (sum(doc_lens) / n_docs) if n_docs else 0.0
+        postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for idx, counts in enumerate(term_counts):
+            norm = 1 - b + b * (doc_lens[idx] / avgdl) if avgdl else 1.0
+            for term, tf in counts.items():
+                postings[term].append((idx, tf * (k1 + 1) / (tf + k1 * norm)))
+
+        self.postings = dict(postings)
+        for term, plist in self.postings.items():
+            df = len(plist)
+            self.idf[term] = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    def __len__(self) -> int:
+        return len(self.doc_keys)
+
+    def score(self, query: str) -> Dict[int, float]:
+        """
+        计算查询与所有命中文档的 BM25 分数
+
+        Args:
+            query: 查询文本
+
+        Returns:
+            文档序号 -> 分数
+        """
+        return self.score_many([query])[0]
+
+    def score_many(self, queries: List[str]) -> List[Dict[int, float]]:
+        """
+        批量计算多个查询的 BM25 分数
+
+        先按词项汇总各查询的权重，每个词项的倒排表只遍历一次，
+        多个子查询共享的词项不会重复扫描。
+
+        Args:
+            queries: 查询文本列表
+
+        Returns:
+            与 queries 一一对应的 文档序号 -> 分数
+        """
+        term_queries: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for qi, query in enumerate(queries):
+            for term, qtf in Counter(tokenize(query)).items():
+                idf = self.idf.get(term)
+                if idf is not None:
+                    term_queries[term].append((qi, idf * qtf))
+
+        scores: List[Dict[int, float]] = [defaultdict(float) for _ in queries]
+        for term, weights in term_queries.items():
+            plist = self.postings[term]
+            if len(weights) == 1:
+                qi, weight = weights[0]
+                target = scores[qi]
+                for idx, w in plist:
+                    target[idx] += weight * w
+                continue
+            for idx, w in plist:
+                for qi, weight in weights:
+                    scores[qi][idx] += weight * w
+        return scores
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+
+        Returns:
+            (文档key, 分数) 列表，按分数降序
+        """
+        scores = self.score(query)
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+        return [(self.doc_keys[idx], score) for idx, score in ranked]
@@ -0,0 +1,450 @@
+"""
+知识库本地向量检索（可选，依赖 numpy）
+
+- 向量来源：默认 TF-IDF + 截断 SVD（随机化 SVD，纯 numpy 实现，完全离线）；
+  设置 KB_EMBEDDING_MODEL 且安装了 sentence-transformers 时改用本地嵌入模型
+- 存储：段落向量保存为 float16/float32 的 .npy 文件，以内存映射方式只读加载，多进程共享页缓存
+- 检索：默认用 numpy 矩阵乘法暴力计算余弦相似度；段落数超过阈值时构建 IVF 倒排分区，只扫描最近的若干分区
+
+索引目录：<kb_path>/.kb_vectors/<fingerprint>/，fingerprint 由文档 key 和哈希决定，
+先写入临时目录再原子重命名，多个 worker 不会读到写了一半的向量文件。
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from tools.kb_retrieval import tokenize, split_passages
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# 向量维度（TF-IDF + SVD）
+KB_VECTOR_DIM = int(os.getenv("KB_VECTOR_DIM", "256"))
+# TF-IDF 词表上限（按文档频率取前 N 个词项）
+KB_VECTOR_VOCAB = int(os.getenv("KB_VECTOR_VOCAB", "50000"))
+# 向量存储精度：float16 或 float32
+KB_VECTOR_DTYPE = os.getenv("KB_VECTOR_DTYPE", "float16")
+# 本地嵌入模型（sentence-transformers 模型名或本地路径），为空时使用 TF-IDF + SVD
+KB_EMBEDDING_MODEL = os.getenv("KB_EMBEDDING_MODEL", "")
+# 段落数超过该值时构建 IVF 分区
+KB_IVF_MIN_PASSAGES = int(os.getenv("KB_IVF_MIN_PASSAGES", "50000"))
+# IVF 查询时探查的分区数
+KB_IVF_NPROBE = int(os.getenv("KB_IVF_NPROBE", "8"))
+# 保留的向量索引版本数（按最近使用时间），其他 worker 仍在加载的上一代索引不会被立即删除
+KB_VECTOR_KEEP = max(1, int(os.getenv("KB_VECTOR_KEEP", "3")))
+
+# 暴力检索时每批参与矩阵乘法的段落数，避免 float16 -> float32 转换时整体复制矩阵
+_SCAN_BLOCK = 65536
+# 稀疏矩阵乘法时每批处理的非零元个数
+_SPARSE_BLOCK = 1 << 20
+
+_embedding_models: Dict[str, object] = {}
+_embedding_lock = threading.Lock()
+
+
+def is_available() -> bool:
+    """向量检索是否可用（是否安装了 numpy）"""
+    return np is not None
+
+
+def documents_fingerprint(documents: Dict[str, Dict]) -> str:
+    """根据文档 key、哈希及向量参数计算索引指纹"""
+    h = hashlib.sha1()
+    h.update(f"{KB_EMBEDDING_MODEL}|{KB_VECTOR_DIM}|{KB_VECTOR_VOCAB}|{KB_VECTOR_DTYPE}".encode("utf-8"))
+    for key in sorted(documents.keys()):
+        h.update(key.encode("utf-8"))
+        h.update(str(documents[key].get('hash', '')).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _get_embedding_model(name: str):
+    """加载本地嵌入模型（进程内缓存），未安装 sentence-transformers 时返回 None"""
+    model = _embedding_models.get(name)
+    if model is not None:
+        return model
+    with _embedding_lock:
+        model = _embedding_models.get(name)
+        if model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                logger.warning("KB_EMBEDDING_MODEL 已设置但未安装 sentence-transformers，使用 TF-IDF + SVD")
+                return None
+            model = SentenceTransformer(name)
+            _embedding_models[name] = model
+        return model
+
+
+class _Csr:
+    """最小化的 CSR 稀疏矩阵（仅支持本模块用到的两种乘法）"""
+
+    def __init__(self, indptr, indices, data, n_cols: int):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.n_rows = len(indptr) - 1
+        self.n_cols = n_cols
+        self.rows = np.repeat(np.arange(self.n_rows, dtype=np.int64), np.diff(indptr))
+        # 转置乘法使用的列序
+        self._col_order = np.argsort(indices, kind="stable")
+
+    @staticmethod
+    def _segment_sum(values, keys, n_out: int):
+        """按已排序的 keys 分段求和，values 为 (nnz, k)"""
+        out = np.zeros((n_out, values.shape[1]), dtype=np.float32)
+        if len(keys) == 0:
+            return out
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        out[keys[starts]] = np.add.reduceat(values, starts, axis=0)
+        return out
+
+    def dot(self, dense):
+        """self @ dense，dense 形状为 (n_cols, k)"""
+        out = np.zeros((self.n_rows, dense.shape[1]), dtype=np.float32)
+        for lo in range(0, len(self.data), _SPARSE_BLOCK):
+            hi = min(len(self.data), lo + _SPARSE_BLOCK)
+            values = self.data[lo:hi, None] * dense[self.indices[lo:hi]]
+            out += self._segment_sum(values, self.rows[lo:hi], self.n_rows)
+        return out
+
+    def tdot(self, dense):
+        """self.T @ dense，dense 形状为 (n_rows, k)"""
+        out = np.zeros((self.n_cols, dense.shape[1]), dtype=np.float32)
+        for lo in range(0, len(self.data), _SPARSE_BLOCK):
+            order = self._col_order[lo:lo + _SPARSE_BLOCK]
+            values = self.data[order, None] * dense[self.rows[order]]
+            out += self._segment_sum(values, self.indices[order], self.n_cols)
+        return out
+
+
+def _randomized_svd_components(x: "_Csr", dim: int, n_iter: int = 4, oversample: int = 10):
+    """
+    随机化截断 SVD（Halko et al.），返回右奇异向量 (n_cols, dim)
+
+    段落向量 = X @ components，即 LSA 语义空间中的坐标。
+    """
+    rng = np.random.default_rng(0)
+    k = min(dim + oversample, x.n_cols, x.n_rows)
+    omega = rng.standard_normal((x.n_cols, k)).astype(np.float32)
+    q, _ = np.linalg.qr(x.dot(omega))
+    for _ in range(n_iter):
+        z, _ = np.linalg.qr(x.tdot(q))
+        q, _ = np.linalg.qr(x.dot(z))
+    b = x.tdot(q).T  # (k, n_cols)
+    _, _, vt = np.linalg.svd(b, full_matrices=False)
+    return np.ascontiguousarray(vt[:min(dim, vt.shape[0])].T.astype(np.float32))
+
+
+def _normalize_rows(mat):
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _kmeans(vectors, n_clusters: int, n_iter: int = 10, sample_size: int = 50000):
+    """球面 k-means（余弦距离），在采样上训练"""
+    rng = np.random.default_rng(0)
+    sample = vectors
+    if len(vectors) > sample_size:
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(n_clusters):
+            members = sample[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = _normalize_rows(centroids)
+    return centroids
+
+
+class DenseIndex:
+    """段落级向量索引（只读，内存映射）"""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.index_dir = index_dir
+        self.backend: str = meta["backend"]
+        self.model_name: str = meta.get("model", "")
+        self.doc_keys: List[str] = meta["doc_keys"]
+        # 段落按文档连续存放：文档 i 的段落为 [doc_offsets[i], doc_offsets[i+1])
+        self.doc_offsets = np.load(os.path.join(index_dir, "doc_offsets.npy"))
+        self.passage_doc = np.load(os.path.join(index_dir, "passage_doc.npy"))
+        self.spans = np.load(os.path.join(index_dir, "spans.npy"))
+        self.vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode='r')
+
+        self.vocab: Dict[str, int] = {}
+        self.idf = None
+        self.components = None
+        if self.backend == "lsa":
+            with open(os.path.join(index_dir, "vocab.json"), 'r', encoding='utf-8') as f:
+                self.vocab = {term: i for i, term in enumerate(json.load(f))}
+            self.idf = np.load(os.path.join(index_dir, "idf.npy"))
+            self.components = np.load(os.path.join(index_dir, "components.npy"))
+
+        self.ivf_centroids = None
+        ivf_path = os.path.join(index_dir, "ivf_centroids.npy")
+        if os.path.exists(ivf_path):
+            self.ivf_centroids = np.load(ivf_path)
+            self.ivf_order = np.load(os.path.join(index_dir, "ivf_order.npy"))
+            self.ivf_offsets = np.load(os.path.join(index_dir, "ivf_offsets.npy"))
+
+    def __len__(self) -> int:
+        return len(self.passage_doc)
+
+    def encode_queries(self, queries: List[str]):
+        """将查询编码为单位向量，形状 (n_queries, dim)"""
+        if self.backend == "embedding":
+            model = _get_embedding_model(self.model_name)
+            if model is None:
+                raise RuntimeError("嵌入模型不可用")
+            return np.asarray(model.encode(queries, normalize_embeddings=True), dtype=np.float32)
+
+        q = np.zeros((len(queries), len(self.vocab)), dtype=np.float32)
+        for row, query in enumerate(queries):
+            for term, tf in Counter(tokenize(query)).items():
+                col = self.vocab.get(term)
+                if col is not None:
+                    q[row, col] = (1.0 + np.log(tf)) * self.idf[col]
+        return _normalize_rows(_normalize_rows(q) @ self.components)
+
+    def _passage_scores(self, query_vecs) -> Tuple[object, object]:
+        """
+        计算候选段落与查询的相似度
+
+        Returns:
+            (段落序号数组, 分数矩阵 (n_queries, n_candidates))
+        """
+        if self.ivf_centroids is not None:
+            nprobe = min(KB_IVF_NPROBE, len(self.ivf_centroids))
+            probe = np.argsort(-(query_vecs @ self.ivf_centroids.T), axis=1)[:, :nprobe]
+            clusters = np.unique(probe)
+            ids = np.concatenate([
+                self.ivf_order[self.ivf_offsets[c]:self.ivf_offsets[c + 1]] for c in clusters
+            ]) if len(clusters) else np.zeros(0, dtype=np.int64)
+            ids.sort()
+            return ids, query_vecs @ np.asarray(self.vectors[ids], dtype=np.float32).T
+
+        n = len(self.vectors)
+        scores = np.empty((len(query_vecs), n), dtype=np.float32)
+        for lo in range(0, n, _SCAN_BLOCK):
+            block = np.asarray(self.vectors[lo:lo + _SCAN_BLOCK], dtype=np.float32)
+            scores[:, lo:lo + len(block)] = query_vecs @ block.T
+        return np.arange(n), scores
+
+    def search_many(self, queries: List[str], top_k: int = 20) -> List[Dict[str, Tuple[float, Tuple[int, int]]]]:
+        """
+        批量向量检索（所有查询共用一次矩阵乘法）
+
+        Args:
+            queries: 查询列表
+            top_k: 每个查询返回的文档数
+
+        Returns:
+            每个查询一个字典：文档key -> (最高段落相似度, 该段落在原文中的位置)
+        """
+        if not queries or len(self.vectors) == 0:
+            return [{} for _ in queries]
+        ids, scores = self._passage_scores(self.encode_queries(queries))
+        results = []
+        for row in scores:
+            # 先用 argpartition 取头部候选段落；同一文档的段落过多导致不足 top_k 个文档时再全量排序
+            n_candidates = top_k * 32
+            if n_candidates < len(row):
+                head = np.argpartition(-row, n_candidates)[:n_candidates]
+                order = head[np.argsort(-row[head])]
+                if len(np.unique(self.passage_doc[ids[order]])) < top_k:
+                    order = np.argsort(-row)
+            else:
+                order = np.argsort(-row)
+            # 每个文档取最相似段落的分数
+            best: Dict[str, Tuple[float, Tuple[int, int]]] = {}
+            for pos in order:
+                passage = int(ids[pos])
+                key = self.doc_keys[int(self.passage_doc[passage])]
+                if key in best:
+                    continue
+                score = float(row[pos])
+                if score <= 0:
+                    break
+                best[key] = (score, (int(self.spans[passage][0]), int(self.spans[passage][1])))
+                if len(best) >= top_k:
+                    break
+            results.append(best)
+        return results
+
+    def search(self, query: str, top_k: int = 20) -> Dict[str, Tuple[float, Tuple[int, int]]]:
+        """单个查询的向量检索，见 search_many"""
+        return self.search_many([query], top_k)[0]
+
+
+def build_dense_index(documents: Dict[str, Dict], index_dir: str):
+    """
+    构建向量索引并写入 index_dir（先写临时目录再原子重命名）
+
+    Args:
+        documents: 知识库文档字典
+        index_dir: 目标目录
+    """
+    doc_keys = list(documents.keys())
+    spans: List[Tuple[int, int]] = []
+    passage_doc: List[int] = []
+    doc_offsets = [0]
+    texts: List[str] = []
+    for idx, key in enumerate(doc_keys):
+        content = documents[key].get('content', '')
+        for start, end in split_passages(content):
+            spans.append((start, end))
+            passage_doc.append(idx)
+            texts.append(content[start:end])
+        doc_offsets.append(len(spans))
+
+    tmp_dir = f"{index_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    try:
+        dtype = np.float16 if KB_VECTOR_DTYPE == "float16" else np.float32
+        meta = {"doc_keys": doc_keys, "n_passages": len(texts)}
+
+        model = _get_embedding_model(KB_EMBEDDING_MODEL) if KB_EMBEDDING_MODEL else None
+        if model is not None:
+            meta.update(backend="embedding", model=KB_EMBEDDING_MODEL)
+            dim = model.get_sentence_embedding_dimension()
+            vectors = np.lib.format.open_memmap(os.path.join(tmp_dir, "vectors.npy"), mode='w+', dtype=dtype, shape=(len(texts), dim))
+            for lo in range(0, len(texts), 1024):
+                vectors[lo:lo + 1024] = model.encode(texts[lo:lo + 1024], normalize_embeddings=True, batch_size=64)
+        else:
+            meta.update(backend="lsa")
+            vectors = _build_lsa(texts, tmp_dir, dtype)
+        vectors.flush()
+
+        if len(texts) >= KB_IVF_MIN_PASSAGES:
+            n_clusters = int(np.sqrt(len(texts)))
+            centroids = _kmeans(vectors, n_clusters)
+            assign = np.concatenate([
+                np.argmax(np.asarray(vectors[lo:lo + _SCAN_BLOCK], dtype=np.float32) @ centroids.T, axis=1)
+                for lo in range(0, len(texts), _SCAN_BLOCK)
+            ])
+            order = np.argsort(assign, kind="stable")
+            offsets = np.searchsorted(assign[order], np.arange(n_clusters + 1))
+            np.save(os.path.join(tmp_dir, "ivf_centroids.npy"), centroids)
+            np.save(os.path.join(tmp_dir, "ivf_order.npy"), order.astype(np.int64))
+            np.save(os.path.join(tmp_dir, "ivf_offsets.npy"), offsets.astype(np.int64))
+        del vectors
+
+        np.save(os.path.join(tmp_dir, "doc_offsets.npy"), np.asarray(doc_offsets, dtype=np.int64))
+        np.save(os.path.join(tmp_dir, "passage_doc.npy"), np.asarray(passage_doc, dtype=np.int32))
+        np.save(os.path.join(tmp_dir, "spans.npy"), np.asarray(spans, dtype=np.int64).reshape(-1, 2))
+        with open(os.path.join(tmp_dir, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        try:
+            os.replace(tmp_dir, index_dir)
+        except OSError:
+            # 其他 worker 已构建好同一指纹的索引
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def _build_lsa(texts: List[str], out_dir: str, dtype):
+    """构建 TF-IDF 矩阵并做截断 SVD，写出词表、idf、投影矩阵和段落向量"""
+    counts = [Counter(tokenize(text)) for text in texts]
+    df: Counter = Counter()
+    for c in counts:
+        df.update(c.keys())
+    vocab = [term for term, _ in df.most_common(KB_VECTOR_VOCAB)]
+    term_idx = {term: i for i, term in enumerate(vocab)}
+    n = max(len(texts), 1)
+    idf = np.asarray([np.log((1 + n) / (1 + df[term])) + 1.0 for term in vocab], dtype=np.float32)
+
+    indptr = [0]
+    indices: List[int] = []
+    data: List[float] = []
+    for c in counts:
+        row = [(term_idx[t], (1.0 + np.log(tf))) for t, tf in c.items() if t in term_idx]
+        if row:
+            cols, vals = zip(*row)
+            vals = np.asarray(vals, dtype=np.float32) * idf[list(cols)]
+            vals /= np.linalg.norm(vals) or 1.0
+            indices.extend(cols)
+            data.extend(vals.tolist())
+        indptr.append(len(indices))
+
+    x = _Csr(np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int64),
+             np.asarray(data, dtype=np.float32), len(vocab))
+    vectors = np.lib.format.open_memmap(os.path.join(out_dir, "vectors.npy"), mode='w+', dtype=dtype,
+                                        shape=(len(texts), min(KB_VECTOR_DIM, max(len(vocab), 1))))
+    if len(vocab) and len(texts):
+        components = _randomized_svd_components(x, KB_VECTOR_DIM)
+        if components.shape[1] < vectors.shape[1]:
+            components = np.pad(components, ((0, 0), (0, vectors.shape[1] - components.shape[1])))
+        vectors[:] = _normalize_rows(x.dot(components))
+    else:
+        components = np.zeros((len(vocab), vectors.shape[1]), dtype=np.float32)
+
+    with open(os.path.join(out_dir, "vocab.json"), 'w', encoding='utf-8') as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    np.save(os.path.join(out_dir, "idf.npy"), idf)
+    np.save(os.path.join(out_dir, "components.npy"), components)
+    return vectors
+
+
+def load_or_build_dense_index(kb_path: str, documents: Dict[str, Dict]) -> Optional[DenseIndex]:
+    """
+    加载与当前文档一致的向量索引，不存在时构建
+
+    Args:
+        kb_path: 知识库路径
+        documents: 当前代的文档字典
+
+    Returns:
+        DenseIndex，numpy 不可用时返回 None
+    """
+    if np is None:
+        return None
+    root = os.path.join(kb_path, ".kb_vectors")
+    fingerprint = documents_fingerprint(documents)
+    index_dir = os.path.join(root, fingerprint)
+    if not os.path.exists(os.path.join(index_dir, "meta.json")):
+        os.makedirs(root, exist_ok=True)
+        build_dense_index(documents, index_dir)
+        _prune_old_versions(root, fingerprint)
+    else:
+        # 记录最近使用时间，正在被使用的版本不会被其他 worker 清理
+        try:
+            os.utime(index_dir)
+        except OSError:
+            pass
+    return DenseIndex(index_dir)
+
+
+def _prune_old_versions(root: str, keep_fingerprint: str):
+    """
+    只保留最近使用的 KB_VECTOR_KEEP 个索引版本
+
+    多个 worker 的文档代数可能短暂不一致，各自需要的版本都在保留范围内，不会互相删除后反复重建；
+    已被其他进程映射的文件在 POSIX 下删除后仍可继续读取。
+    """
+    versions = []
+    for name in os.listdir(root):
+        if name == keep_fingerprint or ".tmp-" in name:
+            continue
+        try:
+            versions.append((os.path.getmtime(os.path.join(root, name)), name))
+        except OSError:
+            continue
+    versions.sort(reverse=True)
+    for _, name in versions[KB_VECTOR_KEEP - 1:]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
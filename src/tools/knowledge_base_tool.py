@@ -4,52 +4,293 @@
 """
 import os
 import json
-from typing import List, Dict, Optional, Tuple
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Tuple, Iterator, Callable, Any
 from pathlib import Path
 import re
 
+from tools.kb_dedup import KB_DIVERSIFY_THRESHOLD, assign_canonicals, is_canonical, signature_similarity
+from tools.kb_retrieval import BM25Index, split_requirements
+from utils.metrics import KB_SEARCH_DURATION
+from utils.log.timeline import trace_span
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 下没有 fcntl，退化为仅进程内加锁
+    fcntl = None
+
+# 支持索引的文件扩展名
+SUPPORTED_EXTENSIONS = {'.txt', '.md', '.pdf', '.docx', '.doc'}
+
+# 共享实例后台增量扫描目录的间隔（秒），0 表示不扫描（由 tools.kb_index 建索引）
+KB_SCAN_INTERVAL = float(os.getenv("KB_SCAN_INTERVAL", "60"))
+
+# 检索模式：keyword（关键词计数）、bm25（倒排索引 BM25）、hybrid（BM25 与本地向量检索融合）
+KB_RETRIEVAL_MODE = os.getenv("KB_RETRIEVAL_MODE", "keyword")
+# 混合检索中向量相似度的权重，其余为归一化后的 BM25 分数
+KB_HYBRID_ALPHA = float(os.getenv("KB_HYBRID_ALPHA", "0.5"))
+
+
+def extract_document_content(file_path: str, ext: str) -> Optional[str]:
+    """
+    提取文档内容（模块级函数，可被多进程提取阶段直接序列化调用）
+
+    Args:
+        file_path: 文件路径
+        ext: 文件扩展名
+
+    Returns:
+        文档内容
+    """
+    try:
+        if ext in ['.txt', '.md']:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return f.read()
+
+        elif ext in ['.pdf', '.docx', '.doc']:
+            # 使用FileOps提取内容
+            from utils.file.file import File, FileOps
+            file_obj = File(url=file_path, file_type="document")
+            return FileOps.extract_text(file_obj)
+
+        return None
+    except Exception as e:
+        print(f"提取文件内容失败 {file_path}: {e}")
+        return None
+
+
+@contextmanager
+def _exclusive_file_lock(lock_path: str) -> Iterator[None]:
+    """跨进程排他文件锁（多个 uvicorn worker 共享同一知识库目录时串行化写者）"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'a') as lock_fd:
+        fcntl.flock(lock_fd.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_fd.fileno(), fcntl.LOCK_UN)
 
-class KnowledgeBaseTool:
-    """本地知识库管理工具"""
 
-    def __init__(self, kb_path: Optional[str] = None):
+class KnowledgeBaseTool:
+    """
+    本地知识库管理工具
+
+    并发模型：
+    - 读者：search 等只读方法在开始时取一次 self.documents 的引用，之后不再访问 self.documents
+    - 写者：在 update_index() 中修改私有的暂存副本，publish() 时整体替换 self.documents（代际切换），
+      读者永远不会看到修改到一半的索引
+    - 跨进程：写者先取 .kb_index.lock 排他锁、再取进程内写锁，索引文件通过临时文件 + 原子重命名写入；
+      其他进程通过 refresh() 比对索引文件状态按需重新加载。重新加载只使用独立的加载锁，
+      等待文件锁的写者（如其他进程正在全量索引）不会挡住本进程加载对方发布的检查点
+    - 目录扫描：由后台线程按 KB_SCAN_INTERVAL 增量执行（见 start_background_scan），文档提取不在请求路径上；
+      尚无索引文件时，首次请求同步扫描一次
+    - 向量索引：代数变化后在后台线程中重建，就绪前检索继续使用上一代向量索引或退化为 BM25
+    """
+
+    def __init__(self, kb_path: Optional[str] = None, retrieval_mode: Optional[str] = None):
         """
         初始化知识库
 
         Args:
             kb_path: 知识库路径，如果为None则使用默认路径
+            retrieval_mode: 检索模式（keyword/bm25/hybrid），为None时使用 KB_RETRIEVAL_MODE
         """
         self.kb_path = kb_path or os.path.join(os.path.dirname(__file__), "../../assets/knowledge_base")
         self.kb_path = os.path.abspath(self.kb_path)
         self.index_file = os.path.join(self.kb_path, ".kb_index.json")
+        self.lock_file = os.path.join(self.kb_path, ".kb_index.lock")
         self.documents = {}
+        # 索引代数，每次切换 self.documents 时递增，供派生缓存判断是否过期
+        self.generation = 0
+        self._index_stat = None
+        self._write_lock = threading.RLock()
+        # 加载锁：保护"索引文件状态 + 当前代文档"的切换，只在加载 / 落盘时短暂持有
+        self._reload_lock = threading.Lock()
+        self._scanner: Optional[threading.Thread] = None
+        self._scanner_lock = threading.Lock()
+        self.retrieval_mode = retrieval_mode or KB_RETRIEVAL_MODE
+        # 由文档派生的检索结构（BM25 倒排表、向量索引），按索引代数缓存
+        self._derived: Dict[str, Tuple[int, Dict[str, Dict], Any]] = {}
+        self._derived_lock = threading.Lock()
+        # 向量索引在后台线程中构建（串行化构建，避免同一代重复构建）
+        self._dense_thread: Optional[threading.Thread] = None
+        self._dense_build_lock = threading.Lock()
         self._load_index()
 
+    def _stat_index(self) -> Optional[Tuple[int, int, int]]:
+        """索引文件状态，用于判断是否被其他进程更新"""
+        try:
+            st = os.stat(self.index_file)
+            return st.st_mtime_ns, st.st_size, st.st_ino
+        except OSError:
+            return None
+
+    def _swap_documents(self, documents: Dict[str, Dict]):
+        """代际切换：整体替换文档字典"""
+        self.documents = documents
+        self.generation += 1
+
     def _load_index(self):
         """加载索引"""
-        if os.path.exists(self.index_file):
-            try:
-                with open(self.index_file, 'r', encoding='utf-8') as f:
-                    self.documents = json.load(f)
-            except Exception as e:
-                print(f"加载知识库索引失败: {e}")
-                self.documents = {}
+        index_stat = self._stat_index()
+        if index_stat is None:
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                documents = json.load(f)
+            self._index_stat = index_stat
+            self._swap_documents(documents)
+        except Exception as e:
+            print(f"加载知识库索引失败: {e}")
+            self._swap_documents({})
 
-    def _save_index(self):
-        """保存索引"""
+    def refresh(self, wait: bool = True) -> bool:
+        """
+        索引文件被其他进程更新时重新加载（仅一次 stat 调用，可在每次请求时调用）
+
+        Args:
+            wait: 为False时，如有其他线程正在加载或落盘则直接返回（稍后的请求会看到新索引）
+
+        Returns:
+            是否重新加载了索引
+        """
+        index_stat = self._stat_index()
+        if index_stat is None or index_stat == self._index_stat:
+            return False
+        if not self._reload_lock.acquire(blocking=wait):
+            return False
+        try:
+            if self._stat_index() == self._index_stat:
+                return False
+            self._load_index()
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def _save_index(self, documents: Optional[Dict[str, Dict]] = None):
+        """保存索引（先写临时文件再原子替换，读者和中断都不会看到半截索引）"""
+        documents = self.documents if documents is None else documents
         try:
             os.makedirs(self.kb_path, exist_ok=True)
-            with open(self.index_file, 'w', encoding='utf-8') as f:
-                json.dump(self.documents, f, ensure_ascii=False, indent=2)
+            tmp_file = f"{self.index_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(documents, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.index_file)
+            self._index_stat = self._stat_index()
         except Exception as e:
             print(f"保存知识库索引失败: {e}")
 
-    def scan_directory(self, directory: Optional[str] = None) -> int:
+    @contextmanager
+    def update_index(self) -> Iterator[Dict[str, Dict]]:
+        """
+        写事务：持有跨进程文件锁和进程内写锁，产出当前索引的暂存副本
+
+        在暂存副本上修改后调用 publish() 发布；事务结束时如果仍有未发布的修改会自动发布。
+        发布前会执行去重阶段（见 tools.kb_dedup），更新近重复文档的代表/变体关联。
+        先取文件锁：其他进程长时间持有文件锁时，本进程的写者在此等待但不占用进程内的锁。
+        """
+        with _exclusive_file_lock(self.lock_file), self._write_lock:
+            # 先合并其他进程在此之前写入的结果
+            self.refresh()
+            staging = dict(self.documents)
+            yield staging
+            # 与最后一次发布的索引比较（事务中可能已调用过 publish()），仍有差异时发布
+            assign_canonicals(staging)
+            if staging != self.documents:
+                self._commit(staging)
+
+    def publish(self, staging: Dict[str, Dict]):
+        """发布暂存副本：去重后落盘并切换到新一代索引（需在 update_index() 内调用）"""
+        assign_canonicals(staging)
+        self._commit(staging)
+
+    def _commit(self, staging: Dict[str, Dict]):
+        """落盘并切换到新一代索引"""
+        documents = dict(staging)
+        with self._reload_lock:
+            self._save_index(documents)
+            self._swap_documents(documents)
+
+    @staticmethod
+    def make_document_entry(file_path: str, file_hash: str, content: str) -> Dict:
+        """
+        构造单个文档的索引条目
+
+        Args:
+            file_path: 文件绝对路径
+            file_hash: 文件哈希值
+            content: 文档内容
+        """
+        return {
+            'path': file_path,
+            'hash': file_hash,
+            'content': content,
+            'title': os.path.basename(file_path),
+            'type': os.path.splitext(file_path)[1].lower()
+        }
+
+    def ensure_fresh(self, scan_interval: float = KB_SCAN_INTERVAL):
+        """
+        请求路径上使用：同步其他进程的索引更新（一次 stat 调用，不等待进行中的写事务）
+
+        目录的增量扫描（含 PDF/DOCX 提取）由后台线程执行，首次调用时启动；尚无索引文件时首次调用同步扫描一次，
+        其余并发请求等待其完成。大型知识库请预先用 tools.kb_index 建索引。
+        """
+        if self._scanner is None and scan_interval > 0 and self._stat_index() is None:
+            with self._scanner_lock:
+                if self._scanner is None and self._stat_index() is None:
+                    self.scan_directory()
+                    self._start_scanner_locked(scan_interval, first_delay=scan_interval)
+        self.start_background_scan(scan_interval)
+        self.refresh(wait=False)
+
+    def start_background_scan(self, interval: float = KB_SCAN_INTERVAL) -> bool:
+        """
+        启动后台线程，立即扫描一次目录，之后每隔 interval 秒增量扫描（每个实例只启动一次）
+
+        Returns:
+            是否有后台扫描线程在运行（interval <= 0 时不启动）
+        """
+        if self._scanner is not None:
+            return True
+        if interval <= 0:
+            return False
+        with self._scanner_lock:
+            if self._scanner is None:
+                self._start_scanner_locked(interval)
+        return True
+
+    def _start_scanner_locked(self, interval: float, first_delay: float = 0.0):
+        """创建并启动后台扫描线程（需持有 _scanner_lock）"""
+        self._scanner = threading.Thread(
+            target=self._scan_loop, args=(interval, first_delay), name="kb-scanner", daemon=True
+        )
+        self._scanner.start()
+
+    def _scan_loop(self, interval: float, first_delay: float = 0.0):
+        time.sleep(first_delay)
+        while True:
+            try:
+                new_count = self.scan_directory()
+                if new_count:
+                    print(f"知识库后台扫描：新增/更新 {new_count} 个文档")
+            except Exception as e:
+                print(f"知识库后台扫描失败: {e}")
+            time.sleep(interval)
+
+    def scan_directory(self, directory: Optional[str] = None, workers: int = 1) -> int:
         """
         扫描目录，索引所有支持的文档
 
         Args:
             directory: 要扫描的目录，如果为None则使用kb_path
+            workers: 提取进程数，大于1时使用多进程索引流水线（见 tools.kb_index）
 
         Returns:
             新增的文档数量
@@ -59,40 +300,34 @@ class KnowledgeBaseTool:
             print(f"目录不存在: {scan_path}")
             return 0
 
+        if workers > 1:
+            from tools.kb_index import run_index_pipeline
+            progress = run_index_pipeline(self, scan_path, workers=workers)
+            return progress.indexed
+
         new_count = 0
-        # 支持的文件扩展名
-        supported_extensions = {'.txt', '.md', '.pdf', '.docx', '.doc'}
-
-        # 遍历目录
-        for root, dirs, files in os.walk(scan_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                ext = os.path.splitext(file)[1].lower()
-
-                if ext in supported_extensions:
-                    # 计算文件相对路径作为key
-                    rel_path = os.path.relpath(file_path, scan_path)
-                    
-                    # 如果文档已存在且未被修改，则跳过
-                    file_hash = self._get_file_hash(file_path)
-                    if rel_path in self.documents and self.documents[rel_path].get('hash') == file_hash:
-                        continue
-
-                    # 提取文档内容
-                    content = self._extract_content(file_path, ext)
-                    if content:
-                        self.documents[rel_path] = {
-                            'path': file_path,
-                            'hash': file_hash,
-                            'content': content,
-                            'title': file,
-                            'type': ext
-                        }
-                        new_count += 1
-
-        # 保存索引
-        if new_count > 0:
-            self._save_index()
+
+        with self.update_index() as staging:
+            # 遍历目录
+            for root, dirs, files in os.walk(scan_path):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    ext = os.path.splitext(file)[1].lower()
+
+                    if ext in SUPPORTED_EXTENSIONS:
+                        # 计算文件相对路径作为key
+                        rel_path = os.path.relpath(file_path, scan_path)
+
+                        # 如果文档已存在且未被修改，则跳过
+                        file_hash = self._get_file_hash(file_path)
+                        if rel_path in staging and staging[rel_path].get('hash') == file_hash:
+                            continue
+
+                        # 提取文档内容
+                        content = self._extract_content(file_path, ext)
+                        if content:
+                            staging[rel_path] = self.make_document_entry(file_path, file_hash, content)
+                            new_count += 1
 
         return new_count
 
@@ -112,57 +347,320 @@ class KnowledgeBaseTool:
         Returns:
             文档内容
         """
-        try:
-            if ext in ['.txt', '.md']:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return f.read()
+        return extract_document_content(file_path, ext)
 
-            elif ext in ['.pdf', '.docx', '.doc']:
-                # 使用FileOps提取内容
-                from utils.file.file import File, FileOps
-                file_obj = File(url=file_path, file_type="document")
-                return FileOps.extract_text(file_obj)
+    def _get_derived(self, name: str, builder: Callable[[Dict[str, Dict]], Any]) -> Tuple[Dict[str, Dict], Any]:
+        """
+        获取当前代索引的派生结构，代数变化后重新构建
 
-            return None
+        Returns:
+            (构建时使用的文档字典, 派生结构)
+        """
+        generation = self.generation
+        cached = self._derived.get(name)
+        if cached is not None and cached[0] == generation:
+            return cached[1], cached[2]
+        with self._derived_lock:
+            cached = self._derived.get(name)
+            if cached is not None and cached[0] == generation:
+                return cached[1], cached[2]
+            documents = self.documents
+            value = builder(documents)
+            self._derived[name] = (generation, documents, value)
+            return documents, value
+
+    def get_bm25_index(self) -> Tuple[Dict[str, Dict], BM25Index]:
+        """获取当前代索引的 BM25 倒排表"""
+        return self._get_derived('bm25', lambda documents: BM25Index(self._canonical_documents(documents)))
+
+    def get_dense_index(self, wait: bool = False):
+        """
+        获取向量索引，numpy 不可用或构建失败时返回 None
+
+        当前代的向量索引尚未就绪时在后台线程中加载或构建，期间继续返回上一代的向量索引
+        （已删除的文档在融合时跳过）；还没有任何可用版本时返回 None，检索退化为 BM25。
+
+        Args:
+            wait: 为 True 时同步等待当前代构建完成（如 tools.kb_index --build-vectors）
+        """
+        generation = self.generation
+        cached = self._derived.get('dense')
+        if cached is not None and cached[0] == generation:
+            return cached[2]
+        if wait:
+            with self._dense_build_lock:
+                cached = self._derived.get('dense')
+                if cached is not None and cached[0] == self.generation:
+                    return cached[2]
+                return self._build_dense(self.generation, self.documents)
+        self._start_dense_build()
+        return cached[2] if cached is not None else None
+
+    def _start_dense_build(self):
+        """启动后台向量索引构建线程（已在构建时不重复启动）"""
+        with self._derived_lock:
+            if self._dense_thread is not None:
+                return
+            self._dense_thread = threading.Thread(
+                target=self._dense_build_loop, name="kb-dense-build", daemon=True
+            )
+            self._dense_thread.start()
+
+    def _dense_build_loop(self):
+        """构建到与最新一代一致为止，构建期间发生的代际切换在下一轮处理"""
+        while True:
+            with self._dense_build_lock:
+                generation, documents = self.generation, self.documents
+                cached = self._derived.get('dense')
+                if cached is None or cached[0] != generation:
+                    self._build_dense(generation, documents)
+            with self._derived_lock:
+                if self.generation == generation:
+                    self._dense_thread = None
+                    return
+
+    def _build_dense(self, generation: int, documents: Dict[str, Dict]):
+        """加载或构建指定代的向量索引；失败时保留上一版本，同一代不再重试"""
+        try:
+            from tools.kb_vector import load_or_build_dense_index
+            value = load_or_build_dense_index(self.kb_path, self._canonical_documents(documents))
         except Exception as e:
-            print(f"提取文件内容失败 {file_path}: {e}")
-            return None
+            print(f"构建知识库向量索引失败，退化为BM25检索: {e}")
+            value = None
+        previous = self._derived.get('dense')
+        if value is None and previous is not None:
+            documents, value = previous[1], previous[2]
+        self._derived['dense'] = (generation, documents, value)
+        return value
+
+    @staticmethod
+    def _canonical_documents(documents: Dict[str, Dict]) -> Dict[str, Dict]:
+        """只保留代表文档，近重复的变体不进入倒排表与向量索引"""
+        return {key: doc for key, doc in documents.items() if is_canonical(doc)}
+
+    @staticmethod
+    def _make_result(doc_key: str, doc: Dict, score: float, span: Optional[Tuple[int, int]] = None) -> Dict:
+        """构造检索结果条目，span 为命中段落在原文中的位置"""
+        content = doc.get('content', '')
+        result = {
+            'content': content,
+            'source': doc.get('title', doc_key),
+            'path': doc.get('path', ''),
+            'score': score,
+            'type': 'local_knowledge_base'
+        }
+        if span is not None:
+            result['passage'] = content[span[0]:span[1]]
+        if doc.get('variants'):
+            result['variants'] = list(doc['variants'])
+        return result
+
+    def _select_diverse(
+        self,
+        documents: Dict[str, Dict],
+        ranked: List[Tuple[str, float, Optional[Tuple[int, int]]]],
+        top_k: int
+    ) -> List[Dict]:
+        """
+        按分数顺序选取结果，跳过与已选结果高度相似的文档，使结果覆盖不同素材
 
-    def search(self, query: str, top_k: int = 5) -> List[Dict]:
+        Args:
+            documents: 文档字典
+            ranked: 按分数降序的 (文档key, 分数, 段落位置) 列表
+            top_k: 返回结果数量
+        """
+        results = []
+        selected: List[List[int]] = []
+        for key, score, span in ranked:
+            doc = documents.get(key)
+            if doc is None:
+                continue
+            signature = doc.get('minhash') or []
+            if signature and any(
+                signature_similarity(signature, other) >= KB_DIVERSIFY_THRESHOLD for other in selected
+            ):
+                continue
+            results.append(self._make_result(key, doc, score, span))
+            selected.append(signature)
+            if len(results) >= top_k:
+                break
+        return results
+
+    def search(self, query: str, top_k: int = 5, mode: Optional[str] = None) -> List[Dict]:
         """
         在知识库中搜索
 
         Args:
             query: 搜索查询词
             top_k: 返回结果数量
+            mode: 检索模式（keyword/bm25/hybrid），为None时使用实例的 retrieval_mode
 
         Returns:
-            搜索结果列表，每项包含content、source、page等
+            搜索结果列表，每项包含content、source、page等；混合检索额外包含最相关段落passage
         """
-        results = []
+        return self._search_batch([query], top_k, mode or self.retrieval_mode)[0]
+
+    def search_many(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        mode: Optional[str] = None,
+        decompose: bool = True
+    ) -> List[List[Dict]]:
+        """
+        批量检索多段需求文本
 
-        # 将查询词分解为关键词
-        keywords = self._extract_keywords(query)
+        每段文本先拆分为逐条需求子查询，所有子查询在一次倒排表遍历
+        （向量检索为一次矩阵乘法）中完成打分。同一文档在一段文本内只出现一次，
+        排序时优先保证每条需求的最佳命中入选；跨文本去重时，文档只保留在
+        得分最高的那段文本的结果中。
 
-        # 计算每个文档的相关性分数
-        for doc_key, doc in self.documents.items():
-            content = doc.get('content', '')
-            score = self._calculate_relevance(content, keywords)
+        Args:
+            queries: 查询文本列表（如商务需求、技术需求）
+            top_k: 每段文本返回的结果数量
+            mode: 检索模式（keyword/bm25/hybrid），为None时使用实例的 retrieval_mode
+            decompose: 是否将每段文本拆分为逐条需求子查询
+
+        Returns:
+            与 queries 一一对应的结果列表，每项额外包含命中的子查询 matched_queries
+        """
+        sub_queries: List[str] = []
+        owners: List[int] = []
+        for qi, query in enumerate(queries):
+            items = split_requirements(query) if decompose else []
+            if not items and query and query.strip():
+                items = [query.strip()]
+            sub_queries.extend(items)
+            owners.extend([qi] * len(items))
+
+        if not sub_queries:
+            return [[] for _ in queries]
+
+        # 每条子查询多取一些候选，为跨文本去重留出余量，再按所属文本汇总
+        ranked = self._search_batch(sub_queries, top_k * 2, mode or self.retrieval_mode)
+        merged: List[Dict[str, Tuple[Tuple[int, float], Dict]]] = [{} for _ in queries]
+        for sub_query, qi, results in zip(sub_queries, owners, ranked):
+            for rank, result in enumerate(results):
+                key = (rank, -result['score'])
+                entry = merged[qi].get(result['path'])
+                if entry is None:
+                    result['matched_queries'] = [sub_query]
+                    merged[qi][result['path']] = (key, result)
+                    continue
+                best_key, best = entry
+                best['matched_queries'].append(sub_query)
+                if key < best_key:
+                    result['matched_queries'] = best['matched_queries']
+                    merged[qi][result['path']] = (key, result)
+
+        # 跨文本去重：按排序全局贪心分配，文档只归属于最先选中它且尚未满额的文本
+        candidates = sorted(
+            (key, qi, path, result)
+            for qi, entries in enumerate(merged)
+            for path, (key, result) in entries.items()
+        )
+        outputs: List[List[Dict]] = [[] for _ in queries]
+        taken = set()
+        for _, qi, path, result in candidates:
+            if path in taken or len(outputs[qi]) >= top_k:
+                continue
+            taken.add(path)
+            outputs[qi].append(result)
+        return outputs
+
+    def _search_batch(self, queries: List[str], top_k: int, mode: str) -> List[List[Dict]]:
+        """按检索模式批量打分，返回每个查询各自的 top_k 结果（记录检索耗时指标与时间线区间）"""
+        op = "search" if len(queries) == 1 else "search_many"
+        start = time.time()
+        try:
+            with trace_span(f"kb.{op}", "kb", mode=mode, queries=len(queries), top_k=top_k):
+                return self._score_batch(queries, top_k, mode)
+        finally:
+            KB_SEARCH_DURATION.observe(time.time() - start, op=op, mode=mode)
+
+    def _score_batch(self, queries: List[str], top_k: int, mode: str) -> List[List[Dict]]:
+        if mode == 'keyword':
+            return self._keyword_search_many(queries, top_k)
+
+        documents, bm25 = self.get_bm25_index()
+        bm25_scores = bm25.score_many(queries)
+        dense = self.get_dense_index() if mode == 'hybrid' else None
+        if dense is None:
+            outputs = []
+            for scores in bm25_scores:
+                ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+                outputs.append(self._select_diverse(
+                    documents, [(bm25.doc_keys[idx], score, None) for idx, score in ranked], top_k
+                ))
+            return outputs
+
+        dense_hits = dense.search_many(queries, top_k * 4)
+        return [
+            self._fuse_results(documents, bm25, scores, hits, top_k)
+            for scores, hits in zip(bm25_scores, dense_hits)
+        ]
 
+    def _fuse_results(
+        self,
+        documents: Dict[str, Dict],
+        bm25: BM25Index,
+        bm25_scores: Dict[int, float],
+        dense_hits: Dict[str, Tuple[float, Tuple[int, int]]],
+        top_k: int
+    ) -> List[Dict]:
+        """
+        融合 BM25 与向量检索分数：KB_HYBRID_ALPHA * 余弦相似度 + (1 - KB_HYBRID_ALPHA) * 归一化 BM25
+
+        候选为 BM25 前 top_k*4 个文档与向量检索命中文档的并集。
+        """
+        max_bm25 = max(bm25_scores.values(), default=0.0) or 1.0
+        candidates = {
+            bm25.doc_keys[idx]
+            for idx, _ in sorted(bm25_scores.items(), key=lambda x: x[1], reverse=True)[:top_k * 4]
+        }
+        candidates.update(dense_hits.keys())
+
+        fused = []
+        for key in candidates:
+            if key not in documents:
+                continue
+            lexical = bm25_scores.get(bm25.key_to_idx.get(key, -1), 0.0) / max_bm25
+            semantic, span = dense_hits.get(key, (0.0, None))
+            score = KB_HYBRID_ALPHA * max(semantic, 0.0) + (1 - KB_HYBRID_ALPHA) * lexical
             if score > 0:
-                results.append({
-                    'content': content,
-                    'source': doc.get('title', doc_key),
-                    'path': doc.get('path', ''),
-                    'score': score,
-                    'type': 'local_knowledge_base'
-                })
+                fused.append((key, score, span))
+
+        fused.sort(key=lambda x: x[1], reverse=True)
+        return self._select_diverse(documents, fused, top_k)
 
-        # 按分数排序
-        results.sort(key=lambda x: x['score'], reverse=True)
+    def _keyword_search(self, query: str, top_k: int) -> List[Dict]:
+        """关键词计数检索（原有实现）"""
+        return self._keyword_search_many([query], top_k)[0]
 
-        # 返回top_k结果
-        return results[:top_k]
+    def _keyword_search_many(self, queries: List[str], top_k: int) -> List[List[Dict]]:
+        """关键词计数检索，多个查询共用一次文档遍历"""
+        # 将查询词分解为关键词
+        keyword_lists = [self._extract_keywords(query) for query in queries]
+        scored: List[List[Tuple[str, float, None]]] = [[] for _ in queries]
+
+        # 计算每个代表文档的相关性分数（只读取一次当前代索引的引用，每个文档只转换一次小写）
+        documents = self.documents
+        for doc_key, doc in documents.items():
+            if not is_canonical(doc):
+                continue
+            content = doc.get('content', '')
+            content_lower = content.lower()
+            for qi, keywords in enumerate(keyword_lists):
+                score = self._calculate_relevance(content, keywords, content_lower)
+                if score > 0:
+                    scored[qi].append((doc_key, score, None))
+
+        # 按分数排序，返回top_k结果
+        results = []
+        for ranked in scored:
+            ranked.sort(key=lambda x: x[1], reverse=True)
+            results.append(self._select_diverse(documents, ranked, top_k))
+        return results
 
     def _extract_keywords(self, query: str) -> List[str]:
         """提取关键词"""
@@ -177,13 +675,14 @@ class KnowledgeBaseTool:
         
         return keywords
 
-    def _calculate_relevance(self, content: str, keywords: List[str]) -> float:
+    def _calculate_relevance(self, content: str, keywords: List[str], content_lower: Optional[str] = None) -> float:
         """
         计算内容与查询的相关性
 
         Args:
             content: 文档内容
             keywords: 关键词列表
+            content_lower: 预先转换的小写内容，批量检索时避免重复转换
 
         Returns:
             相关性分数
@@ -191,7 +690,8 @@ class KnowledgeBaseTool:
         if not keywords:
             return 0.0
 
-        content_lower = content.lower()
+        if content_lower is None:
+            content_lower = content.lower()
         score = 0.0
 
         for keyword in keywords:
@@ -219,12 +719,42 @@ class KnowledgeBaseTool:
                 'title': doc.get('title', key),
                 'path': doc.get('path', ''),
                 'type': doc.get('type', ''),
-                'length': len(doc.get('content', ''))
+                'length': len(doc.get('content', '')),
+                'duplicate_of': doc.get('duplicate_of')
             }
             for key, doc in self.documents.items()
         ]
 
     def clear_index(self):
         """清空索引"""
-        self.documents = {}
-        self._save_index()
+        with self.update_index() as staging:
+            staging.clear()
+            self.publish(staging)
+
+
+_shared_tools: Dict[str, KnowledgeBaseTool] = {}
+_shared_tools_lock = threading.Lock()
+
+
+def get_shared_knowledge_base(kb_path: Optional[str] = None) -> KnowledgeBaseTool:
+    """
+    获取进程内共享的知识库实例（按路径单例，生命周期与进程相同）
+
+    检索节点应使用该函数而不是直接构造 KnowledgeBaseTool，避免每次请求都从磁盘重新加载整个索引。
+
+    Args:
+        kb_path: 知识库路径，如果为None则使用默认路径
+
+    Returns:
+        共享的 KnowledgeBaseTool 实例
+    """
+    key = os.path.abspath(kb_path) if kb_path else ""
+    tool = _shared_tools.get(key)
+    if tool is not None:
+        return tool
+    with _shared_tools_lock:
+        tool = _shared_tools.get(key)
+        if tool is None:
+            tool = KnowledgeBaseTool(kb_path)
+            _shared_tools[key] = tool
+        return tool
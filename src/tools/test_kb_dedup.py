@@ -0,0 +1,57 @@
+"""
+知识库近重复文档去重测试
+"""
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tools.kb_dedup import assign_canonicals, is_canonical, minhash_signature, signature_similarity
+from tools.knowledge_base_tool import KnowledgeBaseTool
+
+_BASE = "".join(
+    f"第{i}条：驻场工程师负责第{i * 37}号机房的日常巡检、漏洞修复与应急响应，响应时间{i + 5}分钟。"
+    for i in range(12)
+)
+
+
+def test_signature_similarity():
+    """相同文本签名一致，差异很小的文本相似度高，无关文本相似度低"""
+    a = minhash_signature(_BASE)
+    assert signature_similarity(a, minhash_signature(_BASE)) == 1.0
+    assert signature_similarity(a, minhash_signature(_BASE + "（二〇二四版）")) >= 0.85
+    assert signature_similarity(a, minhash_signature("办公用品采购清单：纸张、墨盒、文件夹" * 4)) < 0.3
+    assert minhash_signature("   ") == []
+    assert signature_similarity([], a) == 0.0
+
+
+def test_assign_canonicals_clusters_near_duplicates():
+    """近重复文档归为一簇，内容最长者为代表，其余标记为变体"""
+    documents = {
+        "v1.txt": {"content": _BASE},
+        "v2.txt": {"content": _BASE + "（二〇二四版）"},
+        "other.txt": {"content": "办公用品采购清单：纸张、墨盒、文件夹" * 4},
+    }
+    original_v1 = documents["v1.txt"]
+    assert assign_canonicals(documents, enabled=True) == 1
+    assert documents["v2.txt"]["variants"] == ["v1.txt"]
+    assert documents["v1.txt"]["duplicate_of"] == "v2.txt"
+    assert is_canonical(documents["v2.txt"]) and is_canonical(documents["other.txt"])
+    assert not is_canonical(documents["v1.txt"])
+    # 变化的条目以新字典替换，不修改原条目
+    assert "duplicate_of" not in original_v1
+
+    assert assign_canonicals(documents, enabled=False) == 0
+    assert all(is_canonical(doc) for doc in documents.values())
+    assert "variants" not in documents["v2.txt"]
+
+
+def test_variants_hidden_from_search(tmp_path):
+    """检索只返回代表文档"""
+    kb = KnowledgeBaseTool(str(tmp_path), retrieval_mode='bm25')
+    with kb.update_index() as staging:
+        staging["v1.txt"] = kb.make_document_entry("/kb/v1.txt", "1", _BASE)
+        staging["v2.txt"] = kb.make_document_entry("/kb/v2.txt", "1", _BASE + "（二〇二四版）")
+    sources = [r['source'] for r in kb.search("机房巡检 漏洞修复", top_k=5)]
+    assert len(sources) == 1
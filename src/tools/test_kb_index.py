@@ -0,0 +1,76 @@
+"""
+知识库并行索引流水线测试
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tools.kb_index import REBUILD_STATE_FILE, run_index_pipeline
+from tools.knowledge_base_tool import KnowledgeBaseTool
+
+
+def _write_docs(directory: Path, count: int, prefix: str = "doc"):
+    for i in range(count):
+        (directory / f"{prefix}{i}.txt").write_text(f"{prefix} 第{i}份素材 内容{i * 7919}", encoding="utf-8")
+
+
+def test_incremental_index_skips_unchanged(tmp_path):
+    """已索引且未修改的文档在再次执行时跳过"""
+    _write_docs(tmp_path, 3)
+    kb = KnowledgeBaseTool(str(tmp_path))
+    first = run_index_pipeline(kb, workers=2)
+    assert first.indexed == 3
+    second = run_index_pipeline(kb, workers=2)
+    assert second.indexed == 0
+    assert second.skipped == 3
+    assert KnowledgeBaseTool(str(tmp_path)).get_document_count() == 3
+
+
+def test_rebuild_keeps_live_index_until_done(tmp_path):
+    """全量重建期间线上索引保持旧内容，完成后一次性替换"""
+    _write_docs(tmp_path, 4)
+    kb = KnowledgeBaseTool(str(tmp_path))
+    run_index_pipeline(kb, workers=2)
+    os.remove(tmp_path / "doc0.txt")
+
+    seen_by_readers = []
+
+    def on_progress(progress):
+        seen_by_readers.append(KnowledgeBaseTool(str(tmp_path)).get_document_count())
+
+    progress = run_index_pipeline(kb, workers=2, rebuild=True, checkpoint_every=1, progress_callback=on_progress)
+    assert progress.indexed == 3
+    assert seen_by_readers and all(count == 4 for count in seen_by_readers[:-1])
+    assert sorted(KnowledgeBaseTool(str(tmp_path)).documents) == ["doc1.txt", "doc2.txt", "doc3.txt"]
+    assert not (tmp_path / REBUILD_STATE_FILE).exists()
+
+
+def test_interrupted_rebuild_resumes_from_state_file(tmp_path):
+    """中断的重建只写旁路文件，再次 rebuild 时从中继续"""
+    _write_docs(tmp_path, 4)
+    kb = KnowledgeBaseTool(str(tmp_path))
+    run_index_pipeline(kb, workers=1)
+    live = dict(KnowledgeBaseTool(str(tmp_path)).documents)
+
+    calls = []
+
+    def interrupt(progress):
+        calls.append(progress.indexed)
+        if progress.indexed:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        run_index_pipeline(kb, workers=1, max_in_flight=1, rebuild=True, checkpoint_every=1,
+                           progress_callback=interrupt)
+    assert (tmp_path / REBUILD_STATE_FILE).exists()
+    assert KnowledgeBaseTool(str(tmp_path)).documents == live
+
+    resumed = run_index_pipeline(kb, workers=1, rebuild=True)
+    assert resumed.skipped >= 1
+    assert resumed.skipped + resumed.indexed == 4
+    assert not (tmp_path / REBUILD_STATE_FILE).exists()
@@ -0,0 +1,76 @@
+"""
+知识库检索测试：分词、段落切分、需求拆分、BM25 与批量检索
+"""
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tools.kb_retrieval import BM25Index, split_passages, split_requirements, tokenize
+from tools.knowledge_base_tool import KnowledgeBaseTool
+
+
+def test_tokenize_chinese_bigrams_and_words():
+    """中文切为相邻二元组，英文数字保留整词并转小写"""
+    assert tokenize("安全运维") == ["安全", "全运", "运维"]
+    assert tokenize("支持 ISO-27001 认证") == ["支持", "iso-27001", "认证"]
+    assert tokenize("云") == ["云"]
+
+
+def test_split_passages_overlap_and_cover():
+    """段落按窗口重叠切分并覆盖全文"""
+    content = "x" * 1000
+    spans = split_passages(content, size=400, overlap=80)
+    assert spans[0] == (0, 400)
+    assert spans[1][0] == 320
+    assert spans[-1][1] == len(content)
+    assert split_passages("") == []
+
+
+def test_split_requirements_numbering_and_merging():
+    """去掉编号，短片段并入上一条，重复条目去重"""
+    text = "1. 提供7x24小时安全运维服务\n2、具备等级保护测评资质\n备注\n1. 提供7x24小时安全运维服务"
+    items = split_requirements(text)
+    assert items == ["提供7x24小时安全运维服务", "具备等级保护测评资质 备注"]
+    assert split_requirements("") == []
+    assert len(split_requirements("\n".join(f"第{i}条需求内容" for i in range(10)), max_items=4)) <= 4
+
+
+def test_bm25_score_many_matches_single_queries():
+    """批量打分与逐条打分结果一致，相关文档排在前面"""
+    documents = {
+        "a": {"content": "安全运维 驻场服务 七乘二十四小时响应"},
+        "b": {"content": "等级保护测评 整改方案 安全加固"},
+        "c": {"content": "办公用品采购清单"},
+    }
+    index = BM25Index(documents)
+    queries = ["安全运维服务", "等级保护测评"]
+    batched = index.score_many(queries)
+    for query, scores in zip(queries, batched):
+        assert dict(scores) == dict(index.score(query))
+    assert index.search("安全运维服务", top_k=1)[0][0] == "a"
+    assert index.search("等级保护", top_k=1)[0][0] == "b"
+    assert index.score("完全无关") == {}
+
+
+def test_search_many_decomposes_and_dedups_across_queries(tmp_path):
+    """逐条需求各自命中，同一文档只保留在得分最高的那段文本中"""
+    kb = KnowledgeBaseTool(str(tmp_path), retrieval_mode='bm25')
+    with kb.update_index() as staging:
+        for name, content in {
+            "ops.txt": "安全运维 驻场服务 七乘二十四小时响应",
+            "mlps.txt": "等级保护测评 整改方案",
+            "staff.txt": "项目团队 人员资质 高级工程师",
+        }.items():
+            staging[name] = kb.make_document_entry(f"/kb/{name}", "1", content)
+
+    business, technical = kb.search_many(
+        ["1. 项目团队人员资质\n2. 安全运维驻场服务", "1. 等级保护测评\n2. 安全运维"],
+        top_k=3,
+    )
+    business_sources = [r['source'] for r in business]
+    technical_sources = [r['source'] for r in technical]
+    assert "staff.txt" in business_sources and "mlps.txt" in technical_sources
+    assert not set(business_sources) & set(technical_sources)
+    assert all(r['matched_queries'] for r in business + technical)
@@ -0,0 +1,94 @@
+"""
+知识库本地向量检索测试：后台构建与多版本保留
+"""
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tools import kb_vector
+from tools.knowledge_base_tool import KnowledgeBaseTool
+
+pytestmark = pytest.mark.skipif(not kb_vector.is_available(), reason="需要 numpy")
+
+
+def _add(kb: KnowledgeBaseTool, name: str, content: str):
+    with kb.update_index() as staging:
+        staging[name] = kb.make_document_entry(f"/kb/{name}", "1", content)
+
+
+def _wait_ready(kb: KnowledgeBaseTool, timeout: float = 10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        cached = kb._derived.get('dense')
+        if cached is not None and cached[0] == kb.generation and kb._dense_thread is None:
+            return cached[2]
+        time.sleep(0.02)
+    raise AssertionError("向量索引未在限定时间内就绪")
+
+
+def test_hybrid_search_falls_back_to_bm25_while_building(tmp_path, monkeypatch):
+    """首个向量索引构建期间，混合检索不等待构建，直接返回 BM25 结果"""
+    kb = KnowledgeBaseTool(str(tmp_path), retrieval_mode='hybrid')
+    _add(kb, "a.txt", "安全运维 驻场服务 七乘二十四小时")
+    _add(kb, "b.txt", "等级保护测评 整改方案")
+
+    release = threading.Event()
+    original = kb_vector.load_or_build_dense_index
+
+    def slow_build(kb_path, documents):
+        release.wait(5)
+        return original(kb_path, documents)
+
+    monkeypatch.setattr(kb_vector, "load_or_build_dense_index", slow_build)
+    start = time.time()
+    results = kb.search("安全运维", top_k=1)
+    assert time.time() - start < 2
+    assert results and results[0]['source'] == "a.txt"
+
+    release.set()
+    assert _wait_ready(kb) is not None
+
+
+def test_previous_dense_index_served_until_new_generation_ready(tmp_path, monkeypatch):
+    """代数变化后在新版本就绪前继续返回上一代向量索引"""
+    kb = KnowledgeBaseTool(str(tmp_path), retrieval_mode='hybrid')
+    _add(kb, "a.txt", "安全运维 驻场服务")
+    previous = kb.get_dense_index(wait=True)
+    assert previous is not None
+
+    release = threading.Event()
+    original = kb_vector.load_or_build_dense_index
+
+    def slow_build(kb_path, documents):
+        release.wait(5)
+        return original(kb_path, documents)
+
+    monkeypatch.setattr(kb_vector, "load_or_build_dense_index", slow_build)
+    _add(kb, "b.txt", "等级保护测评 整改方案")
+    assert kb.get_dense_index() is previous
+
+    release.set()
+    current = _wait_ready(kb)
+    assert current is not None and current is not previous
+
+
+def test_recent_fingerprints_are_kept(tmp_path, monkeypatch):
+    """新版本构建后只清理超出保留个数的旧版本"""
+    monkeypatch.setattr(kb_vector, "KB_VECTOR_KEEP", 2)
+    root = tmp_path / ".kb_vectors"
+    built = []
+    for i in range(3):
+        documents = {f"d{i}.txt": {'content': f"第{i}份 安全运维 文档", 'hash': str(i)}}
+        kb_vector.load_or_build_dense_index(str(tmp_path), documents)
+        built.append(kb_vector.documents_fingerprint(documents))
+        # 保证 mtime 有先后
+        os.utime(root / built[-1], (time.time() + i, time.time() + i))
+
+    assert sorted(os.listdir(root)) == sorted(built[1:])
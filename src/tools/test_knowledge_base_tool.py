@@ -0,0 +1,84 @@
+"""
+本地知识库工具测试：写事务、跨进程刷新与首次扫描
+"""
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tools.knowledge_base_tool import KnowledgeBaseTool, fcntl
+
+
+def _entry(kb: KnowledgeBaseTool, name: str, content: str):
+    return kb.make_document_entry(f"/kb/{name}", "1", content)
+
+
+def test_edits_after_publish_are_committed(tmp_path):
+    """事务中 publish() 之后的修改在事务结束时发布"""
+    kb = KnowledgeBaseTool(str(tmp_path))
+    with kb.update_index() as staging:
+        staging["a.txt"] = _entry(kb, "a.txt", "alpha 安全运维服务")
+        kb.publish(staging)
+        staging["b.txt"] = _entry(kb, "b.txt", "beta 等级保护测评")
+
+    assert sorted(kb.documents) == ["a.txt", "b.txt"]
+    with open(kb.index_file, encoding="utf-8") as f:
+        assert sorted(json.load(f)) == ["a.txt", "b.txt"]
+
+
+def test_unchanged_transaction_does_not_commit(tmp_path):
+    """没有修改的事务不切换索引代数"""
+    kb = KnowledgeBaseTool(str(tmp_path))
+    with kb.update_index() as staging:
+        staging["a.txt"] = _entry(kb, "a.txt", "alpha")
+    generation = kb.generation
+    with kb.update_index():
+        pass
+    assert kb.generation == generation
+
+
+def test_first_request_scans_unindexed_kb(tmp_path):
+    """尚无索引文件时首次请求同步扫描，请求立即可检索到文档"""
+    (tmp_path / "运维方案.txt").write_text("七乘二十四小时 安全运维 驻场服务", encoding="utf-8")
+    kb = KnowledgeBaseTool(str(tmp_path))
+    kb.ensure_fresh(scan_interval=3600)
+    assert kb.get_document_count() == 1
+    assert kb.search("安全运维", top_k=1)
+
+
+@pytest.mark.skipif(fcntl is None, reason="需要 fcntl 文件锁")
+def test_refresh_not_blocked_by_waiting_writer(tmp_path):
+    """其他写者持有文件锁期间，本进程等待中的写者不阻塞对已发布检查点的加载"""
+    kb = KnowledgeBaseTool(str(tmp_path))
+    other = KnowledgeBaseTool(str(tmp_path))
+    published = threading.Event()
+    release = threading.Event()
+
+    def long_reindex():
+        with other.update_index() as staging:
+            staging["a.txt"] = _entry(other, "a.txt", "检查点文档")
+            other.publish(staging)
+            published.set()
+            release.wait(5)
+
+    writer = threading.Thread(target=long_reindex)
+    writer.start()
+    assert published.wait(5)
+
+    # 本进程的写者（如后台扫描）在文件锁上等待
+    waiting = threading.Thread(target=kb.scan_directory)
+    waiting.start()
+    time.sleep(0.2)
+    try:
+        assert kb.refresh(wait=False)
+        assert "a.txt" in kb.documents
+    finally:
+        release.set()
+        writer.join(5)
+        waiting.join(5)
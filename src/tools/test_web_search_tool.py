@@ -0,0 +1,84 @@
+"""
+联网搜索工具测试：缓存、磁盘层清理、结果合并与后端配置
+"""
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tools.web_search_tool import SearchBackend, WebSearchCache, WebSearchTool
+
+
+class _FakeBackend(SearchBackend):
+    name = "fake"
+
+    def __init__(self):
+        self.calls: List[str] = []
+
+    def search(self, query: str, count: int = 5) -> List[Dict]:
+        self.calls.append(query)
+        return [
+            {'content': f"{query} 结果{i}", 'url': f"https://example.com/{query}/{i}", 'title': f"{query}{i}"}
+            for i in range(count)
+        ]
+
+
+def test_search_is_cached_across_instances(tmp_path):
+    """同一查询第二次命中缓存，磁盘层可被新的缓存实例读取"""
+    backend = _FakeBackend()
+    tool = WebSearchTool(backend=backend, cache=WebSearchCache(cache_dir=str(tmp_path)))
+    first = tool.search("安全运维", count=3)
+    assert tool.search(" 安全运维。", count=3) == first
+    assert backend.calls == ["安全运维"]
+
+    other = WebSearchTool(backend=backend, cache=WebSearchCache(cache_dir=str(tmp_path)))
+    assert other.search("安全运维", count=3) == first
+    assert other.cache.stats()['disk_hits'] == 1
+
+
+def test_search_requirements_returns_five_by_default(tmp_path):
+    """多条需求轮流合并结果，默认最多返回 5 条"""
+    tool = WebSearchTool(backend=_FakeBackend(), cache=WebSearchCache(cache_dir=str(tmp_path)))
+    results = tool.search_requirements("1. 安全运维服务\n2. 等级保护测评\n3. 应急响应预案", "默认", count=5)
+    assert len(results) == 5
+    assert [r['query'] for r in results[:3]] == ["安全运维服务", "等级保护测评", "应急响应预案"]
+
+
+def test_sweep_enforces_entry_and_byte_caps(tmp_path):
+    """清理时删除过期条目与临时文件，超过上限时淘汰最旧的条目"""
+    cache = WebSearchCache(cache_dir=str(tmp_path), disk_max_entries=3, sweep_interval=3600)
+    now = time.time()
+    keys = []
+    for i in range(5):
+        key = cache.make_key("fake", f"查询{i}", 5)
+        cache.set(key, [{'url': f"u{i}"}])
+        os.utime(cache._disk_path(key), (now - 100 + i, now - 100 + i))
+        keys.append(key)
+    expired = cache.make_key("fake", "过期", 5)
+    cache.set(expired, [])
+    os.utime(cache._disk_path(expired), (now - cache.ttl - 1, now - cache.ttl - 1))
+    stale_tmp = tmp_path / "ab" / "leftover.json.1.2.tmp"
+    stale_tmp.parent.mkdir(exist_ok=True)
+    stale_tmp.write_text("{}")
+    os.utime(stale_tmp, (now - cache.ttl - 1, now - cache.ttl - 1))
+
+    assert cache.sweep() == 4
+    assert [os.path.exists(cache._disk_path(k)) for k in keys] == [False, False, True, True, True]
+    assert not stale_tmp.exists()
+
+    cache.disk_max_entries = 100
+    cache.disk_max_bytes = os.path.getsize(cache._disk_path(keys[-1]))
+    cache.sweep()
+    assert [os.path.exists(cache._disk_path(k)) for k in keys[2:]] == [False, False, True]
+
+
+def test_unknown_backend_degrades_to_no_results(tmp_path, monkeypatch):
+    """WEB_SEARCH_BACKEND 配置错误时不抛出异常，返回空结果"""
+    monkeypatch.setattr("tools.web_search_tool.WEB_SEARCH_BACKEND", "no-such-backend")
+    tool = WebSearchTool(cache=WebSearchCache(cache_dir=str(tmp_path)))
+    assert tool.backend is None
+    assert tool.search_requirements("1. 安全运维服务", "默认") == []
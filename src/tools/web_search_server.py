@@ -0,0 +1,87 @@
+"""
+联网搜索本地替身服务
+
+返回确定性的模拟结果，可配置响应延迟，用于在没有 SDK/外网的环境中测试和压测搜索链路。
+
+用法（在 src 目录下执行）：
+    python -m tools.web_search_server --port 18080 --latency 0.5
+    WEB_SEARCH_BACKEND=http WEB_SEARCH_ENDPOINT=http://127.0.0.1:18080/search python main.py ...
+"""
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+def fake_results(query: str, count: int) -> List[dict]:
+    """根据查询词生成确定性的模拟结果（相同查询返回相同 URL）"""
+    digest = hashlib.md5(query.encode('utf-8')).hexdigest()
+    return [
+        {
+            'title': f"{query} - 参考资料 {i + 1}",
+            'url': f"https://example.com/{digest[:8]}/{i}",
+            'site_name': 'example.com',
+            'content': f"关于“{query}”的模拟搜索摘要（第 {i + 1} 条）。",
+        }
+        for i in range(count)
+    ]
+
+
+def make_handler(latency: float):
+    class SearchHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            if parts.path != '/search':
+                self.send_error(404)
+                return
+            params = parse_qs(parts.query)
+            query = params.get('q', [''])[0]
+            count = int(params.get('count', ['5'])[0])
+            if latency > 0:
+                time.sleep(latency)
+
+            body = json.dumps({'results': fake_results(query, count)}, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SearchHandler
+
+
+def start_server(host: str = '127.0.0.1', port: int = 18080, latency: float = 0.0) -> ThreadingHTTPServer:
+    """在后台线程启动替身服务，返回 server 对象（调用 shutdown() 停止）"""
+    server = ThreadingHTTPServer((host, port), make_handler(latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="联网搜索本地替身服务")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.0, help="每次请求的模拟延迟（秒）")
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.latency))
+    print(f"[web_search_server] http://{args.host}:{args.port}/search", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,463 @@
+"""
+互联网搜索工具
+- 搜索后端可插拔：默认使用 coze SDK 的 SearchClient，也可切换为本地替身服务（HTTP），便于测试与压测
+- 结果缓存：按规范化查询词缓存，内存层（LRU）+ 磁盘层，均带 TTL；磁盘层按条目数 / 字节数上限定期清理
+- 需求拆分：将整段需求文本拆分为多条聚焦的查询，有界并发执行，合并结果并按 URL 去重
+
+后端选择（环境变量）：
+    WEB_SEARCH_BACKEND=coze|http
+    WEB_SEARCH_ENDPOINT=http://127.0.0.1:18080/search   （http 后端地址）
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlencode, urlsplit, urlunsplit
+from urllib.request import urlopen
+
+from tools.kb_retrieval import split_requirements
+
+WEB_SEARCH_BACKEND = os.getenv("WEB_SEARCH_BACKEND", "coze")
+WEB_SEARCH_ENDPOINT = os.getenv("WEB_SEARCH_ENDPOINT", "http://127.0.0.1:18080/search")
+# 缓存有效期（秒），0 表示不缓存
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", "86400"))
+# 内存层最大条目数
+WEB_SEARCH_CACHE_SIZE = int(os.getenv("WEB_SEARCH_CACHE_SIZE", "1024"))
+# 磁盘层目录，设为空字符串时只使用内存层
+WEB_SEARCH_CACHE_DIR = os.getenv("WEB_SEARCH_CACHE_DIR", os.path.join(tempfile.gettempdir(), "web_search_cache"))
+# 磁盘层条目数上限与总字节数上限，超出时按最近写入时间淘汰最旧的条目
+WEB_SEARCH_CACHE_DISK_MAX_ENTRIES = int(os.getenv("WEB_SEARCH_CACHE_DISK_MAX_ENTRIES", "10000"))
+WEB_SEARCH_CACHE_DISK_MAX_BYTES = int(os.getenv("WEB_SEARCH_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+# 磁盘层清理间隔（秒）：写入缓存时距上次清理超过该间隔则在后台清理过期与超限的条目
+WEB_SEARCH_CACHE_SWEEP_INTERVAL = float(os.getenv("WEB_SEARCH_CACHE_SWEEP_INTERVAL", "600"))
+# 单次需求检索的最大并发查询数
+WEB_SEARCH_CONCURRENCY = int(os.getenv("WEB_SEARCH_CONCURRENCY", "4"))
+# 单次需求检索拆分出的最大查询数
+WEB_SEARCH_MAX_QUERIES = int(os.getenv("WEB_SEARCH_MAX_QUERIES", "6"))
+# 单条查询的最大长度（字符数），过长的需求条目会被截断
+WEB_SEARCH_QUERY_MAX_LEN = int(os.getenv("WEB_SEARCH_QUERY_MAX_LEN", "64"))
+# 单次需求检索合并后最多返回的结果数
+WEB_SEARCH_MAX_RESULTS = int(os.getenv("WEB_SEARCH_MAX_RESULTS", "5"))
+
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询词：全角转半角、小写、合并空白、去除首尾标点"""
+    text = unicodedata.normalize('NFKC', query or '').lower()
+    return _SPACE_RE.sub(' ', text).strip(' ,.;:!?，。；：！？、')
+
+
+def normalize_url(url: str) -> str:
+    """规范化 URL 用于去重：忽略协议、大小写主机名、片段和末尾斜杠"""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url.strip()
+    path = parts.path.rstrip('/')
+    return urlunsplit(('', parts.netloc.lower(), path, parts.query, ''))
+
+
+class SearchBackend:
+    """搜索后端接口：返回统一格式的结果列表（content/url/title/site_name）"""
+
+    name = "base"
+
+    def search(self, query: str, count: int = 5) -> List[Dict]:
+        raise NotImplementedError
+
+
+class CozeSearchBackend(SearchBackend):
+    """coze SDK 联网搜索"""
+
+    name = "coze"
+
+    def __init__(self, ctx=None):
+        self.ctx = ctx
+
+    def search(self, query: str, count: int = 5) -> List[Dict]:
+        from coze_coding_dev_sdk import SearchClient
+
+        client = SearchClient(ctx=self.ctx)
+        response = client.web_search(query=query, count=count, need_summary=True)
+
+        results = []
+        for item in response.web_items or []:
+            results.append({
+                'content': item.summary or item.snippet,
+                'url': item.url,
+                'title': item.title,
+                'site_name': item.site_name,
+            })
+        return results
+
+
+class HttpSearchBackend(SearchBackend):
+    """
+    HTTP 搜索后端：GET {endpoint}?q=<查询词>&count=<数量>，返回 {"results": [...]}
+
+    用于对接本地替身服务（见 tools.web_search_server）或其他自建搜索服务。
+    """
+
+    name = "http"
+
+    def __init__(self, endpoint: Optional[str] = None, timeout: float = 10.0):
+        self.endpoint = endpoint or WEB_SEARCH_ENDPOINT
+        self.timeout = timeout
+
+    def search(self, query: str, count: int = 5) -> List[Dict]:
+        url = f"{self.endpoint}?{urlencode({'q': query, 'count': count})}"
+        with urlopen(url, timeout=self.timeout) as resp:
+            data = json.loads(resp.read().decode('utf-8'))
+        return [
+            {
+                'content': item.get('content') or item.get('snippet', ''),
+                'url': item.get('url', ''),
+                'title': item.get('title', ''),
+                'site_name': item.get('site_name', ''),
+            }
+            for item in data.get('results', [])
+        ]
+
+
+# 后端注册表：名称 -> 工厂函数(ctx) -> SearchBackend
+_BACKENDS: Dict[str, Callable[[Any], SearchBackend]] = {
+    'coze': lambda ctx: CozeSearchBackend(ctx),
+    'http': lambda ctx: HttpSearchBackend(),
+}
+
+
+def register_search_backend(name: str, factory: Callable[[Any], SearchBackend]):
+    """注册自定义搜索后端，之后可通过 WEB_SEARCH_BACKEND=<name> 或 get_search_backend(name=...) 使用"""
+    _BACKENDS[name] = factory
+
+
+def get_search_backend(ctx=None, name: Optional[str] = None) -> SearchBackend:
+    """
+    按名称创建搜索后端
+
+    Args:
+        ctx: 运行上下文（coze 后端需要）
+        name: 后端名称，为None时使用 WEB_SEARCH_BACKEND
+    """
+    name = name or WEB_SEARCH_BACKEND
+    factory = _BACKENDS.get(name)
+    if factory is None:
+        raise ValueError(f"未知的搜索后端: {name}，可选: {', '.join(sorted(_BACKENDS))}")
+    return factory(ctx)
+
+
+class WebSearchCache:
+    """
+    两级搜索结果缓存
+
+    - 内存层：进程内 LRU，命中时无 IO
+    - 磁盘层：每个查询一个 JSON 文件，进程重启或多进程之间共享；原子写入。
+      写入时按 WEB_SEARCH_CACHE_SWEEP_INTERVAL 在后台清理过期条目，并按条目数 / 字节数上限淘汰最旧的条目
+    """
+
+    def __init__(
+        self,
+        ttl: float = WEB_SEARCH_CACHE_TTL,
+        max_entries: int = WEB_SEARCH_CACHE_SIZE,
+        cache_dir: Optional[str] = WEB_SEARCH_CACHE_DIR,
+        disk_max_entries: int = WEB_SEARCH_CACHE_DISK_MAX_ENTRIES,
+        disk_max_bytes: int = WEB_SEARCH_CACHE_DISK_MAX_BYTES,
+        sweep_interval: float = WEB_SEARCH_CACHE_SWEEP_INTERVAL
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir or None
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.sweep_interval = sweep_interval
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = time.time()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(backend: str, query: str, count: int) -> str:
+        """缓存键：后端名 + 规范化查询词 + 数量"""
+        raw = f"{backend}\n{normalize_query(query)}\n{count}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        """读取缓存，过期或不存在时返回 None"""
+        if self.ttl <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+        results = self._read_disk(key, now)
+        with self._lock:
+            if results is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        return results
+
+    def _read_disk(self, key: str, now: float) -> Optional[List[Dict]]:
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('expires_at', 0) <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        self._put_memory(key, data['expires_at'], data['results'])
+        return data['results']
+
+    def _put_memory(self, key: str, expires_at: float, results: List[Dict]):
+        with self._lock:
+            self._memory[key] = (expires_at, results)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def set(self, key: str, results: List[Dict]):
+        """写入缓存（内存层 + 磁盘层）"""
+        if self.ttl <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        self._put_memory(key, expires_at, results)
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': expires_at, 'results': results}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"写入搜索缓存失败: {e}")
+            return
+        if time.time() - self._last_sweep >= self.sweep_interval and self._sweep_lock.acquire(blocking=False):
+            self._last_sweep = time.time()
+            threading.Thread(target=self._sweep_in_background, name="web-search-cache-sweep", daemon=True).start()
+
+    def _sweep_in_background(self):
+        try:
+            self.sweep()
+        except Exception as e:
+            print(f"清理搜索缓存失败: {e}")
+        finally:
+            self._sweep_lock.release()
+
+    def sweep(self) -> int:
+        """
+        清理磁盘层：删除过期条目与残留的临时文件，超过条目数或字节数上限时按写入时间淘汰最旧的条目
+
+        过期时间按文件修改时间 + TTL 判断（条目写入时的 expires_at 即修改时间 + TTL），无需逐个解析文件。
+
+        Returns:
+            删除的文件数
+        """
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return 0
+        now = time.time()
+        entries = []
+        removed = 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                is_tmp = filename.endswith('.tmp')
+                if st.st_mtime + (max(self.ttl, 3600) if is_tmp else self.ttl) <= now:
+                    removed += self._remove(path)
+                elif not is_tmp:
+                    entries.append((st.st_mtime, st.st_size, path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        count = len(entries)
+        for _, size, path in entries:
+            if count <= self.disk_max_entries and total_bytes <= self.disk_max_bytes:
+                break
+            removed += self._remove(path)
+            count -= 1
+            total_bytes -= size
+        return removed
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    def stats(self) -> Dict[str, int]:
+        """缓存命中统计"""
+        with self._lock:
+            return {
+                'memory_hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+            }
+
+
+_default_cache: Optional[WebSearchCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_web_search_cache() -> WebSearchCache:
+    """获取进程内共享的搜索缓存"""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = WebSearchCache()
+    return _default_cache
+
+
+class WebSearchTool:
+    """带缓存与并发拆分查询的联网搜索"""
+
+    def __init__(
+        self,
+        backend: Optional[SearchBackend] = None,
+        ctx=None,
+        cache: Optional[WebSearchCache] = None,
+        concurrency: int = WEB_SEARCH_CONCURRENCY
+    ):
+        """
+        Args:
+            backend: 搜索后端，为None时按 WEB_SEARCH_BACKEND 创建
+            ctx: 运行上下文（创建 coze 后端时使用）；WEB_SEARCH_BACKEND 未知时不进行联网搜索
+            cache: 结果缓存，为None时使用进程内共享缓存
+            concurrency: 单次需求检索的最大并发查询数
+        """
+        if backend is None:
+            try:
+                backend = get_search_backend(ctx)
+            except ValueError as e:
+                # 配置错误不应导致节点失败：退化为没有联网搜索结果
+                print(f"{e}，本次不使用联网搜索结果")
+        self.backend = backend
+        self.cache = cache or get_web_search_cache()
+        self.concurrency = max(1, concurrency)
+
+    def search(self, query: str, count: int = 5) -> List[Dict]:
+        """
+        单条查询（先查缓存，未命中时调用后端并写入缓存）
+
+        Returns:
+            结果列表（未配置可用后端时为空列表）；后端调用失败时抛出异常，失败结果不会被缓存
+        """
+        if self.backend is None:
+            return []
+        key = self.cache.make_key(self.backend.name, query, count)
+        results = self.cache.get(key)
+        if results is not None:
+            return results
+        results = self.backend.search(query, count)
+        self.cache.set(key, results)
+        return results
+
+    def build_queries(
+        self,
+        requirements: str,
+        default_query: str,
+        max_queries: int = WEB_SEARCH_MAX_QUERIES
+    ) -> List[str]:
+        """
+        将需求文本拆分为聚焦的搜索查询
+
+        Args:
+            requirements: 需求文本
+            default_query: 需求为空时使用的默认查询
+            max_queries: 查询数量上限，超出时相邻条目合并
+        """
+        items = split_requirements(requirements, max_items=max_queries) if requirements else []
+        queries = []
+        seen = set()
+        for item in items or [default_query]:
+            query = item[:WEB_SEARCH_QUERY_MAX_LEN]
+            normalized = normalize_query(query)
+            if normalized and normalized not in seen:
+                seen.add(normalized)
+                queries.append(query)
+        return queries
+
+    def search_requirements(
+        self,
+        requirements: str,
+        default_query: str,
+        count: int = 5,
+        max_results: int = WEB_SEARCH_MAX_RESULTS,
+        max_queries: int = WEB_SEARCH_MAX_QUERIES
+    ) -> List[Dict]:
+        """
+        按需求条目拆分查询，有界并发搜索，合并结果并按 URL 去重
+
+        Args:
+            requirements: 需求文本
+            default_query: 需求为空时使用的默认查询
+            count: 每条查询返回的结果数
+            max_results: 合并后最多返回的结果数
+            max_queries: 拆分出的查询数量上限
+
+        Returns:
+            合并后的结果列表（轮流取各查询的结果，保证每条需求都有素材），每项带 query 字段
+        """
+        queries = self.build_queries(requirements, default_query, max_queries)
+
+        def run(query: str) -> List[Dict]:
+            try:
+                return self.search(query, count)
+            except Exception as e:
+                print(f"联网搜索失败 [{query}]: {e}")
+                return []
+
+        if len(queries) == 1:
+            per_query = [run(queries[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(queries))) as pool:
+                per_query = list(pool.map(run, queries))
+
+        merged = []
+        seen_urls = set()
+        for rank in range(max((len(r) for r in per_query), default=0)):
+            for query, results in zip(queries, per_query):
+                if rank >= len(results):
+                    continue
+                item = results[rank]
+                url_key = normalize_url(item.get('url') or '') or item.get('title', '')
+                if url_key in seen_urls:
+                    continue
+                seen_urls.add(url_key)
+                merged.append({**item, 'query': query, 'source_type': 'web_search'})
+        return merged[:max_results]
@@ -11,6 +11,7 @@ from typing import Optional, Dict, Any, List
 from .codes import ErrorCategory, get_error_description
 from .exceptions import VibeCodingError, classify_error
 from ..log.err_trace import extract_core_stack
+from ..metrics import ERRORS_TOTAL
 
 logger = logging.getLogger(__name__)
 
@@ -177,6 +178,7 @@ class ErrorClassifier:
         ctx = context or {}
 
         self._stats.total_count += 1
+        ERRORS_TOTAL.inc(code=str(error.code), category=error.category.name)
         self._stats.by_category[error.category.name] += 1
         self._stats.by_code[error.code] += 1
 
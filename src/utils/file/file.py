@@ -2,12 +2,15 @@ import os
 import json
 import requests
 import uuid
+import time
 import chardet
 from io import BytesIO
 from typing import Literal,Callable, Any, Optional,Union
 from pydantic import BaseModel, Field, field_validator,PrivateAttr
 from urllib.parse import urlparse
 from pptx import Presentation
+from utils.metrics import FILE_PARSE_DURATION
+from utils.log.timeline import trace_span
 
 MAX_FILE_SIZE = 10 * 1024 * 1024
 
@@ -105,8 +108,16 @@ class FileOps:
     @staticmethod
     def _get_bytes_stream(file_obj:File) -> tuple[bytes, str]:
         """
-        获取文件内容和后缀, 5MB大小限制检查, 超出抛异常
+        获取文件内容和后缀, 5MB大小限制检查, 超出抛异常（记录下载/读取阶段的时间线区间）
         """
+        with trace_span("file.fetch" if file_obj.is_remote else "file.read", "file") as span:
+            content, ext = FileOps._read_bytes_stream(file_obj)
+            if span is not None:
+                span.args.update(ext=ext, bytes=len(content))
+            return content, ext
+
+    @staticmethod
+    def _read_bytes_stream(file_obj:File) -> tuple[bytes, str]:
         _, ext = infer_file_category(file_obj.url)
 
         if file_obj.is_remote:
@@ -200,16 +211,20 @@ class FileOps:
         """
         try:
             content, ext = FileOps._get_bytes_stream(file_obj)
-
-            if ext in ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx']:
-                return FileOps._parse_document_bytes(file_obj, content, ext)
-
-            # 默认直接读
-            charset = chardet.detect(content)
-            if 'encoding' in charset:
-                return content.decode(charset['encoding'])
-            else:
-                return content.decode('utf-8')
+            start = time.time()
+            try:
+                with trace_span("file.parse", "file", ext=ext or "unknown", structured=False):
+                    if ext in ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx']:
+                        return FileOps._parse_document_bytes(file_obj, content, ext)
+
+                    # 默认直接读
+                    charset = chardet.detect(content)
+                    if 'encoding' in charset:
+                        return content.decode(charset['encoding'])
+                    else:
+                        return content.decode('utf-8')
+            finally:
+                FILE_PARSE_DURATION.observe(time.time() - start, file_type=ext or "unknown", structured="false")
 
         except Exception as e:
             return f"[FileOps Error] Failed to read content: {str(e)}"
@@ -223,10 +238,15 @@ class FileOps:
         try:
             content, ext = FileOps._get_bytes_stream(file_obj)
 
-            if ext in ['.docx']:
-                return FileOps._parse_docx_with_structure(content)
-            elif ext in ['.pdf']:
-                return FileOps._parse_pdf_with_structure(content)
+            if ext in ['.docx', '.pdf']:
+                start = time.time()
+                try:
+                    with trace_span("file.parse", "file", ext=ext, structured=True):
+                        if ext == '.docx':
+                            return FileOps._parse_docx_with_structure(content)
+                        return FileOps._parse_pdf_with_structure(content)
+                finally:
+                    FILE_PARSE_DURATION.observe(time.time() - start, file_type=ext, structured="true")
             else:
                 # 其他格式返回纯文本，结构为空
                 text = FileOps.extract_text(file_obj)
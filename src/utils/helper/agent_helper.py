@@ -1,7 +1,7 @@
 import uuid
 import json
 import os
-from typing import Any, Dict, List, Tuple, Iterator
+from typing import Any, AsyncIterator, Dict, List, Tuple, Iterator
 import time
 from utils.file.file import File, FileOps, infer_file_category
 from utils.error import classify_error
@@ -278,31 +278,42 @@ def _item_to_server_messages(
     return messages
 
 
-def _iter_body_to_server_messages(
-        items: Iterator[Dict[Any, Dict[str, Any]]],
-        *,
-        session_id: str,
-        query_msg_id: str,
-        reply_id: str,
-        sequence_id_start: int = 1,
-        log_id: str = "",
-) -> Iterator[ServerMessage]:
-    seq = sequence_id_start
-    # Stable msg_id mapping per logical message stream
-    # Keys are derived from meta to keep same msg_id across chunks
-    stable_ids: Dict[Tuple[str, Any], str] = {}
-
-    accumulated_tool_chunks: List[Any] = []
-    accumulated_tool_response_content: Dict[str, str] = {}
-
-    def _flush_tool_chunks(seq_num: int) -> Tuple[List[ServerMessage], int]:
-        nonlocal accumulated_tool_chunks
+class _BodyConverter:
+    """
+    将 LangGraph messages 流的单个元素转换为 ServerMessage 列表
+
+    跨元素的状态（序号、工具调用分片、稳定 msg_id）保存在实例上，
+    同步与异步流共用同一套转换逻辑。
+    """
+
+    def __init__(
+            self,
+            *,
+            session_id: str,
+            query_msg_id: str,
+            reply_id: str,
+            sequence_id_start: int = 1,
+            log_id: str = "",
+    ):
+        self.session_id = session_id
+        self.query_msg_id = query_msg_id
+        self.reply_id = reply_id
+        self.log_id = log_id
+        self.seq = sequence_id_start
+        # Stable msg_id mapping per logical message stream
+        # Keys are derived from meta to keep same msg_id across chunks
+        self.stable_ids: Dict[Tuple[str, Any], str] = {}
+
+        self.accumulated_tool_chunks: List[Any] = []
+        self.accumulated_tool_response_content: Dict[str, str] = {}
+
+    def _flush_tool_chunks(self, seq_num: int) -> Tuple[List[ServerMessage], int]:
         msgs: List[ServerMessage] = []
-        if not accumulated_tool_chunks:
+        if not self.accumulated_tool_chunks:
             return msgs, seq_num
 
-        merged_tcs = _merge_tool_call_chunks(accumulated_tool_chunks)
-        accumulated_tool_chunks = []
+        merged_tcs = _merge_tool_call_chunks(self.accumulated_tool_chunks)
+        self.accumulated_tool_chunks = []
         for tc in merged_tcs:
             raw_args = tc.get("args", {})
             if isinstance(raw_args, str):
@@ -327,20 +338,24 @@ def _iter_body_to_server_messages(
             msgs.append(
                 ServerMessage(
                     type=MESSAGE_TYPE_TOOL_REQUEST,
-                    session_id=session_id,
-                    query_msg_id=query_msg_id,
-                    reply_id=reply_id,
+                    session_id=self.session_id,
+                    query_msg_id=self.query_msg_id,
+                    reply_id=self.reply_id,
                     msg_id=str(uuid.uuid4()),
                     sequence_id=seq_num,
                     finish=True,
                     content=content,
-                    log_id=log_id,
+                    log_id=self.log_id,
                 )
             )
             seq_num += 1
         return msgs, seq_num
 
-    for item in items:
+
+    def feed(self, item: Any) -> List[ServerMessage]:
+        """处理流中的一个 (chunk, meta) 元素，返回需要输出的消息"""
+        seq = self.seq
+        emitted: List[ServerMessage] = []
         chunk, meta = item
         chunk_type = chunk.__class__.__name__
         is_last = (meta or {}).get("chunk_position") == "last"
@@ -361,24 +376,24 @@ def _iter_body_to_server_messages(
         # because usually tool calls and text content are either separate or tool calls come first.
         # But let's be safe: only flush on ToolMessage or if is_last=True on AIMessageChunk.
 
-        if chunk_type == "ToolMessage" and accumulated_tool_chunks:
-            f_msgs, seq = _flush_tool_chunks(seq)
+        if chunk_type == "ToolMessage" and self.accumulated_tool_chunks:
+            f_msgs, seq = self._flush_tool_chunks(seq)
             flushed_msgs.extend(f_msgs)
 
         # 1. Handle AIMessageChunk with tool_call_chunks (Streaming Tool Request)
         if chunk_type == "AIMessageChunk":
             tc_chunks = getattr(chunk, "tool_call_chunks", None)
             if tc_chunks:
-                accumulated_tool_chunks.extend(tc_chunks)
+                self.accumulated_tool_chunks.extend(tc_chunks)
             # If we have accumulated chunks but this chunk has NO tool_call_chunks,
             # it implies the tool definition phase is likely over.
-            elif accumulated_tool_chunks:
-                f_msgs, seq = _flush_tool_chunks(seq)
+            elif self.accumulated_tool_chunks:
+                f_msgs, seq = self._flush_tool_chunks(seq)
                 flushed_msgs.extend(f_msgs)
 
             # Flush if this is the last chunk
-            if is_last and accumulated_tool_chunks:
-                f_msgs, seq = _flush_tool_chunks(seq)
+            if is_last and self.accumulated_tool_chunks:
+                f_msgs, seq = self._flush_tool_chunks(seq)
                 flushed_msgs.extend(f_msgs)
 
         # 2. Handle ToolMessage (Tool Response)
@@ -393,12 +408,12 @@ def _iter_body_to_server_messages(
                 full_result = result
                 should_emit = True
             else:
-                if tcid not in accumulated_tool_response_content:
-                    accumulated_tool_response_content[tcid] = ""
-                accumulated_tool_response_content[tcid] += str(result)
+                if tcid not in self.accumulated_tool_response_content:
+                    self.accumulated_tool_response_content[tcid] = ""
+                self.accumulated_tool_response_content[tcid] += str(result)
 
                 if is_last:
-                    full_result = accumulated_tool_response_content.pop(tcid)
+                    full_result = self.accumulated_tool_response_content.pop(tcid)
                     should_emit = True
 
             if should_emit:
@@ -412,14 +427,14 @@ def _iter_body_to_server_messages(
                 msgs_to_yield.append(
                     ServerMessage(
                         type=MESSAGE_TYPE_TOOL_RESPONSE,
-                        session_id=session_id,
-                        query_msg_id=query_msg_id,
-                        reply_id=reply_id,
+                        session_id=self.session_id,
+                        query_msg_id=self.query_msg_id,
+                        reply_id=self.reply_id,
                         msg_id=str(uuid.uuid4()),
                         sequence_id=seq,
                         finish=True,
                         content=content,
-                        log_id=log_id,
+                        log_id=self.log_id,
                     )
                 )
                 seq += 1
@@ -428,11 +443,11 @@ def _iter_body_to_server_messages(
         if chunk_type != "ToolMessage":
             inner_msgs = _item_to_server_messages(
                 item,
-                session_id=session_id,
-                query_msg_id=query_msg_id,
-                reply_id=reply_id,
+                session_id=self.session_id,
+                query_msg_id=self.query_msg_id,
+                reply_id=self.reply_id,
                 sequence_id_start=seq,
-                log_id=log_id,
+                log_id=self.log_id,
             )
             # Combine: flushed (previous) + inner (current)
             final_msgs = flushed_msgs + inner_msgs
@@ -481,103 +496,173 @@ def _iter_body_to_server_messages(
             else:
                 key = (m.type, group_base)
 
-            if key not in stable_ids:
-                stable_ids[key] = str(uuid.uuid4())
-            m.msg_id = stable_ids[key]
+            if key not in self.stable_ids:
+                self.stable_ids[key] = str(uuid.uuid4())
+            m.msg_id = self.stable_ids[key]
 
-            yield m
+            emitted.append(m)
 
+        self.seq = seq
+        return emitted
 
-def iter_server_messages(
+
+def _iter_body_to_server_messages(
         items: Iterator[Dict[Any, Dict[str, Any]]],
         *,
         session_id: str,
         query_msg_id: str,
-        local_msg_id: str,
-        run_id: str,
+        reply_id: str,
         sequence_id_start: int = 1,
-        log_id: str,
+        log_id: str = "",
 ) -> Iterator[ServerMessage]:
-    t0 = time.time()
-    reply_id = str(uuid.uuid4())
-    start_msg_id = str(uuid.uuid4())
-    # message_start
-    start_sm = ServerMessage(
-        type=MESSAGE_TYPE_MESSAGE_START,
+    converter = _BodyConverter(
         session_id=session_id,
         query_msg_id=query_msg_id,
         reply_id=reply_id,
-        msg_id=start_msg_id,
-        sequence_id=sequence_id_start,
-        finish=True,
-        content=ServerMessageContent(
-            message_start=MessageStartDetail(
-                local_msg_id=local_msg_id, msg_id=query_msg_id, execute_id=run_id
-            )
-        ),
+        sequence_id_start=sequence_id_start,
         log_id=log_id,
     )
-    yield start_sm
-    next_seq = sequence_id_start + 1
-    last_seq = sequence_id_start
-    try:
-        # body stream
-        for sm in _iter_body_to_server_messages(
-                items,
-                session_id=session_id,
-                query_msg_id=query_msg_id,
-                reply_id=reply_id,
-                sequence_id_start=next_seq,
-                log_id=log_id,
-        ):
-            yield sm
-            last_seq = sm.sequence_id
-
-        # message_end
-        t_ms = int((time.time() - t0) * 1000)
-        end_sm = ServerMessage(
-            type=MESSAGE_TYPE_MESSAGE_END,
+    for item in items:
+        yield from converter.feed(item)
+
+
+class _ServerMessageStream:
+    """一次流式回复的 message_start / 正文 / message_end 消息构造"""
+
+    def __init__(
+            self,
+            *,
+            session_id: str,
+            query_msg_id: str,
+            local_msg_id: str,
+            run_id: str,
+            sequence_id_start: int = 1,
+            log_id: str,
+    ):
+        self.t0 = time.time()
+        self.session_id = session_id
+        self.query_msg_id = query_msg_id
+        self.local_msg_id = local_msg_id
+        self.run_id = run_id
+        self.sequence_id_start = sequence_id_start
+        self.log_id = log_id
+        self.reply_id = str(uuid.uuid4())
+        self.last_seq = sequence_id_start
+        self.body = _BodyConverter(
             session_id=session_id,
             query_msg_id=query_msg_id,
-            reply_id=reply_id,
+            reply_id=self.reply_id,
+            sequence_id_start=sequence_id_start + 1,
+            log_id=log_id,
+        )
+
+    def start(self) -> ServerMessage:
+        # message_start
+        return ServerMessage(
+            type=MESSAGE_TYPE_MESSAGE_START,
+            session_id=self.session_id,
+            query_msg_id=self.query_msg_id,
+            reply_id=self.reply_id,
             msg_id=str(uuid.uuid4()),
-            sequence_id=last_seq + 1,
+            sequence_id=self.sequence_id_start,
             finish=True,
             content=ServerMessageContent(
-                message_end=MessageEndDetail(
-                    code=MESSAGE_END_CODE_SUCCESS,
-                    message="",
-                    token_cost=TokenCost(input_tokens=0, output_tokens=0, total_tokens=0),
-                    time_cost_ms=t_ms,
+                message_start=MessageStartDetail(
+                    local_msg_id=self.local_msg_id, msg_id=self.query_msg_id, execute_id=self.run_id
                 )
             ),
-            log_id=log_id,
+            log_id=self.log_id,
         )
-        yield end_sm
-    except Exception as ex:
-        # 使用错误分类器获取错误码
-        err = classify_error(ex, {"node_name": "stream"})
+
+    def feed(self, item: Any) -> List[ServerMessage]:
+        # body stream
+        msgs = self.body.feed(item)
+        if msgs:
+            self.last_seq = msgs[-1].sequence_id
+        return msgs
+
+    def end(self, code: str = MESSAGE_END_CODE_SUCCESS, message: str = "") -> ServerMessage:
         # message_end
-        t_ms = int((time.time() - t0) * 1000)
-        end_sm = ServerMessage(
+        t_ms = int((time.time() - self.t0) * 1000)
+        return ServerMessage(
             type=MESSAGE_TYPE_MESSAGE_END,
-            session_id=session_id,
-            query_msg_id=query_msg_id,
-            reply_id=reply_id,
+            session_id=self.session_id,
+            query_msg_id=self.query_msg_id,
+            reply_id=self.reply_id,
             msg_id=str(uuid.uuid4()),
-            sequence_id=last_seq + 1,
+            sequence_id=self.last_seq + 1,
             finish=True,
             content=ServerMessageContent(
                 message_end=MessageEndDetail(
-                    code=str(err.code),
-                    message=err.message,
-                    time_cost_ms=t_ms,
+                    code=code,
+                    message=message,
                     token_cost=TokenCost(input_tokens=0, output_tokens=0, total_tokens=0),
+                    time_cost_ms=t_ms,
                 )
             ),
-            log_id=log_id,
+            log_id=self.log_id,
         )
-        yield end_sm
+
+    def fail(self, ex: Exception) -> ServerMessage:
+        # 使用错误分类器获取错误码
+        err = classify_error(ex, {"node_name": "stream"})
+        return self.end(code=str(err.code), message=err.message)
+
+
+def iter_server_messages(
+        items: Iterator[Dict[Any, Dict[str, Any]]],
+        *,
+        session_id: str,
+        query_msg_id: str,
+        local_msg_id: str,
+        run_id: str,
+        sequence_id_start: int = 1,
+        log_id: str,
+) -> Iterator[ServerMessage]:
+    stream = _ServerMessageStream(
+        session_id=session_id,
+        query_msg_id=query_msg_id,
+        local_msg_id=local_msg_id,
+        run_id=run_id,
+        sequence_id_start=sequence_id_start,
+        log_id=log_id,
+    )
+    yield stream.start()
+    try:
+        for item in items:
+            yield from stream.feed(item)
+        yield stream.end()
+    except Exception as ex:
+        yield stream.fail(ex)
+
+
+async def aiter_server_messages(
+        items: AsyncIterator[Any],
+        *,
+        session_id: str,
+        query_msg_id: str,
+        local_msg_id: str,
+        run_id: str,
+        sequence_id_start: int = 1,
+        log_id: str,
+) -> AsyncIterator[ServerMessage]:
+    """iter_server_messages 的异步版本，直接消费 graph.astream 的输出"""
+    stream = _ServerMessageStream(
+        session_id=session_id,
+        query_msg_id=query_msg_id,
+        local_msg_id=local_msg_id,
+        run_id=run_id,
+        sequence_id_start=sequence_id_start,
+        log_id=log_id,
+    )
+    yield stream.start()
+    try:
+        async for item in items:
+            for sm in stream.feed(item):
+                yield sm
+        yield stream.end()
+    except Exception as ex:
+        yield stream.fail(ex)
 
 
 def agent_iter_server_messages(
@@ -598,3 +683,23 @@ def agent_iter_server_messages(
         sequence_id_start=1,
         log_id=log_id,
     )
+
+
+def agent_aiter_server_messages(
+        items: AsyncIterator[Any],
+        *,
+        session_id: str,
+        query_msg_id: str,
+        local_msg_id: str,
+        run_id: str,
+        log_id: str,
+) -> AsyncIterator[ServerMessage]:
+    return aiter_server_messages(
+        items,
+        session_id=session_id,
+        query_msg_id=query_msg_id,
+        local_msg_id=local_msg_id,
+        run_id=run_id,
+        sequence_id_start=1,
+        log_id=log_id,
+    )
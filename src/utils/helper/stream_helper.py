@@ -0,0 +1,181 @@
+"""
+异步流式执行辅助
+- 同步节点线程池：graph.astream 在事件循环上执行，仍是同步函数的节点由 LangGraph
+  交给事件循环的默认线程池运行；这里把默认线程池换成固定大小的池，避免并发流数量决定线程数。
+  池大小按"同时执行的图运行数 × 图的最大扇出 + I/O 预留"计算，asyncio.to_thread 也使用该池；
+  排队与执行中的任务数导出到 /metrics。有时限要求的控制面 I/O（作业心跳、运行登记表）使用各自的专用线程池
+- 有界缓冲：在流的生产者（图执行）与消费者（HTTP 响应）之间放一个有界队列，
+  客户端读取慢时队列写满，图的执行在下一个输出点暂停（背压），内存占用有上限
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 流式输出缓冲队列长度
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "64"))
+# 同步节点线程池大小，0 表示按 sync_executor_size() 自动计算
+GRAPH_SYNC_WORKERS = int(os.getenv("GRAPH_SYNC_WORKERS", "0"))
+# 自动计算线程池大小时为 asyncio.to_thread 等短时 I/O 预留的线程数
+GRAPH_SYNC_IO_WORKERS = int(os.getenv("GRAPH_SYNC_IO_WORKERS", "8"))
+
+_END = object()
+
+
+class _PumpError:
+    """生产者异常的包装，随队列传递给消费者后重新抛出"""
+
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+class SyncExecutor(ThreadPoolExecutor):
+    """记录执行中任务数的线程池，排队任务数取自内部工作队列"""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = ""):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.max_workers = max_workers
+        self._active = 0
+        self._active_lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        def run():
+            with self._active_lock:
+                self._active += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._active_lock:
+                    self._active -= 1
+
+        return super().submit(run)
+
+    def stats(self) -> Dict[str, int]:
+        """线程数上限、执行中任务数、排队任务数"""
+        return {
+            "max_workers": self.max_workers,
+            "active": self._active,
+            "queued": self._work_queue.qsize(),
+        }
+
+
+def graph_max_fanout(graph: Any) -> int:
+    """
+    图中一个节点之后最多可并行执行的节点数（静态边数 + 条件边的可能目标数）
+
+    Args:
+        graph: 编译后的 StateGraph，无法解析结构时按 1 计算
+    """
+    builder = getattr(graph, "builder", None)
+    if builder is None:
+        return 1
+    fanout = Counter(start for start, _ in getattr(builder, "edges", ()))
+    for start, branches in getattr(builder, "branches", {}).items():
+        for spec in branches.values():
+            fanout[start] += len(spec.ends) if spec.ends else 1
+    return max(fanout.values(), default=1)
+
+
+def sync_executor_size(concurrency: int, fanout: int, io_workers: int = GRAPH_SYNC_IO_WORKERS) -> int:
+    """
+    同步节点线程池大小：设置了 GRAPH_SYNC_WORKERS 时直接使用，
+    否则为 同时执行的图运行数 × 图的最大扇出 + I/O 预留，保证并行分支不因线程不足而串行排队
+
+    Args:
+        concurrency: 进程内同时执行的图运行数上限（准入并发 + 作业并发）
+        fanout: 图的最大扇出（见 graph_max_fanout）
+        io_workers: 为 asyncio.to_thread 预留的线程数
+    """
+    if GRAPH_SYNC_WORKERS > 0:
+        return GRAPH_SYNC_WORKERS
+    return max(1, concurrency) * max(1, fanout) + max(0, io_workers)
+
+
+def install_sync_executor(
+    loop: Optional[asyncio.AbstractEventLoop] = None,
+    max_workers: Optional[int] = None
+) -> SyncExecutor:
+    """
+    将事件循环的默认线程池替换为固定大小的线程池
+
+    Args:
+        loop: 事件循环，为None时使用当前运行中的事件循环
+        max_workers: 线程数，为None时使用 GRAPH_SYNC_WORKERS（未设置时按 CPU 数估算）
+
+    Returns:
+        新的线程池
+    """
+    loop = loop or asyncio.get_running_loop()
+    if max_workers is None:
+        max_workers = GRAPH_SYNC_WORKERS or min(32, (os.cpu_count() or 1) * 4)
+    executor = SyncExecutor(max_workers=max_workers, thread_name_prefix="graph-sync")
+    loop.set_default_executor(executor)
+    logger.info(f"Installed sync node executor with {max_workers} workers")
+    return executor
+
+
+async def buffered_aiter(
+    source: AsyncIterator[T],
+    maxsize: int = STREAM_QUEUE_SIZE,
+    deadline: Optional[float] = None
+) -> AsyncIterator[T]:
+    """
+    通过有界队列转发异步迭代器的输出
+
+    生产者在独立的 Task 中运行（继承当前 contextvars），队列满时阻塞；
+    消费者退出或被取消时，生产者 Task 一并取消并关闭源迭代器。
+
+    Args:
+        source: 源异步迭代器
+        maxsize: 队列长度
+        deadline: 截止时间（time.time() 时间戳），超过后抛出 asyncio.TimeoutError
+
+    Yields:
+        源迭代器的元素
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, maxsize))
+
+    async def pump():
+        try:
+            async for item in source:
+                await queue.put(item)
+            await queue.put(_END)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as ex:
+            await queue.put(_PumpError(ex))
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    task = asyncio.create_task(pump())
+    try:
+        while True:
+            if deadline is None:
+                item = await queue.get()
+            else:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                item = await asyncio.wait_for(queue.get(), timeout=remaining)
+            if item is _END:
+                break
+            if isinstance(item, _PumpError):
+                raise item.exc
+            yield item
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
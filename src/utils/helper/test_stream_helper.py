@@ -0,0 +1,82 @@
+"""
+异步流式执行辅助测试：同步节点线程池大小与统计
+"""
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from langgraph.graph import END, START, StateGraph
+from typing_extensions import TypedDict
+
+from utils.helper import stream_helper
+from utils.helper.stream_helper import SyncExecutor, graph_max_fanout, install_sync_executor, sync_executor_size
+
+
+class _State(TypedDict, total=False):
+    value: int
+
+
+def _node(state: _State) -> _State:
+    return {}
+
+
+def _fanout_graph():
+    builder = StateGraph(_State)
+    for name in ("parse", "a", "b", "c", "merge"):
+        builder.add_node(name, _node)
+    builder.add_edge(START, "parse")
+    for name in ("a", "b", "c"):
+        builder.add_edge("parse", name)
+    builder.add_edge(["a", "b", "c"], "merge")
+    builder.add_edge("merge", END)
+    return builder.compile()
+
+
+def test_graph_max_fanout_counts_parallel_branches():
+    """静态并行边计入扇出"""
+    assert graph_max_fanout(_fanout_graph()) == 3
+    assert graph_max_fanout(object()) == 1
+
+
+def test_sync_executor_size(monkeypatch):
+    """按 并发数 × 扇出 + I/O 预留 计算，显式设置 GRAPH_SYNC_WORKERS 时优先"""
+    monkeypatch.setattr(stream_helper, "GRAPH_SYNC_WORKERS", 0)
+    assert sync_executor_size(8, 6, io_workers=8) == 56
+    monkeypatch.setattr(stream_helper, "GRAPH_SYNC_WORKERS", 12)
+    assert sync_executor_size(8, 6) == 12
+
+
+def test_executor_stats_active_and_queued():
+    """统计执行中与排队中的任务数"""
+    executor = SyncExecutor(max_workers=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    first = executor.submit(block)
+    assert started.wait(5)
+    second = executor.submit(lambda: None)
+    assert executor.stats() == {"max_workers": 1, "active": 1, "queued": 1}
+    release.set()
+    first.result(5)
+    second.result(5)
+    assert executor.stats()["active"] == 0
+    executor.shutdown()
+
+
+def test_install_sync_executor_used_by_to_thread():
+    """安装后 asyncio.to_thread 在该线程池中执行"""
+    async def run():
+        executor = install_sync_executor(max_workers=2)
+        name = await asyncio.to_thread(lambda: threading.current_thread().name)
+        executor.shutdown(wait=False)
+        return name
+
+    assert asyncio.run(run()).startswith("graph-sync")
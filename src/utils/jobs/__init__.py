@@ -0,0 +1,32 @@
+"""
+异步作业：持久化作业队列与 worker 池
+"""
+
+from .store import (
+    JobStore,
+    SQLiteJobStore,
+    PostgresJobStore,
+    get_job_store,
+    JOB_STATUS_QUEUED,
+    JOB_STATUS_RUNNING,
+    JOB_STATUS_SUCCEEDED,
+    JOB_STATUS_FAILED,
+    JOB_STATUS_CANCELLED,
+    JOB_FINAL_STATUSES,
+)
+from .worker import JobWorkerPool, JOB_WORKER_CONCURRENCY
+
+__all__ = [
+    "JobStore",
+    "SQLiteJobStore",
+    "PostgresJobStore",
+    "get_job_store",
+    "JobWorkerPool",
+    "JOB_WORKER_CONCURRENCY",
+    "JOB_STATUS_QUEUED",
+    "JOB_STATUS_RUNNING",
+    "JOB_STATUS_SUCCEEDED",
+    "JOB_STATUS_FAILED",
+    "JOB_STATUS_CANCELLED",
+    "JOB_FINAL_STATUSES",
+]
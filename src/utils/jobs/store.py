@@ -0,0 +1,319 @@
+"""
+作业持久化队列
+
+作业（job）记录保存在一张表中，默认使用本地 SQLite，配置 JOB_STORE_BACKEND=postgres 时
+复用 storage/database/db.py 的 SQLAlchemy 引擎。两种后端共用同一套 SQL（命名参数），
+领取作业时按租户当前运行中的作业数排序，实现租户间的公平调度。
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 作业存储后端：sqlite / postgres
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "sqlite")
+# SQLite 作业库路径
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(tempfile.gettempdir(), "graph_jobs.db"))
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_SUCCEEDED = "succeeded"
+JOB_STATUS_FAILED = "failed"
+JOB_STATUS_CANCELLED = "cancelled"
+
+JOB_FINAL_STATUSES = (JOB_STATUS_SUCCEEDED, JOB_STATUS_FAILED, JOB_STATUS_CANCELLED)
+
+# SQLite 与 PostgreSQL 均可执行的建表语句
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS graph_jobs (
+        job_id TEXT PRIMARY KEY,
+        tenant TEXT NOT NULL,
+        status TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        result TEXT,
+        error TEXT,
+        progress TEXT NOT NULL DEFAULT '[]',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        worker_id TEXT,
+        created_at DOUBLE PRECISION NOT NULL,
+        started_at DOUBLE PRECISION,
+        finished_at DOUBLE PRECISION,
+        heartbeat_at DOUBLE PRECISION,
+        thread_id TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_graph_jobs_status ON graph_jobs (status, tenant, created_at)",
+]
+
+# 已有作业库的增量变更（列已存在时报错并跳过）
+_MIGRATIONS = [
+    # checkpoint 线程：为空时即 job_id；从已有运行续跑时为该运行的 run_id / job_id
+    "ALTER TABLE graph_jobs ADD COLUMN thread_id TEXT",
+]
+
+# 公平领取：优先选择运行中作业最少的租户，同等条件下先进先出
+_SELECT_NEXT = """
+    SELECT j.job_id FROM graph_jobs j
+    WHERE j.status = :queued
+    ORDER BY (
+        SELECT COUNT(*) FROM graph_jobs r WHERE r.tenant = j.tenant AND r.status = :running
+    ), j.created_at
+    LIMIT 1
+"""
+
+
+class JobStore:
+    """作业存储，子类只需实现 _execute"""
+
+    def _execute(self, sql: str, params: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        执行一条 SQL
+
+        Returns:
+            (结果行列表, 影响行数)
+        """
+        raise NotImplementedError
+
+    def setup(self):
+        """创建表和索引"""
+        for statement in _SCHEMA:
+            self._execute(statement)
+        for statement in _MIGRATIONS:
+            try:
+                self._execute(statement)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _to_job(row: Dict[str, Any]) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"]) if job.get("payload") else {}
+        job["result"] = json.loads(job["result"]) if job.get("result") else None
+        job["progress"] = json.loads(job["progress"]) if job.get("progress") else []
+        job["cancel_requested"] = bool(job.get("cancel_requested"))
+        return job
+
+    def submit(self, payload: Dict[str, Any], tenant: str = "default", thread_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        提交作业，返回作业记录
+
+        Args:
+            thread_id: 续跑的 checkpoint 线程（已有运行的 run_id / job_id），为空时使用新作业自己的 job_id
+        """
+        job_id = str(uuid.uuid4())
+        self._execute(
+            "INSERT INTO graph_jobs (job_id, tenant, status, payload, created_at, thread_id) "
+            "VALUES (:job_id, :tenant, :status, :payload, :now, :thread_id)",
+            {
+                "job_id": job_id,
+                "tenant": tenant,
+                "status": JOB_STATUS_QUEUED,
+                "payload": json.dumps(payload, ensure_ascii=False),
+                "now": time.time(),
+                "thread_id": thread_id,
+            },
+        )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询作业，不存在时返回 None"""
+        rows, _ = self._execute("SELECT * FROM graph_jobs WHERE job_id = :job_id", {"job_id": job_id})
+        return self._to_job(rows[0]) if rows else None
+
+    def claim(self, worker_id: str, retries: int = 3) -> Optional[Dict[str, Any]]:
+        """
+        领取下一个排队中的作业
+
+        先按公平顺序选出候选，再用带状态条件的 UPDATE 抢占；与其他 worker 竞争失败时重试。
+
+        Returns:
+            领取到的作业，队列为空时返回 None
+        """
+        params = {"queued": JOB_STATUS_QUEUED, "running": JOB_STATUS_RUNNING}
+        for _ in range(retries):
+            rows, _ = self._execute(_SELECT_NEXT, params)
+            if not rows:
+                return None
+            job_id = rows[0]["job_id"]
+            now = time.time()
+            _, count = self._execute(
+                "UPDATE graph_jobs SET status = :running, worker_id = :worker_id, attempts = attempts + 1, "
+                "started_at = COALESCE(started_at, :now), heartbeat_at = :now "
+                "WHERE job_id = :job_id AND status = :queued",
+                {**params, "worker_id": worker_id, "now": now, "job_id": job_id},
+            )
+            if count == 1:
+                return self.get(job_id)
+        return None
+
+    def heartbeat(self, job_id: str, progress: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """
+        刷新心跳（可同时写入进度）
+
+        Returns:
+            作业是否被请求取消
+        """
+        now = time.time()
+        if progress is None:
+            self._execute(
+                "UPDATE graph_jobs SET heartbeat_at = :now WHERE job_id = :job_id",
+                {"now": now, "job_id": job_id},
+            )
+        else:
+            self._execute(
+                "UPDATE graph_jobs SET heartbeat_at = :now, progress = :progress WHERE job_id = :job_id",
+                {"now": now, "progress": json.dumps(progress, ensure_ascii=False), "job_id": job_id},
+            )
+        rows, _ = self._execute(
+            "SELECT cancel_requested FROM graph_jobs WHERE job_id = :job_id", {"job_id": job_id}
+        )
+        return bool(rows and rows[0]["cancel_requested"])
+
+    def finish(
+        self,
+        job_id: str,
+        status: str,
+        result: Any = None,
+        error: Optional[str] = None,
+        progress: Optional[List[Dict[str, Any]]] = None,
+    ):
+        """标记作业结束并写入结果或错误信息"""
+        self._execute(
+            "UPDATE graph_jobs SET status = :status, result = :result, error = :error, "
+            "progress = COALESCE(:progress, progress), finished_at = :now, heartbeat_at = :now "
+            "WHERE job_id = :job_id",
+            {
+                "status": status,
+                "result": json.dumps(result, ensure_ascii=False, default=_json_default) if result is not None else None,
+                "error": error,
+                "progress": json.dumps(progress, ensure_ascii=False) if progress is not None else None,
+                "now": time.time(),
+                "job_id": job_id,
+            },
+        )
+
+    def requeue(self, job_id: str):
+        """将运行中的作业放回队列（进程退出时调用，重新领取后从 checkpoint 续跑）"""
+        self._execute(
+            "UPDATE graph_jobs SET status = :queued, worker_id = NULL WHERE job_id = :job_id AND status = :running",
+            {"queued": JOB_STATUS_QUEUED, "running": JOB_STATUS_RUNNING, "job_id": job_id},
+        )
+
+    def request_cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        取消作业：排队中的直接取消，运行中的设置取消标志由执行者处理
+
+        Returns:
+            更新后的作业记录，不存在时返回 None
+        """
+        now = time.time()
+        self._execute(
+            "UPDATE graph_jobs SET status = :cancelled, finished_at = :now WHERE job_id = :job_id AND status = :queued",
+            {"cancelled": JOB_STATUS_CANCELLED, "queued": JOB_STATUS_QUEUED, "now": now, "job_id": job_id},
+        )
+        self._execute(
+            "UPDATE graph_jobs SET cancel_requested = 1 WHERE job_id = :job_id AND status = :running",
+            {"running": JOB_STATUS_RUNNING, "job_id": job_id},
+        )
+        return self.get(job_id)
+
+    def recover_stale(self, timeout: float) -> int:
+        """
+        回收心跳超时的运行中作业（执行进程已退出），放回队列
+
+        Returns:
+            回收数量
+        """
+        _, count = self._execute(
+            "UPDATE graph_jobs SET status = :queued, worker_id = NULL "
+            "WHERE status = :running AND heartbeat_at < :deadline",
+            {"queued": JOB_STATUS_QUEUED, "running": JOB_STATUS_RUNNING, "deadline": time.time() - timeout},
+        )
+        if count:
+            logger.warning(f"Recovered {count} stale jobs")
+        return count
+
+    def stats(self) -> Dict[str, int]:
+        """各状态的作业数量"""
+        rows, _ = self._execute("SELECT status, COUNT(*) AS n FROM graph_jobs GROUP BY status")
+        return {row["status"]: int(row["n"]) for row in rows}
+
+
+def _json_default(value: Any) -> Any:
+    """结果序列化：pydantic 模型转字典，其余不可序列化对象转字符串"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
+
+
+class SQLiteJobStore(JobStore):
+    """本地 SQLite 作业库（WAL 模式，多进程共享）"""
+
+    def __init__(self, path: str = JOB_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self.setup()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, params: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        cur = self._connect().execute(sql, params or {})
+        rows = [dict(row) for row in cur.fetchall()] if cur.description else []
+        return rows, cur.rowcount
+
+
+class PostgresJobStore(JobStore):
+    """PostgreSQL 作业库，复用 storage.database.db 的引擎"""
+
+    def __init__(self, engine=None):
+        if engine is None:
+            from storage.database.db import get_engine
+            engine = get_engine()
+        self.engine = engine
+        self.setup()
+
+    def _execute(self, sql: str, params: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            result = conn.execute(text(sql), params or {})
+            rows = [dict(row) for row in result.mappings().all()] if result.returns_rows else []
+            return rows, result.rowcount
+
+
+_store: Optional[JobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """获取进程内的作业存储（按 JOB_STORE_BACKEND 选择后端）"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if JOB_STORE_BACKEND == "postgres":
+                    _store = PostgresJobStore()
+                elif JOB_STORE_BACKEND == "sqlite":
+                    _store = SQLiteJobStore()
+                else:
+                    raise ValueError(f"Unknown job store backend: {JOB_STORE_BACKEND}")
+                logger.info(f"Job store backend: {JOB_STORE_BACKEND}")
+    return _store
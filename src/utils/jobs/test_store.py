@@ -0,0 +1,74 @@
+"""
+作业库测试：提交、公平领取、心跳、取消与回收
+"""
+import sys
+import time
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.jobs.store import (
+    SQLiteJobStore,
+    JOB_STATUS_CANCELLED,
+    JOB_STATUS_QUEUED,
+    JOB_STATUS_RUNNING,
+    JOB_STATUS_SUCCEEDED,
+)
+
+
+def test_submit_claim_finish(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    job = store.submit({"x": 1}, tenant="t1")
+    assert job["status"] == JOB_STATUS_QUEUED and job["payload"] == {"x": 1}
+
+    claimed = store.claim("w1")
+    assert claimed["job_id"] == job["job_id"]
+    assert claimed["status"] == JOB_STATUS_RUNNING and claimed["attempts"] == 1
+    assert store.claim("w2") is None
+
+    store.finish(job["job_id"], JOB_STATUS_SUCCEEDED, result={"ok": True}, progress=[{"node": "a"}])
+    done = store.get(job["job_id"])
+    assert done["status"] == JOB_STATUS_SUCCEEDED
+    assert done["result"] == {"ok": True} and done["progress"] == [{"node": "a"}]
+
+
+def test_claim_prefers_tenant_with_fewer_running_jobs(tmp_path):
+    """公平领取：已有运行中作业的租户排在后面"""
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    store.submit({}, tenant="busy")
+    store.submit({}, tenant="busy")
+    quiet = store.submit({}, tenant="quiet")
+    assert store.claim("w1")["tenant"] == "busy"
+    assert store.claim("w1")["job_id"] == quiet["job_id"]
+
+
+def test_cancel_queued_and_running(tmp_path):
+    """排队中的作业直接取消，运行中的作业设置取消标志并在心跳时返回"""
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    running = store.submit({})
+    store.claim("w1")
+    queued = store.submit({})
+
+    assert store.request_cancel(queued["job_id"])["status"] == JOB_STATUS_CANCELLED
+    assert store.heartbeat(running["job_id"]) is False
+    assert store.request_cancel(running["job_id"])["cancel_requested"] is True
+    assert store.heartbeat(running["job_id"], progress=[{"node": "a"}]) is True
+    assert store.get(running["job_id"])["progress"] == [{"node": "a"}]
+
+
+def test_recover_stale_and_requeue(tmp_path):
+    """心跳超时的作业被放回队列，可被其他 worker 重新领取"""
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    job = store.submit({}, thread_id="run-1")
+    store.claim("w1")
+    assert store.recover_stale(timeout=3600) == 0
+    time.sleep(0.01)
+    assert store.recover_stale(timeout=0) == 1
+    again = store.claim("w2")
+    assert again["job_id"] == job["job_id"]
+    assert again["attempts"] == 2 and again["thread_id"] == "run-1"
+
+    store.requeue(job["job_id"])
+    assert store.get(job["job_id"])["status"] == JOB_STATUS_QUEUED
+    assert store.stats() == {JOB_STATUS_QUEUED: 1}
@@ -0,0 +1,194 @@
+"""
+作业 worker 池
+
+在服务进程的事件循环中运行固定数量的 worker 协程，从作业库中按租户公平顺序领取作业执行：
+- 每完成一个节点写入一次进度并刷新心跳，长节点由心跳协程定期刷新
+- 心跳时检查取消标志，被取消的作业在下一个 await 点终止
+- 进程正常退出时把运行中的作业放回队列；异常退出的作业在心跳超时后被其他 worker 回收，
+  重新执行时由 checkpointer 从最后一个完成的节点续跑
+- 作业库读写（领取、心跳、回收、写结果）在专用的小线程池中执行，不与同步图节点共用默认线程池，
+  长时间运行的节点占满默认线程池时心跳也不会排队超时（否则仍在运行的作业会被回收并重复执行）
+"""
+import asyncio
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .store import (
+    JobStore,
+    JOB_STATUS_SUCCEEDED,
+    JOB_STATUS_FAILED,
+    JOB_STATUS_CANCELLED,
+)
+
+logger = logging.getLogger(__name__)
+
+# 每个进程并发执行的作业数，默认 0 即不启用作业模式（不启动轮询协程、不在启动时创建 checkpointer）；
+# 启用时须配置数据库，回收的作业才能从其他进程的 checkpoint 续跑
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "0"))
+# 队列为空时的轮询间隔（秒）
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# 心跳间隔（秒）
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "5"))
+# 心跳超时（秒），超过后视为执行进程已退出，作业重新入队
+JOB_HEARTBEAT_TIMEOUT = float(os.getenv("JOB_HEARTBEAT_TIMEOUT", "60"))
+# 单个作业执行超时（秒）
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "3600"))
+# 作业库读写专用线程数
+JOB_STORE_IO_WORKERS = int(os.getenv("JOB_STORE_IO_WORKERS", "2"))
+
+# 作业执行函数：(作业记录, 节点完成回调) -> 输出
+JobExecutor = Callable[[Dict[str, Any], Callable[[str], Awaitable[None]]], Awaitable[Any]]
+
+
+class JobWorkerPool:
+    """作业 worker 池"""
+
+    def __init__(
+        self,
+        store: JobStore,
+        execute: JobExecutor,
+        worker_id: str,
+        concurrency: int = JOB_WORKER_CONCURRENCY,
+        on_finished: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    ):
+        """
+        Args:
+            store: 作业存储
+            execute: 作业执行函数
+            worker_id: 当前进程标识，写入作业记录
+            concurrency: 并发执行的作业数
+            on_finished: 作业结束并写入结果后的回调 (job_id, status)，用于清理 checkpoint
+        """
+        self.store = store
+        self.execute = execute
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.on_finished = on_finished
+        self._workers: List[asyncio.Task] = []
+        self._jobs: Dict[str, asyncio.Task] = {}
+        self._stopping = False
+        self._last_recover = 0.0
+        self._io_executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def active_jobs(self) -> int:
+        return len(self._jobs)
+
+    def start(self):
+        """启动 worker 协程（需在事件循环中调用）"""
+        if self._workers or self.concurrency <= 0:
+            return
+        self._stopping = False
+        self._io_executor = ThreadPoolExecutor(max_workers=JOB_STORE_IO_WORKERS, thread_name_prefix="job-store")
+        for i in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker_loop(i), name=f"job-worker-{i}"))
+        logger.info(f"Job worker pool started: worker_id={self.worker_id}, concurrency={self.concurrency}")
+
+    async def stop(self):
+        """停止 worker，运行中的作业放回队列"""
+        self._stopping = True
+        for task in list(self._jobs.values()):
+            task.cancel()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        if self._io_executor is not None:
+            self._io_executor.shutdown(wait=False)
+            self._io_executor = None
+        logger.info("Job worker pool stopped")
+
+    async def _store_call(self, func: Callable[..., Any], *args: Any) -> Any:
+        """在作业库专用线程池中执行作业库方法"""
+        return await asyncio.get_running_loop().run_in_executor(self._io_executor, partial(func, *args))
+
+    async def _worker_loop(self, index: int):
+        while not self._stopping:
+            try:
+                await self._maybe_recover()
+                job = await self._store_call(self.store.claim, self.worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Job worker {index} failed to claim job: {e}")
+                job = None
+
+            if job is None:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+            await self._run_job(job)
+
+    async def _maybe_recover(self):
+        """定期回收心跳超时的作业"""
+        now = time.time()
+        if now - self._last_recover < JOB_HEARTBEAT_TIMEOUT / 2:
+            return
+        self._last_recover = now
+        await self._store_call(self.store.recover_stale, JOB_HEARTBEAT_TIMEOUT)
+
+    async def _beat(self, job_id: str, task: asyncio.Task, progress: Optional[List[Dict[str, Any]]] = None):
+        """刷新心跳，发现取消标志时取消作业任务"""
+        cancel_requested = await self._store_call(self.store.heartbeat, job_id, progress)
+        if cancel_requested and not task.done():
+            logger.info(f"Cancelling job {job_id} on request")
+            task.cancel()
+
+    async def _heartbeat_loop(self, job_id: str, task: asyncio.Task):
+        while not task.done():
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                await self._beat(job_id, task)
+            except Exception as e:
+                logger.warning(f"Heartbeat failed for job {job_id}: {e}")
+
+    async def _run_job(self, job: Dict[str, Any]):
+        job_id = job["job_id"]
+        progress: List[Dict[str, Any]] = list(job.get("progress") or [])
+        logger.info(f"Job {job_id} started (tenant={job['tenant']}, attempt={job['attempts']})")
+
+        async def on_node(node_name: str):
+            progress.append({"node": node_name, "finished_at": time.time(), "attempt": job["attempts"]})
+            try:
+                await self._beat(job_id, task, list(progress))
+            except Exception as e:
+                logger.warning(f"Failed to record progress for job {job_id}: {e}")
+
+        task = asyncio.create_task(asyncio.wait_for(self.execute(job, on_node), timeout=JOB_TIMEOUT_SECONDS))
+        self._jobs[job_id] = task
+        heartbeat = asyncio.create_task(self._heartbeat_loop(job_id, task))
+        status = JOB_STATUS_SUCCEEDED
+        result: Any = None
+        error: Optional[str] = None
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if self._stopping:
+                # 进程退出：放回队列，重新领取后从 checkpoint 续跑（同步调用，避免再次被取消打断）
+                self.store.requeue(job_id)
+                logger.info(f"Job {job_id} requeued on shutdown")
+                raise
+            status = JOB_STATUS_CANCELLED
+            error = "Job was cancelled"
+        except asyncio.TimeoutError:
+            status = JOB_STATUS_FAILED
+            error = f"Job timeout: exceeded {JOB_TIMEOUT_SECONDS} seconds"
+        except Exception as e:
+            status = JOB_STATUS_FAILED
+            error = f"{type(e).__name__}: {e}"
+            logger.error(f"Job {job_id} failed: {error}\n{traceback.format_exc()}")
+        finally:
+            heartbeat.cancel()
+            self._jobs.pop(job_id, None)
+
+        await self._store_call(self.store.finish, job_id, status, result, error, progress)
+        logger.info(f"Job {job_id} finished with status {status}")
+        if self.on_finished is not None:
+            try:
+                await self.on_finished(job_id, status)
+            except Exception as e:
+                logger.warning(f"on_finished callback failed for job {job_id}: {e}")
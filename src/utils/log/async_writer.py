@@ -0,0 +1,241 @@
+"""
+后台批量日志写入器
+
+节点开始/结束等事件日志不再在请求路径上逐条 open/write/fsync，而是写入有界环形缓冲区，
+由后台线程组提交（每 LOG_FLUSH_INTERVAL_MS 毫秒或攒够 LOG_FLUSH_BATCH 条写一次）。
+- 缓冲区满时丢弃最旧的日志并计数，请求路径永远不会因磁盘变慢而阻塞
+- 持久化级别由 LOG_DURABILITY 控制：
+    sync  —— 调用方同步写入并 fsync（旧行为）
+    fsync —— 每批写入后 flush + fsync
+    flush —— 每批写入后 flush，由操作系统决定落盘时机（默认）
+- 进程退出（atexit）或服务关闭时把缓冲区中的日志全部写完
+文件写入复用 setup_logging 在根 logger 上挂载的 RotatingFileHandler（同一文件时），
+因此轮转策略与其它日志一致，也不会出现两个 handler 各自轮转同一文件的情况。
+"""
+import atexit
+import collections
+import logging
+import logging.handlers
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from utils.metrics import LOG_ENTRIES_DROPPED
+
+# 环形缓冲区容量（条）
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", "10000"))
+# 组提交间隔（毫秒）
+LOG_FLUSH_INTERVAL_MS = int(os.getenv("LOG_FLUSH_INTERVAL_MS", "200"))
+# 攒够多少条立即写一批
+LOG_FLUSH_BATCH = int(os.getenv("LOG_FLUSH_BATCH", "256"))
+# 持久化级别：sync / fsync / flush
+LOG_DURABILITY = os.getenv("LOG_DURABILITY", "flush").strip().lower()
+# 未共享到根 logger 的 handler 时，自建 RotatingFileHandler 的轮转参数
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(100 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+
+DURABILITY_SYNC = "sync"
+DURABILITY_FSYNC = "fsync"
+DURABILITY_FLUSH = "flush"
+_DURABILITY_LEVELS = (DURABILITY_SYNC, DURABILITY_FSYNC, DURABILITY_FLUSH)
+
+
+def _find_shared_handler(log_file: str) -> Optional[logging.handlers.RotatingFileHandler]:
+    """查找根 logger 上写同一文件的 RotatingFileHandler（由 setup_logging 创建）"""
+    target = os.path.abspath(log_file)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.handlers.RotatingFileHandler) and handler.baseFilename == target:
+            return handler
+    return None
+
+
+class BatchedLogWriter:
+    """有界缓冲 + 后台线程组提交的行日志写入器"""
+
+    def __init__(
+        self,
+        log_file: str,
+        buffer_size: int = LOG_BUFFER_SIZE,
+        flush_interval_ms: int = LOG_FLUSH_INTERVAL_MS,
+        flush_batch: int = LOG_FLUSH_BATCH,
+        durability: str = LOG_DURABILITY,
+    ):
+        self.log_file = log_file
+        self.buffer_size = max(1, buffer_size)
+        self.flush_interval = max(1, flush_interval_ms) / 1000.0
+        self.flush_batch = max(1, flush_batch)
+        self.durability = durability if durability in _DURABILITY_LEVELS else DURABILITY_FLUSH
+        # deque(maxlen) 即环形缓冲区：写满后追加会挤掉最旧的一条
+        self._buffer: collections.deque = collections.deque(maxlen=self.buffer_size)
+        self._cond = threading.Condition(threading.Lock())
+        self._handler: Optional[logging.handlers.RotatingFileHandler] = None
+        self._owns_handler = False
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+
+    def _get_handler(self) -> logging.handlers.RotatingFileHandler:
+        # setup_logging 可能晚于本模块导入执行（或重新配置），每次都优先使用根 logger 上的 handler
+        shared = _find_shared_handler(self.log_file)
+        if shared is not None:
+            if self._owns_handler and self._handler is not None:
+                self._handler.close()
+                self._owns_handler = False
+            self._handler = shared
+            return shared
+        if self._handler is None or not self._owns_handler:
+            self._handler = logging.handlers.RotatingFileHandler(
+                filename=self.log_file,
+                maxBytes=LOG_MAX_BYTES,
+                backupCount=LOG_BACKUP_COUNT,
+                encoding="utf-8",
+                delay=True,
+            )
+            self._owns_handler = True
+        return self._handler
+
+    def _write_lines(self, lines: List[str], fsync: bool):
+        """在 handler 锁内写入一批日志（必要时先轮转）"""
+        data = "".join(line + "\n" for line in lines)
+        handler = self._get_handler()
+        handler.acquire()
+        try:
+            if handler.stream is None:
+                handler.stream = handler._open()
+            if handler.maxBytes > 0 and handler.stream.tell() + len(data) >= handler.maxBytes:
+                handler.doRollover()
+                if handler.stream is None:
+                    handler.stream = handler._open()
+            handler.stream.write(data)
+            handler.stream.flush()
+            if fsync:
+                os.fsync(handler.stream.fileno())
+        finally:
+            handler.release()
+        self.written += len(lines)
+        self.batches += 1
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def write(self, line: str, urgent: bool = False):
+        """
+        追加一行日志
+
+        Args:
+            line: 已序列化的一行日志（不含换行符）
+            urgent: 为 True 时立即唤醒写线程（用于错误日志）
+        """
+        if self.durability == DURABILITY_SYNC or self._stopping:
+            # 同步模式，或写入器已关闭（如 atexit 之后的日志）时直接写入
+            self._write_lines([line], fsync=self.durability != DURABILITY_FLUSH)
+            return
+        if self._thread is None:
+            self.start()
+        with self._cond:
+            if len(self._buffer) >= self.buffer_size:
+                self.dropped += 1
+                LOG_ENTRIES_DROPPED.inc()
+            self._buffer.append(line)
+            if urgent or len(self._buffer) >= self.flush_batch:
+                self._cond.notify()
+
+    def _drain(self) -> List[str]:
+        lines = list(self._buffer)
+        self._buffer.clear()
+        return lines
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._buffer) < self.flush_batch and not self._stopping:
+                    # 未攒满一批：最多等一个间隔，之后无论多少都写出
+                    self._cond.wait(self.flush_interval)
+                lines = self._drain()
+                stopping = self._stopping
+            if lines:
+                try:
+                    self._write_lines(lines, fsync=self.durability == DURABILITY_FSYNC)
+                except Exception as e:
+                    print(f"Failed to write {len(lines)} log entries: {e}", flush=True)
+            if stopping:
+                return
+
+    def flush(self):
+        """把缓冲区中已有的日志同步写出（调用方线程执行）"""
+        with self._cond:
+            lines = self._drain()
+        if lines:
+            self._write_lines(lines, fsync=self.durability != DURABILITY_FLUSH)
+
+    def close(self, timeout: float = 5.0):
+        """停止写线程并写完剩余日志"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Failed to flush logs on shutdown: {e}", flush=True)
+        if self._owns_handler and self._handler is not None:
+            self._handler.close()
+            self._handler = None
+            self._owns_handler = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "durability": self.durability,
+            "buffered": len(self._buffer),
+            "buffer_size": self.buffer_size,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+        }
+
+
+_writers: Dict[str, BatchedLogWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_log_writer(log_file: str) -> BatchedLogWriter:
+    """按文件获取进程内共享的写入器"""
+    writer = _writers.get(log_file)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(log_file)
+            if writer is None:
+                writer = BatchedLogWriter(log_file)
+                _writers[log_file] = writer
+    return writer
+
+
+def shutdown_log_writers():
+    """关闭全部写入器（服务关闭与 atexit 时调用，可重复调用）"""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.close()
+
+
+atexit.register(shutdown_log_writers)
+
+
+__all__ = [
+    "BatchedLogWriter",
+    "get_log_writer",
+    "shutdown_log_writers",
+    "DURABILITY_SYNC",
+    "DURABILITY_FSYNC",
+    "DURABILITY_FLUSH",
+]
@@ -12,7 +12,18 @@ import sys
 import json
 from typing import Dict, Optional, Any
 from pydantic import BaseModel
-from utils.log.parser import LangGraphParser
+from utils.log.parser import get_graph_parser
+from utils.log.async_writer import get_log_writer
+from utils.log.payload_policy import apply_payload_policy, should_log_full_payload
+from utils.log.timeline import active_timeline, finish_timeline
+from utils.metrics import (
+    GRAPH_RUN_DURATION,
+    NODE_DURATION,
+    LLM_CALL_DURATION,
+    LLM_TIME_TO_FIRST_TOKEN,
+    LLM_TOKENS,
+    LLM_TOKENS_TOTAL,
+)
 import asyncio
 
 
@@ -56,7 +67,8 @@ logger.setLevel(logging.INFO)
 
 def write_log(log_entry):
     """
-    直接使用文件操作写入JSON格式日志，确保立即刷新到磁盘
+    写入JSON格式日志：序列化后放入后台写入器的缓冲区，由后台线程批量落盘
+    （持久化级别见 utils.log.async_writer.LOG_DURABILITY）
     :param log_entry: 符合要求格式的日志字典
     """
     try:
@@ -64,34 +76,18 @@ def write_log(log_entry):
             #  线上不打日志，待具备清理能后再打
             return None
         log_json = json.dumps(log_entry, ensure_ascii=False)
-
-        # 修改为行缓冲模式（buffering=1）而不是无缓冲模式
-        with open(LOG_FILE, 'a', encoding='utf-8', buffering=1) as f:  # 行缓冲模式
-            f.write(log_json + '\n')
-            # 显式调用flush和fsync确保数据写入磁盘
-            f.flush()
-            os.fsync(f.fileno())
+        level = log_entry.get('level', 'info').lower()
+        get_log_writer(LOG_FILE).write(log_json, urgent=level == 'error')
 
         # 同时输出到控制台以便调试
-        level = log_entry.get('level', 'info').lower()
         log_method = getattr(logger, level, logger.info)
         log_method(log_entry.get('message', ''))
 
     except Exception as e:
         # 如果写入失败，打印到标准错误
         print(f"Failed to write log: {e}", flush=True)
-        # 尝试再次写入作为备选
         try:
-            log_json = json.dumps(log_entry, ensure_ascii=False)
-            print(f"Attempting fallback write: {log_json}", flush=True)
-            # 修改备选方案为行缓冲模式
-            f = open(LOG_FILE, 'a', encoding='utf-8', buffering=1)
-            try:
-                f.write(log_json + '\n')
-                f.flush()
-                os.fsync(f.fileno())
-            finally:
-                f.close()
+            print(f"Attempting fallback write: {json.dumps(log_entry, ensure_ascii=False)}", flush=True)
         except Exception as fallback_e:
             print(f"Fallback log write failed: {fallback_e}", flush=True)
 
@@ -191,7 +187,8 @@ def log_workflow_start(project_id, commit_id, log_id=None, execute_id="", input_
 
 
 def log_workflow_end(execution_id, output=None, total_time=None, status="success", token_consumed=None,
-                     error_reason=None, error_code=None, is_test_run=False, log_id="", method=""):
+                     error_reason=None, error_code=None, is_test_run=False, log_id="", method="",
+                     full_payload=False):
     """
     记录流程结束日志
     :param execution_id: 执行唯一ID
@@ -202,6 +199,7 @@ def log_workflow_end(execution_id, output=None, total_time=None, status="success
     :param error_reason: 错误原因
     :param error_code: 错误码
     :param is_test_run: 是否试运行
+    :param full_payload: 是否完整记录输出（否则按载荷日志策略裁剪）
     """
     level = "error" if status == "error" else "info"
     execute_mode = "test_run" if is_test_run else "run"
@@ -214,7 +212,7 @@ def log_workflow_end(execution_id, output=None, total_time=None, status="success
         level=level,
         message=message,
         latency=int(total_time * 1000) if total_time else 0,
-        output_data=_serialize_data(output),
+        output_data=_serialize_data(output, full=full_payload),
         execute_mode=execute_mode,
         event_type="test_run_done" if is_test_run else "done",
         token=str(token_consumed) if token_consumed else "",
@@ -228,15 +226,40 @@ def log_workflow_end(execution_id, output=None, total_time=None, status="success
     write_log(log_entry)
 
 
+# 单次运行中同时跟踪的 run 数上限，超出时丢弃最早登记的（正常情况下在结束回调中移除）
+LOGGER_MAX_TRACKED_RUNS = int(os.getenv("LOGGER_MAX_TRACKED_RUNS", "10000"))
+
+
+def _remember(mapping: Dict, key: Any, value: Any):
+    """写入有界字典：超过上限时按插入顺序淘汰最早的项"""
+    mapping[key] = value
+    if len(mapping) > LOGGER_MAX_TRACKED_RUNS:
+        try:
+            mapping.pop(next(iter(mapping)))
+        except (StopIteration, KeyError, RuntimeError):
+            pass
+
+
 class Logger(BaseCallbackHandler):
+    """每次运行一个的轻量回调对象：图的静态解析结果由 get_graph_parser 按图缓存共享"""
+
     def __init__(self, graph, ctx: Context):
         self.root_run_id = None
         self.graph = graph
         self.runtime_ctx = ctx
         self.start_time = time.time()
-        self.parser = LangGraphParser(graph)
-
-    run_id_map: Dict[uuid.UUID, str] = {}
+        self.parser = get_graph_parser(graph)
+        # 按 run_id 抽样：抽中的运行完整记录节点输入输出，其余按载荷日志策略裁剪
+        self.full_payload = should_log_full_payload(ctx.run_id)
+        # 本次运行内的 run_id -> 节点名（有界，节点结束时移除）
+        self.run_id_map: Dict[uuid.UUID, str] = {}
+        # 指标：节点开始时间、父子 run 关系（用于把 LLM 调用归属到节点）、进行中的 LLM 调用
+        self._node_started: Dict[uuid.UUID, float] = {}
+        self._parents: Dict[uuid.UUID, Optional[uuid.UUID]] = {}
+        self._llm_runs: Dict[uuid.UUID, Dict[str, Any]] = {}
+        # 耗时时间线（仅在本次运行开启了时间线记录时存在）：run_id -> 进行中的区间
+        self.timeline = active_timeline(ctx.run_id)
+        self._spans: Dict[uuid.UUID, Any] = {}
 
     def on_chain_start_graph(
             self,
@@ -254,10 +277,15 @@ class Logger(BaseCallbackHandler):
         node_name_value = kwargs.get("name")
         node_name: str | None = node_name_value if isinstance(node_name_value, str) else None
         if node_name:
-            self.run_id_map[run_id] = node_name
+            _remember(self.run_id_map, run_id, node_name)
+        _remember(self._parents, run_id, parent_run_id)
         if parent_run_id is None:
+            self._begin_span(run_id, "graph", "graph", method=self.runtime_ctx.method)
             self._on_graph_start(inputs)  # workflow 开始
         node_info = self.parser.nodes.get(node_name) if node_name is not None else None
+        if node_info is not None:
+            _remember(self._node_started, run_id, time.time())
+            self._begin_span(run_id, node_info.title or node_name, "node", node=node_name)
         if node_info is None:
             # 检查是否为条件节点
             if node_name in self.parser.condition_funcs:
@@ -265,7 +293,7 @@ class Logger(BaseCallbackHandler):
                 log_entry = create_log_entry(
                     level="info",
                     message=f"Condition node '{node_name}' started",
-                    input_data=_serialize_data(inputs),
+                    input_data=_serialize_data(inputs, full=self.full_payload),
                     node_name=self.parser.condition_funcs[node_name]["cond_node_name"],  # 前端的条件节点名
                     execution_id=self.runtime_ctx.run_id,
                     execute_mode=get_execute_mode(),
@@ -281,7 +309,7 @@ class Logger(BaseCallbackHandler):
         log_entry = create_log_entry(
             level="info",
             message=f"Node '{node_info.name}' started",
-            input_data=_serialize_data(inputs),
+            input_data=_serialize_data(inputs, full=self.full_payload),
             node_id=node_info.node_id,
             node_type=node_info.node_type,
             node_title=node_info.title,
@@ -303,8 +331,12 @@ class Logger(BaseCallbackHandler):
             **kwargs: Any,
     ) -> Any:
         node_name = self.run_id_map.pop(run_id, None)
+        self._parents.pop(run_id, None)
+        self._observe_node(run_id, node_name, "success")
+        self._end_span(run_id, status="success")
         if parent_run_id is None:  # 根节点
             self._on_graph_end(outputs)
+            self._finish_timeline()
         elif node_name:
             # Node end
             node_info = self.parser.nodes.get(node_name, None)
@@ -315,7 +347,7 @@ class Logger(BaseCallbackHandler):
                     log_entry = create_log_entry(
                         level="info",
                         message=f"Condition node '{node_name}' ended",
-                        output_data=_serialize_data(outputs),
+                        output_data=_serialize_data(outputs, full=self.full_payload),
                         node_name=self.parser.condition_funcs[node_name]["cond_node_name"],  # 前端的条件节点名
                         execution_id=self.runtime_ctx.run_id,
                         execute_mode=get_execute_mode(),
@@ -331,7 +363,7 @@ class Logger(BaseCallbackHandler):
             log_entry = create_log_entry(
                 level="info",
                 message=f"Node '{node_info.name}' ended",
-                output_data=_serialize_data(outputs),
+                output_data=_serialize_data(outputs, full=self.full_payload),
                 node_id=node_info.node_id,  # 注册的时候使用的function name，前端用来流转
                 node_type=node_info.node_type,
                 node_title=node_info.title,
@@ -353,13 +385,14 @@ class Logger(BaseCallbackHandler):
             commit_id=commit_id,
             log_id=str(self.runtime_ctx.logid),
             execute_id=self.runtime_ctx.run_id,
-            input_data=_serialize_data(inputs),
+            input_data=_serialize_data(inputs, full=self.full_payload),
             method=self.runtime_ctx.method,
         )
 
     def _on_graph_end(self, outputs: Dict[str, Any]):
         # Workflow end
         total_time = time.time() - self.start_time
+        GRAPH_RUN_DURATION.observe(total_time, method=self.runtime_ctx.method, status="success")
         log_workflow_end(
             execution_id=self.runtime_ctx.run_id,
             output=outputs,
@@ -368,6 +401,7 @@ class Logger(BaseCallbackHandler):
             log_id=self.runtime_ctx.logid,
             is_test_run=not is_prod(),
             method=self.runtime_ctx.method,
+            full_payload=self.full_payload,
         )
 
     def on_chain_error(
@@ -386,6 +420,14 @@ class Logger(BaseCallbackHandler):
             event_type = "cancel"
         # 记录节点失败日志
         node_name = self.run_id_map.pop(run_id, "")
+        self._parents.pop(run_id, None)
+        self._observe_node(run_id, node_name, event_type)
+        self._end_span(run_id, status=event_type, error=type(error).__name__)
+        if parent_run_id is None:
+            GRAPH_RUN_DURATION.observe(
+                time.time() - self.start_time, method=self.runtime_ctx.method, status=event_type
+            )
+            self._finish_timeline()
         # Node end
         node_id = ""
         node_title = ""
@@ -413,6 +455,96 @@ class Logger(BaseCallbackHandler):
         )
         write_log(error_log_entry)
 
+    def _observe_node(self, run_id: uuid.UUID, node_name: Optional[str], status: str):
+        """记录节点耗时（仅图中注册的节点）"""
+        started = self._node_started.pop(run_id, None)
+        if started is not None and node_name:
+            NODE_DURATION.observe(time.time() - started, node=node_name, status=status)
+
+    def _begin_span(self, run_id: uuid.UUID, name: str, cat: str, **args: Any):
+        if self.timeline is not None:
+            _remember(self._spans, run_id, self.timeline.begin(name, cat, **args))
+
+    def _end_span(self, run_id: uuid.UUID, **args: Any):
+        if self.timeline is not None:
+            self.timeline.end(self._spans.pop(run_id, None), **args)
+
+    def _finish_timeline(self):
+        if self.timeline is not None:
+            # 未正常结束的区间（如被取消的并行节点）一并收尾
+            for run_id in list(self._spans):
+                self._end_span(run_id, status="unfinished")
+            finish_timeline(self.runtime_ctx.run_id)
+
+    def _resolve_node(self, run_id: Optional[uuid.UUID]) -> str:
+        """沿父 run 向上查找所属的图节点名"""
+        for _ in range(64):
+            if run_id is None:
+                break
+            name = self.run_id_map.get(run_id)
+            if name and name in self.parser.nodes:
+                return name
+            run_id = self._parents.get(run_id)
+        return ""
+
+    @staticmethod
+    def _model_name(serialized: Optional[dict], metadata: Optional[dict], kwargs: Dict[str, Any]) -> str:
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or (metadata or {}).get("ls_model_name")
+        if not model and serialized:
+            model = (serialized.get("kwargs") or {}).get("model_name") or (serialized.get("kwargs") or {}).get("model")
+        return str(model or "unknown")
+
+    def _on_llm_start(self, serialized, run_id, parent_run_id, metadata, kwargs):
+        node = self._resolve_node(parent_run_id)
+        model = self._model_name(serialized, metadata, kwargs)
+        _remember(self._llm_runs, run_id, {
+            "start": time.time(),
+            "node": node,
+            "model": model,
+            "first_token": False,
+        })
+        self._begin_span(run_id, "call_llm", "llm", node=node, model=model)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        self._on_llm_start(serialized, run_id, parent_run_id, metadata, kwargs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None,
+                            **kwargs):
+        self._on_llm_start(serialized, run_id, parent_run_id, metadata, kwargs)
+
+    def on_llm_new_token(self, token, *, chunk=None, run_id, parent_run_id=None, **kwargs):
+        llm_run = self._llm_runs.get(run_id)
+        if llm_run is not None and not llm_run["first_token"]:
+            llm_run["first_token"] = True
+            ttft = time.time() - llm_run["start"]
+            LLM_TIME_TO_FIRST_TOKEN.observe(ttft, node=llm_run["node"], model=llm_run["model"])
+            span = self._spans.get(run_id)
+            if span is not None:
+                span.args["ttft_ms"] = round(ttft * 1000, 1)
+                self.timeline.instant("first_token", "llm", lane=span.lane, node=llm_run["node"])
+
+    def on_llm_end(self, response, *, run_id, parent_run_id=None, **kwargs):
+        llm_run = self._llm_runs.pop(run_id, None)
+        if llm_run is None:
+            return
+        node, model = llm_run["node"], llm_run["model"]
+        LLM_CALL_DURATION.observe(time.time() - llm_run["start"], node=node, model=model, status="success")
+        prompt_tokens, completion_tokens = _token_usage(response)
+        for kind, count in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+            if count:
+                LLM_TOKENS.observe(count, node=node, kind=kind)
+                LLM_TOKENS_TOTAL.inc(count, node=node, kind=kind)
+        self._end_span(run_id, status="success", prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        llm_run = self._llm_runs.pop(run_id, None)
+        if llm_run is not None:
+            LLM_CALL_DURATION.observe(
+                time.time() - llm_run["start"], node=llm_run["node"], model=llm_run["model"], status="error"
+            )
+        self._end_span(run_id, status="error", error=type(error).__name__)
+
     def get_node_tags(self, node_name: str) -> dict[str, str]:
         node_tags = {}
         if node_name is None or node_name == "":
@@ -440,14 +572,34 @@ class Logger(BaseCallbackHandler):
         return node_title
 
 
-def _serialize_data(data: Any) -> str:
+def _token_usage(response: Any) -> tuple[int, int]:
+    """从 LLMResult 中提取 (prompt_tokens, completion_tokens)"""
+    usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    if prompt_tokens or completion_tokens:
+        return int(prompt_tokens), int(completion_tokens)
+    # 流式或部分模型只在消息的 usage_metadata 中给出用量
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt_tokens += usage_metadata.get("input_tokens") or 0
+            completion_tokens += usage_metadata.get("output_tokens") or 0
+    return int(prompt_tokens), int(completion_tokens)
+
+
+def _serialize_data(data: Any, full: bool = False) -> str:
     """
     增强版数据序列化函数，支持：
     - Pydantic BaseModel
     - 字典/列表等基础类型
     - 自定义对象（通过 __dict__ 序列化）
     - 特殊字符（保证 ASCII 编码）
+    默认按载荷日志策略裁剪（见 utils.log.payload_policy），full=True 时完整序列化
     """
+    if is_prod():
+        # 线上不写事件日志，无需序列化
+        return ""
 
     def _recursive_serialize(item: Any):
         """递归序列化单个元素"""
@@ -473,7 +625,7 @@ def _serialize_data(data: Any) -> str:
 
     try:
         # 先递归处理数据为可序列化的基础类型
-        serialized_data = _recursive_serialize(data)
+        serialized_data = _recursive_serialize(data) if full else apply_payload_policy(data)
         # 最终序列化为 JSON 字符串
         return json.dumps(serialized_data, ensure_ascii=False, indent=None)
 
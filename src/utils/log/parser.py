@@ -1,4 +1,6 @@
 import inspect
+import threading
+import weakref
 from dataclasses import dataclass
 from typing import Dict, Optional, Any, Callable, cast
 from langgraph.graph.state import CompiledStateGraph
@@ -253,3 +255,24 @@ class LangGraphParser:
                 conditional_funcs[check_func_name] = {
                     "cond_node_name": "cond_" + parent_id} # 拼成前端的条件节点名
         return conditional_funcs
+
+
+# 编译后的图 -> 解析结果；图被回收时缓存项随之释放
+_parser_cache: "weakref.WeakKeyDictionary[CompiledStateGraph, LangGraphParser]" = weakref.WeakKeyDictionary()
+_parser_cache_lock = threading.Lock()
+
+
+def get_graph_parser(app: CompiledStateGraph) -> LangGraphParser:
+    """
+    获取图的解析结果（每个编译后的图只解析一次）
+
+    返回的解析器在各次运行间共享，调用方只读使用。
+    """
+    parser = _parser_cache.get(app)
+    if parser is None:
+        with _parser_cache_lock:
+            parser = _parser_cache.get(app)
+            if parser is None:
+                parser = LangGraphParser(app)
+                _parser_cache[app] = parser
+    return parser
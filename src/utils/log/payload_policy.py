@@ -0,0 +1,127 @@
+"""
+载荷日志策略
+
+节点输入输出与请求体里常带着整份招标/投标文档，逐事件全文记录会让一次运行写出数 MB 的重复文本。
+记录前按以下策略裁剪：
+- 单个字符串字段最多保留 LOG_PAYLOAD_FIELD_BUDGET 个字符，超出部分以“长度 + 内容摘要”标记
+- 超过 LOG_PAYLOAD_HASH_THRESHOLD 的字符串只记录长度与摘要，同一文档在不同事件中可按摘要对应
+- 列表/字典最多保留 LOG_PAYLOAD_MAX_ITEMS 个元素，嵌套超过 LOG_PAYLOAD_MAX_DEPTH 层的部分省略
+- 按 LOG_PAYLOAD_SAMPLE_RATE 的比例抽样完整记录（按 run_id 确定，同一次运行的所有事件一致）
+"""
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+from pydantic import BaseModel
+
+# 单个字符串字段保留的最大字符数
+LOG_PAYLOAD_FIELD_BUDGET = int(os.getenv("LOG_PAYLOAD_FIELD_BUDGET", "1024"))
+# 超过此长度的字符串只记录长度与摘要
+LOG_PAYLOAD_HASH_THRESHOLD = int(os.getenv("LOG_PAYLOAD_HASH_THRESHOLD", "16384"))
+# 列表/字典最多保留的元素数
+LOG_PAYLOAD_MAX_ITEMS = int(os.getenv("LOG_PAYLOAD_MAX_ITEMS", "50"))
+# 最大嵌套层数
+LOG_PAYLOAD_MAX_DEPTH = int(os.getenv("LOG_PAYLOAD_MAX_DEPTH", "8"))
+# 完整记录载荷的运行比例（0~1）
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0"))
+
+
+# 摘要缓存容量：同一份文档字符串会在每个节点事件中重复出现，只计算一次
+_DIGEST_CACHE_SIZE = 256
+_digest_cache: Dict[Tuple[int, int, str, str], str] = {}
+_digest_lock = threading.Lock()
+
+
+def content_digest(text: str) -> str:
+    """字符串内容摘要（16 位十六进制）"""
+    # 以对象 id + 长度 + 首尾片段为键，避免对象被回收后 id 复用导致误命中
+    key = (id(text), len(text), text[:32], text[-32:])
+    digest = _digest_cache.get(key)
+    if digest is None:
+        digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8).hexdigest()
+        with _digest_lock:
+            if len(_digest_cache) >= _DIGEST_CACHE_SIZE:
+                _digest_cache.pop(next(iter(_digest_cache)))
+            _digest_cache[key] = digest
+    return digest
+
+
+def summarize_string(
+    text: str,
+    budget: int = LOG_PAYLOAD_FIELD_BUDGET,
+    hash_threshold: int = LOG_PAYLOAD_HASH_THRESHOLD,
+) -> str:
+    """
+    按预算裁剪字符串
+
+    Returns:
+        未超预算时原样返回；超预算时返回前缀 + 截断标记；超过摘要阈值时只返回长度与摘要
+    """
+    length = len(text)
+    if length <= budget:
+        return text
+    digest = content_digest(text)
+    if length > hash_threshold:
+        return f"<omitted len={length} digest={digest}>"
+    return f"{text[:budget]}...<truncated len={length} digest={digest}>"
+
+
+def apply_payload_policy(item: Any, depth: int = 0) -> Any:
+    """把载荷转换为已裁剪的、可 JSON 序列化的基础类型"""
+    if isinstance(item, str):
+        return summarize_string(item)
+    if item is None or isinstance(item, (bool, int, float)):
+        return item
+    if isinstance(item, (bytes, bytearray, memoryview)):
+        return f"<bytes len={len(item)}>"
+    if depth >= LOG_PAYLOAD_MAX_DEPTH:
+        return f"<{type(item).__name__} omitted: max depth>"
+
+    if isinstance(item, BaseModel):
+        # 按字段读取，避免 model_dump 深拷贝整个状态
+        item = {name: getattr(item, name, None) for name in type(item).model_fields}
+    elif not isinstance(item, (dict, list, tuple, set, frozenset)) and hasattr(item, "__dict__"):
+        item = item.__dict__
+
+    if isinstance(item, dict):
+        result = {}
+        for i, (key, value) in enumerate(item.items()):
+            if i >= LOG_PAYLOAD_MAX_ITEMS:
+                result["..."] = f"<{len(item) - i} more keys>"
+                break
+            result[key if isinstance(key, str) else str(key)] = apply_payload_policy(value, depth + 1)
+        return result
+    if isinstance(item, (list, tuple, set, frozenset)):
+        items = list(item) if not isinstance(item, (list, tuple)) else item
+        result = [apply_payload_policy(value, depth + 1) for value in items[:LOG_PAYLOAD_MAX_ITEMS]]
+        if len(items) > LOG_PAYLOAD_MAX_ITEMS:
+            result.append(f"<{len(items) - LOG_PAYLOAD_MAX_ITEMS} more items>")
+        return result
+    return summarize_string(str(item))
+
+
+def should_log_full_payload(key: str, rate: float = LOG_PAYLOAD_SAMPLE_RATE) -> bool:
+    """按 key（通常是 run_id）确定性抽样：同一 key 在所有事件、所有 worker 上结论一致"""
+    if rate <= 0 or not key:
+        return False
+    if rate >= 1:
+        return True
+    bucket = int.from_bytes(hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest(), "big")
+    return bucket / 2 ** 64 < rate
+
+
+def format_payload_text(text: str, key: str = "") -> str:
+    """请求体等原始文本的日志形式（抽中完整记录时原样返回）"""
+    if should_log_full_payload(key):
+        return text
+    return summarize_string(text)
+
+
+__all__ = [
+    "content_digest",
+    "summarize_string",
+    "apply_payload_policy",
+    "should_log_full_payload",
+    "format_payload_text",
+]
@@ -0,0 +1,81 @@
+"""
+载荷日志策略测试：字符串裁剪、摘要、容器截断与确定性抽样
+"""
+import json
+import sys
+from pathlib import Path
+
+from pydantic import BaseModel
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.log import payload_policy
+from utils.log.payload_policy import (
+    apply_payload_policy,
+    content_digest,
+    format_payload_text,
+    should_log_full_payload,
+    summarize_string,
+)
+
+
+def test_summarize_string_budget_and_hash():
+    """未超预算原样保留，超预算截断并附摘要，超过阈值只记录长度与摘要"""
+    assert summarize_string("short", budget=10) == "short"
+    truncated = summarize_string("a" * 20, budget=10, hash_threshold=100)
+    assert truncated.startswith("a" * 10 + "...<truncated len=20 digest=")
+    omitted = summarize_string("b" * 200, budget=10, hash_threshold=100)
+    assert omitted == f"<omitted len=200 digest={content_digest('b' * 200)}>"
+
+
+def test_digest_identifies_same_content():
+    """内容相同的不同字符串对象摘要一致，内容不同则不同"""
+    a = "招标文件" * 100
+    b = "".join(["招标文件"] * 100)
+    assert a is not b
+    assert content_digest(a) == content_digest(b)
+    assert content_digest(a) != content_digest(a + "。")
+
+
+class _State(BaseModel):
+    name: str
+    doc: str
+    items: list
+
+
+def test_apply_payload_policy_limits_structure(monkeypatch):
+    """模型按字段转换，长列表与深层嵌套被截断，结果可 JSON 序列化"""
+    monkeypatch.setattr(payload_policy, "LOG_PAYLOAD_MAX_ITEMS", 3)
+    monkeypatch.setattr(payload_policy, "LOG_PAYLOAD_MAX_DEPTH", 2)
+    state = _State(name="x", doc="d" * 20000, items=list(range(5)))
+    result = apply_payload_policy({"state": state, "raw": b"\x00" * 8, "nested": {"a": {"b": {"c": 1}}}})
+
+    assert result["raw"] == "<bytes len=8>"
+    assert result["state"]["doc"].startswith("<omitted len=20000")
+    assert result["state"]["items"] == "<list omitted: max depth>"
+    assert result["nested"]["a"] == "<dict omitted: max depth>"
+    json.dumps(result)
+
+    shallow = apply_payload_policy(list(range(5)))
+    assert shallow == [0, 1, 2, "<2 more items>"]
+    keys = apply_payload_policy({str(i): i for i in range(5)})
+    assert keys["..."] == "<2 more keys>"
+
+
+def test_sampling_is_deterministic():
+    """抽样按 key 确定：同一 run_id 结论一致，比例大致符合设置"""
+    assert not should_log_full_payload("run-1", rate=0)
+    assert should_log_full_payload("run-1", rate=1)
+    assert not should_log_full_payload("", rate=1)
+    picks = [should_log_full_payload(f"run-{i}", rate=0.25) for i in range(4000)]
+    assert picks == [should_log_full_payload(f"run-{i}", rate=0.25) for i in range(4000)]
+    assert 800 < sum(picks) < 1200
+
+
+def test_format_payload_text_uses_sampling(monkeypatch):
+    """抽中完整记录的运行原样记录请求体，其余按预算裁剪"""
+    text = "x" * (payload_policy.LOG_PAYLOAD_FIELD_BUDGET + 1)
+    assert format_payload_text(text, key="run-1") != text
+    monkeypatch.setattr(payload_policy, "should_log_full_payload", lambda key: key == "run-1")
+    assert format_payload_text(text, key="run-1") == text
@@ -0,0 +1,56 @@
+"""
+运行时间线测试：区间记录、结束转存、进行中与已结束列表的上限
+"""
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.log import timeline
+from utils.log.timeline import finish_timeline, get_timeline, start_timeline
+
+
+def _reset(monkeypatch, max_active=1000, retention=200):
+    monkeypatch.setattr(timeline, "_active", timeline.OrderedDict())
+    monkeypatch.setattr(timeline, "_finished", timeline.OrderedDict())
+    monkeypatch.setattr(timeline, "RUN_TRACE_MAX_ACTIVE", max_active)
+    monkeypatch.setattr(timeline, "RUN_TRACE_RETENTION", retention)
+
+
+def test_spans_exported_as_chrome_trace(monkeypatch):
+    """并行区间分配到不同 lane，导出为 complete 事件"""
+    _reset(monkeypatch)
+    run = start_timeline("run-1")
+    assert start_timeline("run-1") is run
+    outer = run.begin("graph", "graph")
+    with run.span("node_a", "node"):
+        pass
+    run.end(outer)
+    trace = run.to_chrome_trace()
+    events = [e for e in trace["traceEvents"] if e.get("ph") == "X"]
+    assert {e["name"] for e in events} == {"graph", "node_a"}
+    assert len({e["tid"] for e in events}) == 2
+
+
+def test_finish_moves_to_bounded_finished(monkeypatch):
+    """结束后仍可查询，重复结束无副作用，超出保留数量时丢弃最早的"""
+    _reset(monkeypatch, retention=2)
+    for i in range(3):
+        start_timeline(f"run-{i}")
+        finish_timeline(f"run-{i}")
+    finish_timeline("run-2")
+    assert not timeline._active
+    assert get_timeline("run-0") is None
+    assert get_timeline("run-2").finished
+
+
+def test_active_timelines_are_bounded(monkeypatch):
+    """未结束的时间线超过上限时，最早开始的转入已结束列表并标记为未完成"""
+    _reset(monkeypatch, max_active=2)
+    for i in range(3):
+        start_timeline(f"run-{i}")
+    assert list(timeline._active) == ["run-1", "run-2"]
+    evicted = get_timeline("run-0")
+    assert evicted is not None and not evicted.finished
+    assert timeline.active_timeline("run-0") is None
@@ -0,0 +1,235 @@
+"""
+运行耗时时间线（Chrome trace / Perfetto 格式）
+
+按运行记录图、节点、LLM 调用（含首 token 时间与 token 数）、文件下载/解析、知识库检索等阶段的耗时区间，
+可导出为 Chrome trace JSON（chrome://tracing、ui.perfetto.dev 直接打开）。
+- 时间戳取自 time.perf_counter（单调时钟），相对运行开始计时
+- 并行的区间分配到不同的 lane（trace 中的 tid），同一 lane 上的区间不会交叠
+- 节点、LLM 区间由 node_log.Logger 回调记录；文件与检索等工具代码通过 trace_span 记录，
+  按 write_log.request_context 中的 run_id 找到当前运行的时间线，未开启记录时为空操作
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.log.write_log import request_context
+
+# 是否为所有运行记录时间线（否则仅在请求头 X-Run-Trace: 1 时记录）
+RUN_TRACE_ENABLED = os.getenv("RUN_TRACE_ENABLED", "false").lower() in ("1", "true", "yes")
+# 按请求开启时间线记录的请求头
+RUN_TRACE_HEADER = "x-run-trace"
+# 进程内保留的已结束时间线数量
+RUN_TRACE_RETENTION = int(os.getenv("RUN_TRACE_RETENTION", "200"))
+# 单次运行最多记录的事件数
+RUN_TRACE_MAX_EVENTS = int(os.getenv("RUN_TRACE_MAX_EVENTS", "20000"))
+# 进程内同时进行中的时间线上限，超出时最早开始的转入已结束列表（finished 为 false）并停止记录
+RUN_TRACE_MAX_ACTIVE = int(os.getenv("RUN_TRACE_MAX_ACTIVE", "1000"))
+
+
+class Span:
+    """进行中的区间"""
+
+    __slots__ = ("name", "cat", "start", "lane", "args")
+
+    def __init__(self, name: str, cat: str, start: float, lane: int, args: Dict[str, Any]):
+        self.name = name
+        self.cat = cat
+        self.start = start
+        self.lane = lane
+        self.args = args
+
+
+class RunTimeline:
+    """单次运行的时间线（线程安全）"""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.origin = time.perf_counter()
+        self.started_at = time.time()
+        self.finished = False
+        self.dropped = 0
+        self._events: List[Dict[str, Any]] = []
+        self._lanes: List[bool] = []
+        self._lock = threading.Lock()
+
+    def _ts(self, t: float) -> float:
+        """相对运行开始的微秒数"""
+        return round((t - self.origin) * 1e6, 3)
+
+    def _append(self, event: Dict[str, Any]):
+        if len(self._events) >= RUN_TRACE_MAX_EVENTS:
+            self.dropped += 1
+            return
+        self._events.append(event)
+
+    def begin(self, name: str, cat: str, **args: Any) -> Span:
+        """开始一个区间，分配第一个空闲的 lane"""
+        with self._lock:
+            for lane, busy in enumerate(self._lanes):
+                if not busy:
+                    self._lanes[lane] = True
+                    break
+            else:
+                lane = len(self._lanes)
+                self._lanes.append(True)
+        return Span(name, cat, time.perf_counter(), lane, args)
+
+    def end(self, span: Optional[Span], **args: Any):
+        """结束区间并记录为 Chrome trace 的 complete 事件"""
+        if span is None:
+            return
+        end = time.perf_counter()
+        span.args.update(args)
+        with self._lock:
+            if span.lane < len(self._lanes):
+                self._lanes[span.lane] = False
+            self._append({
+                "name": span.name,
+                "cat": span.cat,
+                "ph": "X",
+                "ts": self._ts(span.start),
+                "dur": round((end - span.start) * 1e6, 3),
+                "pid": 1,
+                "tid": span.lane,
+                "args": span.args,
+            })
+
+    def instant(self, name: str, cat: str, lane: int = 0, **args: Any):
+        """记录瞬时事件（如首 token 到达）"""
+        with self._lock:
+            self._append({
+                "name": name,
+                "cat": cat,
+                "ph": "i",
+                "s": "t",
+                "ts": self._ts(time.perf_counter()),
+                "pid": 1,
+                "tid": lane,
+                "args": args,
+            })
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args: Any) -> Iterator[Span]:
+        span = self.begin(name, cat, **args)
+        try:
+            yield span
+        except BaseException as e:
+            span.args["error"] = type(e).__name__
+            raise
+        finally:
+            self.end(span)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """导出为 Chrome trace（JSON Object Format）"""
+        with self._lock:
+            events = sorted(self._events, key=lambda e: e["ts"])
+            lanes = len(self._lanes)
+        metadata: List[Dict[str, Any]] = [
+            {"name": "process_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": f"run {self.run_id}"}},
+        ]
+        for lane in range(max(1, lanes)):
+            metadata.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": lane, "args": {"name": f"lane {lane}"}})
+            metadata.append({"name": "thread_sort_index", "ph": "M", "pid": 1, "tid": lane, "args": {"sort_index": lane}})
+        return {
+            "traceEvents": metadata + events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "run_id": self.run_id,
+                "started_at": self.started_at,
+                "finished": self.finished,
+                "dropped_events": self.dropped,
+            },
+        }
+
+
+_active: "OrderedDict[str, RunTimeline]" = OrderedDict()
+_finished: "OrderedDict[str, RunTimeline]" = OrderedDict()
+_registry_lock = threading.Lock()
+
+
+def _retain(run_id: str, timeline: RunTimeline):
+    """转入有界的已结束列表（调用方持有 _registry_lock）"""
+    _finished[run_id] = timeline
+    while len(_finished) > RUN_TRACE_RETENTION:
+        _finished.popitem(last=False)
+
+
+def tracing_requested(header_value: Optional[str]) -> bool:
+    """根据全局开关与请求头判断是否记录本次运行的时间线"""
+    if RUN_TRACE_ENABLED:
+        return True
+    return (header_value or "").strip().lower() in ("1", "true", "yes")
+
+
+def start_timeline(run_id: str) -> RunTimeline:
+    """为运行创建时间线（已存在时返回已有的）"""
+    with _registry_lock:
+        timeline = _active.get(run_id)
+        if timeline is None:
+            timeline = RunTimeline(run_id)
+            _active[run_id] = timeline
+            while len(_active) > RUN_TRACE_MAX_ACTIVE:
+                evicted_id, evicted = _active.popitem(last=False)
+                _retain(evicted_id, evicted)
+        return timeline
+
+
+def get_timeline(run_id: Optional[str]) -> Optional[RunTimeline]:
+    """查找进行中或最近结束的时间线"""
+    if not run_id:
+        return None
+    with _registry_lock:
+        return _active.get(run_id) or _finished.get(run_id)
+
+
+def active_timeline(run_id: Optional[str]) -> Optional[RunTimeline]:
+    """查找进行中的时间线"""
+    if not run_id:
+        return None
+    return _active.get(run_id)
+
+
+def finish_timeline(run_id: Optional[str]):
+    """结束时间线并转入有界的已结束列表（可重复调用）"""
+    if not run_id:
+        return
+    with _registry_lock:
+        timeline = _active.pop(run_id, None)
+        if timeline is None:
+            return
+        timeline.finished = True
+        _retain(run_id, timeline)
+
+
+def current_timeline() -> Optional[RunTimeline]:
+    """当前请求上下文（write_log.request_context）对应的进行中时间线"""
+    ctx = request_context.get()
+    return active_timeline(ctx.run_id if ctx is not None else None)
+
+
+@contextmanager
+def trace_span(name: str, cat: str, **args: Any) -> Iterator[Optional[Span]]:
+    """在当前运行的时间线上记录区间；当前运行未开启时间线时不做任何事"""
+    timeline = current_timeline()
+    if timeline is None:
+        yield None
+        return
+    with timeline.span(name, cat, **args) as span:
+        yield span
+
+
+__all__ = [
+    "RunTimeline",
+    "Span",
+    "RUN_TRACE_HEADER",
+    "tracing_requested",
+    "start_timeline",
+    "get_timeline",
+    "active_timeline",
+    "finish_timeline",
+    "current_timeline",
+    "trace_span",
+]
@@ -0,0 +1,53 @@
+"""
+指标：进程内注册表与 Prometheus 文本格式导出
+
+指标按进程记录，样本带 worker 标签；多 worker 部署时由 SharedMetrics 合并各 worker 的快照，
+否则每个 worker 须单独抓取。
+"""
+
+from .registry import (
+    MetricsRegistry,
+    Counter,
+    Histogram,
+    CallbackGauge,
+    DEFAULT_BUCKETS,
+)
+from .metrics import (
+    REGISTRY,
+    GRAPH_RUN_DURATION,
+    NODE_DURATION,
+    LLM_CALL_DURATION,
+    LLM_TIME_TO_FIRST_TOKEN,
+    LLM_TOKENS,
+    LLM_TOKENS_TOTAL,
+    FILE_PARSE_DURATION,
+    KB_SEARCH_DURATION,
+    ERRORS_TOTAL,
+    ADMISSION_QUEUE_WAIT,
+    LOG_ENTRIES_DROPPED,
+)
+from .shared import SharedMetrics, default_shared_dir, METRICS_SHARED_DIR, METRICS_SNAPSHOT_INTERVAL
+
+__all__ = [
+    "MetricsRegistry",
+    "Counter",
+    "Histogram",
+    "CallbackGauge",
+    "DEFAULT_BUCKETS",
+    "REGISTRY",
+    "GRAPH_RUN_DURATION",
+    "NODE_DURATION",
+    "LLM_CALL_DURATION",
+    "LLM_TIME_TO_FIRST_TOKEN",
+    "LLM_TOKENS",
+    "LLM_TOKENS_TOTAL",
+    "FILE_PARSE_DURATION",
+    "KB_SEARCH_DURATION",
+    "ERRORS_TOTAL",
+    "ADMISSION_QUEUE_WAIT",
+    "LOG_ENTRIES_DROPPED",
+    "SharedMetrics",
+    "default_shared_dir",
+    "METRICS_SHARED_DIR",
+    "METRICS_SNAPSHOT_INTERVAL",
+]
@@ -0,0 +1,88 @@
+"""
+服务指标定义
+
+所有指标注册在进程级的 REGISTRY 上，由 /metrics 导出。指标是进程内的：
+每个样本带 worker 标签（主机名:进程号，与运行登记表中的 worker_id 一致），
+多 worker 部署时由 SharedMetrics 合并各 worker 的快照（见 utils.metrics.shared）。
+"""
+import os
+
+from utils.runs.registry import current_worker_id
+
+from .registry import MetricsRegistry
+
+# 标识进程的常量标签名，设为空字符串时不附加
+METRICS_WORKER_LABEL = os.getenv("METRICS_WORKER_LABEL", "worker")
+
+REGISTRY = MetricsRegistry(
+    const_labels=(lambda: {METRICS_WORKER_LABEL: current_worker_id()}) if METRICS_WORKER_LABEL else None
+)
+
+# token 数分桶
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+GRAPH_RUN_DURATION = REGISTRY.histogram(
+    "graph_run_duration_seconds",
+    "Duration of whole graph runs",
+    ["method", "status"],
+)
+
+NODE_DURATION = REGISTRY.histogram(
+    "graph_node_duration_seconds",
+    "Duration of graph node executions",
+    ["node", "status"],
+)
+
+LLM_CALL_DURATION = REGISTRY.histogram(
+    "llm_call_duration_seconds",
+    "Duration of LLM calls",
+    ["node", "model", "status"],
+)
+
+LLM_TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from LLM call start to the first streamed token",
+    ["node", "model"],
+)
+
+LLM_TOKENS = REGISTRY.histogram(
+    "llm_tokens",
+    "Tokens per LLM call",
+    ["node", "kind"],
+    buckets=TOKEN_BUCKETS,
+)
+
+LLM_TOKENS_TOTAL = REGISTRY.counter(
+    "llm_tokens_total",
+    "Total tokens consumed by LLM calls",
+    ["node", "kind"],
+)
+
+FILE_PARSE_DURATION = REGISTRY.histogram(
+    "file_parse_duration_seconds",
+    "Duration of document text extraction",
+    ["file_type", "structured"],
+)
+
+KB_SEARCH_DURATION = REGISTRY.histogram(
+    "kb_search_duration_seconds",
+    "Latency of knowledge base searches",
+    ["op", "mode"],
+)
+
+ERRORS_TOTAL = REGISTRY.counter(
+    "errors_total",
+    "Errors classified by ErrorClassifier",
+    ["code", "category"],
+)
+
+ADMISSION_QUEUE_WAIT = REGISTRY.histogram(
+    "admission_queue_wait_seconds",
+    "Time requests wait for an execution slot",
+    ["priority", "outcome"],
+)
+
+LOG_ENTRIES_DROPPED = REGISTRY.counter(
+    "log_entries_dropped_total",
+    "Event log entries dropped because the log buffer was full",
+)
@@ -0,0 +1,268 @@
+"""
+进程内指标注册表
+
+提供 Counter / Histogram / 回调式 Gauge，并按 Prometheus 文本格式（0.0.4）导出。
+记录路径不加锁：每个线程写自己的分片（threading.local），只有线程第一次写某个指标时
+登记分片需要加锁；导出时再合并所有分片。
+导出时可为所有样本附加常量标签（如 worker），多进程的样本合并后仍可区分来源。
+"""
+import bisect
+import math
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+LabelPairs = Sequence[Tuple[str, str]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: LabelPairs = ()) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(str(v))}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类：管理各线程的分片"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _snapshots(self) -> List[dict]:
+        with self._lock:
+            shards = list(self._shards)
+        # dict.copy 在持有 GIL 时完成，不会与写入线程的插入冲突
+        return [shard.copy() for shard in shards]
+
+    def render(self, const_labels: LabelPairs = ()) -> List[str]:
+        """导出样本行，const_labels 附加在每个样本的标签之后"""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+    def collect(self) -> Dict[LabelValues, float]:
+        merged: Dict[LabelValues, float] = {}
+        for shard in self._snapshots():
+            for key, value in shard.items():
+                merged[key] = merged.get(key, 0.0) + value
+        return merged
+
+    def render(self, const_labels: LabelPairs = ()) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key, const_labels)} {_format_value(value)}"
+            for key, value in sorted(self.collect().items())
+        ]
+
+
+class Histogram(_Metric):
+    """分桶直方图（每个分片按标签保存 [各桶计数..., 总和, 次数]）"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str):
+        shard = self._shard()
+        key = self._key(labels)
+        cells = shard.get(key)
+        if cells is None:
+            cells = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            shard[key] = cells
+        cells[bisect.bisect_left(self.buckets, value)] += 1
+        cells[-2] += value
+        cells[-1] += 1
+
+    def collect(self) -> Dict[LabelValues, List[float]]:
+        merged: Dict[LabelValues, List[float]] = {}
+        for shard in self._snapshots():
+            for key, cells in shard.items():
+                cells = list(cells)
+                total = merged.get(key)
+                if total is None:
+                    merged[key] = cells
+                else:
+                    for i, value in enumerate(cells):
+                        total[i] += value
+        return merged
+
+    def render(self, const_labels: LabelPairs = ()) -> List[str]:
+        lines = []
+        for key, cells in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), cells):
+                cumulative += count
+                le = (*const_labels, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key, const_labels)
+            lines.append(f"{self.name}_sum{labels} {_format_value(cells[-2])}")
+            lines.append(f"{self.name}_count{labels} {int(cells[-1])}")
+        return lines
+
+
+GaugeValue = Union[float, Dict[LabelValues, float]]
+
+
+class CallbackGauge(_Metric):
+    """导出时调用回调取值的 Gauge（用于队列深度、执行中数量等瞬时值）"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], GaugeValue], labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def render(self, const_labels: LabelPairs = ()) -> List[str]:
+        value = self.func()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key, const_labels)} {_format_value(float(v))}"
+            for key, v in sorted(items)
+        ]
+
+
+class MetricsRegistry:
+    """指标注册表：同名指标重复注册时返回已有实例"""
+
+    def __init__(self, const_labels: Optional[Callable[[], Dict[str, str]]] = None):
+        """
+        Args:
+            const_labels: 导出时附加到所有样本的常量标签（导出时调用，fork 出的子进程取到自己的值）
+        """
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self.const_labels = const_labels
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        func: Callable[[], GaugeValue],
+        labelnames: Sequence[str] = (),
+    ) -> CallbackGauge:
+        """注册回调式 Gauge，同名时替换回调"""
+        with self._lock:
+            metric = CallbackGauge(name, documentation, func, labelnames)
+            self._metrics[name] = metric
+            return metric
+
+    def metrics(self) -> Iterable[_Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def families(self) -> List[Dict[str, Any]]:
+        """
+        导出全部指标的样本（可序列化为 JSON，供多进程合并）
+
+        Returns:
+            每个指标一项：name、type、help、samples（样本行）；采集失败时为 name、error
+        """
+        const_labels = tuple(sorted(self.const_labels().items())) if self.const_labels else ()
+        families = []
+        for metric in self.metrics():
+            try:
+                samples = metric.render(const_labels)
+            except Exception as e:
+                families.append({"name": metric.name, "error": str(e)})
+                continue
+            families.append({
+                "name": metric.name,
+                "type": metric.type_name,
+                "help": metric.documentation,
+                "samples": samples,
+            })
+        return families
+
+    @staticmethod
+    def format_families(families: Iterable[Dict[str, Any]]) -> str:
+        """按 Prometheus 文本格式输出，同名指标（来自不同进程）合并为一组，HELP/TYPE 只输出一次"""
+        merged: Dict[str, Dict[str, Any]] = {}
+        errors: List[str] = []
+        for family in families:
+            if "error" in family:
+                errors.append(f"# {family['name']} collection failed: {_escape(family['error'])}")
+                continue
+            target = merged.get(family["name"])
+            if target is None:
+                merged[family["name"]] = {**family, "samples": list(family["samples"])}
+            else:
+                target["samples"].extend(family["samples"])
+        lines: List[str] = list(errors)
+        for name, family in merged.items():
+            lines.append(f"# HELP {name} {_escape(family['help'])}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            lines.extend(family["samples"])
+        return "\n".join(lines) + "\n"
+
+    def render(self) -> str:
+        """按 Prometheus 文本格式导出全部指标"""
+        return self.format_families(self.families())
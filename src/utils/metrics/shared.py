@@ -0,0 +1,94 @@
+"""
+多 worker 指标合并
+
+REGISTRY 中的指标只属于当前进程。uvicorn 多 worker 共用一个监听端口，抓取请求落到哪个 worker 是随机的，
+直接抓取只能得到其中一个进程的数据。启用后每个 worker 定期把自己的指标快照写入共享目录，
+/metrics 合并所有存活 worker 的快照（样本带 worker 标签区分），一次抓取即可得到全部 worker 的指标；
+/metrics?scope=local 只返回处理该请求的 worker 自己的指标。
+
+快照超过 METRICS_SNAPSHOT_STALE_AFTER 未更新的 worker 视为已退出，不再合并；其计数器随之消失，
+Prometheus 按新的 worker 标签视为新的时间序列。
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from .registry import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# 快照共享目录，为空时多 worker 部署使用临时目录下的 graph_metrics（同机多套部署须分别设置）
+METRICS_SHARED_DIR = os.getenv("METRICS_SHARED_DIR", "")
+# 快照写入间隔（秒）
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "5"))
+# 快照超过该时间（秒）未更新的 worker 不再合并，超过 10 倍时删除其快照文件
+METRICS_SNAPSHOT_STALE_AFTER = float(os.getenv("METRICS_SNAPSHOT_STALE_AFTER", "30"))
+
+
+def default_shared_dir() -> str:
+    """未设置 METRICS_SHARED_DIR 时使用的共享目录"""
+    return METRICS_SHARED_DIR or os.path.join(tempfile.gettempdir(), "graph_metrics")
+
+
+class SharedMetrics:
+    """把本进程指标快照写入共享目录，并合并所有存活 worker 的快照"""
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        directory: str,
+        worker_id: str,
+        stale_after: float = METRICS_SNAPSHOT_STALE_AFTER,
+    ):
+        self.registry = registry
+        self.directory = directory
+        self.worker_id = worker_id
+        self.stale_after = stale_after
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, worker_id: str) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in worker_id)
+        return os.path.join(self.directory, f"{safe}.json")
+
+    def write_snapshot(self):
+        """原子写入本进程的指标快照"""
+        path = self._path(self.worker_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"worker_id": self.worker_id, "families": self.registry.families()}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def remove_snapshot(self):
+        """进程退出时删除自己的快照"""
+        try:
+            os.remove(self._path(self.worker_id))
+        except OSError:
+            pass
+
+    def _peer_families(self) -> List[Dict[str, Any]]:
+        """读取其他存活 worker 的快照，顺带删除早已退出的 worker 留下的文件"""
+        own = self._path(self.worker_id)
+        now = time.time()
+        families: List[Dict[str, Any]] = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == own or not name.endswith(".json"):
+                continue
+            try:
+                age = now - os.path.getmtime(path)
+                if age > self.stale_after:
+                    if age > self.stale_after * 10:
+                        os.remove(path)
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    families.extend(json.load(f).get("families", []))
+            except (OSError, ValueError) as e:
+                logger.debug(f"Skipped metrics snapshot {name}: {e}")
+        return families
+
+    def render(self) -> str:
+        """合并本进程的实时指标与其他存活 worker 的快照"""
+        return MetricsRegistry.format_families(self.registry.families() + self._peer_families())
@@ -0,0 +1,81 @@
+"""
+指标注册表测试：分片合并、导出格式、worker 标签与多进程快照合并
+"""
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.metrics.registry import MetricsRegistry
+from utils.metrics.shared import SharedMetrics
+
+
+def test_counter_merges_thread_shards():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests", ["route"])
+
+    def work():
+        for _ in range(1000):
+            counter.inc(route="/run")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    counter.inc(2, route="/stream_run")
+    assert counter.collect() == {("/run",): 4000.0, ("/stream_run",): 2.0}
+    assert registry.counter("requests_total", "Requests", ["route"]) is counter
+
+
+def test_histogram_and_gauge_render():
+    registry = MetricsRegistry()
+    hist = registry.histogram("latency_seconds", "Latency", ["op"], buckets=(0.1, 1.0))
+    hist.observe(0.05, op="a")
+    hist.observe(0.5, op="a")
+    registry.gauge("queue_depth", "Depth", lambda: {("high",): 2, ("low",): 0}, ["priority"])
+    registry.gauge("broken", "Broken", lambda: 1 / 0)
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{op="a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{op="a",le="+Inf"} 2' in lines
+    assert 'latency_seconds_count{op="a"} 2' in lines
+    assert 'queue_depth{priority="high"} 2' in lines
+    assert any(line.startswith("# broken collection failed") for line in lines)
+    assert lines.count("# TYPE latency_seconds histogram") == 1
+
+
+def test_const_labels_added_to_every_sample():
+    """常量标签附加在所有样本上，直方图的 le 保持在最后"""
+    registry = MetricsRegistry(const_labels=lambda: {"worker": "host:1"})
+    registry.counter("c_total", "C").inc()
+    registry.histogram("h", "H", buckets=(1.0,)).observe(0.5)
+    lines = registry.render().splitlines()
+    assert 'c_total{worker="host:1"} 1' in lines
+    assert 'h_bucket{worker="host:1",le="1"} 1' in lines
+
+
+def test_shared_metrics_merges_live_workers(tmp_path):
+    """多个 worker 的快照合并为一份输出，同名指标的 HELP/TYPE 只出现一次，过期快照不合并"""
+    workers = []
+    for worker_id in ("host:1", "host:2", "host:3"):
+        registry = MetricsRegistry(const_labels=lambda w=worker_id: {"worker": w})
+        registry.counter("runs_total", "Runs").inc()
+        shared = SharedMetrics(registry, str(tmp_path), worker_id, stale_after=60)
+        shared.write_snapshot()
+        workers.append(shared)
+    stale = workers[2]._path("host:3")
+    os.utime(stale, (time.time() - 120, time.time() - 120))
+
+    lines = workers[0].render().splitlines()
+    assert lines.count("# TYPE runs_total counter") == 1
+    assert 'runs_total{worker="host:1"} 1' in lines
+    assert 'runs_total{worker="host:2"} 1' in lines
+    assert 'runs_total{worker="host:3"} 1' not in lines
+
+    workers[1].remove_snapshot()
+    assert 'runs_total{worker="host:2"} 1' not in workers[0].render().splitlines()
@@ -2,7 +2,7 @@
 
 import json
 import time
-from typing import Iterator, Optional, List, Dict, Any
+from typing import AsyncIterator, Iterator, Optional, List, Dict, Any
 
 from utils.openai.types.response import (
     ChatCompletionChunk,
@@ -25,6 +25,7 @@ class ResponseConverter:
         self.model = model
         self.created = int(time.time())
         self._sent_role = False  # 是否已发送 assistant role
+        self._sent_finish_reason = False  # 是否已发送过 finish_reason（tool_calls 或 stop）
         # 工具调用流式状态
         self._current_tool_calls: Dict[int, Dict[str, Any]] = {}  # index -> {id, name, args}
 
@@ -61,36 +62,54 @@ class ResponseConverter:
         Yields:
             SSE 格式字符串
         """
-        # 跟踪是否已发送过 finish_reason（tool_calls 或 stop）
-        sent_finish_reason = False
-
         for item in items:
-            chunk, meta = item
-            chunk_type = chunk.__class__.__name__
-
-            # 过滤 tools 节点的消息
-            if (meta or {}).get("langgraph_node") == "tools":
-                # 但是 ToolMessage 需要处理
-                if chunk_type != "ToolMessage":
-                    continue
+            yield from self.feed_langgraph_item(item)
+        yield from self.finish_langgraph_stream()
 
-            # 处理前检查是否有工具调用（用于判断是否会发送 tool_calls finish_reason）
-            had_tool_calls_before = bool(self._current_tool_calls)
+    async def aiter_langgraph_stream(
+        self, items: AsyncIterator[Any]
+    ) -> AsyncIterator[str]:
+        """
+        iter_langgraph_stream 的异步版本，直接消费 graph.astream(stream_mode="messages") 的输出
 
-            for sse_chunk in self._process_langgraph_chunk(chunk, meta):
+        Yields:
+            SSE 格式字符串
+        """
+        async for item in items:
+            for sse_chunk in self.feed_langgraph_item(item):
                 yield sse_chunk
+        for sse_chunk in self.finish_langgraph_stream():
+            yield sse_chunk
 
-            # 检查是否在处理过程中发送了 tool_calls finish_reason
-            is_last = (meta or {}).get("chunk_position") == "last"
-            if chunk_type == "AIMessageChunk" and is_last and had_tool_calls_before:
-                # 处理过程中发送了 tool_calls finish_reason，重置标记
-                sent_finish_reason = True
-            elif chunk_type == "ToolMessage":
-                # ToolMessage 后面还会有 assistant 消息，重置标记
-                sent_finish_reason = False
+    def feed_langgraph_item(self, item: Any) -> Iterator[str]:
+        """处理流中的一个 (chunk, metadata) 元素"""
+        chunk, meta = item
+        chunk_type = chunk.__class__.__name__
+
+        # 过滤 tools 节点的消息
+        if (meta or {}).get("langgraph_node") == "tools":
+            # 但是 ToolMessage 需要处理
+            if chunk_type != "ToolMessage":
+                return
+
+        # 处理前检查是否有工具调用（用于判断是否会发送 tool_calls finish_reason）
+        had_tool_calls_before = bool(self._current_tool_calls)
+
+        yield from self._process_langgraph_chunk(chunk, meta)
+
+        # 检查是否在处理过程中发送了 tool_calls finish_reason
+        is_last = (meta or {}).get("chunk_position") == "last"
+        if chunk_type == "AIMessageChunk" and is_last and had_tool_calls_before:
+            # 处理过程中发送了 tool_calls finish_reason，重置标记
+            self._sent_finish_reason = True
+        elif chunk_type == "ToolMessage":
+            # ToolMessage 后面还会有 assistant 消息，重置标记
+            self._sent_finish_reason = False
 
+    def finish_langgraph_stream(self) -> Iterator[str]:
+        """流结束：补发 finish_reason 和 [DONE]"""
         # 流结束时，如果发送过 role 但没有发送过 finish_reason，发送 stop
-        if self._sent_role and not sent_finish_reason:
+        if self._sent_role and not self._sent_finish_reason:
             yield self._chunk_to_sse(self._create_chunk(Delta(), finish_reason="stop"))
 
         yield "data: [DONE]\n\n"
@@ -2,8 +2,6 @@
 
 import asyncio
 import logging
-import threading
-import contextvars
 from typing import Dict, Any, Union, AsyncGenerator
 
 from fastapi.responses import StreamingResponse, JSONResponse
@@ -13,6 +11,7 @@ from utils.openai.types.response import OpenAIError, OpenAIErrorResponse
 from utils.openai.converter.request_converter import RequestConverter
 from utils.openai.converter.response_converter import ResponseConverter
 from utils.error import classify_error
+from utils.helper.stream_helper import buffered_aiter
 
 logger = logging.getLogger(__name__)
 
@@ -95,6 +94,22 @@ class OpenAIChatHandler:
             logger.error(f"Error in OpenAIChatHandler.handle: {e}", exc_info=True)
             return self._handle_error(e)
 
+    def _prepare_run(self, session_id: str, ctx: Context):
+        """获取 graph 并生成运行配置"""
+        from utils.helper import graph_helper
+        graph = self.graph_service._get_graph(ctx)
+
+        if graph_helper.is_agent_proj():
+            from utils.log.loop_trace import init_agent_config
+            run_config = init_agent_config(graph, ctx)
+        else:
+            from utils.log.loop_trace import init_run_config
+            run_config = init_run_config(graph, ctx)
+
+        run_config["recursion_limit"] = 100
+        run_config["configurable"] = {"thread_id": session_id}
+        return graph, run_config
+
     def _handle_stream(
         self,
         stream_input: Dict[str, Any],
@@ -105,67 +120,36 @@ class OpenAIChatHandler:
         """流式响应处理"""
 
         async def stream_generator() -> AsyncGenerator[str, None]:
-            """异步流式生成器"""
-            loop = asyncio.get_running_loop()
-            queue: asyncio.Queue = asyncio.Queue()
-            context = contextvars.copy_context()
-
-            def producer():
-                """后台线程生产者"""
-                try:
-                    # 获取 graph 并配置
-                    from utils.helper import graph_helper
-                    graph = self.graph_service._get_graph(ctx)
-
-                    if graph_helper.is_agent_proj():
-                        from utils.log.loop_trace import init_agent_config
-                        run_config = init_agent_config(graph, ctx)
-                    else:
-                        from utils.log.loop_trace import init_run_config
-                        run_config = init_run_config(graph, ctx)
-
-                    run_config["recursion_limit"] = 100
-                    run_config["configurable"] = {"thread_id": session_id}
-
-                    # 流式执行 - 直接使用 LangGraph 原始流
-                    items = graph.stream(
-                        stream_input,
-                        stream_mode="messages",
-                        config=run_config,
-                        context=ctx,
-                    )
-
-                    # 使用 iter_langgraph_stream 方法，支持工具参数流式输出
-                    for sse_data in response_converter.iter_langgraph_stream(items):
-                        if sse_data != "data: [DONE]\n\n":  # 不在这里发送 DONE
-                            loop.call_soon_threadsafe(queue.put_nowait, sse_data)
-
-                except Exception as ex:
-                    logger.error(f"Stream producer error: {ex}", exc_info=True)
-                    err = classify_error(ex, {"node_name": "openai_stream"})
-                    error_chunk = self._create_error_sse_chunk(
-                        str(err.code),
-                        str(ex),
-                        response_converter.request_id,
-                    )
-                    loop.call_soon_threadsafe(queue.put_nowait, error_chunk)
-                finally:
-                    loop.call_soon_threadsafe(queue.put_nowait, "data: [DONE]\n\n")
-                    loop.call_soon_threadsafe(queue.put_nowait, None)
-
-            # 启动后台线程
-            threading.Thread(target=lambda: context.run(producer), daemon=True).start()
-
-            # 从队列消费
+            """异步流式生成器：在事件循环上直接执行 graph.astream，经有界队列输出"""
             try:
-                while True:
-                    item = await queue.get()
-                    if item is None:
-                        break
-                    yield item
+                graph, run_config = self._prepare_run(session_id, ctx)
+
+                # 流式执行 - 直接使用 LangGraph 原始异步流
+                items = graph.astream(
+                    stream_input,
+                    stream_mode="messages",
+                    config=run_config,
+                    context=ctx,
+                )
+
+                # 使用 aiter_langgraph_stream 方法，支持工具参数流式输出
+                async for sse_data in buffered_aiter(response_converter.aiter_langgraph_stream(items)):
+                    if sse_data != "data: [DONE]\n\n":  # 不在这里发送 DONE
+                        yield sse_data
+
             except asyncio.CancelledError:
                 logger.info(f"Stream cancelled for run_id: {ctx.run_id}")
                 raise
+            except Exception as ex:
+                logger.error(f"Stream producer error: {ex}", exc_info=True)
+                err = classify_error(ex, {"node_name": "openai_stream"})
+                yield self._create_error_sse_chunk(
+                    str(err.code),
+                    str(ex),
+                    response_converter.request_id,
+                )
+
+            yield "data: [DONE]\n\n"
 
         return StreamingResponse(
             stream_generator(),
@@ -180,56 +164,25 @@ class OpenAIChatHandler:
         ctx: Context,
     ) -> JSONResponse:
         """非流式响应处理"""
-        loop = asyncio.get_running_loop()
-        context = contextvars.copy_context()
-        result_future: asyncio.Future = loop.create_future()
+        try:
+            graph, run_config = self._prepare_run(session_id, ctx)
 
-        def producer():
-            """后台线程生产者"""
-            try:
-                # 获取 graph 并配置
-                from utils.helper import graph_helper
-                graph = self.graph_service._get_graph(ctx)
-
-                if graph_helper.is_agent_proj():
-                    from utils.log.loop_trace import init_agent_config
-                    run_config = init_agent_config(graph, ctx)
-                else:
-                    from utils.log.loop_trace import init_run_config
-                    run_config = init_run_config(graph, ctx)
-
-                run_config["recursion_limit"] = 100
-                run_config["configurable"] = {"thread_id": session_id}
-
-                # 流式执行 - 直接使用 LangGraph 原始流
-                items = graph.stream(
+            # 流式执行 - 直接使用 LangGraph 原始异步流
+            items = [
+                item async for item in graph.astream(
                     stream_input,
                     stream_mode="messages",
                     config=run_config,
                     context=ctx,
                 )
+            ]
 
-                # 使用 collect_langgraph_to_response 方法收集结果
-                response = response_converter.collect_langgraph_to_response(items)
-                loop.call_soon_threadsafe(
-                    result_future.set_result,
-                    response.to_dict()
-                )
+            # 使用 collect_langgraph_to_response 方法收集结果
+            response = response_converter.collect_langgraph_to_response(items)
+            return JSONResponse(content=response.to_dict())
 
-            except Exception as ex:
-                logger.error(f"Non-stream producer error: {ex}", exc_info=True)
-                loop.call_soon_threadsafe(
-                    result_future.set_exception,
-                    ex
-                )
-
-        # 启动后台线程
-        threading.Thread(target=lambda: context.run(producer), daemon=True).start()
-
-        try:
-            result = await result_future
-            return JSONResponse(content=result)
         except Exception as e:
+            logger.error(f"Non-stream producer error: {e}", exc_info=True)
             return self._handle_error(e)
 
     def _handle_error(self, error: Exception) -> JSONResponse:
@@ -0,0 +1,43 @@
+"""
+运行管理：多 worker 共享的运行登记表（归属、状态、取消标志）与准入控制
+"""
+
+from .registry import (
+    RunRegistry,
+    InMemoryRunRegistry,
+    SQLiteRunRegistry,
+    get_run_registry,
+    current_worker_id,
+    RUN_STATUS_RUNNING,
+    RUN_STATUS_COMPLETED,
+    RUN_STATUS_CANCELLED,
+    RUN_STATUS_FAILED,
+    RUN_STATUS_TIMEOUT,
+)
+from .admission import (
+    AdmissionController,
+    AdmissionRejected,
+    parse_priority,
+    PRIORITY_HEADER,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BATCH,
+)
+
+__all__ = [
+    "RunRegistry",
+    "InMemoryRunRegistry",
+    "SQLiteRunRegistry",
+    "get_run_registry",
+    "current_worker_id",
+    "RUN_STATUS_RUNNING",
+    "RUN_STATUS_COMPLETED",
+    "RUN_STATUS_CANCELLED",
+    "RUN_STATUS_FAILED",
+    "RUN_STATUS_TIMEOUT",
+    "AdmissionController",
+    "AdmissionRejected",
+    "parse_priority",
+    "PRIORITY_HEADER",
+    "PRIORITY_INTERACTIVE",
+    "PRIORITY_BATCH",
+]
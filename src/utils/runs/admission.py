@@ -0,0 +1,189 @@
+"""
+准入控制（Admission Control）
+
+限制每个进程同时执行的图运行数，超出的请求进入有界的优先级等待队列：
+- 交互式请求（interactive）排在批量请求（batch）之前
+- 队列已满时，交互式请求可挤出队尾的批量请求；否则直接拒绝
+- 等待超过 ADMISSION_QUEUE_TIMEOUT 的请求被拒绝
+被拒绝的请求由 HTTP 层返回 429 和 Retry-After，过载时延迟平稳上升而不是进程被拖垮。
+"""
+import asyncio
+import bisect
+import itertools
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每个进程同时执行的图运行数上限
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "8"))
+# 等待队列长度上限
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+# 排队等待超时（秒）
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+# 没有历史耗时数据时建议的重试间隔（秒）
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+# 请求优先级请求头
+PRIORITY_HEADER = "x-request-priority"
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+
+# 数值越小越优先
+_PRIORITY_RANK = {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 1}
+
+# 运行耗时滑动平均的平滑系数
+_EWMA_ALPHA = 0.2
+# Retry-After 上限（秒）
+_MAX_RETRY_AFTER = 120
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入（队列已满、排队超时或被更高优先级请求挤出）"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Admission rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_priority(value: Optional[str], default: str = PRIORITY_BATCH) -> str:
+    """解析优先级请求头，无法识别时使用默认值"""
+    value = (value or "").strip().lower()
+    return value if value in _PRIORITY_RANK else default
+
+
+class AdmissionController:
+    """单进程的准入控制器（在同一个事件循环中使用）"""
+
+    def __init__(
+        self,
+        max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        # 按 (优先级, 序号) 有序的等待者列表
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._avg_run_seconds: Optional[float] = None
+        self._counters: Dict[str, int] = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "evicted": 0,
+        }
+
+    def _retry_after(self) -> int:
+        """按平均运行耗时与排队长度估算重试间隔"""
+        if self._avg_run_seconds is None:
+            return ADMISSION_RETRY_AFTER
+        waves = (len(self._waiters) + 1) / self.max_concurrency
+        return max(1, min(_MAX_RETRY_AFTER, math.ceil(self._avg_run_seconds * waves)))
+
+    def _remove_waiter(self, fut: asyncio.Future) -> bool:
+        for i, (_, _, waiter) in enumerate(self._waiters):
+            if waiter is fut:
+                del self._waiters[i]
+                return True
+        return False
+
+    async def acquire(self, priority: str = PRIORITY_BATCH):
+        """
+        获取执行名额
+
+        Raises:
+            AdmissionRejected: 队列已满、排队超时或被挤出
+        """
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            self._counters["admitted"] += 1
+            return
+
+        rank = _PRIORITY_RANK.get(priority, _PRIORITY_RANK[PRIORITY_BATCH])
+        if len(self._waiters) >= self.max_queue:
+            # 队列已满：挤出优先级更低的队尾请求，否则拒绝自身
+            if self._waiters and self._waiters[-1][0] > rank:
+                _, _, victim = self._waiters.pop()
+                if not victim.done():
+                    victim.set_exception(AdmissionRejected("evicted", self._retry_after()))
+                self._counters["evicted"] += 1
+            else:
+                self._counters["rejected_queue_full"] += 1
+                raise AdmissionRejected("queue_full", self._retry_after())
+
+        fut = asyncio.get_running_loop().create_future()
+        bisect.insort(self._waiters, (rank, next(self._seq), fut))
+        self._counters["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                # 超时与分配名额同时发生：名额已归属本请求
+                self._counters["admitted"] += 1
+                return
+            self._remove_waiter(fut)
+            fut.cancel()
+            self._counters["rejected_timeout"] += 1
+            raise AdmissionRejected("queue_timeout", self._retry_after())
+        except asyncio.CancelledError:
+            # 客户端断开：名额已分配则归还，否则退出队列
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self.release()
+            else:
+                self._remove_waiter(fut)
+                fut.cancel()
+            raise
+        self._counters["admitted"] += 1
+
+    def release(self, run_seconds: Optional[float] = None):
+        """归还执行名额，并直接转交给队首等待者"""
+        if run_seconds is not None:
+            if self._avg_run_seconds is None:
+                self._avg_run_seconds = run_seconds
+            else:
+                self._avg_run_seconds += _EWMA_ALPHA * (run_seconds - self._avg_run_seconds)
+
+        while self._waiters:
+            _, _, fut = self._waiters.pop(0)
+            if not fut.done():
+                # in_flight 不变：名额从当前请求转交给等待者
+                fut.set_result(True)
+                return
+        self.in_flight = max(0, self.in_flight - 1)
+
+    @asynccontextmanager
+    async def slot(self, priority: str = PRIORITY_BATCH) -> AsyncIterator[None]:
+        """获取名额，退出时归还"""
+        await self.acquire(priority)
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.release(time.time() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        """当前的执行数、排队数与累计计数"""
+        queued_by_priority = {name: 0 for name in _PRIORITY_RANK}
+        names = {rank: name for name, rank in _PRIORITY_RANK.items()}
+        for rank, _, fut in self._waiters:
+            if not fut.done():
+                queued_by_priority[names[rank]] += 1
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": sum(queued_by_priority.values()),
+            "queue_depth_by_priority": queued_by_priority,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "avg_run_seconds": round(self._avg_run_seconds, 3) if self._avg_run_seconds is not None else None,
+            **self._counters,
+        }
@@ -0,0 +1,345 @@
+"""
+运行登记表（Run Registry）
+
+记录每个 run 的归属进程、状态和取消标志，使多 worker 部署下 /cancel 与状态查询
+不依赖请求落在哪个进程：
+- InMemoryRunRegistry：进程内实现，单 worker 时使用
+- SQLiteRunRegistry：多进程共享的本地 SQLite 表（WAL 模式），各 worker 定期轮询
+  属于自己且被请求取消的 run，并取消本进程内对应的任务
+
+worker 租约：各 worker 定期续约（heartbeat），超过 RUN_REGISTRY_LEASE_TTL 未续约的 worker 视为已退出，
+查询、取消或清理时把它仍处于 running 的记录标记为 failed，不会永远停留在 running。
+"""
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 登记表后端：memory / sqlite，为空时按 worker 数自动选择
+RUN_REGISTRY_BACKEND = os.getenv("RUN_REGISTRY_BACKEND", "")
+# SQLite 登记表路径
+RUN_REGISTRY_PATH = os.getenv("RUN_REGISTRY_PATH", os.path.join(tempfile.gettempdir(), "run_registry.db"))
+# 已结束 run 的保留时间（秒）
+RUN_REGISTRY_RETENTION = float(os.getenv("RUN_REGISTRY_RETENTION", "86400"))
+# worker 租约有效期（秒），须明显大于续约间隔（RUN_REGISTRY_HEARTBEAT_INTERVAL）
+RUN_REGISTRY_LEASE_TTL = float(os.getenv("RUN_REGISTRY_LEASE_TTL", "30"))
+
+RUN_STATUS_RUNNING = "running"
+RUN_STATUS_COMPLETED = "completed"
+RUN_STATUS_CANCELLED = "cancelled"
+RUN_STATUS_FAILED = "failed"
+RUN_STATUS_TIMEOUT = "timeout"
+
+
+def current_worker_id() -> str:
+    """当前 worker 标识：主机名:进程号"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class RunRegistry:
+    """运行登记表接口"""
+
+    # 是否跨进程共享（共享时需要轮询取消标志）
+    shared = False
+
+    def register(self, run_id: str, method: str = "", worker_id: Optional[str] = None):
+        """登记一个开始执行的 run"""
+        raise NotImplementedError
+
+    def finish(self, run_id: str, status: str = RUN_STATUS_COMPLETED, message: str = ""):
+        """标记 run 结束"""
+        raise NotImplementedError
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """查询 run 记录，不存在时返回 None"""
+        raise NotImplementedError
+
+    def request_cancel(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """
+        设置取消标志
+
+        Returns:
+            设置前的 run 记录；不存在时返回 None
+        """
+        raise NotImplementedError
+
+    def pending_cancels(self, worker_id: str) -> List[str]:
+        """查询属于指定 worker、仍在运行且被请求取消的 run"""
+        raise NotImplementedError
+
+    def cleanup(self, retention: float = RUN_REGISTRY_RETENTION) -> int:
+        """删除结束超过保留时间的记录，返回删除数量"""
+        raise NotImplementedError
+
+    def heartbeat(self, worker_id: str):
+        """续约 worker 租约（不跨进程共享的实现中持有者就是本进程，无需续约）"""
+
+    def claim_worker(self, worker_id: str) -> int:
+        """
+        worker 启动时调用：同一 worker_id 的旧进程（如容器内复用的进程号）遗留的 running 记录标记为 failed
+
+        Returns:
+            标记的记录数
+        """
+        return 0
+
+
+class InMemoryRunRegistry(RunRegistry):
+    """进程内登记表"""
+
+    def __init__(self):
+        self._runs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, run_id: str, method: str = "", worker_id: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            self._runs[run_id] = {
+                "run_id": run_id,
+                "worker_id": worker_id or current_worker_id(),
+                "method": method,
+                "status": RUN_STATUS_RUNNING,
+                "cancel_requested": False,
+                "message": "",
+                "created_at": now,
+                "updated_at": now,
+            }
+
+    def finish(self, run_id: str, status: str = RUN_STATUS_COMPLETED, message: str = ""):
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None:
+                run.update(status=status, message=message, updated_at=time.time())
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            run = self._runs.get(run_id)
+            return dict(run) if run is not None else None
+
+    def request_cancel(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None:
+                return None
+            before = dict(run)
+            if run["status"] == RUN_STATUS_RUNNING:
+                run.update(cancel_requested=True, updated_at=time.time())
+            return before
+
+    def pending_cancels(self, worker_id: str) -> List[str]:
+        with self._lock:
+            return [
+                run_id for run_id, run in self._runs.items()
+                if run["worker_id"] == worker_id and run["status"] == RUN_STATUS_RUNNING and run["cancel_requested"]
+            ]
+
+    def cleanup(self, retention: float = RUN_REGISTRY_RETENTION) -> int:
+        deadline = time.time() - retention
+        with self._lock:
+            expired = [
+                run_id for run_id, run in self._runs.items()
+                if run["status"] != RUN_STATUS_RUNNING and run["updated_at"] < deadline
+            ]
+            for run_id in expired:
+                del self._runs[run_id]
+        return len(expired)
+
+
+class SQLiteRunRegistry(RunRegistry):
+    """多进程共享的 SQLite 登记表"""
+
+    shared = True
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id TEXT PRIMARY KEY,
+            worker_id TEXT NOT NULL,
+            method TEXT NOT NULL DEFAULT '',
+            status TEXT NOT NULL,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            message TEXT NOT NULL DEFAULT '',
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """
+
+    _WORKERS_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS workers (
+            worker_id TEXT PRIMARY KEY,
+            heartbeat_at REAL NOT NULL
+        )
+    """
+
+    # 把租约过期的 worker 仍在 running 的记录标记为 failed
+    _EXPIRE_LOST = (
+        "UPDATE runs SET status = ?, message = 'worker ' || worker_id || ' lost: lease expired', updated_at = ? "
+        "WHERE status = ? AND NOT EXISTS "
+        "(SELECT 1 FROM workers w WHERE w.worker_id = runs.worker_id AND w.heartbeat_at >= ?)"
+    )
+
+    def __init__(self, path: str = RUN_REGISTRY_PATH, lease_ttl: float = RUN_REGISTRY_LEASE_TTL):
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(self._SCHEMA)
+            conn.execute(self._WORKERS_SCHEMA)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_runs_cancel ON runs (worker_id, status, cancel_requested)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程一个连接（sqlite3 连接不能跨线程共享）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_dict(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        run = dict(row)
+        run["cancel_requested"] = bool(run["cancel_requested"])
+        return run
+
+    def _expire_lost(self, conn: sqlite3.Connection, run_id: Optional[str] = None) -> int:
+        """把租约过期的 worker 的 running 记录标记为 failed，run_id 不为空时只处理该记录"""
+        now = time.time()
+        sql, params = self._EXPIRE_LOST, [RUN_STATUS_FAILED, now, RUN_STATUS_RUNNING, now - self.lease_ttl]
+        if run_id is not None:
+            sql, params = f"{sql} AND run_id = ?", params + [run_id]
+        return conn.execute(sql, params).rowcount
+
+    def _get_checked(self, conn: sqlite3.Connection, run_id: str) -> Optional[Dict[str, Any]]:
+        """查询记录；仍为 running 但持有者租约已过期时先标记为 failed"""
+        row = conn.execute(
+            "SELECT runs.*, workers.heartbeat_at FROM runs LEFT JOIN workers USING (worker_id) WHERE run_id = ?",
+            (run_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        if row["status"] == RUN_STATUS_RUNNING and (row["heartbeat_at"] or 0) < time.time() - self.lease_ttl:
+            if self._expire_lost(conn, run_id):
+                logger.warning(f"Run {run_id} marked failed: worker {row['worker_id']} lease expired")
+            row = conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        run = self._to_dict(row)
+        if run is not None:
+            run.pop("heartbeat_at", None)
+        return run
+
+    def register(self, run_id: str, method: str = "", worker_id: Optional[str] = None):
+        now = time.time()
+        worker_id = worker_id or current_worker_id()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO runs "
+            "(run_id, worker_id, method, status, cancel_requested, message, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 0, '', ?, ?)",
+            (run_id, worker_id, method, RUN_STATUS_RUNNING, now, now),
+        )
+        # 登记即续约，保证持有者在第一次定时续约之前也有有效租约
+        self.heartbeat(worker_id)
+
+    def finish(self, run_id: str, status: str = RUN_STATUS_COMPLETED, message: str = ""):
+        self._connect().execute(
+            "UPDATE runs SET status = ?, message = ?, updated_at = ? WHERE run_id = ?",
+            (status, message, time.time(), run_id),
+        )
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        return self._get_checked(self._connect(), run_id)
+
+    def request_cancel(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """持有者租约已过期时不设置取消标志，返回已标记为 failed 的记录"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = self._get_checked(conn, run_id)
+            if before is not None and before["status"] == RUN_STATUS_RUNNING:
+                conn.execute(
+                    "UPDATE runs SET cancel_requested = 1, updated_at = ? WHERE run_id = ?",
+                    (time.time(), run_id),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return before
+
+    def pending_cancels(self, worker_id: str) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT run_id FROM runs WHERE worker_id = ? AND status = ? AND cancel_requested = 1",
+            (worker_id, RUN_STATUS_RUNNING),
+        ).fetchall()
+        return [row["run_id"] for row in rows]
+
+    def cleanup(self, retention: float = RUN_REGISTRY_RETENTION) -> int:
+        """先把租约过期的 worker 遗留的 running 记录标记为 failed，再删除过期记录与早已退出的 worker"""
+        conn = self._connect()
+        lost = self._expire_lost(conn)
+        if lost:
+            logger.warning(f"Marked {lost} runs failed: owning workers' leases expired")
+        deadline = time.time() - retention
+        cur = conn.execute("DELETE FROM runs WHERE status != ? AND updated_at < ?", (RUN_STATUS_RUNNING, deadline))
+        conn.execute(
+            "DELETE FROM workers WHERE heartbeat_at < ? AND NOT EXISTS "
+            "(SELECT 1 FROM runs WHERE runs.worker_id = workers.worker_id)",
+            (deadline,),
+        )
+        return cur.rowcount
+
+    def heartbeat(self, worker_id: str):
+        self._connect().execute(
+            "INSERT INTO workers (worker_id, heartbeat_at) VALUES (?, ?) "
+            "ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+            (worker_id, time.time()),
+        )
+
+    def claim_worker(self, worker_id: str) -> int:
+        conn = self._connect()
+        cur = conn.execute(
+            "UPDATE runs SET status = ?, message = 'worker ' || worker_id || ' restarted', updated_at = ? "
+            "WHERE worker_id = ? AND status = ?",
+            (RUN_STATUS_FAILED, time.time(), worker_id, RUN_STATUS_RUNNING),
+        )
+        self.heartbeat(worker_id)
+        return cur.rowcount
+
+
+_registry: Optional[RunRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_run_registry() -> RunRegistry:
+    """
+    获取进程内的运行登记表
+
+    RUN_REGISTRY_BACKEND 未设置时，HTTP_WORKERS 大于 1 使用 SQLite，否则使用内存实现。
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                backend = RUN_REGISTRY_BACKEND
+                if not backend:
+                    backend = "sqlite" if int(os.getenv("HTTP_WORKERS", "1")) > 1 else "memory"
+                if backend == "sqlite":
+                    _registry = SQLiteRunRegistry()
+                elif backend == "memory":
+                    _registry = InMemoryRunRegistry()
+                else:
+                    raise ValueError(f"Unknown run registry backend: {backend}")
+                logger.info(f"Run registry backend: {backend}")
+    return _registry
@@ -0,0 +1,111 @@
+"""
+从 checkpoint 续跑与单节点重跑
+
+- 续跑：以原运行的 thread_id（即原 run_id / job_id）输入 None 调用图，LangGraph 从最后一个 checkpoint 继续，
+  同一 superstep 中已成功节点的 pending writes 直接复用，只执行失败或未执行的节点
+- 重跑节点 X：找到 next 包含 X 的最近一个 checkpoint，复制出分支，把同一 superstep 中其它已成功节点的输出
+  作为其 writes 写入分支（新输入合并进其中，并路由到 X）；随后从分支续跑，只执行 X 及其下游
+"""
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.types import Command, StateSnapshot, StateUpdate
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointNotFound(LookupError):
+    """没有可续跑 / 重跑的 checkpoint（或要重跑的节点不存在）"""
+
+
+def thread_config(thread_id: str) -> RunnableConfig:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+async def load_resumable_state(graph: CompiledStateGraph, thread_id: str) -> StateSnapshot:
+    """
+    读取线程最新的 checkpoint
+
+    Raises:
+        CheckpointNotFound: 线程没有任何 checkpoint
+    """
+    snapshot = await graph.aget_state(thread_config(thread_id))
+    if not snapshot.values and not snapshot.next:
+        raise CheckpointNotFound(f"No checkpoint found for run: {thread_id}")
+    return snapshot
+
+
+def snapshot_output(graph: CompiledStateGraph, snapshot: StateSnapshot) -> Dict[str, Any]:
+    """已跑完的 checkpoint 对应的图输出"""
+    channels = graph.output_channels
+    if isinstance(channels, str):
+        return snapshot.values.get(channels)
+    return {k: snapshot.values.get(k) for k in channels}
+
+
+async def find_node_checkpoint(graph: CompiledStateGraph, thread_id: str, node: str) -> StateSnapshot:
+    """
+    查找 next 中包含 node 的最近一个 checkpoint（即 node 所在 superstep 开始前的状态）
+
+    Raises:
+        CheckpointNotFound: 历史中没有执行过（或计划执行）该节点
+    """
+    async for snapshot in graph.aget_state_history(thread_config(thread_id)):
+        if node in snapshot.next:
+            return snapshot
+    raise CheckpointNotFound(f"Node '{node}' was never scheduled in run: {thread_id}")
+
+
+async def fork_for_rerun(
+    graph: CompiledStateGraph,
+    thread_id: str,
+    node: str,
+    values: Optional[Dict[str, Any]] = None,
+) -> RunnableConfig:
+    """
+    为重跑 node 创建 checkpoint 分支，返回分支的 config（以 None 为输入从该 config 续跑）
+
+    Args:
+        values: 新输入，合并进状态后 node 重新执行
+
+    Raises:
+        CheckpointNotFound: 节点不存在或从未被调度
+    """
+    if node not in graph.nodes:
+        raise CheckpointNotFound(f"node_id '{node}' not found")
+    snapshot = await find_node_checkpoint(graph, thread_id, node)
+    values = dict(values or {})
+
+    # 同一 superstep 中已成功的其它节点（含失败后续跑成功的）：把原输出作为其 writes 写入分支，避免重复执行
+    done: List[Tuple[Any, str]] = [
+        (task.result, task.name)
+        for task in snapshot.tasks
+        if task.name != node and task.result is not None
+    ]
+    if done:
+        # 边的触发通道只保留一个 superstep，由第一个同级节点携带新输入并重新路由到 node
+        first_values, first_node = done[0]
+        done[0] = (Command(update={**(first_values or {}), **values}, goto=node), first_node)
+        config = await graph.abulk_update_state(snapshot.config, [[StateUpdate(done, "__copy__")]])
+    else:
+        config = await graph.aupdate_state(snapshot.config, None, as_node="__copy__")
+        if values:
+            # 没有可携带新输入的同级节点：以触发 node 的上游节点身份写入
+            config = await graph.aupdate_state(config, values)
+    logger.info(
+        f"Forked run {thread_id} for rerun of node '{node}' "
+        f"from checkpoint {snapshot.config['configurable'].get('checkpoint_id')}, reused {len(done)} sibling results"
+    )
+    return config
+
+
+__all__ = [
+    "CheckpointNotFound",
+    "thread_config",
+    "load_resumable_state",
+    "snapshot_output",
+    "find_node_checkpoint",
+    "fork_for_rerun",
+]
@@ -0,0 +1,120 @@
+"""
+准入控制测试：并发上限、优先级排队、挤出、超时与取消
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.runs.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    parse_priority,
+)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_parse_priority():
+    assert parse_priority(" Interactive ") == PRIORITY_INTERACTIVE
+    assert parse_priority("urgent") == PRIORITY_BATCH
+    assert parse_priority(None, default=PRIORITY_INTERACTIVE) == PRIORITY_INTERACTIVE
+
+
+def test_interactive_waiters_served_first():
+    """名额释放时先转交给交互式请求，同优先级先进先出"""
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=8, queue_timeout=5)
+        await admission.acquire()
+        order = []
+
+        async def wait(name, priority):
+            await admission.acquire(priority)
+            order.append(name)
+
+        tasks = [
+            asyncio.create_task(wait("batch-1", PRIORITY_BATCH)),
+            asyncio.create_task(wait("batch-2", PRIORITY_BATCH)),
+            asyncio.create_task(wait("interactive", PRIORITY_INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        assert admission.stats()["queue_depth_by_priority"] == {PRIORITY_INTERACTIVE: 1, PRIORITY_BATCH: 2}
+        for _ in tasks:
+            admission.release(1.0)
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert admission.in_flight == 1
+        return order
+
+    assert _run(scenario()) == ["interactive", "batch-1", "batch-2"]
+
+
+def test_full_queue_evicts_batch_for_interactive():
+    """队列已满时交互式请求挤出队尾的批量请求，批量请求则直接被拒绝"""
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+        await admission.acquire()
+        queued = asyncio.create_task(admission.acquire(PRIORITY_BATCH))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire(PRIORITY_BATCH)
+        assert rejected.value.reason == "queue_full"
+
+        interactive = asyncio.create_task(admission.acquire(PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as evicted:
+            await queued
+        assert evicted.value.reason == "evicted"
+
+        admission.release()
+        await interactive
+        stats = admission.stats()
+        assert stats["evicted"] == 1 and stats["rejected_queue_full"] == 1
+        assert stats["in_flight"] == 1
+
+    _run(scenario())
+
+
+def test_queue_timeout_and_retry_after():
+    """排队超时被拒绝，Retry-After 按平均耗时与排队长度估算"""
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        async with admission.slot():
+            with pytest.raises(AdmissionRejected) as rejected:
+                await admission.acquire()
+        assert rejected.value.reason == "queue_timeout"
+        assert admission.stats()["queue_depth"] == 0
+        assert admission.in_flight == 0
+
+        fresh = AdmissionController(max_concurrency=2)
+        await fresh.acquire()
+        fresh.release(10.0)
+        assert fresh._retry_after() == 5
+
+    _run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    """排队中的请求被取消（客户端断开）时退出队列，不占用名额"""
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=5)
+        await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert admission.stats()["queue_depth"] == 0
+        admission.release()
+        assert admission.in_flight == 0
+
+    _run(scenario())
@@ -0,0 +1,109 @@
+"""
+运行登记表测试：归属、取消标志、清理与 worker 租约
+"""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.runs.registry import (
+    InMemoryRunRegistry,
+    SQLiteRunRegistry,
+    RUN_STATUS_COMPLETED,
+    RUN_STATUS_FAILED,
+    RUN_STATUS_RUNNING,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def registry(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryRunRegistry()
+    return SQLiteRunRegistry(str(tmp_path / "runs.db"))
+
+
+def test_register_finish_and_get(registry):
+    registry.register("r1", method="run", worker_id="w1")
+    run = registry.get("r1")
+    assert run["worker_id"] == "w1" and run["status"] == RUN_STATUS_RUNNING
+    registry.finish("r1", RUN_STATUS_COMPLETED)
+    assert registry.get("r1")["status"] == RUN_STATUS_COMPLETED
+    assert registry.get("missing") is None
+
+
+def test_cancel_flag_reaches_owner_only(registry):
+    registry.register("r1", worker_id="w1")
+    registry.register("r2", worker_id="w2")
+    before = registry.request_cancel("r1")
+    assert before["status"] == RUN_STATUS_RUNNING and not before["cancel_requested"]
+    assert registry.pending_cancels("w1") == ["r1"]
+    assert registry.pending_cancels("w2") == []
+
+    registry.finish("r1", RUN_STATUS_COMPLETED)
+    assert registry.pending_cancels("w1") == []
+    assert registry.request_cancel("r1")["status"] == RUN_STATUS_COMPLETED
+    assert registry.request_cancel("missing") is None
+
+
+def test_cleanup_removes_only_old_finished_runs(registry):
+    registry.register("done", worker_id="w1")
+    registry.register("live", worker_id="w1")
+    registry.finish("done", RUN_STATUS_COMPLETED)
+    assert registry.cleanup(retention=3600) == 0
+    time.sleep(0.01)
+    assert registry.cleanup(retention=0) == 1
+    assert registry.get("done") is None
+    assert registry.get("live")["status"] == RUN_STATUS_RUNNING
+
+
+def test_shared_registry_visible_across_instances(tmp_path):
+    """两个实例（模拟两个 worker 进程）共享同一个 SQLite 文件"""
+    a = SQLiteRunRegistry(str(tmp_path / "runs.db"))
+    b = SQLiteRunRegistry(str(tmp_path / "runs.db"))
+    a.register("r1", worker_id="wa")
+    assert b.request_cancel("r1")["worker_id"] == "wa"
+    assert a.pending_cancels("wa") == ["r1"]
+
+
+def test_dead_owner_runs_marked_failed(tmp_path):
+    """持有者租约过期后，查询与取消都看到 failed，取消不再报告转发成功"""
+    path = str(tmp_path / "runs.db")
+    crashed = SQLiteRunRegistry(path, lease_ttl=0.2)
+    crashed.register("orphan", worker_id="dead")
+    crashed.register("alive", worker_id="live")
+
+    other = SQLiteRunRegistry(path, lease_ttl=0.2)
+    assert other.get("orphan")["status"] == RUN_STATUS_RUNNING
+    time.sleep(0.3)
+    other.heartbeat("live")
+
+    run = other.request_cancel("orphan")
+    assert run["status"] == RUN_STATUS_FAILED
+    assert "dead" in run["message"]
+    assert other.pending_cancels("dead") == []
+    assert other.get("alive")["status"] == RUN_STATUS_RUNNING
+
+
+def test_cleanup_expires_lost_runs_and_prunes_them(tmp_path):
+    """清理时标记租约过期的 running 记录，超过保留时间后删除"""
+    registry = SQLiteRunRegistry(str(tmp_path / "runs.db"), lease_ttl=0.1)
+    registry.register("orphan", worker_id="dead")
+    time.sleep(0.2)
+    assert registry.cleanup(retention=3600) == 0
+    assert registry.get("orphan")["status"] == RUN_STATUS_FAILED
+    time.sleep(0.01)
+    assert registry.cleanup(retention=0) == 1
+    assert registry.get("orphan") is None
+
+
+def test_claim_worker_fails_previous_incarnation(tmp_path):
+    """同名 worker 重启后，旧进程遗留的 running 记录标记为 failed"""
+    registry = SQLiteRunRegistry(str(tmp_path / "runs.db"))
+    registry.register("old", worker_id="host:1")
+    assert registry.claim_worker("host:1") == 1
+    assert registry.get("old")["status"] == RUN_STATUS_FAILED
+    assert InMemoryRunRegistry().claim_worker("host:1") == 0
@@ -0,0 +1,116 @@
+"""
+续跑与重跑测试：读取 checkpoint、已完成运行的输出、执行者失联后续跑、单节点重跑
+"""
+import asyncio
+import operator
+import sys
+import time
+from pathlib import Path
+from typing import Annotated, TypedDict
+
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.runs.registry import RUN_STATUS_FAILED, RUN_STATUS_RUNNING, SQLiteRunRegistry
+from utils.runs.resume import (
+    CheckpointNotFound,
+    fork_for_rerun,
+    load_resumable_state,
+    snapshot_output,
+    thread_config,
+)
+
+
+class _State(TypedDict):
+    query: str
+    steps: Annotated[list, operator.add]
+
+
+def _graph(calls, fail_on=()):
+    """a -> b -> c；fail_on 中的节点第一次执行时失败"""
+    def node(name):
+        def run(state):
+            calls.append(name)
+            if name in fail_on and calls.count(name) == 1:
+                raise RuntimeError(f"{name} failed")
+            return {"steps": [f"{name}:{state['query']}"]}
+        return run
+
+    builder = StateGraph(_State)
+    for name in ("a", "b", "c"):
+        builder.add_node(name, node(name))
+    builder.add_edge(START, "a")
+    builder.add_edge("a", "b")
+    builder.add_edge("b", "c")
+    builder.add_edge("c", END)
+    return builder.compile(checkpointer=MemorySaver())
+
+
+def test_missing_checkpoint_raises():
+    async def scenario():
+        with pytest.raises(CheckpointNotFound):
+            await load_resumable_state(_graph([]), "missing")
+
+    asyncio.run(scenario())
+
+
+def test_completed_run_returns_checkpointed_output():
+    """已跑完的运行没有待执行节点，输出取自最后一个 checkpoint"""
+    async def scenario():
+        graph = _graph([])
+        await graph.ainvoke({"query": "q", "steps": []}, thread_config("r1"))
+        snapshot = await load_resumable_state(graph, "r1")
+        assert not snapshot.next
+        return snapshot_output(graph, snapshot)
+
+    assert asyncio.run(scenario()) == {"query": "q", "steps": ["a:q", "b:q", "c:q"]}
+
+
+def test_abandoned_run_is_resumable(tmp_path):
+    """执行者失联（租约过期）的运行在登记表中变为 failed，从 checkpoint 续跑时已完成的节点不再执行"""
+    registry = SQLiteRunRegistry(str(tmp_path / "runs.db"), lease_ttl=0.05)
+    registry.register("r1", method="run", worker_id="dead:1")
+    calls = []
+    graph = _graph(calls, fail_on=("b",))
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await graph.ainvoke({"query": "q", "steps": []}, thread_config("r1"))
+        # 进程被杀：没有 finish，也不再续约
+        assert registry.get("r1")["status"] == RUN_STATUS_RUNNING
+        time.sleep(0.1)
+        run = registry.get("r1")
+        assert run["status"] == RUN_STATUS_FAILED and "lease expired" in run["message"]
+
+        snapshot = await load_resumable_state(graph, "r1")
+        assert snapshot.next == ("b",)
+        return await graph.ainvoke(None, thread_config("r1"))
+
+    output = asyncio.run(scenario())
+    assert output["steps"] == ["a:q", "b:q", "c:q"]
+    assert calls == ["a", "b", "b", "c"]
+
+
+def test_fork_for_rerun_runs_node_and_downstream():
+    """以新输入重跑 b：a 不再执行，b 与下游使用新输入；分支记在原线程下，之后以原 run_id 读取到重跑结果"""
+    calls = []
+    graph = _graph(calls)
+
+    async def scenario():
+        await graph.ainvoke({"query": "old", "steps": []}, thread_config("r1"))
+        calls.clear()
+        with pytest.raises(CheckpointNotFound):
+            await fork_for_rerun(graph, "r1", "missing")
+        fork = await fork_for_rerun(graph, "r1", "b", {"query": "new"})
+        output = await graph.ainvoke(None, fork)
+        original = await load_resumable_state(graph, "r1")
+        return output, original
+
+    output, original = asyncio.run(scenario())
+    assert calls == ["b", "c"]
+    assert output["steps"] == ["a:old", "b:new", "c:new"]
+    assert original.values["steps"] == output["steps"] and not original.next